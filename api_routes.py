@@ -207,7 +207,9 @@ def send_message(conversation_id):
     try:
         response = qwen_client.chat(
             user_message,
-            conversation_id=conversation_id
+            conversation_id=conversation_id,
+            tenant_id=g.tenant_id,
+            plan=g.tenant.plan
         )
         
         # 保存AI回复
@@ -18,8 +18,14 @@ import asyncio
 from functools import wraps
 
 from config import Config
-from qwen_client_enhanced import QwenChatService
+from qwen_client_enhanced import QwenChatService, TurnUsage, SYSTEM_PROMPT_VERSION, iterate_sync
 from mcp_manager_enhanced import MCPServiceManager
+import mcp_digest
+from response_cache import get_response_cache
+from conversation_store import HISTORY_NAMESPACE, get_conversation_store
+from model_router import get_router
+from prompt_cache import get_prefix_stats
+from llm_dispatcher import get_dispatcher
 
 # 配置日志
 logging.basicConfig(
@@ -169,6 +175,23 @@ def get_db():
     return conn
 
 
+def load_conversation_history(conversation_id):
+    """对话状态未命中时（重启、其他进程、空闲淘汰）从消息表重建最近的对话历史"""
+    conn = get_db()
+    rows = conn.execute('''
+        SELECT role, content FROM messages
+        WHERE conversation_id = ? AND role IN ('user', 'assistant')
+        ORDER BY created_at DESC, rowid DESC LIMIT 30
+    ''', (conversation_id,)).fetchall()
+    conn.close()
+    if not rows:
+        return None
+    return [{'role': row['role'], 'content': row['content']} for row in reversed(rows)]
+
+
+get_conversation_store().set_loader(HISTORY_NAMESPACE, load_conversation_history)
+
+
 # ==================== 配额管理 ====================
 
 TIER_LIMITS = {
@@ -205,7 +228,7 @@ def check_quota(user_id: str) -> dict:
     # 获取本月使用量
     first_day_of_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     usage = conn.execute('''
-        SELECT COUNT(*) as count 
+        SELECT COUNT(*) as count, COALESCE(SUM(tokens_used), 0) as tokens 
         FROM api_calls 
         WHERE user_id = ? AND created_at >= ?
     ''', (user_id, first_day_of_month.isoformat())).fetchone()
@@ -218,17 +241,50 @@ def check_quota(user_id: str) -> dict:
         'tier': tier,
         'limit': limit,
         'used': used,
+        'tokens_used': usage['tokens'],
         'remaining': limit - used if limit != -1 else -1
     }
 
 
-def record_api_call(user_id: str, endpoint: str, tokens: int = 0):
-    """记录API调用"""
-    conn = get_db()
+def record_api_call(conn, user_id: str, endpoint: str, tokens: int = 0):
+    """记录API调用（随调用方的事务提交）"""
     conn.execute('''
         INSERT INTO api_calls (id, user_id, endpoint, tokens_used, created_at)
         VALUES (?, ?, ?, ?, ?)
     ''', (str(uuid.uuid4()), user_id, endpoint, tokens, datetime.now().isoformat()))
+
+
+def save_chat_turn(
+    user_id: str,
+    endpoint: str,
+    conversation_id: str,
+    content: str,
+    tool_calls: list,
+    tokens: int,
+    completed: bool
+):
+    """
+    一轮对话结束（正常结束、出错或客户端断开）时保存助手回复并记录API调用，同一事务提交
+
+    未正常结束时不保存回复，但API调用照常计入配额，token 按已产生的用量（含工具调用轮）记录
+    """
+    conn = get_db()
+    if completed:
+        conn.execute('''
+            INSERT INTO messages (id, conversation_id, role, content, tool_calls, tokens_used)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (
+            str(uuid.uuid4()),
+            conversation_id,
+            'assistant',
+            content,
+            json.dumps(tool_calls, ensure_ascii=False),
+            tokens
+        ))
+        conn.execute('''
+            UPDATE conversations SET updated_at = ? WHERE id = ?
+        ''', (datetime.now().isoformat(), conversation_id))
+    record_api_call(conn, user_id, endpoint, tokens)
     conn.commit()
     conn.close()
 
@@ -295,25 +351,24 @@ def chat_stream(user_id):
         conn.commit()
         conn.close()
         
-        # 记录API调用
-        record_api_call(user_id, '/api/chat/stream')
-        
-        # 流式响应函数
+        # 流式响应函数（回复和API调用在结束时同一事务写入，客户端中途断开也计入配额）
         def generate():
             """生成SSE流"""
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
             assistant_content = ""
             tool_calls_data = []
+            turn_usage = TurnUsage()
+            completed = False
             
             async def stream_chat():
-                nonlocal assistant_content, tool_calls_data
+                nonlocal assistant_content
                 
                 async for chunk in qwen_service.chat_stream(
                     user_id,
                     conversation_id,
-                    message
+                    message,
+                    plan=quota['tier'],
+                    features=TIER_LIMITS[quota['tier']]['features'],
+                    usage=turn_usage
                 ):
                     # 发送chunk到前端
                     yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
@@ -324,35 +379,13 @@ def chat_stream(user_id):
                     elif chunk['type'] in ['tool_call', 'tool_result']:
                         tool_calls_data.append(chunk)
             
-            # 运行异步生成器
+            # 逐个驱动异步生成器，保证工具进度和文本实时推送到前端；
+            # 客户端断开时 Flask 关闭本生成器，finally 中关闭 chat_events 以归还工具执行许可
+            chat_events = iterate_sync(stream_chat())
             try:
-                for item in loop.run_until_complete(
-                    asyncio.gather(*(stream_chat(),))
-                )[0]:
+                for item in chat_events:
                     yield item
-                
-                # 保存助手回复
-                conn = get_db()
-                conn.execute('''
-                    INSERT INTO messages (id, conversation_id, role, content, tool_calls)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    str(uuid.uuid4()),
-                    conversation_id,
-                    'assistant',
-                    assistant_content,
-                    json.dumps(tool_calls_data, ensure_ascii=False)
-                ))
-                
-                # 更新对话时间
-                conn.execute('''
-                    UPDATE conversations 
-                    SET updated_at = ? 
-                    WHERE id = ?
-                ''', (datetime.now().isoformat(), conversation_id))
-                
-                conn.commit()
-                conn.close()
+                completed = True
                 
             except Exception as e:
                 logger.error(f"流式响应错误: {e}", exc_info=True)
@@ -362,7 +395,15 @@ def chat_stream(user_id):
                 }
                 yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
             finally:
-                loop.close()
+                # 断开（GeneratorExit）、出错和正常结束都会走到这里
+                chat_events.close()
+                try:
+                    save_chat_turn(
+                        user_id, '/api/chat/stream', conversation_id,
+                        assistant_content, tool_calls_data, turn_usage.total_tokens, completed
+                    )
+                except Exception as e:
+                    logger.error(f"保存对话失败: {e}", exc_info=True)
         
         return Response(
             stream_with_context(generate()),
@@ -435,54 +476,40 @@ def handle_chat_message(data):
         conn.commit()
         conn.close()
         
-        # 记录API调用
-        record_api_call(user_id, '/ws/chat')
-        
-        # 异步处理对话
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
+        # 异步处理对话（独立事件循环；出错或断开时关闭生成器，归还工具执行许可）
         assistant_content = ""
         tool_calls_data = []
+        turn_usage = TurnUsage()
+        completed = False
         
-        async def process_chat():
-            nonlocal assistant_content, tool_calls_data
-            
-            async for chunk in qwen_service.chat_stream(
-                user_id,
-                conversation_id,
-                message,
-                on_chunk=lambda c: emit('chat_chunk', c)
-            ):
+        chat_events = iterate_sync(qwen_service.chat_stream(
+            user_id,
+            conversation_id,
+            message,
+            on_chunk=lambda c: emit('chat_chunk', c),
+            plan=quota['tier'],
+            features=TIER_LIMITS[quota['tier']]['features'],
+            usage=turn_usage
+        ))
+        try:
+            for chunk in chat_events:
                 if chunk['type'] == 'text':
                     assistant_content += chunk.get('content', '')
                 elif chunk['type'] in ['tool_call', 'tool_result']:
                     tool_calls_data.append(chunk)
-        
-        loop.run_until_complete(process_chat())
-        loop.close()
-        
-        # 保存助手回复
-        conn = get_db()
-        conn.execute('''
-            INSERT INTO messages (id, conversation_id, role, content, tool_calls)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            str(uuid.uuid4()),
-            conversation_id,
-            'assistant',
-            assistant_content,
-            json.dumps(tool_calls_data, ensure_ascii=False)
-        ))
-        conn.execute('''
-            UPDATE conversations SET updated_at = ? WHERE id = ?
-        ''', (datetime.now().isoformat(), conversation_id))
-        conn.commit()
-        conn.close()
+            completed = True
+        finally:
+            # 回复和API调用同一事务写入；出错时按已产生的用量计费
+            chat_events.close()
+            save_chat_turn(
+                user_id, '/ws/chat', conversation_id,
+                assistant_content, tool_calls_data, turn_usage.total_tokens, completed
+            )
         
         emit('chat_complete', {
             'conversation_id': conversation_id,
-            'message': '对话完成'
+            'message': '对话完成',
+            'usage': turn_usage.to_dict()
         })
         
     except Exception as e:
@@ -559,6 +586,37 @@ def get_conversation(user_id, conversation_id):
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/tool-results/<result_ref>', methods=['GET'])
+@require_auth
+def get_tool_result(user_id, result_ref):
+    """
+    取回工具的完整结果（对话中只推送降采样版本）
+    
+    查询参数:
+        path: 子结构路径（如 results.series.渠段1），默认整个结果
+        points: 每个序列的点数（min/max 抽取），默认返回全分辨率
+    """
+    try:
+        result = mcp_digest.result_store.get(result_ref, owner=user_id)
+        if result is None:
+            return jsonify({'error': '结果不存在或已过期'}), 404
+        
+        try:
+            data = mcp_digest.resolve_path(result, request.args.get('path'))
+        except KeyError:
+            return jsonify({'error': f"路径不存在: {request.args.get('path')}"}), 404
+        
+        points = request.args.get('points', type=int)
+        if points:
+            data = mcp_digest.digest(data, points, 'minmax', ref=result_ref)
+        
+        return jsonify({'success': True, 'result_ref': result_ref, 'data': data})
+        
+    except Exception as e:
+        logger.error(f"获取工具结果失败: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 # ==================== 用户API ====================
 
 @app.route('/api/user/quota', methods=['GET'])
@@ -626,6 +684,7 @@ def get_mcp_services():
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查"""
+    cache = get_response_cache()
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
@@ -635,7 +694,11 @@ def health_check():
             'model': Config.QWEN_MODEL,
             'available': qwen_service.is_available()
         },
-        'mcp_services': len(mcp_manager.list_services())
+        'mcp_services': len(mcp_manager.list_services()),
+        'response_cache': cache.get_stats() if cache else {'enabled': False},
+        'model_routing': get_router(Config.QWEN_MODEL).get_stats(),
+        'prompt_cache': {**get_prefix_stats().get_stats(), 'system_prompt_version': SYSTEM_PROMPT_VERSION},
+        'llm_dispatcher': get_dispatcher().get_stats()
     })
 
 
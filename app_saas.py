@@ -18,6 +18,7 @@ from models import db
 from auth import jwt, require_auth, require_api_key
 from quota import limiter, require_quota
 from qwen_client import QwenClient
+from conversation_store import HISTORY_NAMESPACE, get_conversation_store
 from wechat_handler import WechatMessageHandler
 
 # 导入API路由
@@ -47,11 +48,31 @@ qwen_client = QwenClient(
     model=Config.QWEN_MODEL
 )
 
+
+def load_conversation_history(conversation_id):
+    """对话状态未命中时（重启、其他进程、空闲淘汰）从 messages 表重建最近的对话历史"""
+    from models import Message
+    with app.app_context():
+        rows = Message.query.filter(
+            Message.conversation_id == conversation_id,
+            Message.role.in_(['user', 'assistant'])
+        ).order_by(Message.created_at.desc()).limit(20).all()
+        if not rows:
+            return None
+        return [{'role': m.role, 'content': m.content} for m in reversed(rows)]
+
+
+get_conversation_store().set_loader(HISTORY_NAMESPACE, load_conversation_history)
+
 # 初始化微信处理器（如果启用）
 wechat_handler = None
 if Config.WECHAT_ENABLED:
     from mcp_manager import MCPServiceManager
-    mcp_manager = MCPServiceManager()
+    from mcp_registry import MCPServiceRegistry, SQLAlchemyServiceSource
+    mcp_manager = MCPServiceManager(registry=MCPServiceRegistry(
+        services_dir=Config.MCP_SERVICES_DIR,
+        db_source=SQLAlchemyServiceSource(app)
+    ))
     wechat_handler = WechatMessageHandler(
         token=Config.WECHAT_TOKEN,
         qwen_client=qwen_client,
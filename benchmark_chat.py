@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+对话接口端到端延迟压测
+
+按目标并发驱动以下接口，统计首 token 延迟（TTFT）、token 间隔（ITL）、端到端延迟分位数和吞吐：
+    stream   Pro 版 POST /api/chat/stream（SSE，X-User-ID 认证）
+    ws       Pro 版 WebSocket chat_message 事件（需要安装 python-socketio）
+    saas     SaaS 版 POST /api/chat/conversations/<id>/messages（非流式，JWT 认证，TTFT 即端到端延迟）
+
+配合 mock_dashscope.py 使用，不消耗真实 token:
+    python mock_dashscope.py --ttft 0.4 --tokens-per-second 40
+    DASHSCOPE_HTTP_BASE_URL=http://127.0.0.1:8089/api/v1 ALIYUN_API_KEY=mock RESPONSE_CACHE_ENABLED=false \\
+        python app_hydronet_pro.py
+    python benchmark_chat.py --target stream --url http://127.0.0.1:5000 --concurrency 16 --requests 200 \\
+        --user-id bench_user
+
+注意:
+    - Pro 版按用户套餐限制每月调用次数，压测用户需设为不限次数的套餐:
+      UPDATE users SET tier = 'enterprise' WHERE id = 'bench_user';
+    - 回复缓存会让重复问题直接命中，测模型链路时在服务端设置 RESPONSE_CACHE_ENABLED=false
+"""
+
+import json
+import time
+import argparse
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Any
+
+import requests
+
+try:
+    import socketio
+    SOCKETIO_AVAILABLE = True
+except ImportError:
+    SOCKETIO_AVAILABLE = False
+
+
+DEFAULT_MESSAGES = [
+    '介绍一下水网调度的基本原理',
+    '渠道节制闸的开度应该如何调整？',
+    '模拟一下上游来水增加 20% 时下游水位的变化',
+    '水库汛限水位和正常蓄水位有什么区别？'
+]
+TEXT_CHUNKS = ('text', 'preamble')
+
+
+class Sample:
+    """一次请求的计时（秒）"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.token_times: List[float] = []
+        self.finished: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def token(self):
+        self.token_times.append(time.perf_counter())
+
+    def finish(self, error: Optional[str] = None):
+        self.finished = time.perf_counter()
+        self.error = error
+
+    @property
+    def ttft(self) -> Optional[float]:
+        first = self.token_times[0] if self.token_times else self.finished
+        return first - self.started if first is not None else None
+
+    @property
+    def gaps(self) -> List[float]:
+        return [b - a for a, b in zip(self.token_times, self.token_times[1:])]
+
+    @property
+    def e2e(self) -> Optional[float]:
+        return self.finished - self.started if self.finished is not None else None
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近秩分位数（q 取 0~100）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples: List[Sample], elapsed: float) -> Dict[str, Any]:
+    """汇总压测结果（延迟单位毫秒）"""
+    ok = [s for s in samples if s.error is None]
+
+    def latency(values):
+        return {
+            f'p{q}': round(percentile(values, q) * 1000, 1) if values else None
+            for q in (50, 90, 99)
+        }
+
+    errors: Dict[str, int] = {}
+    for s in samples:
+        if s.error is not None:
+            errors[s.error] = errors.get(s.error, 0) + 1
+    return {
+        'requests': len(samples),
+        'succeeded': len(ok),
+        'failed': len(samples) - len(ok),
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else None,
+        'chunks_per_s': round(sum(len(s.token_times) for s in ok) / elapsed, 1) if elapsed else None,
+        'ttft_ms': latency([s.ttft for s in ok]),
+        'itl_ms': latency([gap for s in ok for gap in s.gaps]),
+        'e2e_ms': latency([s.e2e for s in ok]),
+        'errors': errors
+    }
+
+
+# ==================== 各接口的客户端 ====================
+
+class StreamClient:
+    """Pro 版 SSE 接口（每个并发线程一个会话，复用对话ID）"""
+
+    def __init__(self, url: str, user_id: str, timeout: float):
+        self.url = url.rstrip('/') + '/api/chat/stream'
+        self.session = requests.Session()
+        self.session.headers['X-User-ID'] = user_id
+        self.timeout = timeout
+        self.conversation_id = None
+
+    def send(self, message: str) -> Sample:
+        sample = Sample()
+        try:
+            with self.session.post(
+                self.url,
+                json={'message': message, 'conversation_id': self.conversation_id},
+                stream=True,
+                timeout=self.timeout
+            ) as response:
+                if response.status_code != 200:
+                    sample.finish(f'HTTP {response.status_code}')
+                    return sample
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data: '):
+                        continue
+                    chunk = json.loads(line[6:])
+                    if chunk['type'] in TEXT_CHUNKS:
+                        sample.token()
+                    elif chunk['type'] == 'complete':
+                        self.conversation_id = chunk.get('conversation_id') or self.conversation_id
+                    elif chunk['type'] == 'error':
+                        sample.finish(chunk.get('error', 'error')[:80])
+                        return sample
+            sample.finish()
+        except requests.RequestException as e:
+            sample.finish(type(e).__name__)
+        return sample
+
+    def close(self):
+        self.session.close()
+
+
+class WebSocketClient:
+    """Pro 版 WebSocket 接口（每个并发线程一个连接）"""
+
+    def __init__(self, url: str, user_id: str, timeout: float):
+        if not SOCKETIO_AVAILABLE:
+            raise RuntimeError("WebSocket 压测需要安装 python-socketio: pip install 'python-socketio[client]'")
+        self.user_id = user_id
+        self.timeout = timeout
+        self.conversation_id = None
+        self._sample: Optional[Sample] = None
+        self._done = threading.Event()
+        self.client = socketio.Client(reconnection=False)
+        self.client.on('chat_chunk', self._on_chunk)
+        self.client.on('conversation_created', self._on_created)
+        self.client.on('chat_complete', self._on_complete)
+        self.client.on('error', self._on_error)
+        self.client.connect(url, transports=['websocket'])
+
+    def _on_chunk(self, chunk):
+        if self._sample is not None and chunk.get('type') in TEXT_CHUNKS:
+            self._sample.token()
+
+    def _on_created(self, data):
+        self.conversation_id = data.get('conversation_id')
+
+    def _on_complete(self, data):
+        self.conversation_id = data.get('conversation_id') or self.conversation_id
+        if self._sample is not None:
+            self._sample.finish()
+        self._done.set()
+
+    def _on_error(self, data):
+        if self._sample is not None:
+            self._sample.finish(str((data or {}).get('message', 'error'))[:80])
+        self._done.set()
+
+    def send(self, message: str) -> Sample:
+        self._sample = sample = Sample()
+        self._done.clear()
+        self.client.emit('chat_message', {
+            'user_id': self.user_id,
+            'conversation_id': self.conversation_id,
+            'message': message
+        })
+        if not self._done.wait(self.timeout):
+            sample.finish('timeout')
+        self._sample = None
+        return sample
+
+    def close(self):
+        self.client.disconnect()
+
+
+class SaasClient:
+    """SaaS 版非流式接口（每个并发线程先创建一个对话）"""
+
+    def __init__(self, url: str, token: str, timeout: float):
+        self.base = url.rstrip('/') + '/api/chat/conversations'
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Bearer {token}'
+        self.timeout = timeout
+        response = self.session.post(self.base, json={'title': 'benchmark'}, timeout=timeout)
+        response.raise_for_status()
+        self.conversation_id = response.json()['id']
+
+    def send(self, message: str) -> Sample:
+        sample = Sample()
+        try:
+            response = self.session.post(
+                f'{self.base}/{self.conversation_id}/messages',
+                json={'message': message},
+                timeout=self.timeout
+            )
+            sample.finish(None if response.status_code == 200 else f'HTTP {response.status_code}')
+        except requests.RequestException as e:
+            sample.finish(type(e).__name__)
+        return sample
+
+    def close(self):
+        self.session.close()
+
+
+def saas_login(url: str, email: str, password: str) -> str:
+    """SaaS 版登录，返回 JWT"""
+    response = requests.post(
+        url.rstrip('/') + '/api/auth/login',
+        json={'email': email, 'password': password},
+        timeout=10
+    )
+    response.raise_for_status()
+    return response.json()['access_token']
+
+
+# ==================== 压测主流程 ====================
+
+def run_benchmark(
+    make_client,
+    messages: List[str],
+    concurrency: int,
+    total: Optional[int] = None,
+    duration: Optional[float] = None,
+    warmup: int = 0
+) -> Dict[str, Any]:
+    """
+    并发发送请求直到完成 total 个或运行满 duration 秒
+
+    Args:
+        make_client: 创建客户端的函数（每个并发线程一个客户端）
+        messages: 轮流发送的消息
+        concurrency: 并发数
+        total: 请求总数（不含预热）
+        duration: 运行时长（秒），与 total 至少指定一个
+        warmup: 每个线程开始计时前的预热请求数
+    """
+    counter = itertools.count()
+    cycle = itertools.cycle(messages)
+    lock = threading.Lock()
+    samples: List[Sample] = []
+    ready = threading.Barrier(concurrency + 1)
+    deadline = [None]
+
+    def next_message() -> Optional[str]:
+        with lock:
+            if total is not None and next(counter) >= total:
+                return None
+            if deadline[0] is not None and time.perf_counter() >= deadline[0]:
+                return None
+            return next(cycle)
+
+    def worker():
+        client = None
+        try:
+            client = make_client()
+            with lock:
+                warmups = [next(cycle) for _ in range(warmup)]
+            for message in warmups:
+                client.send(message)
+        finally:
+            ready.wait()
+        if client is None:
+            return
+        try:
+            while True:
+                message = next_message()
+                if message is None:
+                    break
+                sample = client.send(message)
+                with lock:
+                    samples.append(sample)
+        finally:
+            client.close()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(worker) for _ in range(concurrency)]
+        ready.wait()
+        started = time.perf_counter()
+        if duration:
+            deadline[0] = started + duration
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - started
+    return summarize(samples, elapsed)
+
+
+def print_report(target: str, concurrency: int, report: Dict[str, Any]):
+    def row(name, values):
+        cells = '  '.join(f"{q} {v if v is not None else '-':>8}" for q, v in values.items())
+        print(f"  {name:<8} {cells}")
+
+    print(f"\n📊 {target}  并发 {concurrency}  请求 {report['requests']}"
+          f"（成功 {report['succeeded']} / 失败 {report['failed']}）  耗时 {report['elapsed_s']} s")
+    print(f"  吞吐     {report['throughput_rps']} 请求/s，{report['chunks_per_s']} 文本块/s")
+    print("  延迟（毫秒）")
+    row('TTFT', report['ttft_ms'])
+    row('ITL', report['itl_ms'])
+    row('E2E', report['e2e_ms'])
+    if report['errors']:
+        print(f"  错误     {json.dumps(report['errors'], ensure_ascii=False)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对话接口端到端延迟压测')
+    parser.add_argument('--target', choices=['stream', 'ws', 'saas'], default='stream')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=None, help='请求总数（默认 concurrency × 10）')
+    parser.add_argument('--duration', type=float, default=None, help='运行时长（秒），指定后不限请求总数')
+    parser.add_argument('--warmup', type=int, default=1, help='每个并发线程的预热请求数（不计入统计）')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--user-id', default='default_user', help='Pro 版用户ID')
+    parser.add_argument('--token', default=None, help='SaaS 版 JWT')
+    parser.add_argument('--login', default=None, help='SaaS 版登录账号 email:password（代替 --token）')
+    parser.add_argument('--messages-file', default=None, help='消息文件（每行一条）')
+    parser.add_argument('--json', default=None, help='把结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    messages = DEFAULT_MESSAGES
+    if args.messages_file:
+        with open(args.messages_file, encoding='utf-8') as f:
+            messages = [line.strip() for line in f if line.strip()]
+    total = args.requests if args.requests or args.duration else args.concurrency * 10
+
+    if args.target == 'stream':
+        make_client = lambda: StreamClient(args.url, args.user_id, args.timeout)
+    elif args.target == 'ws':
+        make_client = lambda: WebSocketClient(args.url, args.user_id, args.timeout)
+    else:
+        token = args.token
+        if token is None:
+            if not args.login:
+                parser.error('saas 压测需要 --token 或 --login email:password')
+            email, password = args.login.split(':', 1)
+            token = saas_login(args.url, email, password)
+        make_client = lambda: SaasClient(args.url, token, args.timeout)
+
+    report = run_benchmark(make_client, messages, args.concurrency, total, args.duration, args.warmup)
+    print_report(args.target, args.concurrency, report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'target': args.target, 'concurrency': args.concurrency, **report}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
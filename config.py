@@ -35,7 +35,7 @@ class Config:
     WECHAT_APP_SECRET = os.getenv('WECHAT_APP_SECRET', '')
     
     # MCP服务配置
-    MCP_SERVICES_DIR = os.getenv('MCP_SERVICES_DIR', './mcp_services')
+    MCP_SERVICES_DIR = os.getenv('MCP_SERVICES_DIR', 'instance/mcp_services')  # 运行时注册的服务清单
     MCP_TIMEOUT = int(os.getenv('MCP_TIMEOUT', 30))  # 秒
     
     # 数据库配置（可选，用于存储对话历史）
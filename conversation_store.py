@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+对话状态存储
+
+替代 QwenChatService / QwenClient 的 conversations 字典和微信处理器的 user_sessions 字典：
+    - 进程内 LRU：按序列化后的字节数计量内存上限，空闲超时淘汰
+    - 共享层：SQLite（默认，同机多个 Gunicorn 进程共享）或 Redis 协议兼容的服务器，
+      每次写入递增版本号；读取时先比对版本，本进程缓存已过期（其他进程写过）时重新加载
+    - 两层都没有时，调用应用注册的加载函数从 messages 表重建历史
+
+配置（CONVERSATION_STORE_URL）:
+    sqlite:///conversation_state.db   默认
+    redis://localhost:6379/1          需要安装 redis
+    memory://                         只用进程内缓存（单进程开发环境）
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Any, Callable, Tuple
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+STORE_URL = os.environ.get('CONVERSATION_STORE_URL', 'sqlite:///conversation_state.db')
+# 进程内缓存：内存上限（MB）、空闲超时（秒）
+MEMORY_LIMIT_MB = float(os.environ.get('CONVERSATION_MEMORY_MB', '64'))
+IDLE_TTL = float(os.environ.get('CONVERSATION_IDLE_TTL', '1800'))
+# 共享层保存时长（秒），过期后从 messages 表重建
+SHARED_TTL = float(os.environ.get('CONVERSATION_SHARED_TTL', str(7 * 86400)))
+
+# 命名空间：对话历史（消息列表）、微信用户会话
+HISTORY_NAMESPACE = 'history'
+WECHAT_NAMESPACE = 'wechat'
+
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+class MemoryTier:
+    """
+    按字节计量的进程内 LRU（最近访问的排在队尾），空闲超时淘汰
+
+    保存序列化后的字符串，每次取出都是新对象，调用方的就地修改在 save 之前不会影响缓存
+    """
+
+    def __init__(self, max_bytes: int, idle_ttl: float):
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.bytes = 0
+        # 键 → (最近访问时刻, 版本, 字节数, 序列化后的值)
+        self._entries: 'OrderedDict[str, Tuple[float, int, int, str]]' = OrderedDict()
+
+    def get(self, key: str) -> Optional[Tuple[int, str]]:
+        self._expire()
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries[key] = (time.monotonic(), entry[1], entry[2], entry[3])
+        self._entries.move_to_end(key)
+        return entry[1], entry[3]
+
+    def put(self, key: str, version: int, encoded: str):
+        self.discard(key)
+        size = len(encoded.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic(), version, size, encoded)
+        self.bytes += size
+        self._expire()
+
+    def discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def _expire(self):
+        deadline = time.monotonic() - self.idle_ttl
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry[0] >= deadline and self.bytes <= self.max_bytes:
+                break
+            self._entries.popitem(last=False)
+            self.bytes -= entry[2]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """SQLite 共享层（WAL 模式，同机多进程读写）"""
+
+    def __init__(self, path: str, ttl: float = SHARED_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS conversation_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    version INTEGER NOT NULL DEFAULT 1,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_conversation_state_expires ON conversation_state (expires_at)')
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def version(self, key: str) -> Optional[int]:
+        row = self._connection().execute(
+            'SELECT version FROM conversation_state WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def load(self, key: str) -> Optional[Tuple[int, str]]:
+        row = self._connection().execute(
+            'SELECT version, value FROM conversation_state WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def save(self, key: str, encoded: str) -> int:
+        conn = self._connection()
+        with conn:
+            conn.execute('''
+                INSERT INTO conversation_state (key, value, version, expires_at) VALUES (?, ?, 1, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    value = excluded.value, version = version + 1, expires_at = excluded.expires_at
+            ''', (key, encoded, time.time() + self.ttl))
+            version = conn.execute('SELECT version FROM conversation_state WHERE key = ?', (key,)).fetchone()[0]
+        return version
+
+    def delete(self, key: str):
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM conversation_state WHERE key = ?', (key,))
+
+    def purge(self) -> int:
+        """删除过期记录，返回删除条数"""
+        conn = self._connection()
+        with conn:
+            return conn.execute('DELETE FROM conversation_state WHERE expires_at <= ?', (time.time(),)).rowcount
+
+
+class RedisBackend:
+    """Redis 协议共享层（每个键为 {version, value} 哈希，带过期时间）"""
+
+    def __init__(self, url: str, ttl: float = SHARED_TTL, prefix: str = 'hydronet:state:'):
+        self.client = redis.Redis.from_url(url)
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    def version(self, key: str) -> Optional[int]:
+        version = self.client.hget(self.prefix + key, 'version')
+        return int(version) if version is not None else None
+
+    def load(self, key: str) -> Optional[Tuple[int, str]]:
+        version, value = self.client.hmget(self.prefix + key, 'version', 'value')
+        if version is None or value is None:
+            return None
+        return int(version), value.decode('utf-8')
+
+    def save(self, key: str, encoded: str) -> int:
+        name = self.prefix + key
+        pipe = self.client.pipeline()
+        pipe.hincrby(name, 'version', 1)
+        pipe.hset(name, 'value', encoded)
+        pipe.expire(name, self.ttl)
+        return int(pipe.execute()[0])
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def purge(self) -> int:
+        return 0  # 过期由 Redis 自行处理
+
+
+def create_backend(url: str):
+    """按 URL 创建共享层，memory:// 返回 None"""
+    if not url or url.startswith('memory://'):
+        return None
+    if url.startswith('redis://') or url.startswith('rediss://'):
+        if REDIS_AVAILABLE:
+            return RedisBackend(url)
+        logger.warning("⚠️ 未安装 redis，对话状态改用 SQLite 共享")
+        url = 'sqlite:///conversation_state.db'
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    raise ValueError(f"不支持的对话存储: {url}")
+
+
+class ConversationStore:
+    """
+    两级对话状态存储（线程安全）
+
+    值为任意 JSON 兼容结构：对话历史是消息列表，微信会话是字典。
+    调用方取出后就地修改，修改完成后 save 写回（写回前其他进程看不到本次修改）。
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        max_bytes: int = int(MEMORY_LIMIT_MB * 1024 * 1024),
+        idle_ttl: float = IDLE_TTL
+    ):
+        self.backend = backend
+        self.memory = MemoryTier(max_bytes, idle_ttl)
+        self._lock = threading.Lock()
+        self._loaders: Dict[str, Callable[[str], Optional[Any]]] = {}
+        self._stats = {'memory_hits': 0, 'shared_hits': 0, 'rebuilt': 0, 'misses': 0, 'saves': 0, 'errors': 0}
+
+    def set_loader(self, namespace: str, loader: Callable[[str], Optional[Any]]):
+        """注册缓存未命中时的重建函数（如从 messages 表读取对话历史）"""
+        self._loaders[namespace] = loader
+
+    @staticmethod
+    def _key(namespace: str, key: str) -> str:
+        return f'{namespace}:{key}'
+
+    def load(self, namespace: str, key: str) -> Optional[Any]:
+        """取出状态；进程内缓存与共享层版本一致时不读共享层的值"""
+        name = self._key(namespace, key)
+        with self._lock:
+            cached = self.memory.get(name)
+        shared_version = None
+        if self.backend is not None:
+            try:
+                shared_version = self.backend.version(name)
+            except Exception as e:
+                self._stats['errors'] += 1
+                logger.warning(f"⚠️ 读取共享对话状态失败，使用进程内缓存: {e}")
+                shared_version = cached[0] if cached else None
+        if cached is not None and (self.backend is None or cached[0] == shared_version):
+            self._stats['memory_hits'] += 1
+            return json.loads(cached[1])
+
+        if shared_version is not None:
+            try:
+                loaded = self.backend.load(name)
+            except Exception as e:
+                self._stats['errors'] += 1
+                logger.warning(f"⚠️ 读取共享对话状态失败: {e}")
+                loaded = None
+            if loaded is not None:
+                version, encoded = loaded
+                value = json.loads(encoded)
+                with self._lock:
+                    self.memory.put(name, version, encoded)
+                self._stats['shared_hits'] += 1
+                return value
+
+        loader = self._loaders.get(namespace)
+        value = loader(key) if loader else None
+        if value is None:
+            self._stats['misses'] += 1
+            return None
+        self._stats['rebuilt'] += 1
+        self.save(namespace, key, value)
+        return value
+
+    def save(self, namespace: str, key: str, value: Any):
+        """写回状态（进程内缓存 + 共享层）"""
+        name = self._key(namespace, key)
+        encoded = _encode(value)
+        version = 0
+        if self.backend is not None:
+            try:
+                version = self.backend.save(name, encoded)
+            except Exception as e:
+                self._stats['errors'] += 1
+                logger.warning(f"⚠️ 写入共享对话状态失败，仅保存在本进程: {e}")
+        with self._lock:
+            self.memory.put(name, version, encoded)
+        self._stats['saves'] += 1
+
+    def delete(self, namespace: str, key: str):
+        name = self._key(namespace, key)
+        with self._lock:
+            self.memory.discard(name)
+        if self.backend is not None:
+            try:
+                self.backend.delete(name)
+            except Exception as e:
+                self._stats['errors'] += 1
+                logger.warning(f"⚠️ 删除共享对话状态失败: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                'memory_entries': len(self.memory),
+                'memory_bytes': self.memory.bytes,
+                'backend': type(self.backend).__name__ if self.backend else None
+            }
+
+
+_store: Optional[ConversationStore] = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """本进程共享的对话状态存储"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationStore(create_backend(STORE_URL))
+                logger.info(f"💾 对话状态存储: {STORE_URL}")
+    return _store
@@ -4,12 +4,16 @@ HydroSIS MCP客户端
 用于连接和调用HydroSIS MCP服务器的18个专业水文工具
 """
 
+import json
+import base64
 import aiohttp
 import asyncio
 import logging
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, AsyncGenerator
 from datetime import datetime
 
+import mcp_codec
+
 logger = logging.getLogger(__name__)
 
 
@@ -34,6 +38,8 @@ class HydroSISMCPClient:
         self.base_url = base_url.rstrip('/')
         self.timeout = aiohttp.ClientTimeout(total=timeout)
         self.tools_cache = None
+        # 服务器通告的请求体压缩能力（收到首个响应后才压缩请求体）
+        self.server_encodings = None
         
         logger.info(f"✅ HydroSIS MCP客户端初始化: {base_url}")
     
@@ -123,18 +129,23 @@ class HydroSISMCPClient:
             if 'user_id' not in arguments:
                 arguments['user_id'] = user_id
             
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
+            body, body_headers = mcp_codec.encode_body(arguments, accept_encoding=self.server_encodings)
+            headers = mcp_codec.negotiation_headers()
+            headers.update({k: v for k, v in body_headers.items() if k != 'Accept-Encoding'})
+            
+            # 关闭自动解压：由 mcp_codec 统一处理 gzip/zstd
+            async with aiohttp.ClientSession(timeout=self.timeout, auto_decompress=False) as session:
                 async with session.post(
                     f"{self.base_url}/mcp/tools/{tool_name}",
-                    json=arguments,
-                    headers={'Content-Type': 'application/json'}
+                    data=body,
+                    headers=headers
                 ) as response:
                     if response.status == 200:
-                        result = await response.json()
+                        result = await self._read_response(response)
                         logger.info(f"✅ 工具 {tool_name} 执行成功")
                         return self._parse_mcp_result(result)
                     else:
-                        error_text = await response.text()
+                        error_text = await self._read_error(response)
                         logger.error(f"❌ 工具执行失败 ({response.status}): {error_text}")
                         raise Exception(f"工具执行失败: {error_text}")
         
@@ -204,14 +215,20 @@ class HydroSISMCPClient:
             任务状态信息，包括进度、状态、结果等
         """
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
-                async with session.get(f"{self.base_url}/tasks/{task_id}") as response:
+            async with aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=10),
+                auto_decompress=False
+            ) as session:
+                async with session.get(
+                    f"{self.base_url}/tasks/{task_id}",
+                    headers=mcp_codec.negotiation_headers()
+                ) as response:
                     if response.status == 200:
-                        return await response.json()
+                        return await self._read_response(response)
                     elif response.status == 404:
                         raise KeyError(f"任务不存在: {task_id}")
                     else:
-                        error_text = await response.text()
+                        error_text = await self._read_error(response)
                         raise Exception(f"查询任务失败: {error_text}")
         
         except KeyError:
@@ -220,22 +237,25 @@ class HydroSISMCPClient:
             logger.error(f"❌ 查询任务状态失败: {e}")
             raise
     
-    async def wait_for_task(
+    async def iter_task_updates(
         self,
         task_id: str,
         poll_interval: float = 2.0,
         max_wait: float = 600.0
-    ) -> Dict[str, Any]:
+    ) -> AsyncGenerator[Dict[str, Any], None]:
         """
-        等待任务完成
+        逐次产出任务状态（用于向前端推送进度）
+        
+        每次轮询产出一次完整状态字典，其中可能包含:
+        - progress: 进度百分比
+        - message: 当前阶段说明
+        - partial_results: 部分结果（时间序列块、校准迭代等）
+        任务进入终态（completed/failed/cancelled）后产出最后一次状态并结束。
         
         Args:
             task_id: 任务ID
             poll_interval: 轮询间隔（秒）
             max_wait: 最大等待时间（秒）
-            
-        Returns:
-            任务最终状态和结果
         """
         start_time = datetime.now()
         
@@ -248,21 +268,60 @@ class HydroSISMCPClient:
             # 查询状态
             status = await self.get_task_status(task_id)
             current_status = status.get('status')
-            progress = status.get('progress', 0)
+            progress = status.get('progress') or 0
             
             logger.info(f"⏳ 任务 {task_id}: {current_status} ({progress:.1f}%)")
             
+            yield status
+            
             # 检查是否完成
             if current_status in ['completed', 'failed', 'cancelled']:
                 if current_status == 'completed':
                     logger.info(f"✅ 任务完成: {task_id}")
                 else:
                     logger.error(f"❌ 任务失败/取消: {task_id}")
-                return status
+                return
             
             # 等待
             await asyncio.sleep(poll_interval)
     
+    async def wait_for_task(
+        self,
+        task_id: str,
+        poll_interval: float = 2.0,
+        max_wait: float = 600.0
+    ) -> Dict[str, Any]:
+        """
+        等待任务完成
+        
+        Args:
+            task_id: 任务ID
+            poll_interval: 轮询间隔（秒）
+            max_wait: 最大等待时间（秒）
+            
+        Returns:
+            任务最终状态和结果
+        """
+        status = {}
+        async for status in self.iter_task_updates(task_id, poll_interval, max_wait):
+            pass
+        return status
+    
+    async def _read_response(self, response) -> Any:
+        """按协商结果解压并解析响应（JSON/MessagePack，列式数组还原为NumPy）"""
+        if response.headers.get('Accept-Encoding'):
+            self.server_encodings = response.headers['Accept-Encoding']
+        return mcp_codec.decode_body(
+            await response.read(),
+            response.content_type,
+            response.headers.get('Content-Encoding')
+        )
+    
+    @staticmethod
+    async def _read_error(response) -> str:
+        body = mcp_codec.decompress(await response.read(), response.headers.get('Content-Encoding'))
+        return body.decode('utf-8', 'replace')
+    
     def _parse_mcp_result(self, mcp_response: Dict[str, Any]) -> Dict[str, Any]:
         """
         解析MCP标准响应格式
@@ -270,10 +329,14 @@ class HydroSISMCPClient:
         MCP响应格式:
         {
             "content": [{"type": "text", "text": "..."}],
+            "structuredContent": {...},   # 可选，结构化结果（优先使用）
             "isError": false,
             "metadata": {...}
         }
         
+        content 中也可以是 MessagePack 资源块:
+        {"type": "resource", "resource": {"mimeType": "application/msgpack", "blob": "<base64>"}}
+        
         Returns:
             解析后的结果字典
         """
@@ -281,25 +344,38 @@ class HydroSISMCPClient:
         is_error = mcp_response.get('isError', False)
         metadata = mcp_response.get('metadata', {})
         
-        # 提取文本内容
-        result_text = ""
-        for block in content_blocks:
-            if block.get('type') == 'text':
-                result_text += block.get('text', '')
-        
-        # 尝试解析JSON
-        try:
-            import json
-            result_data = json.loads(result_text) if result_text else {}
-        except:
-            result_data = {"raw_text": result_text}
+        if 'structuredContent' in mcp_response:
+            # 结构化结果无需再次解析文本
+            result_data = mcp_response['structuredContent']
+        else:
+            result_data = self._parse_content_blocks(content_blocks)
         
         return {
             "status": "error" if is_error else "success",
-            "data": result_data,
+            "data": mcp_codec.unpack_arrays(result_data),
             "metadata": metadata,
             "raw_response": mcp_response
         }
+    
+    @staticmethod
+    def _parse_content_blocks(content_blocks: List[Dict[str, Any]]) -> Any:
+        texts = []
+        for block in content_blocks:
+            if block.get('type') == 'text':
+                texts.append(block.get('text', ''))
+            elif block.get('type') == 'resource':
+                resource = block.get('resource', {})
+                if resource.get('mimeType') == mcp_codec.MSGPACK_TYPE and 'blob' in resource:
+                    return mcp_codec.decode_body(base64.b64decode(resource['blob']), mcp_codec.MSGPACK_TYPE)
+        
+        # 单个文本块直接解析，多个文本块只拼接一次
+        result_text = texts[0] if len(texts) == 1 else ''.join(texts)
+        if not result_text:
+            return {}
+        try:
+            return json.loads(result_text)
+        except ValueError:
+            return {"raw_text": result_text}
 
 
 # 工具分类常量
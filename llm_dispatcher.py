@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+"""
+大模型调用调度器
+
+两个客户端（qwen_client / qwen_client_enhanced）的每次 DashScope 调用都先在这里排队取额度：
+    - 额度：请求数（RPM/QPS）+ token 数（TPM）双令牌桶，按估算 token 预取、返回后按实际用量结算；
+      默认每个进程分摊账号配额（rate_limiter.py），配置 LLM_DISPATCH_SHARED 后同机多进程共用一份额度
+    - 优先级：interactive（网页对话）> wechat（公众号）> batch（批量摘要等后台任务），
+      同级按到达顺序；只有队首能取额度，低优先级不会插到高优先级前面。
+      batch 只在 token 桶余量高于 LLM_BATCH_RESERVE 时才发出，给交互请求留出突发空间
+    - 并发：本进程同时在途的调用不超过 LLM_MAX_IN_FLIGHT（流式调用直到读完才释放）
+    - 限流冷却：任一调用收到 429 时整个调度器暂停（服从 Retry-After，否则指数递增），
+      所有排队请求一起等待，而不是各自重试形成重试风暴
+    - 指标：各优先级的排队时间（p50/p95/max）、超时数、当前队列长度和在途数，见 /api/health
+
+配置（LLM_DISPATCH_SHARED）:
+    空                              默认，每进程按 DASHSCOPE_PROCESSES 分摊账号配额
+    sqlite:///llm_budget.db         同机多个 Gunicorn 进程共享额度和冷却状态（在途上限仍按进程计）
+"""
+
+import os
+import time
+import heapq
+import sqlite3
+import asyncio
+import logging
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any
+
+from rate_limiter import (
+    RateLimitTimeout, RATE_LIMIT_WAIT, DASHSCOPE_QPS, DASHSCOPE_TPM, get_limiter
+)
+
+logger = logging.getLogger(__name__)
+
+
+# 优先级从高到低
+PRIORITIES = ('interactive', 'wechat', 'batch')
+PRIORITY_RANK = {name: rank for rank, name in enumerate(PRIORITIES)}
+
+SHARED_URL = os.environ.get('LLM_DISPATCH_SHARED', '')
+# 本进程同时在途的调用数上限
+MAX_IN_FLIGHT = int(os.environ.get('LLM_MAX_IN_FLIGHT', '8'))
+# batch 调用发出后 token 桶至少保留的比例（留给交互请求）
+BATCH_RESERVE = float(os.environ.get('LLM_BATCH_RESERVE', '0.2'))
+# 排队超时（秒）：交互和微信沿用 DASHSCOPE_RATE_LIMIT_WAIT，后台任务可以等更久
+QUEUE_TIMEOUTS = {
+    'interactive': RATE_LIMIT_WAIT,
+    'wechat': RATE_LIMIT_WAIT,
+    'batch': float(os.environ.get('LLM_BATCH_QUEUE_TIMEOUT', '600'))
+}
+# 429 冷却：无 Retry-After 时从 COOLDOWN_BASE 秒起按连续次数翻倍，最多 LLM_COOLDOWN_MAX 秒
+COOLDOWN_BASE = 1.0
+COOLDOWN_MAX = float(os.environ.get('LLM_COOLDOWN_MAX', '30'))
+# 每个优先级保留最近多少次排队时间用于计算分位数
+QUEUE_SAMPLES = 500
+
+
+class SQLiteBudget:
+    """
+    同机多进程共享的请求 + token 额度
+
+    两个令牌桶和冷却截止时间各占 llm_budget 表的一行，每次取额度在 BEGIN IMMEDIATE 事务中
+    补充、判断、扣减，多个进程的调度器看到同一份余额。接口与 ModelRateLimiter 相同。
+    """
+
+    def __init__(self, path: str, qps: float, tpm: float):
+        self.path = path
+        self.qps = qps
+        self.tpm = tpm
+        self.capacity = {'requests': max(1.0, qps), 'tokens': tpm}
+        self.rate = {'requests': qps, 'tokens': tpm / 60.0}
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_budget (
+                name TEXT PRIMARY KEY,
+                level REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        ''')
+        now = time.time()
+        conn.executemany(
+            'INSERT OR IGNORE INTO llm_budget (name, level, updated) VALUES (?, ?, ?)',
+            [('requests', self.capacity['requests'], now), ('tokens', self.capacity['tokens'], now), ('pause', 0.0, now)]
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None：事务由 BEGIN IMMEDIATE 显式控制
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _levels(self, conn: sqlite3.Connection, now: float) -> Dict[str, float]:
+        """读取各行并按经过的时间补充两个令牌桶（pause 行为冷却截止的时间戳）"""
+        levels = {}
+        for name, level, updated in conn.execute('SELECT name, level, updated FROM llm_budget'):
+            if name in self.rate:
+                level = min(self.capacity[name], level + max(0.0, now - updated) * self.rate[name])
+            levels[name] = level
+        return levels
+
+    def _store(self, conn: sqlite3.Connection, levels: Dict[str, float], now: float):
+        conn.executemany(
+            'UPDATE llm_budget SET level = ?, updated = ? WHERE name = ?',
+            [(levels[name], now, name) for name in self.rate]
+        )
+
+    def try_take(self, estimated_tokens: int = 0, reserve: float = 0.0) -> float:
+        """不等待地取出 1 个请求和 estimated_tokens 个 token，返回 0 或还需等待的秒数"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            levels = self._levels(conn, now)
+            if levels['pause'] > now:
+                conn.execute('ROLLBACK')
+                return levels['pause'] - now
+            amount = min(float(estimated_tokens), self.capacity['tokens'])
+            needed = min(amount + reserve, self.capacity['tokens']) if amount > 0 else 0.0
+            wait = max(0.0, (needed - levels['tokens']) / self.rate['tokens'])
+            if wait == 0.0 and levels['requests'] < 1.0:
+                wait = (1.0 - levels['requests']) / self.rate['requests']
+            if wait > 0:
+                conn.execute('ROLLBACK')
+                return wait
+            levels['requests'] -= 1.0
+            levels['tokens'] -= amount
+            self._store(conn, levels, now)
+            conn.execute('COMMIT')
+            return 0.0
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """按实际用量多退少补（余额可以为负）"""
+        if actual_tokens is None:
+            return
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            levels = self._levels(conn, now)
+            levels['tokens'] = min(self.capacity['tokens'], levels['tokens'] - (actual_tokens - estimated_tokens))
+            self._store(conn, levels, now)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def pause(self, seconds: float):
+        """所有共享进程暂停发出调用 seconds 秒（已有更晚的截止时间时不缩短）"""
+        self._connection().execute(
+            'UPDATE llm_budget SET level = MAX(level, ?) WHERE name = ?', (time.time() + seconds, 'pause')
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        levels = self._levels(self._connection(), time.time())
+        return {
+            'shared': self.path,
+            'qps': self.qps,
+            'tpm': round(self.tpm),
+            'available_requests': round(levels['requests'], 2),
+            'available_tokens': round(levels['tokens'])
+        }
+
+
+class Ticket:
+    """一次已放行的调用：持有在途名额，调用结束后 release 结算 token 并归还名额"""
+
+    def __init__(self, dispatcher: 'LLMDispatcher', priority: str, estimated_tokens: int):
+        self.dispatcher = dispatcher
+        self.priority = priority
+        self.estimated_tokens = estimated_tokens
+        self.enqueued = time.monotonic()
+        self.queue_time = 0.0
+        self.throttled = False
+        self.released = False
+
+    def throttle(self, retry_after: Optional[float] = None):
+        """本次调用收到 429：通知调度器整体冷却"""
+        self.throttled = True
+        self.dispatcher.backoff(retry_after)
+
+    def release(self, actual_tokens: Optional[int] = None):
+        """
+        归还在途名额（重复调用无效）
+
+        Args:
+            actual_tokens: 实际用量，给出时按它结算预取的 token
+        """
+        if self.released:
+            return
+        self.released = True
+        if actual_tokens is not None:
+            self.dispatcher.settle(self.estimated_tokens, actual_tokens)
+        self.dispatcher._release(self)
+
+
+class PriorityStats:
+    """单个优先级的排队统计"""
+
+    def __init__(self):
+        self.admitted = 0
+        self.timeouts = 0
+        self.waited = 0.0
+        self.samples = deque(maxlen=QUEUE_SAMPLES)
+
+    def get_stats(self, queued: int) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+
+        def percentile(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 4)
+
+        return {
+            'queued': queued,
+            'admitted': self.admitted,
+            'timeouts': self.timeouts,
+            'queue_seconds_total': round(self.waited, 3),
+            'queue_p50': percentile(0.5),
+            'queue_p95': percentile(0.95),
+            'queue_max': round(ordered[-1], 4) if ordered else 0.0
+        }
+
+
+class LLMDispatcher:
+    """
+    按优先级排队的大模型调用调度器（线程安全）
+
+    等待者按 (优先级, 到达序号) 放在堆中，只有堆顶尝试取额度；堆顶取不到时在条件变量上等待
+    预计的补充时间，期间有更高优先级的请求到达会成为新的堆顶。
+    """
+
+    def __init__(self, budget, max_in_flight: int = MAX_IN_FLIGHT, shared: bool = False):
+        self.budget = budget
+        self.max_in_flight = max(1, max_in_flight)
+        self.shared = shared
+        self.in_flight = 0
+        self.throttled = 0
+        self._queue: List = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._paused_until = 0.0
+        self._strikes = 0
+        self._stats = {name: PriorityStats() for name in PRIORITIES}
+
+    def acquire(
+        self,
+        estimated_tokens: int = 0,
+        priority: str = 'interactive',
+        timeout: Optional[float] = None,
+        cancelled: Optional[threading.Event] = None
+    ) -> Ticket:
+        """
+        排队直到可以发出调用
+
+        Args:
+            estimated_tokens: 预估的 token 数（输入 + 输出上限），重试时传 0 只占请求数
+            priority: interactive / wechat / batch
+            timeout: 最长排队秒数（默认按优先级取 QUEUE_TIMEOUTS）
+            cancelled: 调用方放弃时置位，排队中的请求随即出队（置位后需 notify 调度器，见 acquire_async）
+
+        Raises:
+            RateLimitTimeout: 超时仍未放行或已被取消
+        """
+        if priority not in PRIORITY_RANK:
+            raise ValueError(f"未知的调用优先级: {priority}")
+        timeout = QUEUE_TIMEOUTS[priority] if timeout is None else timeout
+        ticket = Ticket(self, priority, estimated_tokens)
+        entry = (PRIORITY_RANK[priority], next(self._seq), ticket)
+        deadline = ticket.enqueued + timeout
+        reserve = self.budget_capacity() * BATCH_RESERVE if priority == 'batch' else 0.0
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            self._cond.notify_all()
+            try:
+                while True:
+                    if cancelled is not None and cancelled.is_set():
+                        raise RateLimitTimeout(f"大模型调用排队已取消（{priority}）")
+                    wait = self._try_admit(entry, reserve)
+                    if wait == 0.0:
+                        break
+                    remaining = deadline - time.monotonic()
+                    # 已是队首且预计等待超过剩余时间时直接失败，不必空等到超时
+                    if remaining <= 0 or (self._queue[0] is entry and wait > remaining):
+                        self._stats[priority].timeouts += 1
+                        raise RateLimitTimeout(
+                            f"大模型调用排队超时（{priority}，已等待 {time.monotonic() - ticket.enqueued:.1f} 秒）"
+                        )
+                    self._cond.wait(min(wait, remaining, 1.0))
+            except BaseException:
+                if entry in self._queue:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self._cond.notify_all()
+                raise
+            ticket.queue_time = time.monotonic() - ticket.enqueued
+            stats = self._stats[priority]
+            stats.admitted += 1
+            stats.waited += ticket.queue_time
+            stats.samples.append(ticket.queue_time)
+        if ticket.queue_time > 0.5:
+            logger.info(f"⏳ 大模型调用排队 {ticket.queue_time:.1f} 秒（{priority}）")
+        return ticket
+
+    def _try_admit(self, entry, reserve: float) -> float:
+        """持有锁时调用：放行则出队并占用在途名额返回 0，否则返回建议等待的秒数"""
+        if self._queue[0] is not entry or self.in_flight >= self.max_in_flight:
+            return 1.0  # 等队首放行或在途调用结束时的通知
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            return pause
+        wait = self.budget.try_take(entry[2].estimated_tokens, reserve)
+        if wait > 0:
+            return wait
+        heapq.heappop(self._queue)
+        self.in_flight += 1
+        self._cond.notify_all()
+        return 0.0
+
+    async def acquire_async(
+        self,
+        estimated_tokens: int = 0,
+        priority: str = 'interactive',
+        timeout: Optional[float] = None
+    ) -> Ticket:
+        """acquire 的协程版本（在线程池中排队，不阻塞事件循环）"""
+        loop = asyncio.get_running_loop()
+        cancelled = threading.Event()
+        guard = threading.Lock()
+        admitted = []
+
+        def queue() -> Ticket:
+            ticket = self.acquire(estimated_tokens, priority, timeout, cancelled)
+            with guard:
+                if cancelled.is_set():
+                    ticket.release(0)
+                else:
+                    admitted.append(ticket)
+            return ticket
+
+        future = loop.run_in_executor(None, queue)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # 调用方已放弃（客户端断开）：排队中的请求立即出队，已放行的名额直接归还。
+            # 不依赖事件循环回调，调用方的私有循环随后关闭也不会漏还名额
+            with guard:
+                cancelled.set()
+            future.cancel()
+            with self._cond:
+                self._cond.notify_all()
+            for ticket in admitted:
+                ticket.release(0)
+            raise
+
+    @contextmanager
+    def slot(self, estimated_tokens: int = 0, priority: str = 'interactive', timeout: Optional[float] = None):
+        """排队取得名额，with 块结束时归还（块内可调用 ticket.release(实际用量) 提前结算）"""
+        ticket = self.acquire(estimated_tokens, priority, timeout)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def _release(self, ticket: Ticket):
+        with self._cond:
+            self.in_flight -= 1
+            if not ticket.throttled:
+                self._strikes = 0
+            self._cond.notify_all()
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """响应返回后按实际用量结算预取的 token"""
+        self.budget.settle(estimated_tokens, actual_tokens)
+
+    def backoff(self, retry_after: Optional[float] = None):
+        """
+        收到 429 后暂停放行
+
+        Args:
+            retry_after: 服务端要求的等待秒数；没有时按连续 429 次数指数递增
+        """
+        with self._cond:
+            self.throttled += 1
+            now = time.monotonic()
+            # 冷却期间陆续返回的 429 来自冷却前发出的请求，只按服务端要求延长，不再翻倍
+            if now >= self._paused_until:
+                self._strikes += 1
+            elif not retry_after:
+                return
+            delay = retry_after if retry_after else COOLDOWN_BASE * 2 ** (self._strikes - 1)
+            delay = min(max(delay, 0.0), COOLDOWN_MAX)
+            self._paused_until = max(self._paused_until, now + delay)
+        if self.shared:
+            self.budget.pause(delay)
+        logger.warning(f"🧊 大模型调用被限流，暂停放行 {delay:.1f} 秒（排队 {len(self._queue)} 个）")
+
+    def budget_capacity(self) -> float:
+        """token 桶容量（用于计算 batch 的预留量）"""
+        if self.shared:
+            return self.budget.capacity['tokens']
+        return self.budget.tokens.capacity
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            queued = {name: 0 for name in PRIORITIES}
+            for _, _, ticket in self._queue:
+                queued[ticket.priority] += 1
+            return {
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'throttled': self.throttled,
+                'paused_seconds': round(max(0.0, self._paused_until - time.monotonic()), 2),
+                'budget': self.budget.get_stats(),
+                'priorities': {name: self._stats[name].get_stats(queued[name]) for name in PRIORITIES}
+            }
+
+
+_dispatcher: Optional[LLMDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> LLMDispatcher:
+    """本进程共享的大模型调用调度器"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                if SHARED_URL.startswith('sqlite:///'):
+                    budget = SQLiteBudget(SHARED_URL[len('sqlite:///'):], DASHSCOPE_QPS, DASHSCOPE_TPM)
+                    logger.info(f"🚦 大模型调度: 共享额度 {SHARED_URL}，在途上限 {MAX_IN_FLIGHT}（每进程）")
+                    _dispatcher = LLMDispatcher(budget, shared=True)
+                else:
+                    if SHARED_URL:
+                        logger.warning(f"⚠️ 不支持的调度共享层 {SHARED_URL}，改为每进程分摊额度")
+                    _dispatcher = LLMDispatcher(get_limiter())
+                    logger.info(f"🚦 大模型调度: 在途上限 {MAX_IN_FLIGHT}（每进程）")
+    return _dispatcher
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+MCP载荷编解码
+内容协商（JSON/MessagePack + gzip/zstd压缩）和数值序列的列式二进制编码
+
+数值数组编码为:
+    {"__ndarray__": <小端字节，JSON中为base64>, "dtype": "<f8", "shape": [n]}
+解码时直接还原为NumPy数组（未安装NumPy时还原为列表）。
+Python 列表无损编码：整数列表为 int64，含小数的列表为 float64；只有调用方显式指定的字段才降为 float32。
+"""
+
+import gzip
+import json
+import zlib
+import base64
+import struct
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+
+JSON_TYPE = 'application/json'
+MSGPACK_TYPE = 'application/msgpack'
+ARRAY_HEADER = 'X-MCP-Array-Encoding'
+ARRAY_ENCODING = 'columnar'
+
+# 小于该长度的数值列表保持原样（编码开销不划算）
+MIN_ARRAY_LENGTH = 64
+# 小于该字节数的请求/响应体不压缩
+COMPRESS_THRESHOLD = 4096
+
+_STRUCT_CODES = {
+    'f4': 'f', 'f8': 'd', 'i1': 'b', 'u1': 'B', 'i2': 'h', 'u2': 'H',
+    'i4': 'i', 'u4': 'I', 'i8': 'q', 'u8': 'Q'
+}
+
+
+def supported_encodings() -> list:
+    """本端支持的压缩算法（按优先级）"""
+    return (['zstd'] if ZSTD_AVAILABLE else []) + ['gzip']
+
+
+def negotiation_headers() -> Dict[str, str]:
+    """客户端请求头：声明可接受的格式、压缩和数组编码"""
+    return {
+        'Accept': f'{MSGPACK_TYPE}, {JSON_TYPE}' if MSGPACK_AVAILABLE else JSON_TYPE,
+        'Accept-Encoding': ', '.join(supported_encodings()),
+        ARRAY_HEADER: ARRAY_ENCODING
+    }
+
+
+# ==================== 数组编码 ====================
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+
+def _list_dtype(value) -> Optional[str]:
+    """
+    长数值列表的无损编码类型：全部为整数（int64 范围内）时 '<i8'，全部为数值时 '<f8'，否则 None
+
+    逐个检查所有元素，中间夹有字符串、None、布尔或超出 int64 的整数时保持原样
+    """
+    if len(value) < MIN_ARRAY_LENGTH:
+        return None
+    integers = True
+    for item in value:
+        if isinstance(item, bool) or not isinstance(item, (int, float)):
+            return None
+        if isinstance(item, int):
+            if not INT64_MIN <= item <= INT64_MAX:
+                return None
+        else:
+            integers = False
+    return '<i8' if integers else '<f8'
+
+
+def pack_arrays(obj, binary: bool = False, float32_fields=(), _field: Optional[str] = None):
+    """
+    将长数值序列替换为列式数组块
+
+    Args:
+        obj: 任意JSON结构（可包含NumPy数组）
+        binary: True时保留原始字节（MessagePack），False时使用base64（JSON）
+        float32_fields: 允许降为 float32 的字段名（只作用于这些键下的小数列表，如绘图用的水位序列）；
+            其他 Python 列表无损编码，NumPy 数组保留自身精度
+    """
+    if isinstance(obj, dict):
+        return {key: pack_arrays(value, binary, float32_fields, key) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        dtype = _list_dtype(obj) if NUMPY_AVAILABLE else None
+        if dtype is not None:
+            if dtype == '<f8' and _field in float32_fields:
+                dtype = '<f4'
+            return _array_block(np.asarray(obj, dtype=dtype), binary)
+        return [pack_arrays(value, binary, float32_fields, _field) for value in obj]
+    if NUMPY_AVAILABLE and isinstance(obj, np.ndarray):
+        if obj.dtype.kind in 'fiu':
+            return _array_block(obj, binary)
+        return obj.tolist()
+    if NUMPY_AVAILABLE and isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def _array_block(array, binary: bool) -> Dict[str, Any]:
+    array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+    data = array.tobytes()
+    return {
+        '__ndarray__': data if binary else base64.b64encode(data).decode('ascii'),
+        'dtype': array.dtype.str,
+        'shape': list(array.shape)
+    }
+
+
+def unpack_arrays(obj):
+    """还原列式数组块为NumPy数组（未安装NumPy时为列表）"""
+    if isinstance(obj, dict):
+        if '__ndarray__' in obj:
+            return _decode_array_block(obj)
+        return {key: unpack_arrays(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [unpack_arrays(value) for value in obj]
+    return obj
+
+
+def _decode_array_block(block: Dict[str, Any]):
+    data = block['__ndarray__']
+    if isinstance(data, str):
+        data = base64.b64decode(data)
+    if NUMPY_AVAILABLE:
+        return np.frombuffer(data, dtype=np.dtype(block['dtype'])).reshape(block['shape'])
+
+    # 无NumPy时按struct解码为一维列表
+    code = _STRUCT_CODES[block['dtype'].lstrip('<|')]
+    return list(struct.unpack(f'<{len(data) // struct.calcsize(code)}{code}', data))
+
+
+def to_jsonable(obj):
+    """将NumPy数组/标量转换为可直接json.dumps的结构（用于前端和LLM）"""
+    if isinstance(obj, dict):
+        return {key: to_jsonable(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_jsonable(value) for value in obj]
+    if NUMPY_AVAILABLE and isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    return obj
+
+
+def json_default(obj):
+    """json.dumps 的 default 钩子"""
+    if NUMPY_AVAILABLE and isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# ==================== 压缩 ====================
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=5)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return data
+
+
+def decompress(data: bytes, encoding: Optional[str]) -> bytes:
+    if not encoding or encoding == 'identity':
+        return data
+    if encoding == 'gzip':
+        return gzip.decompress(data)
+    if encoding == 'deflate':
+        return zlib.decompress(data)
+    if encoding == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise ValueError("响应使用zstd压缩，但未安装zstandard")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"不支持的压缩格式: {encoding}")
+
+
+def make_decompressor(encoding: Optional[str]):
+    """流式解压器（用于NDJSON等分块响应），返回带 decompress(chunk) 方法的对象"""
+    if encoding == 'gzip':
+        return zlib.decompressobj(wbits=31)
+    if encoding == 'deflate':
+        return zlib.decompressobj()
+    if encoding == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise ValueError("响应使用zstd压缩，但未安装zstandard")
+        return zstandard.ZstdDecompressor().decompressobj()
+    return _Passthrough()
+
+
+def compress_stream(chunks, encoding: Optional[str]):
+    """
+    流式压缩（服务端NDJSON响应），每个分块后同步刷新，客户端可逐行解压
+
+    Args:
+        chunks: 字节串或字符串迭代器
+        encoding: gzip / zstd / None
+    """
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(5, zlib.DEFLATED, 31)
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+    elif encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        flush = lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+    else:
+        compressor = None
+
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if compressor is None:
+            yield chunk
+        else:
+            yield compressor.compress(chunk) + flush()
+
+    if compressor is not None:
+        yield compressor.flush()
+
+
+class _Passthrough:
+    @staticmethod
+    def decompress(data: bytes) -> bytes:
+        return data
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """从对端 Accept-Encoding 中选择双方都支持的压缩算法"""
+    if not accept_encoding:
+        return None
+    offered = {item.split(';')[0].strip().lower() for item in accept_encoding.split(',')}
+    for encoding in supported_encodings():
+        if encoding in offered:
+            return encoding
+    return None
+
+
+# ==================== 请求/响应 ====================
+
+def encode_body(
+    obj,
+    accept: Optional[str] = None,
+    accept_encoding: Optional[str] = None,
+    array_encoding: Optional[str] = None,
+    float32_fields=()
+) -> Tuple[bytes, Dict[str, str]]:
+    """
+    按对端声明的能力编码消息体
+
+    Args:
+        obj: 要发送的数据
+        accept: 对端 Accept 头
+        accept_encoding: 对端 Accept-Encoding 头（请求方向为服务端通告的能力）
+        array_encoding: 对端 X-MCP-Array-Encoding 头
+        float32_fields: 列式编码时允许降为 float32 的字段名（见 pack_arrays）
+
+    Returns:
+        (消息体, 需要附加的HTTP头)
+    """
+    use_msgpack = MSGPACK_AVAILABLE and accept is not None and MSGPACK_TYPE in accept
+    if array_encoding == ARRAY_ENCODING:
+        obj = pack_arrays(obj, binary=use_msgpack, float32_fields=float32_fields)
+
+    headers = {'Accept-Encoding': ', '.join(supported_encodings())}
+    if use_msgpack:
+        body = msgpack.packb(obj, default=json_default, use_bin_type=True)
+        headers['Content-Type'] = MSGPACK_TYPE
+    else:
+        body = json.dumps(obj, ensure_ascii=False, default=json_default).encode('utf-8')
+        headers['Content-Type'] = f'{JSON_TYPE}; charset=utf-8'
+
+    encoding = choose_encoding(accept_encoding)
+    if encoding and len(body) >= COMPRESS_THRESHOLD:
+        body = compress(body, encoding)
+        headers['Content-Encoding'] = encoding
+
+    return body, headers
+
+
+def decode_body(body: bytes, content_type: Optional[str], content_encoding: Optional[str] = None):
+    """解压并解析消息体，列式数组块还原为NumPy数组"""
+    body = decompress(body, content_encoding)
+    if content_type and content_type.startswith(MSGPACK_TYPE):
+        obj = msgpack.unpackb(body, raw=False)
+    else:
+        obj = json.loads(body) if body else {}
+    return unpack_arrays(obj)
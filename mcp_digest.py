@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+"""
+MCP结果降采样与摘要
+
+工具结果里的长时间序列不直接交给模型和前端：
+    - 模型：每个序列几十个点（LTTB，首末点和全局极值点必选）+ 统计量（最值及出现位置、均值）
+    - 前端：按屏幕宽度分桶，每桶保留最小、最大值（min/max 抽取），曲线形状和峰谷不丢失
+完整结果保存在 ResultStore 中，摘要里带引用ID，前端可按路径取回全分辨率数据。
+
+识别的序列形式：
+    - 等长数值列组成的字典（如 {'time': [...], 'water_level': [...]}）
+    - 带横轴字段的记录列表（如 [{'hour': 0, 'flow': ...}, ...]）
+    - 等间距单调的独立数值列（如时间轴）在模型摘要中压缩为 {start, step, count}
+没有自带横轴的序列沿用最近一层上级的横轴（如结果顶层的 hours），降采样后在该序列旁补上选中的横轴值。
+原有结构和字段名不变，只减少点数；降采样信息统一放在顶层 '_digest' 中。
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# 模型和前端的点数预算（每个序列）；模型摘要另有总点数上限，序列多时平均分配（每个不少于 MIN_POINTS）
+LLM_POINTS = int(os.environ.get('MCP_DIGEST_LLM_POINTS', '32'))
+LLM_TOTAL_POINTS = int(os.environ.get('MCP_DIGEST_LLM_TOTAL_POINTS', '400'))
+UI_POINTS = int(os.environ.get('MCP_DIGEST_UI_POINTS', '1200'))
+MIN_POINTS = 8
+# 作为横轴的列名（按优先级）
+X_KEYS = ('time', 'hour', 'hours', 'timestamp', 't', 'x', 'km', 'step')
+# 完整结果的保存个数和时长（秒）
+STORE_SIZE = int(os.environ.get('MCP_RESULT_STORE_SIZE', '200'))
+STORE_TTL = float(os.environ.get('MCP_RESULT_STORE_TTL', '3600'))
+
+
+# ==================== 抽取算法 ====================
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets：首末点固定，中间每桶取与前一选中点、后一桶均值点
+    构成三角形面积最大的点
+
+    Returns:
+        选中点的下标（升序）
+    """
+    length = len(y)
+    if n >= length or n < 3:
+        return np.arange(length) if n >= length else np.array([0, length - 1])
+    edges = np.linspace(1, length - 1, n - 1).astype(np.int64)
+    selected = np.empty(n, dtype=np.int64)
+    selected[0], selected[-1] = 0, length - 1
+    previous = 0
+    for i in range(n - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        if i + 2 < n - 1:
+            following = slice(edges[i + 1], max(edges[i + 2], edges[i + 1] + 1))
+            cx, cy = x[following].mean(), y[following].mean()
+        else:
+            cx, cy = x[-1], y[-1]
+        ax, ay = x[previous], y[previous]
+        area = np.abs((ax - cx) * (y[start:end] - ay) - (ax - x[start:end]) * (cy - ay))
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    return selected
+
+
+def minmax_indices(y: np.ndarray, n: int) -> np.ndarray:
+    """
+    分桶最值抽取：n/2 个等宽桶，每桶保留最小值和最大值所在点（再加首末点）
+
+    Returns:
+        选中点的下标（升序）
+    """
+    length = len(y)
+    buckets = max(1, n // 2)
+    if n >= length:
+        return np.arange(length)
+    edges = np.linspace(0, length, buckets + 1).astype(np.int64)
+    bucket = np.repeat(np.arange(buckets), np.diff(edges))
+    # 按 (桶, 值) 排序后每桶的第一个/最后一个即为该桶最小/最大值
+    order = np.lexsort((y, bucket))
+    starts = edges[:-1]
+    ends = edges[1:] - 1
+    return np.unique(np.concatenate((order[starts], order[ends], [0, length - 1])))
+
+
+METHODS = {'lttb', 'minmax'}
+
+
+def _clean(values: np.ndarray) -> np.ndarray:
+    """非有限值按均值填充（只影响选点，不改原数据）"""
+    finite = np.isfinite(values)
+    if finite.all():
+        return values
+    return np.where(finite, values, values[finite].mean() if finite.any() else 0.0)
+
+
+def select_indices(columns: Dict[str, np.ndarray], x: Optional[np.ndarray], budget: int, method: str) -> np.ndarray:
+    """
+    多列共用的选中下标：每列分到 budget/列数 个点，取并集；每列的全局最值点始终保留
+    """
+    length = len(next(iter(columns.values())))
+    if length <= budget:
+        return np.arange(length)
+    axis = np.arange(length, dtype=np.float64) if x is None else _clean(x.astype(np.float64))
+    per_column = max(4, budget // max(len(columns), 1))
+    chosen = [np.array([0, length - 1])]
+    for values in columns.values():
+        values = _clean(values.astype(np.float64))
+        if method == 'lttb':
+            chosen.append(lttb_indices(axis, values, per_column))
+        else:
+            chosen.append(minmax_indices(values, per_column))
+        chosen.append(np.array([np.argmin(values), np.argmax(values)]))
+    return np.unique(np.concatenate(chosen))
+
+
+# ==================== 结果遍历 ====================
+
+def _numeric_array(value) -> Optional[np.ndarray]:
+    """数值列表/一维数组 → ndarray，否则 None"""
+    if isinstance(value, np.ndarray):
+        return value if value.ndim == 1 and value.dtype.kind in 'fiu' else None
+    if isinstance(value, (list, tuple)) and value:
+        first, last = value[0], value[-1]
+        if isinstance(first, (int, float)) and not isinstance(first, bool) \
+                and isinstance(last, (int, float)) and not isinstance(last, bool):
+            try:
+                return np.asarray(value, dtype=np.float64)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def _regular_axis(values: np.ndarray) -> Optional[Dict[str, float]]:
+    """等间距单调序列 → {start, step, count}"""
+    if len(values) < 3:
+        return None
+    steps = np.diff(values.astype(np.float64))
+    if steps[0] == 0 or not np.allclose(steps, steps[0], rtol=1e-6, atol=1e-9):
+        return None
+    return {'start': _number(values[0]), 'step': _number(steps[0]), 'count': int(len(values))}
+
+
+def _number(value) -> Any:
+    value = float(value)
+    if not np.isfinite(value):
+        return None
+    return int(value) if value.is_integer() and abs(value) < 2 ** 53 else round(value, 6)
+
+
+def _statistics(columns: Dict[str, np.ndarray], x: Optional[np.ndarray]) -> Dict[str, Dict[str, Any]]:
+    stats = {}
+    for name, values in columns.items():
+        values = values.astype(np.float64)
+        finite = np.isfinite(values)
+        if not finite.any():
+            continue
+        low = int(np.nanargmin(np.where(finite, values, np.nan)))
+        high = int(np.nanargmax(np.where(finite, values, np.nan)))
+        at = (lambda i: _number(x[i])) if x is not None else (lambda i: i)
+        stats[name] = {
+            'min': _number(values[low]),
+            'min_at': at(low),
+            'max': _number(values[high]),
+            'max_at': at(high),
+            'mean': _number(values[finite].mean())
+        }
+    return stats
+
+
+def _x_key(keys) -> Optional[str]:
+    for key in X_KEYS:
+        if key in keys:
+            return key
+    return None
+
+
+class _Digester:
+    """按预算递归降采样，记录每个被处理的序列"""
+
+    def __init__(self, budget: int, method: str, statistics: bool, compact_axes: bool):
+        if method not in METHODS:
+            raise ValueError(f"未知的降采样方法: {method}")
+        self.budget = max(3, int(budget))
+        self.method = method
+        self.statistics = statistics
+        self.compact_axes = compact_axes
+        self.series: Dict[str, Dict[str, Any]] = {}
+
+    def walk(self, value, path: str, axis: Optional[Tuple[str, np.ndarray]] = None):
+        """axis: 上级的横轴 (列名, 数值)"""
+        if isinstance(value, dict):
+            return self._dict(value, path, axis)
+        if isinstance(value, (list, tuple)):
+            if value and all(isinstance(item, dict) for item in value):
+                return self._records(value, path, axis)
+            if _numeric_array(value) is None:
+                return [self.walk(item, f'{path}.{i}', axis) for i, item in enumerate(value)]
+        return value
+
+    def _record(self, path: str, columns: Dict[str, np.ndarray], x: Optional[np.ndarray], x_key: Optional[str], index: np.ndarray):
+        entry = {
+            'method': self.method,
+            'original_points': int(len(next(iter(columns.values())))),
+            'points': int(len(index))
+        }
+        if x_key:
+            entry['x'] = x_key
+        elif len(index) < entry['original_points']:
+            entry['index'] = index.tolist()
+        if self.statistics:
+            entry['statistics'] = _statistics(columns, x)
+        self.series[path or '.'] = entry
+
+    def _dict(self, value: Dict[str, Any], path: str, axis: Optional[Tuple[str, np.ndarray]]) -> Dict[str, Any]:
+        arrays = {key: array for key, array in ((k, _numeric_array(v)) for k, v in value.items()) if array is not None}
+        own_axis = _x_key(arrays)
+        if own_axis:
+            axis = (own_axis, arrays[own_axis])
+        # 同一长度、超出预算的数值列视为一张表
+        lengths = {}
+        for key, array in arrays.items():
+            lengths.setdefault(len(array), []).append(key)
+        tables = {length: keys for length, keys in lengths.items() if length > self.budget}
+
+        result = {}
+        handled = set()
+        for length, keys in tables.items():
+            x_key = _x_key(keys)
+            columns = {key: arrays[key] for key in keys if key != x_key}
+            x = arrays[x_key] if x_key else None
+            inherited = x is None and axis is not None and len(axis[1]) == length and axis[0] not in value
+            if inherited:
+                x_key, x = axis
+            if not columns:
+                # 只有横轴：模型摘要中等间距轴压缩为 {start, step, count}
+                compact = _regular_axis(x) if self.compact_axes else None
+                if compact is not None:
+                    result[x_key] = compact
+                    handled.add(x_key)
+                continue
+            index = select_indices(columns, x, self.budget, self.method)
+            for key in keys:
+                result[key] = self._take(value[key], index)
+                handled.add(key)
+            if inherited and len(index) < length:
+                result[x_key] = [_number(v) for v in x[index]]
+            self._record(f'{path}.{"/".join(keys)}' if len(tables) > 1 else path, columns, x, x_key, index)
+
+        # 单独的等间距数值列（如结果顶层的 hours）
+        for key, array in arrays.items():
+            if key in handled or len(array) <= self.budget or len(lengths[len(array)]) > 1:
+                continue
+            compact = _regular_axis(array) if self.compact_axes else None
+            if compact is not None:
+                result[key] = compact
+                handled.add(key)
+
+        for key, item in value.items():
+            if key not in handled:
+                result[key] = self.walk(item, f'{path}.{key}' if path else key, axis)
+        ordered = {key: result.pop(key) for key in value}
+        ordered.update(result)
+        return ordered
+
+    def _records(self, value: List[Dict[str, Any]], path: str, axis: Optional[Tuple[str, np.ndarray]]):
+        if len(value) <= self.budget:
+            return [self.walk(item, f'{path}.{i}', axis) for i, item in enumerate(value)]
+        fields = [
+            key for key, item in value[0].items()
+            if isinstance(item, (int, float)) and not isinstance(item, bool)
+        ]
+        fields = [key for key in fields if all(isinstance(record.get(key), (int, float)) for record in value)]
+        if not fields:
+            return [self.walk(item, f'{path}.{i}', axis) for i, item in enumerate(value)]
+        # 只抽取带横轴字段的扁平记录（逐时刻/逐断面结果）；设施清单等含嵌套结构的记录逐条处理
+        x_key = _x_key(fields)
+        flat = all(not isinstance(item, (dict, list, tuple)) for item in value[0].values())
+        if x_key is None or not flat or len(fields) < 2:
+            return [self.walk(item, f'{path}.{i}', axis) for i, item in enumerate(value)]
+        x = np.array([record[x_key] for record in value], dtype=np.float64)
+        columns = {
+            key: np.array([record[key] for record in value], dtype=np.float64)
+            for key in fields if key != x_key
+        }
+        index = select_indices(columns, x, self.budget, self.method)
+        self._record(path, columns, x, x_key, index)
+        return [value[i] for i in index]
+
+    @staticmethod
+    def _take(value, index: np.ndarray):
+        if isinstance(value, np.ndarray):
+            return value[index]
+        return [value[i] for i in index]
+
+
+def digest(
+    result: Any,
+    budget: int,
+    method: str = 'lttb',
+    statistics: bool = False,
+    compact_axes: bool = False,
+    ref: Optional[str] = None,
+    total: Optional[int] = None
+) -> Any:
+    """
+    降采样工具结果
+
+    Args:
+        result: 工具结果（JSON兼容结构，可含NumPy数组）
+        budget: 每个序列的点数上限
+        method: 'lttb'（形状优先，适合少量点）或 'minmax'（保留每个像素桶的峰谷，适合绘图）
+        statistics: 是否为每个序列附带统计量
+        compact_axes: 是否把等间距横轴压缩为 {start, step, count}
+        ref: 完整结果的引用ID
+        total: 所有序列的总点数上限（超出时按序列数平均缩减 budget，不低于 MIN_POINTS）
+
+    Returns:
+        结构相同的结果；有序列被处理时增加 '_digest': {'ref', 'series': {路径: 信息}}
+    """
+    digester = _Digester(budget, method, statistics, compact_axes)
+    reduced = digester.walk(result, '')
+    if total and len(digester.series) * digester.budget > total:
+        shared = max(MIN_POINTS, total // len(digester.series))
+        if shared < digester.budget:
+            digester = _Digester(shared, method, statistics, compact_axes)
+            reduced = digester.walk(result, '')
+    if isinstance(reduced, dict) and (digester.series or ref):
+        reduced['_digest'] = {'ref': ref, 'budget': digester.budget, 'series': digester.series}
+    return reduced
+
+
+def for_llm(result: Any, ref: Optional[str] = None, budget: int = LLM_POINTS) -> Any:
+    """模型上下文用：几十个点 + 统计量"""
+    return digest(result, budget, 'lttb', statistics=True, compact_axes=True, ref=ref, total=LLM_TOTAL_POINTS)
+
+
+def for_ui(result: Any, ref: Optional[str] = None, budget: int = UI_POINTS) -> Any:
+    """前端绘图用：按屏幕宽度的 min/max 抽取"""
+    return digest(result, budget, 'minmax', ref=ref)
+
+
+def resolve_path(result: Any, path: Optional[str]) -> Any:
+    """按 'results.time_series' 形式的路径取子结构（列表用数字下标）"""
+    node = result
+    for part in (path or '').split('.'):
+        if not part:
+            continue
+        if isinstance(node, dict) and part in node:
+            node = node[part]
+        elif isinstance(node, (list, tuple)) and part.isdigit() and int(part) < len(node):
+            node = node[int(part)]
+        else:
+            raise KeyError(path)
+    return node
+
+
+# ==================== 完整结果存储 ====================
+
+class ResultStore:
+    """
+    完整工具结果的内存存储（LRU + 过期），摘要中的 ref 指向这里
+
+    多进程部署时每个Web进程各自保存，引用只在产生它的进程内有效
+    """
+
+    def __init__(self, max_entries: int = STORE_SIZE, ttl: float = STORE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, Tuple[float, Optional[str], Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, result: Any, owner: Optional[str] = None) -> str:
+        ref = uuid.uuid4().hex
+        with self._lock:
+            self._entries[ref] = (time.monotonic() + self.ttl, owner, result)
+            self._expire()
+        return ref
+
+    def get(self, ref: str, owner: Optional[str] = None) -> Optional[Any]:
+        """取回完整结果；过期、不存在或不属于 owner 时返回 None"""
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(ref)
+            if entry is None:
+                return None
+            if owner is not None and entry[1] is not None and entry[1] != owner:
+                return None
+            self._entries.move_to_end(ref)
+            return entry[2]
+
+    def _expire(self):
+        now = time.monotonic()
+        for ref in [ref for ref, entry in self._entries.items() if entry[0] < now]:
+            del self._entries[ref]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+result_store = ResultStore()
@@ -4,6 +4,7 @@ MCP服务管理器
 管理和调用各种水网MCP服务：仿真、辨识、调度、控制、测试
 """
 
+import os
 import json
 import logging
 import requests
@@ -11,18 +12,51 @@ from typing import Dict, List, Optional, Any
 from datetime import datetime
 import re
 
+from mcp_registry import MCPServiceRegistry
+
 logger = logging.getLogger(__name__)
 
 
 class MCPServiceManager:
     """MCP服务管理器"""
     
-    def __init__(self):
-        """初始化MCP服务管理器"""
+    def __init__(self, registry: MCPServiceRegistry = None):
+        """
+        初始化MCP服务管理器
+        
+        Args:
+            registry: 服务注册中心（默认从 MCP_SERVICES_DIR 加载服务清单并热加载）
+        """
         self.services = {}
         self._initialize_default_services()
+        self._default_services = dict(self.services)
+        
+        # 服务清单/数据库中的服务覆盖默认服务，变化时自动同步
+        self.registry = registry or MCPServiceRegistry(
+            poll_interval=float(os.environ.get('MCP_REGISTRY_POLL_INTERVAL', '5'))
+        )
+        self.registry.add_listener(self._sync_registry)
+        self._sync_registry(self.registry)
+        self.registry.start_watching()
+        
         logger.info("MCP服务管理器初始化完成")
     
+    def _sync_registry(self, registry: MCPServiceRegistry):
+        """将注册中心的全局服务合并到服务表（整体替换，读取方无需加锁）"""
+        services = dict(self._default_services)
+        for name, spec in registry.global_services.items():
+            services[name] = {
+                'name': name,
+                'url': spec.get('url'),
+                'description': spec.get('description', ''),
+                'type': spec.get('category', 'general'),
+                'methods': spec.get('methods', []),
+                'keywords': spec.get('keywords', []),
+                'status': 'active' if spec.get('url') else 'pending',
+                'registered_at': spec.get('registered_at')
+            }
+        self.services = services
+    
     def _initialize_default_services(self):
         """初始化默认的MCP服务"""
         
@@ -88,7 +122,8 @@ class MCPServiceManager:
         description: str = '',
         service_type: str = 'general',
         methods: List[str] = None,
-        keywords: List[str] = None
+        keywords: List[str] = None,
+        persist: bool = True
     ):
         """
         注册MCP服务
@@ -100,17 +135,17 @@ class MCPServiceManager:
             service_type: 服务类型
             methods: 支持的方法列表
             keywords: 关键词列表
+            persist: 是否写入服务清单目录（重启后仍然有效）
         """
-        self.services[name] = {
+        self.registry.register({
             'name': name,
             'url': url,
             'description': description,
-            'type': service_type,
+            'category': service_type,
             'methods': methods or [],
             'keywords': keywords or [],
-            'status': 'active',
             'registered_at': datetime.now().isoformat()
-        }
+        }, persist=persist)
         logger.info(f"注册MCP服务: {name} -> {url}")
     
     def list_services(self) -> List[Dict]:
@@ -7,12 +7,18 @@
 
 import os
 import json
+import importlib
 import logging
 import aiohttp
 import asyncio
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, AsyncGenerator
 from datetime import datetime
 
+import mcp_codec
+from tool_admission import ToolAdmissionController
+from mcp_registry import MCPServiceRegistry
+from mcp_services.runtime import ServiceRuntime, RuntimeQueueFull
+
 logger = logging.getLogger(__name__)
 
 # 尝试导入HydroSIS客户端
@@ -24,6 +30,20 @@ except ImportError:
     HYDROSIS_AVAILABLE = False
 
 
+# 未配置远程URL时在本地执行的计算引擎 {工具名: (模块, 函数)}
+# 函数签名为 fn(arguments, progress_callback) -> 结果字典；依赖缺失时退回Mock数据。
+# 引擎在独立的进程池中执行（不占用Web进程的GIL），超时或客户端断开时取消
+LOCAL_ENGINE_WORKERS = int(os.environ.get('MCP_LOCAL_ENGINE_WORKERS', '0')) or None
+LOCAL_ENGINES = {
+    'simulation': ('mcp_services.simulation', 'run_simulation'),
+    'identification': ('mcp_services.identification', 'identify'),
+    'scheduling': ('mcp_services.scheduling', 'run_scheduling'),
+    'control': ('mcp_services.control', 'design_controller'),
+    'testing': ('mcp_services.testing', 'run_testing'),
+    'reservoir_operation': ('mcp_services.reservoir', 'optimize_operation')
+}
+
+
 class MCPServiceManager:
     """
     MCP服务管理器（增强版）
@@ -36,10 +56,43 @@ class MCPServiceManager:
     5. 错误处理
     """
     
-    def __init__(self):
-        """初始化MCP服务管理器"""
-        self.services = {}
+    def __init__(self, registry: MCPServiceRegistry = None):
+        """
+        初始化MCP服务管理器
+        
+        Args:
+            registry: 服务注册中心（默认从 MCP_SERVICES_DIR 加载服务清单并热加载）
+        """
+        self.registry = registry or MCPServiceRegistry(
+            poll_interval=float(os.environ.get('MCP_REGISTRY_POLL_INTERVAL', '5'))
+        )
+        
+        # 租户工具视图缓存 {(tenant_id, features_key): {'tools': [...], 'names': frozenset}}
+        self._tool_views = {}
+        self.catalogue_version = 0
+        self.registry.add_listener(self._invalidate_tool_views)
+        
         self._initialize_hydronet_services()
+        self.registry.start_watching()
+        
+        # 已加载的本地计算引擎 {工具名: 函数或None}，执行引擎的进程池首次调用时启动
+        self._local_engines: Dict[str, Any] = {}
+        self._local_runtime: Optional[ServiceRuntime] = None
+        
+        # 远程服务通告的请求体压缩能力 {url: Accept-Encoding}，收到首个响应后才压缩请求
+        self._remote_encodings: Dict[str, str] = {}
+        
+        # 工具调用准入控制（租户公平排队 + 后端并发限制）
+        self.admission = ToolAdmissionController(
+            backend_limits={
+                'hydrosis': int(os.environ.get('HYDROSIS_MCP_MAX_CONCURRENCY', '4'))
+            },
+            default_backend_limit=int(os.environ.get('MCP_BACKEND_MAX_CONCURRENCY', '8')),
+            max_queue_depth=int(os.environ.get('MCP_MAX_QUEUE_DEPTH', '200')),
+            queue_timeout=float(os.environ.get('MCP_QUEUE_TIMEOUT', '30')),
+            tenant_idle_ttl=float(os.environ.get('MCP_TENANT_IDLE_TTL', '3600')),
+            max_tenants=int(os.environ.get('MCP_MAX_TRACKED_TENANTS', '10000'))
+        )
         
         # 初始化HydroSIS客户端
         self.hydrosis_client = None
@@ -64,11 +117,17 @@ class MCPServiceManager:
         
         logger.info("✅ MCP服务管理器初始化完成")
     
+    @property
+    def services(self) -> Dict[str, Dict]:
+        """全局服务目录（名称 -> 服务定义），由注册中心维护"""
+        return self.registry.global_services
+    
     def _initialize_hydronet_services(self):
-        """初始化HydroNet专业服务"""
+        """初始化HydroNet专业服务（内置默认值，可被服务清单覆盖）"""
+        services = {}
         
         # 1. 水网仿真服务
-        self.services['simulation'] = {
+        services['simulation'] = {
             'name': 'simulation',
             'description': '水网仿真模拟 - 预测流量、水位、压力等运行参数',
             'url': None,  # 可配置远程服务URL
@@ -108,7 +167,7 @@ class MCPServiceManager:
         }
         
         # 2. 系统辨识服务
-        self.services['identification'] = {
+        services['identification'] = {
             'name': 'identification',
             'description': '系统辨识 - 识别管网参数、校准模型',
             'url': None,
@@ -143,7 +202,7 @@ class MCPServiceManager:
         }
         
         # 3. 优化调度服务
-        self.services['scheduling'] = {
+        services['scheduling'] = {
             'name': 'scheduling',
             'description': '优化调度 - 生成最优水资源调度方案',
             'url': None,
@@ -176,7 +235,7 @@ class MCPServiceManager:
         }
         
         # 4. 控制策略服务
-        self.services['control'] = {
+        services['control'] = {
             'name': 'control',
             'description': '控制策略设计 - 设计和优化控制器（PID、MPC等）',
             'url': None,
@@ -185,7 +244,7 @@ class MCPServiceManager:
                 'properties': {
                     'controller_type': {
                         'type': 'string',
-                        'enum': ['PID', 'MPC', 'fuzzy', 'adaptive'],
+                        'enum': ['PID', 'MPC'],
                         'description': '控制器类型'
                     },
                     'setpoint': {
@@ -210,7 +269,7 @@ class MCPServiceManager:
         }
         
         # 5. 性能测试服务
-        self.services['testing'] = {
+        services['testing'] = {
             'name': 'testing',
             'description': '性能测试 - 测试和评估系统性能',
             'url': None,
@@ -235,18 +294,108 @@ class MCPServiceManager:
             }
         }
         
+        # 6. 水库调度服务（与优化调度同属 scheduling 分类）
+        services['reservoir_operation'] = {
+            'name': 'reservoir_operation',
+            'category': 'scheduling',
+            'description': '水库调度 - 随机动态规划优化水库月调度规则（发电/供水/综合）',
+            'url': None,
+            'parameters': {
+                'type': 'object',
+                'properties': {
+                    'objective': {
+                        'type': 'string',
+                        'enum': ['hydropower', 'water_supply', 'balanced'],
+                        'description': '调度目标'
+                    },
+                    'current_storage': {
+                        'type': 'number',
+                        'description': '当前库容（百万m³）'
+                    },
+                    'current_month': {
+                        'type': 'integer',
+                        'description': '当前月份',
+                        'minimum': 1,
+                        'maximum': 12
+                    },
+                    'last_inflow': {
+                        'type': 'number',
+                        'description': '上月平均入流（m³/s）'
+                    },
+                    'inflow_forecast': {
+                        'type': 'number',
+                        'description': '本月入流预报（m³/s）'
+                    },
+                    'reservoir': {
+                        'type': 'object',
+                        'description': '水库参数（总库容、死库容、汛限库容、库容-水位曲线、装机等）'
+                    },
+                    'inflow': {
+                        'type': 'object',
+                        'description': '入流统计（逐月均值、变差系数、月间相关）或历史月入流序列 history'
+                    },
+                    'demand': {
+                        'type': 'array',
+                        'items': {'type': 'number'},
+                        'description': '逐月下游供水需求（m³/s）'
+                    }
+                },
+                'required': ['objective', 'current_storage']
+            }
+        }
+        
+        self.registry.set_builtin_services(services)
         logger.info(f"📦 注册了 {len(self.services)} 个HydroNet专业服务")
     
-    def get_tools_list(self) -> List[Dict]:
+    def get_tools_list(self, tenant_id: str = None, features=None) -> List[Dict]:
         """
         获取工具列表（供LLM使用）
         返回格式符合通义千问Function Calling要求
-        包括HydroNet工具 + HydroSIS工具
+        包括HydroNet工具 + HydroSIS工具 + 租户自己注册的服务
+        
+        每个 (租户, 套餐功能) 的工具视图只构建一次并缓存，服务目录或HydroSIS
+        工具变化时整体失效。返回的列表是共享的缓存对象，调用方不要修改。
+        
+        Args:
+            tenant_id: 租户ID（为空时只返回全局工具）
+            features: 套餐允许的功能列表（如 TIER_LIMITS['features']），
+                      None 或 'all' 表示不限制；工具名称或分类在列表中即可使用
         """
+        return self._get_tool_view(tenant_id, features)['tools']
+    
+    def is_tool_allowed(self, tool_name: str, tenant_id: str = None, features=None) -> bool:
+        """检查工具是否在租户的工具视图中（O(1)）"""
+        return tool_name in self._get_tool_view(tenant_id, features)['names']
+    
+    def _get_tool_view(self, tenant_id: str, features) -> Dict[str, Any]:
+        key = (tenant_id, self.features_key(features))
+        view = self._tool_views.get(key)
+        if view is None:
+            view = self._build_tool_view(tenant_id, features)
+            self._tool_views[key] = view
+        return view
+    
+    @staticmethod
+    def features_key(features):
+        if features is None or features == 'all':
+            return 'all'
+        return tuple(sorted(set(features)))
+    
+    def _build_tool_view(self, tenant_id: str, features) -> Dict[str, Any]:
+        """构建租户工具视图"""
+        allowed = None if self.features_key(features) == 'all' else set(features)
+        
+        def is_allowed(name, category):
+            return allowed is None or name in allowed or category in allowed
+        
         tools = []
+        tenant_services = self.registry.tenant_services(tenant_id) if tenant_id else {}
         
-        # 1. HydroNet自己的5个工具
-        for service in self.services.values():
+        # 各组按名称排序：工具列表与注册/加载顺序无关，所有租户共享的全局工具排在前面（模型请求前缀稳定、可缓存）
+        # 1. HydroNet全局工具（同名租户服务优先）
+        for service in sorted(self.services.values(), key=lambda s: s['name']):
+            if service['name'] in tenant_services or not is_allowed(service['name'], service['category']):
+                continue
             tool = {
                 'name': service['name'],
                 'description': f"[HydroNet] {service['description']}",
@@ -256,7 +405,9 @@ class MCPServiceManager:
         
         # 2. HydroSIS的18个工具（如果已连接）
         if self.hydrosis_client and self.hydrosis_tools_cache:
-            for hydrosis_tool in self.hydrosis_tools_cache:
+            for hydrosis_tool in sorted(self.hydrosis_tools_cache, key=lambda t: t['name']):
+                if not is_allowed(hydrosis_tool['name'], hydrosis_tool.get('category')):
+                    continue
                 tool = {
                     'name': f"hydrosis_{hydrosis_tool['name']}",
                     'description': f"[HydroSIS] {hydrosis_tool['description']}",
@@ -264,14 +415,31 @@ class MCPServiceManager:
                 }
                 tools.append(tool)
         
-        return tools
+        # 3. 租户自己注册的服务（不受套餐功能限制）
+        for service in sorted(tenant_services.values(), key=lambda s: s['name']):
+            tools.append({
+                'name': service['name'],
+                'description': f"[自定义] {service['description']}",
+                'parameters': service['parameters']
+            })
+        
+        return {'tools': tools, 'names': frozenset(tool['name'] for tool in tools)}
+    
+    def _invalidate_tool_views(self, *args):
+        """服务目录或HydroSIS工具变化时清空工具视图缓存"""
+        self._tool_views = {}
+        self.catalogue_version += 1
     
     async def call_tool(
         self,
         tool_name: str,
         arguments: Dict[str, Any],
         user_id: str = None,
-        timeout: int = 30
+        timeout: int = 30,
+        tenant_id: str = None,
+        plan: str = None,
+        priority: str = 'interactive',
+        features=None
     ) -> Dict[str, Any]:
         """
         调用MCP工具（异步）
@@ -282,42 +450,192 @@ class MCPServiceManager:
             arguments: 参数字典
             user_id: 用户ID
             timeout: 超时时间（秒）
+            tenant_id: 租户ID（默认按用户排队）
+            plan: 套餐（free/basic/pro/enterprise），决定并发和排队权重
+            priority: interactive（对话）| batch（批量任务）
+            features: 套餐允许的功能列表（None表示不限制）
             
         Returns:
             工具执行结果
+            
+        Raises:
+            ToolAdmissionRejected: 队列已满或排队超时
+        """
+        result = None
+        async for event in self.call_tool_stream(
+            tool_name, arguments, user_id, timeout,
+            tenant_id=tenant_id, plan=plan, priority=priority, features=features
+        ):
+            if event['event'] == 'result':
+                result = event['result']
+        return result
+    
+    async def call_tool_stream(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        user_id: str = None,
+        timeout: int = 30,
+        tenant_id: str = None,
+        plan: str = None,
+        priority: str = 'interactive',
+        features=None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        流式调用MCP工具（异步生成器）
+        
+        执行过程中产出增量事件，最后产出一次最终结果:
+        - {'event': 'progress', 'progress': 42.0, 'stage': 'running',
+           'message': '...', 'partial': {...}}
+        - {'event': 'result', 'result': {...}}
+        
+        partial 可以是部分时间序列块（{'time_series': {...}, 'offset': n}）
+        或校准迭代信息（{'iteration': n, 'objective': v, 'parameters': {...}}）。
+        
+        Args:
+            tool_name: 工具名称（hydrosis_开头的是HydroSIS工具）
+            arguments: 参数字典
+            user_id: 用户ID
+            timeout: 超时时间（秒）
+            tenant_id: 租户ID（默认按用户排队）
+            plan: 套餐，决定并发和排队权重
+            priority: interactive | batch
+            features: 套餐允许的功能列表（None表示不限制）
         """
         logger.info(f"🔧 调用工具: {tool_name}")
         logger.debug(f"参数: {json.dumps(arguments, ensure_ascii=False)}")
         
-        # 检查是否是HydroSIS工具
-        if tool_name.startswith('hydrosis_'):
-            return await self._call_hydrosis_tool(tool_name, arguments, user_id, timeout)
+        if self.features_key(features) != 'all' and not self.is_tool_allowed(tool_name, tenant_id, features):
+            raise ValueError(f"❌ 当前套餐不支持工具: {tool_name}")
         
-        # HydroNet自己的工具
-        if tool_name not in self.services:
-            raise ValueError(f"❌ 工具不存在: {tool_name}")
+        # HydroNet工具和租户注册的服务（O(1)查找，租户私有服务优先）
+        service = None
+        if tool_name.startswith('hydrosis_'):
+            backend = 'hydrosis'
+        else:
+            service = self.registry.get(tool_name, tenant_id)
+            if service is None:
+                raise ValueError(f"❌ 工具不存在: {tool_name}")
+            backend = service.get('url') or 'local'
         
-        service = self.services[tool_name]
+        async with self.admission.admit(
+            tenant_id or user_id or 'default',
+            plan,
+            backend,
+            priority
+        ):
+            async for event in self._dispatch_tool(tool_name, service, arguments, user_id, timeout):
+                yield event
+    
+    async def _dispatch_tool(
+        self,
+        tool_name: str,
+        service: Optional[Dict],
+        arguments: Dict[str, Any],
+        user_id: str,
+        timeout: int
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """按工具类型分派执行（已获得准入许可）"""
+        # 检查是否是HydroSIS工具
+        if tool_name.startswith('hydrosis_'):
+            async for event in self._stream_hydrosis_tool(tool_name, arguments, user_id, timeout):
+                yield event
+            return
         
         # 如果配置了远程服务URL，调用远程服务
         if service.get('url'):
             try:
-                result = await self._call_remote_service(
+                async for event in self._stream_remote_service(
                     service['url'],
                     tool_name,
                     arguments,
                     user_id,
                     timeout
-                )
+                ):
+                    yield event
                 logger.info(f"✅ 远程服务调用成功: {tool_name}")
-                return result
             except Exception as e:
                 logger.error(f"❌ 远程服务调用失败: {e}")
                 raise
+        elif self._load_local_engine(tool_name):
+            # 本地计算引擎（在进程池中执行，不阻塞事件循环）
+            async for event in self._stream_local_engine(tool_name, arguments, timeout):
+                yield event
         else:
             # 返回Mock数据（开发测试用）
             logger.warning(f"⚠️ {tool_name} 未配置远程服务，返回Mock数据")
-            return self._get_mock_response(tool_name, arguments, user_id)
+            yield {'event': 'result', 'result': self._get_mock_response(tool_name, arguments, user_id)}
+    
+    def _load_local_engine(self, tool_name: str):
+        """按需导入本地计算引擎，导入失败时记录并返回None"""
+        if tool_name not in self._local_engines:
+            engine = None
+            if tool_name in LOCAL_ENGINES:
+                module_name, function_name = LOCAL_ENGINES[tool_name]
+                try:
+                    engine = getattr(importlib.import_module(module_name), function_name)
+                    logger.info(f"✅ 已加载本地计算引擎: {tool_name}")
+                except ImportError as e:
+                    logger.warning(f"⚠️ 本地计算引擎 {tool_name} 不可用（{e}），将返回Mock数据")
+            self._local_engines[tool_name] = engine
+        return self._local_engines[tool_name]
+    
+    def _get_local_runtime(self) -> ServiceRuntime:
+        """本地计算引擎的进程池（只包含可导入的引擎，工作进程启动时预先导入）"""
+        if self._local_runtime is None:
+            tools = {
+                name: f'{module_name}:{function_name}'
+                for name, (module_name, function_name) in LOCAL_ENGINES.items()
+                if self._load_local_engine(name)
+            }
+            self._local_runtime = ServiceRuntime(tools, max_workers=LOCAL_ENGINE_WORKERS)
+        return self._local_runtime
+    
+    async def _stream_local_engine(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        timeout: int
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """在进程池中执行本地计算引擎，并把进度回调转为进度事件；超时或调用方关闭时取消任务"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        def on_event(kind: str, payload: Dict[str, Any]):
+            # 在运行时的事件汇总线程中调用；客户端断开后事件循环可能已关闭，任务随后被取消
+            event = {'event': 'progress', 'stage': 'running', **payload} if kind == 'progress' else payload
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                pass
+        
+        runtime = self._get_local_runtime()
+        try:
+            task_id = runtime.submit(tool_name, arguments, listener=on_event)['task_id']
+        except RuntimeQueueFull as e:
+            raise Exception(f"本地计算资源繁忙: {e}")
+        
+        # 任务结束前退出（超时、出错、生成器被关闭）时取消任务，工作进程在下一次进度回调时中止
+        outcome = None
+        try:
+            deadline = loop.time() + timeout
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    raise Exception(f"工具 {tool_name} 执行超时（>{timeout}秒）")
+                if event.get('event') != 'progress':
+                    outcome = event
+                    break
+                yield event
+        finally:
+            if outcome is None:
+                runtime.cancel(task_id)
+        
+        if outcome['status'] != 'completed':
+            raise outcome['exception'] or Exception(f"工具 {tool_name} 执行已取消")
+        yield {'event': 'result', 'result': outcome['results']}
+        logger.info(f"✅ 本地计算完成: {tool_name}")
     
     async def _call_remote_service(
         self,
@@ -328,24 +646,97 @@ class MCPServiceManager:
         timeout: int
     ) -> Dict:
         """调用远程MCP服务"""
-        async with aiohttp.ClientSession() as session:
-            payload = {
-                'tool_name': tool_name,
-                'arguments': arguments,
-                'user_id': user_id,
-                'timestamp': datetime.now().isoformat()
-            }
-            
+        result = None
+        async for event in self._stream_remote_service(url, tool_name, arguments, user_id, timeout):
+            if event['event'] == 'result':
+                result = event['result']
+        return result
+    
+    async def _stream_remote_service(
+        self,
+        url: str,
+        tool_name: str,
+        arguments: Dict,
+        user_id: str,
+        timeout: int
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        流式调用远程MCP服务
+        
+        服务端若返回 application/x-ndjson，则每行是一个事件：
+        {"type": "progress", ...} / {"type": "partial", ...} / {"type": "result", "data": {...}}；
+        否则按普通响应处理，只产出最终结果。
+        
+        传输通过内容协商：响应可为JSON或MessagePack，可用zstd/gzip压缩，
+        长数值序列按列式二进制编码并直接解码为NumPy数组（见 mcp_codec）。
+        """
+        payload = {
+            'tool_name': tool_name,
+            'arguments': arguments,
+            'user_id': user_id,
+            'stream': True,
+            'timestamp': datetime.now().isoformat()
+        }
+        body, body_headers = mcp_codec.encode_body(
+            payload, accept_encoding=self._remote_encodings.get(url)
+        )
+        headers = mcp_codec.negotiation_headers()
+        headers['Accept'] = 'application/x-ndjson, ' + headers['Accept']
+        headers['Content-Type'] = body_headers['Content-Type']
+        if 'Content-Encoding' in body_headers:
+            headers['Content-Encoding'] = body_headers['Content-Encoding']
+        
+        # 关闭自动解压：zstd 和流式NDJSON都由 mcp_codec 处理
+        async with aiohttp.ClientSession(auto_decompress=False) as session:
             async with session.post(
                 f"{url}/execute",
-                json=payload,
+                data=body,
+                headers=headers,
                 timeout=aiohttp.ClientTimeout(total=timeout)
             ) as response:
+                encoding = response.headers.get('Content-Encoding')
+                if response.headers.get('Accept-Encoding'):
+                    self._remote_encodings[url] = response.headers['Accept-Encoding']
+                
                 if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"服务返回错误 {response.status}: {error_text}")
+                    error_text = mcp_codec.decompress(await response.read(), encoding)
+                    raise Exception(f"服务返回错误 {response.status}: {error_text.decode('utf-8', 'replace')}")
+                
+                if not response.content_type.startswith('application/x-ndjson'):
+                    result = mcp_codec.decode_body(await response.read(), response.content_type, encoding)
+                    yield {'event': 'result', 'result': result}
+                    return
+                
+                result = None
+                async for message in self._iter_ndjson(response, encoding):
+                    if message.get('type') == 'result':
+                        result = message.get('data', message)
+                        continue
+                    yield {
+                        'event': 'progress',
+                        'progress': message.get('progress'),
+                        'stage': message.get('stage', 'running'),
+                        'message': message.get('message'),
+                        'partial': message.get('partial')
+                    }
                 
-                return await response.json()
+                if result is None:
+                    raise Exception(f"服务 {tool_name} 未返回最终结果")
+                yield {'event': 'result', 'result': result}
+    
+    @staticmethod
+    async def _iter_ndjson(response, encoding: Optional[str]) -> AsyncGenerator[Dict[str, Any], None]:
+        """边接收边解压并按行解析NDJSON响应"""
+        decompressor = mcp_codec.make_decompressor(encoding)
+        buffer = b''
+        async for chunk in response.content.iter_any():
+            buffer += decompressor.decompress(chunk)
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                if line.strip():
+                    yield mcp_codec.unpack_arrays(json.loads(line))
+        if buffer.strip():
+            yield mcp_codec.unpack_arrays(json.loads(buffer))
     
     def _get_mock_response(
         self,
@@ -501,6 +892,28 @@ class MCPServiceManager:
                     ],
                     'note': '⚠️ 这是Mock数据，请配置实际MCP服务URL'
                 }
+            },
+            
+            'reservoir_operation': {
+                'status': 'success',
+                'tool': 'reservoir_operation',
+                'message': '✅ 水库调度规则优化完成（Mock数据）',
+                'results': {
+                    'recommendation': {
+                        'month': arguments.get('current_month', 4),
+                        'current_storage': arguments.get('current_storage', 700),
+                        'release': 91.3,
+                        'release_range': [85.7, 95.2],
+                        'expected_end_storage': 713.7
+                    },
+                    'performance': {
+                        'annual_energy_gwh': 532.8,
+                        'supply_reliability': 0.96,
+                        'ecological_compliance': 1.0,
+                        'mean_spill': 0.6
+                    },
+                    'note': '⚠️ 这是Mock数据，请配置实际MCP服务URL'
+                }
             }
         }
         
@@ -526,7 +939,10 @@ class MCPServiceManager:
         description: str,
         url: str,
         parameters: Dict,
-        examples: List[Dict] = None
+        examples: List[Dict] = None,
+        category: str = None,
+        tenant_id: str = None,
+        persist: bool = True
     ):
         """
         注册新的MCP服务
@@ -537,20 +953,25 @@ class MCPServiceManager:
             url: 服务URL
             parameters: 参数Schema（JSON Schema格式）
             examples: 示例列表
+            category: 服务分类（默认与名称相同）
+            tenant_id: 租户ID（为空表示全局服务）
+            persist: 是否写入服务清单目录（重启后仍然有效）
         """
-        self.services[name] = {
+        self.registry.register({
             'name': name,
             'description': description,
             'url': url,
             'parameters': parameters,
             'examples': examples or [],
+            'category': category,
+            'tenant_id': tenant_id,
             'registered_at': datetime.now().isoformat()
-        }
+        }, persist=persist)
         logger.info(f"✅ 注册MCP服务: {name} -> {url}")
     
-    def get_service_info(self, name: str) -> Optional[Dict]:
+    def get_service_info(self, name: str, tenant_id: str = None) -> Optional[Dict]:
         """获取服务详细信息"""
-        return self.services.get(name)
+        return self.registry.get(name, tenant_id)
     
     def list_services(self) -> List[Dict]:
         """列出所有服务"""
@@ -569,6 +990,10 @@ class MCPServiceManager:
             }
         }
         
+        # 工具调用排队和并发指标
+        status['admission'] = self.admission.get_metrics()
+        status['registry'] = self.registry.get_status()
+        
         # 添加HydroSIS状态
         if self.hydrosis_client:
             status['hydrosis'] = {
@@ -603,6 +1028,7 @@ class MCPServiceManager:
             # 加载工具列表
             tools = await self.hydrosis_client.list_tools()
             self.hydrosis_tools_cache = tools
+            self._invalidate_tool_views()
             
             logger.info(f"✅ 已加载 {len(tools)} 个HydroSIS工具")
             
@@ -614,6 +1040,7 @@ class MCPServiceManager:
         except Exception as e:
             logger.error(f"❌ 加载HydroSIS工具失败: {e}")
             self.hydrosis_tools_cache = []
+            self._invalidate_tool_views()
     
     async def _call_hydrosis_tool(
         self,
@@ -634,6 +1061,25 @@ class MCPServiceManager:
         Returns:
             工具执行结果
         """
+        result = None
+        async for event in self._stream_hydrosis_tool(tool_name, arguments, user_id, timeout):
+            if event['event'] == 'result':
+                result = event['result']
+        return result
+    
+    async def _stream_hydrosis_tool(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        user_id: str,
+        timeout: int
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        流式调用HydroSIS MCP工具
+        
+        异步任务每次轮询都会产出一个progress事件（含任务返回的partial_results），
+        任务完成后产出最终结果事件。
+        """
         if not self.hydrosis_client:
             raise Exception("❌ HydroSIS MCP客户端未初始化")
         
@@ -659,15 +1105,24 @@ class MCPServiceManager:
                 logger.info(f"   📋 任务ID: {task_id}")
                 
                 # 等待任务完成（带进度反馈）
-                result = await self.hydrosis_client.wait_for_task(
+                result = {}
+                async for result in self.hydrosis_client.iter_task_updates(
                     task_id,
                     poll_interval=2.0,
                     max_wait=min(timeout, 600)  # 最多等待10分钟
-                )
+                ):
+                    if result.get('status') not in ['completed', 'failed', 'cancelled']:
+                        yield {
+                            'event': 'progress',
+                            'progress': result.get('progress'),
+                            'stage': result.get('status', 'running'),
+                            'message': result.get('message'),
+                            'partial': result.get('partial_results')
+                        }
                 
                 # 转换为统一格式
                 if result.get('status') == 'completed':
-                    return {
+                    yield {'event': 'result', 'result': {
                         'status': 'success',
                         'tool': tool_name,
                         'message': f'✅ {actual_tool_name} 执行完成',
@@ -678,7 +1133,7 @@ class MCPServiceManager:
                             'is_hydrosis': True,
                             'is_async': True
                         }
-                    }
+                    }}
                 else:
                     raise Exception(f"任务失败: {result.get('error', '未知错误')}")
             
@@ -691,7 +1146,7 @@ class MCPServiceManager:
                 )
                 
                 # 转换为统一格式
-                return {
+                yield {'event': 'result', 'result': {
                     'status': result.get('status', 'success'),
                     'tool': tool_name,
                     'message': f'✅ {actual_tool_name} 执行完成',
@@ -701,7 +1156,7 @@ class MCPServiceManager:
                         'is_hydrosis': True,
                         'is_async': False
                     }
-                }
+                }}
         
         except Exception as e:
             logger.error(f"❌ HydroSIS工具调用失败: {e}")
@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""
+MCP服务注册中心
+从服务清单（*.json）和SaaS版 mcp_services 表加载服务，
+建立按名称/分类/租户索引的内存目录，并在文件或数据库变化时热加载
+
+清单有两个目录：
+    - 随代码发布的 mcp_services 包目录：只读，注册中心从不写入
+    - 数据目录 MCP_SERVICES_DIR（默认 instance/mcp_services）：运行时注册的服务写入这里，
+      同名服务覆盖包目录中的清单
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+# 运行时注册的服务清单写入的数据目录（不在源码树中）
+SERVICES_DIR = os.environ.get('MCP_SERVICES_DIR', 'instance/mcp_services')
+# 随代码发布的只读清单目录
+BUILTIN_MANIFEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mcp_services')
+# 只读目录中清单的键前缀（合并时排在数据目录之前）
+BUILTIN_PREFIX = 'builtin:'
+
+
+# 服务名和租户ID会拼进清单文件名，只允许字母、数字、下划线和连字符
+IDENTIFIER_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+
+
+DEFAULT_PARAMETERS = {
+    'type': 'object',
+    'properties': {},
+    'required': []
+}
+
+
+def normalize_service(spec: Dict[str, Any], source: str) -> Dict[str, Any]:
+    """
+    规范化服务定义
+
+    服务清单格式（JSON）:
+    {
+        "name": "pump_station_sim",
+        "description": "泵站仿真服务",
+        "url": "http://10.0.0.5:8080",
+        "category": "simulation",
+        "tenant_id": null,            # 为空表示全局服务
+        "enabled": true,
+        "parameters": {...},          # JSON Schema
+        "examples": [...],
+        "keywords": [...],            # 旧版管理器关键词匹配用
+        "methods": [...]
+    }
+    一个文件可以是单个服务，也可以是 {"services": [...]}。
+    """
+    if not spec.get('name'):
+        raise ValueError(f"服务定义缺少name字段: {spec}")
+    if not isinstance(spec['name'], str) or not IDENTIFIER_PATTERN.fullmatch(spec['name']):
+        raise ValueError(f"服务名只能包含字母、数字、下划线和连字符: {spec['name']!r}")
+    tenant_id = spec.get('tenant_id')
+    if tenant_id and (not isinstance(tenant_id, str) or not IDENTIFIER_PATTERN.fullmatch(tenant_id)):
+        raise ValueError(f"租户ID只能包含字母、数字、下划线和连字符: {tenant_id!r}")
+
+    return {
+        **spec,
+        'name': spec['name'],
+        'description': spec.get('description', ''),
+        'url': spec.get('url'),
+        'category': spec.get('category') or spec.get('type') or spec['name'],
+        'tenant_id': spec.get('tenant_id'),
+        'enabled': spec.get('enabled', True),
+        'parameters': spec.get('parameters') or DEFAULT_PARAMETERS,
+        'examples': spec.get('examples', []),
+        'source': source
+    }
+
+
+class SQLAlchemyServiceSource:
+    """
+    SaaS版 mcp_services 表数据源
+
+    版本戳为 (记录数, 最大updated_at)，新增、删除、修改都会改变版本戳，
+    轮询时只需一次聚合查询，版本变化时才加载全部记录。
+    """
+
+    def __init__(self, app):
+        """
+        Args:
+            app: Flask应用（后台线程查询时需要应用上下文）
+        """
+        self.app = app
+
+    def version(self):
+        from sqlalchemy import func
+        from models import db, MCPService
+
+        with self.app.app_context():
+            count, updated_at = db.session.query(
+                func.count(MCPService.id),
+                func.max(MCPService.updated_at)
+            ).one()
+            return count, updated_at
+
+    def load(self) -> List[Dict[str, Any]]:
+        from models import MCPService
+
+        with self.app.app_context():
+            services = []
+            for row in MCPService.query.filter_by(is_active=True).all():
+                config = row.config or {}
+                services.append({
+                    'name': row.name,
+                    'description': row.description or '',
+                    'url': row.url,
+                    'category': row.service_type,
+                    'tenant_id': row.tenant_id,
+                    'parameters': config.get('parameters'),
+                    'examples': config.get('examples', []),
+                    'keywords': config.get('keywords', []),
+                    'service_id': row.id
+                })
+            return services
+
+
+class MCPServiceRegistry:
+    """
+    MCP服务注册中心
+
+    三层来源，后者覆盖前者：内置服务 < 服务清单文件 < 数据库。
+    每次变化都重建完整索引后整体替换，读取方无需加锁，查找为O(1)字典访问。
+    """
+
+    def __init__(
+        self,
+        services_dir: Optional[str] = None,
+        db_source=None,
+        poll_interval: float = 5.0,
+        builtin_dir: Optional[str] = BUILTIN_MANIFEST_DIR
+    ):
+        """
+        Args:
+            services_dir: 可写的服务清单数据目录（默认 MCP_SERVICES_DIR）
+            db_source: 数据库数据源（需提供 version() 和 load()）
+            poll_interval: 热加载轮询间隔（秒），0表示不启动后台轮询
+            builtin_dir: 随代码发布的只读清单目录（None 表示不加载）
+        """
+        self.services_dir = services_dir or SERVICES_DIR
+        # 数据目录就是包目录时不重复扫描（旧配置 MCP_SERVICES_DIR=./mcp_services）
+        if builtin_dir and os.path.realpath(builtin_dir) == os.path.realpath(self.services_dir):
+            builtin_dir = None
+        self.builtin_dir = builtin_dir
+        self.db_source = db_source
+        self.poll_interval = poll_interval
+
+        self.version = 0
+        self._lock = threading.RLock()
+        self._listeners: List[Callable[['MCPServiceRegistry'], None]] = []
+        self._watcher = None
+
+        self._builtin: Dict[str, Dict] = {}
+        self._file_specs: Dict[str, List[Dict]] = {}  # 文件名 -> 服务列表
+        self._file_stamps: Dict[str, tuple] = {}
+        self._db_specs: List[Dict] = []
+        self._db_stamp = None
+
+        # 索引
+        self._by_key: Dict[tuple, Dict] = {}  # (tenant_id, name) -> 服务
+        self._global: Dict[str, Dict] = {}
+        self._by_category: Dict[str, List[Dict]] = {}
+        self._by_tenant: Dict[str, Dict[str, Dict]] = {}
+
+        self.refresh(force=True)
+
+    # ==================== 查询 ====================
+
+    @property
+    def global_services(self) -> Dict[str, Dict]:
+        """全局服务（名称 -> 服务定义）"""
+        return self._global
+
+    def get(self, name: str, tenant_id: Optional[str] = None) -> Optional[Dict]:
+        """按名称查找服务，租户私有服务优先于同名全局服务"""
+        if tenant_id is not None:
+            service = self._by_key.get((tenant_id, name))
+            if service is not None:
+                return service
+        return self._global.get(name)
+
+    def tenant_services(self, tenant_id: str) -> Dict[str, Dict]:
+        """租户私有服务（名称 -> 服务定义）"""
+        return self._by_tenant.get(tenant_id, {})
+
+    def by_category(self, category: str) -> List[Dict]:
+        """按分类列出服务（含各租户私有服务）"""
+        return self._by_category.get(category, [])
+
+    def add_listener(self, callback: Callable[['MCPServiceRegistry'], None]):
+        """注册目录变化回调（参数为注册中心本身）"""
+        self._listeners.append(callback)
+
+    # ==================== 注册 ====================
+
+    def set_builtin_services(self, services: Dict[str, Dict]):
+        """设置内置服务（优先级最低，可被清单文件和数据库覆盖）"""
+        with self._lock:
+            self._builtin = {
+                name: normalize_service(spec, 'builtin') for name, spec in services.items()
+            }
+            self._rebuild()
+
+    def register(self, spec: Dict[str, Any], persist: bool = True) -> Dict:
+        """
+        注册服务
+
+        Args:
+            spec: 服务定义
+            persist: 是否写入服务清单目录（重启后仍然有效）
+
+        Raises:
+            ValueError: 服务名或租户ID不合法（在写入任何文件之前检查）
+        """
+        normalize_service(spec, 'runtime')
+        if persist:
+            path = self._write_manifest(spec)
+            if path:
+                # 直接加载刚写入的文件，不等待下一次轮询
+                self.refresh()
+                return self.get(spec['name'], spec.get('tenant_id'))
+
+        with self._lock:
+            self._file_specs.setdefault('<runtime>', [])
+            self._file_specs['<runtime>'] = [
+                s for s in self._file_specs['<runtime>']
+                if (s.get('tenant_id'), s['name']) != (spec.get('tenant_id'), spec['name'])
+            ] + [normalize_service(spec, 'runtime')]
+            self._rebuild()
+        return self.get(spec['name'], spec.get('tenant_id'))
+
+    def _write_manifest(self, spec: Dict[str, Any]) -> Optional[str]:
+        filename = spec['name'] + '.json'
+        if spec.get('tenant_id'):
+            filename = f"{spec['tenant_id']}__{filename}"
+        path = os.path.join(self.services_dir, filename)
+
+        try:
+            os.makedirs(self.services_dir, exist_ok=True)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(spec, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+            logger.info(f"💾 已写入服务清单: {path}")
+            return path
+        except OSError as e:
+            logger.warning(f"⚠️ 写入服务清单失败，仅在内存中注册: {e}")
+            return None
+
+    # ==================== 热加载 ====================
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        检查清单文件和数据库版本戳，有变化时重建索引
+
+        Returns:
+            目录是否发生变化
+        """
+        with self._lock:
+            changed = self._scan_files(force)
+            changed = self._poll_db(force) or changed
+            if changed or force:
+                self._rebuild()
+            return changed
+
+    def _list_manifests(self) -> Dict[str, tuple]:
+        """清单键 -> (路径, 版本戳)；只读目录中的清单键带 BUILTIN_PREFIX"""
+        entries = {}
+        dirs = [(BUILTIN_PREFIX, self.builtin_dir)] if self.builtin_dir else []
+        for prefix, directory in dirs + [('', self.services_dir)]:
+            try:
+                for entry in os.scandir(directory):
+                    if entry.is_file() and entry.name.endswith('.json'):
+                        stat = entry.stat()
+                        entries[prefix + entry.name] = (entry.path, (stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def _scan_files(self, force: bool) -> bool:
+        entries = self._list_manifests()
+
+        changed = False
+        for filename in set(self._file_stamps) - set(entries):
+            self._file_stamps.pop(filename)
+            self._file_specs.pop(filename, None)
+            logger.info(f"🗑️ 服务清单已移除: {filename}")
+            changed = True
+
+        for filename, (path, stamp) in entries.items():
+            if not force and self._file_stamps.get(filename) == stamp:
+                continue
+            self._file_stamps[filename] = stamp
+            changed = True
+
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                specs = manifest.get('services', [manifest]) if isinstance(manifest, dict) else manifest
+                self._file_specs[filename] = [normalize_service(spec, f'file:{filename}') for spec in specs]
+                logger.info(f"📄 加载服务清单: {filename} ({len(specs)} 个服务)")
+            except (OSError, ValueError) as e:
+                # 解析失败时保留上一次成功加载的内容
+                logger.error(f"❌ 服务清单无效 {filename}: {e}")
+
+        return changed
+
+    def _poll_db(self, force: bool) -> bool:
+        if not self.db_source:
+            return False
+        try:
+            stamp = self.db_source.version()
+            if not force and stamp == self._db_stamp:
+                return False
+            self._db_specs = [normalize_service(spec, 'database') for spec in self.db_source.load()]
+            self._db_stamp = stamp
+            logger.info(f"🗄️ 从数据库加载 {len(self._db_specs)} 个MCP服务")
+            return True
+        except Exception as e:
+            logger.error(f"❌ 读取数据库MCP服务失败: {e}")
+            return False
+
+    def _rebuild(self):
+        """按优先级合并所有来源并重建索引（持锁调用）"""
+        by_key: Dict[tuple, Dict] = {}
+        for spec in self._builtin.values():
+            by_key[(None, spec['name'])] = spec
+        # 只读清单在前，数据目录中的同名服务覆盖它们
+        for filename in sorted(self._file_specs, key=lambda name: (not name.startswith(BUILTIN_PREFIX), name)):
+            for spec in self._file_specs[filename]:
+                by_key[(spec['tenant_id'], spec['name'])] = spec
+        for spec in self._db_specs:
+            by_key[(spec['tenant_id'], spec['name'])] = spec
+
+        by_key = {key: spec for key, spec in by_key.items() if spec['enabled']}
+
+        global_services: Dict[str, Dict] = {}
+        by_category: Dict[str, List[Dict]] = {}
+        by_tenant: Dict[str, Dict[str, Dict]] = {}
+        for (tenant_id, name), spec in by_key.items():
+            if tenant_id is None:
+                global_services[name] = spec
+            else:
+                by_tenant.setdefault(tenant_id, {})[name] = spec
+            by_category.setdefault(spec['category'], []).append(spec)
+
+        self._by_key = by_key
+        self._global = global_services
+        self._by_category = by_category
+        self._by_tenant = by_tenant
+        self.version += 1
+
+        for callback in self._listeners:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(f"❌ 服务目录变化回调失败: {e}")
+
+    def start_watching(self):
+        """启动后台轮询线程（守护线程，随进程退出）"""
+        if self._watcher or self.poll_interval <= 0:
+            return
+
+        stop_event = threading.Event()
+
+        def watch():
+            while not stop_event.wait(self.poll_interval):
+                try:
+                    if self.refresh():
+                        logger.info(f"🔄 MCP服务目录已热加载 (版本 {self.version})")
+                except Exception as e:
+                    logger.error(f"❌ MCP服务目录热加载失败: {e}")
+
+        self._watcher = threading.Thread(target=watch, name='mcp-registry-watcher', daemon=True)
+        self._watcher.stop_event = stop_event
+        self._watcher.start()
+        logger.info(f"👀 监视MCP服务目录: {self.services_dir} (每 {self.poll_interval} 秒)")
+
+    def stop_watching(self):
+        """停止后台轮询线程"""
+        if self._watcher:
+            self._watcher.stop_event.set()
+            self._watcher = None
+
+    def get_status(self) -> Dict[str, Any]:
+        """注册中心状态"""
+        return {
+            'version': self.version,
+            'services_dir': self.services_dir,
+            'builtin_dir': self.builtin_dir,
+            'manifests': sorted(name for name in self._file_specs if name != '<runtime>'),
+            'database': self.db_source is not None,
+            'global_services': len(self._global),
+            'tenant_services': sum(len(services) for services in self._by_tenant.values()),
+            'watching': self._watcher is not None,
+            'checked_at': datetime.now().isoformat()
+        }
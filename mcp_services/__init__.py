@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+HydroNet MCP服务实现
+
+各子包既可以作为独立服务部署（提供 /execute 接口），
+也可以由 MCP服务管理器在未配置远程URL时直接在本地调用。
+"""
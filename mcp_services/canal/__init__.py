@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+渠道仿真服务
+长距离输水明渠的一维非恒定流仿真（圣维南方程 Preissmann 隐式格式，带状求解，节制闸/泵站内边界）
+"""
+
+from .channel import build_systems, build_default_canal
+from .preissmann import PreissmannSolver
+from .engine import run_canal_simulation
+
+__all__ = [
+    'build_systems',
+    'build_default_canal',
+    'PreissmannSolver',
+    'run_canal_simulation'
+]
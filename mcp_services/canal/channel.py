@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+"""
+渠道描述与恒定流初始状态
+
+渠道由若干渠段（梯形断面）串联，相邻渠段之间为节制闸或泵站：
+    - 节制闸按淹没孔流计算过闸流量，与上下游水位隐式耦合，闸前后的渠段在同一个方程组中求解
+    - 泵站按给定流量过程抽水，把渠道分成水力上相互独立的“系统”，各系统可以并行计算
+
+系统以纯字典/列表描述（可序列化，传给工作进程），由 build_systems 生成。
+"""
+
+import math
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+GRAVITY = 9.81
+# 动量修正系数
+MOMENTUM_COEFFICIENT = 1.0
+# 计算用最小水深（m），防止断面面积为零
+MIN_DEPTH = 0.05
+# 过闸流量公式的正则化水头差（m）：Δh 接近 0 时 √Δh 的导数无界
+GATE_EPSILON = 0.01
+# 节制闸的最小水头损失（m），目标水位无法维持时按此计算开度
+MIN_GATE_HEAD = 0.05
+
+# 默认渠段断面：底宽 m、边坡 1:m、糙率、纵坡、渠深 m
+DEFAULT_SECTION = {'bottom_width': 25.0, 'side_slope': 2.0, 'manning': 0.015, 'slope': 1.0 / 25000, 'bank_height': 9.5}
+# 默认节制闸：总净宽 m、流量系数
+DEFAULT_GATE = {'width': 40.0, 'discharge_coefficient': 0.8}
+
+
+def schedule(value: Any, name: str) -> List[List[float]]:
+    """
+    流量/水位/开度过程 → [[小时...], [值...]]（按小时线性插值，超出范围取端点值）
+
+    Args:
+        value: 常数、[[小时, 值], ...] 或 {'hours': [...], 'values': [...]}
+    """
+    if isinstance(value, dict):
+        hours, values = value.get('hours'), value.get('values')
+    elif isinstance(value, (list, tuple)):
+        if not value or any(not isinstance(p, (list, tuple)) or len(p) != 2 for p in value):
+            raise ValueError(f"{name} 的过程需要是 [[小时, 值], ...] 形式")
+        hours, values = [p[0] for p in value], [p[1] for p in value]
+    else:
+        hours, values = [0.0], [value]
+    hours = [float(h) for h in hours]
+    values = [float(v) for v in values]
+    if len(hours) != len(values) or not hours or any(b < a for a, b in zip(hours, hours[1:])):
+        raise ValueError(f"{name} 的过程时间需要非递减且与取值一一对应")
+    return [hours, values]
+
+
+def at(series: List[List[float]], hour: float) -> float:
+    return float(np.interp(hour, series[0], series[1]))
+
+
+def section_geometry(depth: np.ndarray, width: np.ndarray, side: np.ndarray, manning: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """
+    梯形断面
+
+    Returns:
+        (面积 A, 水面宽 B, 流量模数 K = A·R^(2/3)/n, dK/dh)
+    """
+    area = (width + side * depth) * depth
+    top = width + 2 * side * depth
+    wetted_slope = 2 * np.sqrt(1 + side * side)
+    perimeter = width + wetted_slope * depth
+    conveyance = area ** (5.0 / 3.0) / (manning * perimeter ** (2.0 / 3.0))
+    d_conveyance = conveyance * (5.0 * top / (3.0 * area) - 2.0 * wetted_slope / (3.0 * perimeter))
+    return area, top, conveyance, d_conveyance
+
+
+def _scalar_geometry(depth: float, width: float, side: float, manning: float) -> Tuple[float, float, float, float]:
+    """section_geometry 的标量版本（恒定流推算逐断面调用，避免小数组开销）"""
+    depth = max(depth, MIN_DEPTH)
+    area = (width + side * depth) * depth
+    top = width + 2 * side * depth
+    wetted_slope = 2 * math.sqrt(1 + side * side)
+    perimeter = width + wetted_slope * depth
+    conveyance = area ** (5.0 / 3.0) / (manning * perimeter ** (2.0 / 3.0))
+    d_conveyance = conveyance * (5.0 * top / (3.0 * area) - 2.0 * wetted_slope / (3.0 * perimeter))
+    return area, top, conveyance, d_conveyance
+
+
+def normal_depth(flow: float, width: float, side: float, manning: float, slope: float) -> float:
+    """均匀流水深（二分法）"""
+    if flow <= 0 or slope <= 0:
+        return MIN_DEPTH
+    target = flow / math.sqrt(slope)
+    low, high = MIN_DEPTH, 1.0
+    while _scalar_geometry(high, width, side, manning)[2] < target:
+        high *= 2
+    for _ in range(60):
+        middle = (low + high) / 2
+        if _scalar_geometry(middle, width, side, manning)[2] < target:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+def gate_flow(head: np.ndarray, coefficient: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    淹没孔流 Q = Cd·b·e·√(2g)·Δh/√(|Δh|+ε)
+
+    Args:
+        coefficient: Cd·b·e·√(2g)
+    Returns:
+        (流量, dQ/dΔh)
+    """
+    root = np.sqrt(np.abs(head) + GATE_EPSILON)
+    flow = coefficient * head / root
+    slope = coefficient * (0.5 * np.abs(head) + GATE_EPSILON) / root ** 3
+    return flow, slope
+
+
+def gate_head(flow: float, coefficient: float) -> float:
+    """gate_flow 的反函数：给定流量的过闸水头差"""
+    if coefficient <= 0:
+        raise ValueError("节制闸开度为零时不能通过流量")
+    y = abs(flow) / coefficient
+    head = (y * y + math.sqrt(y ** 4 + 4 * y * y * GATE_EPSILON)) / 2
+    return math.copysign(head, flow)
+
+
+def _reach(raw: Dict[str, Any], index: int, previous_bed: Optional[float]) -> Dict[str, Any]:
+    reach = {**DEFAULT_SECTION, **raw}
+    reach['id'] = str(raw.get('id', f'渠段{index + 1}'))
+    reach['length'] = float(raw.get('length', 0)) * 1000.0
+    if reach['length'] <= 0:
+        raise ValueError(f"渠段 {reach['id']} 的长度（km）必须大于0")
+    for key in ('bottom_width', 'side_slope', 'manning', 'bank_height'):
+        reach[key] = float(reach[key])
+    if reach['bottom_width'] <= 0 and reach['side_slope'] <= 0:
+        raise ValueError(f"渠段 {reach['id']} 的断面无效")
+    if reach['manning'] <= 0:
+        raise ValueError(f"渠段 {reach['id']} 的糙率必须大于0")
+    if 'bed_upstream' in raw:
+        upstream = float(raw['bed_upstream'])
+    elif previous_bed is not None:
+        upstream = previous_bed
+    else:
+        upstream = 100.0
+    if 'bed_downstream' in raw:
+        downstream = float(raw['bed_downstream'])
+    else:
+        downstream = upstream - float(reach['slope']) * reach['length']
+    reach['bed_upstream'], reach['bed_downstream'] = upstream, downstream
+    reach['slope'] = (upstream - downstream) / reach['length']
+    return reach
+
+
+def _structure(raw: Dict[str, Any], index: int) -> Dict[str, Any]:
+    kind = raw.get('type', 'gate')
+    if kind not in ('gate', 'pump'):
+        raise ValueError(f"未知的建筑物类型: {kind}（可选 gate / pump）")
+    structure = {'type': kind, 'id': str(raw.get('id', f"{'节制闸' if kind == 'gate' else '泵站'}{index + 1}"))}
+    if kind == 'gate':
+        structure['width'] = float(raw.get('width', DEFAULT_GATE['width']))
+        structure['discharge_coefficient'] = float(raw.get('discharge_coefficient', DEFAULT_GATE['discharge_coefficient']))
+        structure['opening'] = schedule(raw['opening'], f"{structure['id']} 开度") if raw.get('opening') is not None else None
+    else:
+        if raw.get('flow') is None:
+            raise ValueError(f"泵站 {structure['id']} 需要给定流量过程 flow")
+        structure['flow'] = schedule(raw['flow'], f"{structure['id']} 流量")
+        structure['efficiency'] = float(raw.get('efficiency', 0.82))
+    return structure
+
+
+def _boundary(raw: Optional[Dict[str, Any]], name: str, default: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    raw = raw or default
+    if raw is None:
+        return None
+    kind = raw.get('type', 'flow')
+    if kind not in ('flow', 'level'):
+        raise ValueError(f"{name}边界类型需要是 flow 或 level")
+    return {'type': kind, 'series': schedule(raw['value'], f'{name}边界') if raw.get('value') is not None else None}
+
+
+def build_systems(arguments: Dict[str, Any], dx: float) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]], List[str]]:
+    """
+    解析渠道配置，按泵站拆分为独立系统并计算恒定流初始状态
+
+    Args:
+        arguments: {'reaches', 'structures', 'upstream', 'downstream', 'offtakes'}
+        dx: 断面间距上限（m）
+
+    Returns:
+        (系统列表, 渠段列表, 建筑物列表, 警告)
+    """
+    raw_reaches = arguments.get('reaches') or []
+    if not raw_reaches:
+        raise ValueError("至少需要一个渠段")
+    reaches = []
+    for i, raw in enumerate(raw_reaches):
+        reaches.append(_reach(raw, i, reaches[-1]['bed_downstream'] if reaches else None))
+    raw_structures = arguments.get('structures') or [{'type': 'gate'}] * (len(reaches) - 1)
+    if len(raw_structures) != len(reaches) - 1:
+        raise ValueError(f"{len(reaches)} 个渠段之间需要 {len(reaches) - 1} 个建筑物，实际 {len(raw_structures)} 个")
+    structures = [_structure(raw, i) for i, raw in enumerate(raw_structures)]
+
+    upstream = _boundary(arguments.get('upstream'), '上游', None)
+    downstream = _boundary(arguments.get('downstream'), '下游', {'type': 'level'})
+    if upstream is None or upstream['type'] != 'flow' or upstream['series'] is None:
+        raise ValueError("上游边界需要给定流量过程（type=flow, value）")
+
+    # 分水口：按所在渠段和位置归入断面区间
+    offtakes = [[] for _ in reaches]
+    ids = {reach['id']: i for i, reach in enumerate(reaches)}
+    for k, raw in enumerate(arguments.get('offtakes') or []):
+        index = ids.get(str(raw.get('reach')), raw.get('reach'))
+        if not isinstance(index, int) or not 0 <= index < len(reaches):
+            raise ValueError(f"分水口 {k + 1} 的所属渠段 {raw.get('reach')} 不存在")
+        position = float(raw.get('position', reaches[index]['length'] / 1000.0)) * 1000.0
+        offtakes[index].append({
+            'id': str(raw.get('id', f'分水口{k + 1}')),
+            'position': min(max(position, 0.0), reaches[index]['length']),
+            'series': schedule(raw.get('flow', 0.0), f'分水口{k + 1} 流量')
+        })
+
+    # 各渠段断面划分
+    for reach in reaches:
+        count = max(2, int(math.ceil(reach['length'] / dx)))
+        reach['dx'] = reach['length'] / count
+        reach['segments'] = count
+
+    # 初始流量：自上游按分水口和泵站流量逐段递减
+    warnings = []
+    flow = at(upstream['series'], 0.0)
+    for k, reach in enumerate(reaches):
+        reach['flow_in'] = flow
+        reach['segment_flows'] = []
+        withdrawals = np.zeros(reach['segments'])
+        for offtake in offtakes[k]:
+            segment = min(int(offtake['position'] / reach['dx']), reach['segments'] - 1)
+            offtake['segment'] = segment
+            withdrawals[segment] += at(offtake['series'], 0.0)
+        reach['withdrawals'] = withdrawals
+        flow -= withdrawals.sum()
+        reach['flow_out'] = flow
+        if flow < 0:
+            raise ValueError(f"渠段 {reach['id']} 的分水流量超过来水，初始状态无法建立")
+        if k < len(structures) and structures[k]['type'] == 'pump':
+            pumped = at(structures[k]['flow'], 0.0)
+            if abs(pumped - flow) > 1e-6 * max(flow, 1.0):
+                warnings.append(
+                    f"泵站 {structures[k]['id']} 初始流量 {pumped:g} m³/s 与来水 {flow:g} m³/s 不一致，前池水位将持续变化"
+                )
+            flow = pumped
+        if reach.get('target_depth') is None:
+            reach['target_depth'] = normal_depth(
+                max(reach['flow_out'], 1e-3), reach['bottom_width'], reach['side_slope'], reach['manning'], max(reach['slope'], 1e-6)
+            )
+        reach['target_depth'] = float(reach['target_depth'])
+
+    # 按泵站拆分系统
+    groups, current = [], [0]
+    for k, structure in enumerate(structures):
+        if structure['type'] == 'pump':
+            groups.append(current)
+            current = []
+        current.append(k + 1)
+    groups.append(current)
+
+    systems = []
+    for g, group in enumerate(groups):
+        first, last = group[0], group[-1]
+        system_upstream = upstream if first == 0 else {'type': 'flow', 'series': structures[first - 1]['flow']}
+        if last == len(reaches) - 1:
+            system_downstream = dict(downstream)
+            if system_downstream['series'] is None:
+                reach = reaches[last]
+                system_downstream['series'] = schedule(reach['bed_downstream'] + reach['target_depth'], '下游边界')
+        else:
+            system_downstream = {'type': 'flow', 'series': structures[last]['flow']}
+        systems.append(_system(g, group, reaches, structures, offtakes, system_upstream, system_downstream, warnings))
+    return systems, reaches, structures, warnings
+
+
+def _system(
+    index: int,
+    group: List[int],
+    reaches: List[Dict[str, Any]],
+    structures: List[Dict[str, Any]],
+    offtakes: List[List[Dict[str, Any]]],
+    upstream: Dict[str, Any],
+    downstream: Dict[str, Any],
+    warnings: List[str]
+) -> Dict[str, Any]:
+    """组装一个系统的断面数组、内部节制闸和恒定流初始水面线"""
+    bed, width, side, manning, flows = [], [], [], [], []
+    segment_left, segment_dx, segment_reach = [], [], []
+    ranges, gates, system_offtakes = [], [], []
+    for k in group:
+        reach = reaches[k]
+        start = len(bed)
+        n = reach['segments']
+        bed.extend(np.linspace(reach['bed_upstream'], reach['bed_downstream'], n + 1).tolist())
+        width.extend([reach['bottom_width']] * (n + 1))
+        side.extend([reach['side_slope']] * (n + 1))
+        manning.extend([reach['manning']] * (n + 1))
+        flows.extend((reach['flow_in'] - np.concatenate(([0.0], np.cumsum(reach['withdrawals'])))).tolist())
+        segment_left.extend(range(start, start + n))
+        segment_dx.extend([reach['dx']] * n)
+        segment_reach.extend([k] * n)
+        ranges.append([start, start + n])
+        for offtake in offtakes[k]:
+            system_offtakes.append({'id': offtake['id'], 'segment': len(segment_left) - n + offtake['segment'], 'series': offtake['series']})
+        if k != group[-1]:
+            gates.append({'structure': k, 'left': start + n})
+
+    # 恒定流水面线：自下游向上游逐断面推算；节制闸默认按维持闸前目标水位确定开度
+    levels = np.zeros(len(bed))
+    last = group[-1]
+    if downstream['type'] == 'level':
+        levels[-1] = at(downstream['series'], 0.0)
+    else:
+        levels[-1] = bed[-1] + reaches[last]['target_depth']
+    for position in range(len(group) - 1, -1, -1):
+        k = group[position]
+        start, end = ranges[position]
+        if position < len(group) - 1:
+            gate = structures[k]
+            below = levels[end + 1]
+            flow = flows[end]
+            if gate['opening'] is None:
+                target = bed[end] + reaches[k]['target_depth']
+                head = target - below
+                if head < MIN_GATE_HEAD:
+                    warnings.append(
+                        f"节制闸 {gate['id']} 闸后水位 {below:.2f} m 高于闸前目标水位 {target:.2f} m，按最小水头差计算开度"
+                    )
+                    head = MIN_GATE_HEAD
+                coefficient = flow * math.sqrt(head + GATE_EPSILON) / head
+                opening = coefficient / (gate['discharge_coefficient'] * gate['width'] * math.sqrt(2 * GRAVITY))
+                gate['opening'] = schedule(opening, f"{gate['id']} 开度")
+                gate['opening_derived'] = True
+            else:
+                opening = at(gate['opening'], 0.0)
+                coefficient = gate['discharge_coefficient'] * gate['width'] * opening * math.sqrt(2 * GRAVITY)
+                head = gate_head(flow, coefficient)
+            levels[end] = below + head
+        for j in range(end - 1, start - 1, -1):
+            levels[j] = _backwater(
+                levels[j + 1], flows[j], flows[j + 1], bed[j], bed[j + 1],
+                width[j], side[j], manning[j], segment_dx[j - position]
+            )
+
+    for gate in gates:
+        structure = structures[gate['structure']]
+        gate.update({
+            'id': structure['id'],
+            'coefficient': structure['discharge_coefficient'] * structure['width'] * math.sqrt(2 * GRAVITY),
+            'opening': structure['opening']
+        })
+
+    return {
+        'index': index,
+        'reaches': group,
+        'bed': bed,
+        'width': width,
+        'side': side,
+        'manning': manning,
+        'segment_left': segment_left,
+        'segment_dx': segment_dx,
+        'ranges': ranges,
+        'gates': gates,
+        'offtakes': system_offtakes,
+        'upstream': upstream,
+        'downstream': downstream,
+        'initial': {'levels': levels.tolist(), 'flows': flows}
+    }
+
+
+def _backwater(
+    level_right: float, flow_left: float, flow_right: float, bed_left: float, bed_right: float,
+    width: float, side: float, manning: float, dx: float
+) -> float:
+    """
+    恒定流下由右断面水位求左断面水位
+
+    与 Preissmann 动量方程的恒定形式一致：
+        (Φ_R - Φ_L)/Δx + g·Ā·(Z_R - Z_L)/Δx + (G_L + G_R)/2 = 0，Φ = βQ²/A，G = g·A·Q|Q|/K²
+    """
+    area_r, _, conveyance_r, _ = _scalar_geometry(level_right - bed_right, width, side, manning)
+    phi_r = MOMENTUM_COEFFICIENT * flow_right ** 2 / area_r
+    friction_r = GRAVITY * area_r * flow_right * abs(flow_right) / conveyance_r ** 2
+    level = level_right + friction_r / (GRAVITY * area_r) * dx
+    for _ in range(50):
+        depth = max(level - bed_left, MIN_DEPTH)
+        area, top, conveyance, d_conveyance = _scalar_geometry(depth, width, side, manning)
+        mean_area = (area + area_r) / 2
+        phi = MOMENTUM_COEFFICIENT * flow_left ** 2 / area
+        friction = GRAVITY * area * flow_left * abs(flow_left) / conveyance ** 2
+        residual = (phi_r - phi) / dx + GRAVITY * mean_area * (level_right - level) / dx + (friction + friction_r) / 2
+        derivative = (
+            MOMENTUM_COEFFICIENT * flow_left ** 2 * top / area ** 2 / dx
+            + GRAVITY * top / 2 * (level_right - level) / dx
+            - GRAVITY * mean_area / dx
+            + GRAVITY * flow_left * abs(flow_left) * (top / conveyance ** 2 - 2 * area * d_conveyance / conveyance ** 3) / 2
+        )
+        if derivative == 0:
+            break
+        change = residual / derivative
+        level -= change
+        if abs(change) < 1e-8:
+            break
+    return level
+
+
+def build_default_canal(
+    length_km: float = 1000.0,
+    pool_km: float = 50.0,
+    inflow: float = 350.0,
+    offtake: float = 8.0
+) -> Dict[str, Any]:
+    """
+    示例长距离调水干渠
+
+    等长渠段由节制闸分隔（闸处底板跌落 0.3 m），中点设一座提水泵站（扬程约 10 m）；
+    每个渠段末端附近有一个分水口。第 24~72 小时中游 4 个分水口加大分水，渠首提前同步加大引水。
+
+    Args:
+        length_km: 干渠总长（km）
+        pool_km: 节制闸间距（km）
+        inflow: 渠首引水流量（m³/s）
+        offtake: 每个分水口的基本分水流量（m³/s）
+    """
+    pools = max(1, int(round(length_km / pool_km)))
+    length = length_km / pools
+    pump_at = pools // 2 if pools >= 4 else None
+    raise_window = set(range(pools // 5, pools // 5 + 4)) if pools >= 8 else set()
+    extra = 0.5 * offtake * len(raise_window)
+
+    reaches, structures, offtakes = [], [], []
+    bed = 150.0
+    for k in range(pools):
+        reaches.append({'id': f'渠段{k + 1}', 'length': length, 'bed_upstream': bed, **DEFAULT_SECTION})
+        bed -= DEFAULT_SECTION['slope'] * length * 1000.0
+        flow = offtake if k not in raise_window else [[0, offtake], [24, offtake], [26, 1.5 * offtake], [72, 1.5 * offtake], [74, offtake]]
+        offtakes.append({'id': f'分水口{k + 1}', 'reach': k, 'position': 0.9 * length, 'flow': flow})
+        if k < pools - 1:
+            if pump_at is not None and k == pump_at - 1:
+                structures.append({'type': 'pump', 'id': '中途泵站', 'flow': inflow - offtake * (k + 1), 'efficiency': 0.82})
+                bed += 10.0
+            else:
+                structures.append({'type': 'gate', 'id': f'节制闸{k + 1}'})
+                bed -= 0.3
+
+    head = [[0, inflow], [24, inflow], [25, inflow + extra], [72, inflow + extra], [73, inflow]] if extra else inflow
+    return {
+        'reaches': reaches,
+        'structures': structures,
+        'offtakes': offtakes,
+        'upstream': {'type': 'flow', 'value': head},
+        'downstream': {'type': 'level'}
+    }
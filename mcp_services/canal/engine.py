@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+canal_simulation 工具入口
+
+泵站把渠道分成水力上独立的系统，各系统在常驻进程池中并行求解（1 个系统或 1 个工作进程时在当前进程内计算）。
+"""
+
+import os
+import time
+import logging
+import threading
+import multiprocessing
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Any, Optional, Callable
+
+import numpy as np
+
+from .channel import GRAVITY, build_systems, build_default_canal, at
+from .preissmann import DEFAULT_THETA, PreissmannSolver, run_system
+
+logger = logging.getLogger(__name__)
+
+
+def _available_cpus() -> int:
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# 并行求解系统的工作进程数
+WORKERS = int(os.environ.get('MCP_CANAL_WORKERS', '0')) or _available_cpus()
+MAX_DURATION_HOURS = 720
+DEFAULT_DURATION_HOURS = 168
+# 默认时间步长（秒）、断面间距上限（米）、输出间隔（小时）
+DEFAULT_TIME_STEP = 600.0
+DEFAULT_DX = 1000.0
+DEFAULT_OUTPUT_HOURS = 1.0
+# 断面总数上限
+MAX_SECTIONS = 20000
+# 剖面包络输出的最多点数
+MAX_PROFILE_POINTS = 200
+# 安全超高下限（m）和最小运行水深占目标水深的比例
+MIN_FREEBOARD = 0.5
+MIN_DEPTH_RATIO = 0.6
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """常驻进程池（spawn 启动，调用方可能是多线程的Web进程）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context('spawn'))
+            # 与蒙特卡洛进程池相同：在运行时工作进程中使用时需要在任务队列清理之前关闭
+            multiprocessing.util.Finalize(None, _reset_pool, kwargs={'wait': True}, exitpriority=100)
+            logger.info(f"🚀 渠道仿真进程池已启动: {WORKERS} 个工作进程")
+        return _pool
+
+
+def _reset_pool(wait: bool = False):
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
+
+
+def _solve_systems(
+    systems: List[Dict[str, Any]],
+    time_step: float,
+    theta: float,
+    duration: float,
+    output_hours: float,
+    progress_callback: Optional[Callable] = None
+) -> List[Dict[str, Any]]:
+    parallel = min(WORKERS, len(systems))
+    if parallel <= 1:
+        results = []
+        for k, system in enumerate(systems):
+            def report(update, k=k):
+                if progress_callback:
+                    progress_callback({
+                        'progress': round(5 + 90 * (k + update['progress'] / 100.0) / len(systems), 1),
+                        'message': f"系统 {k + 1}/{len(systems)}: {update['message']}"
+                    })
+            results.append(PreissmannSolver(system, time_step, theta).run(duration, output_hours, report))
+        return results
+
+    pool = _get_pool()
+    futures = [pool.submit(run_system, system, time_step, theta, duration, output_hours) for system in systems]
+    results = [None] * len(systems)
+    try:
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results[result['index']] = result
+            if progress_callback:
+                progress_callback({
+                    'progress': round(5 + 90 * done / len(systems), 1),
+                    'message': f'已完成 {done}/{len(systems)} 个系统'
+                })
+    except BrokenProcessPool:
+        _reset_pool()
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+    return results
+
+
+def _envelope(values: np.ndarray, chainage: np.ndarray) -> Dict[str, List[float]]:
+    """沿程包络，断面过多时等间距抽取"""
+    step = max(1, int(np.ceil(len(chainage) / MAX_PROFILE_POINTS)))
+    index = np.unique(np.append(np.arange(0, len(chainage), step), len(chainage) - 1))
+    return {
+        'km': np.round(chainage[index] / 1000.0, 2),
+        'max_level': np.round(values.max(axis=0)[index], 3),
+        'min_level': np.round(values.min(axis=0)[index], 3),
+        'final_level': np.round(values[-1][index], 3)
+    }
+
+
+def run_canal_simulation(
+    arguments: Dict[str, Any],
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    明渠非恒定流仿真（一维圣维南方程，Preissmann 隐式格式）
+
+    Args:
+        arguments: 工具参数
+            reaches / structures / offtakes / upstream / downstream: 渠道配置（缺省使用示例干渠，
+                可用 length_km、pool_km 调整规模）
+            duration: 模拟时长（小时），time_step: 计算步长（秒），dx: 断面间距（米），
+            output_interval: 输出间隔（小时），theta: 时间权重
+    """
+    started = time.perf_counter()
+    duration = float(arguments.get('duration', DEFAULT_DURATION_HOURS))
+    if not 0 < duration <= MAX_DURATION_HOURS:
+        raise ValueError(f"模拟时长需在 0~{MAX_DURATION_HOURS} 小时之间")
+    output_hours = float(arguments.get('output_interval', DEFAULT_OUTPUT_HOURS))
+    time_step = float(arguments.get('time_step', DEFAULT_TIME_STEP))
+    dx = float(arguments.get('dx', DEFAULT_DX))
+    theta = float(arguments.get('theta', DEFAULT_THETA))
+    if output_hours <= 0 or time_step <= 0 or dx <= 0:
+        raise ValueError("输出间隔、时间步长和断面间距必须大于0")
+    if not 0.5 <= theta <= 1.0:
+        raise ValueError("时间权重 theta 需在 0.5~1 之间")
+    # 时间步长取能整除输出间隔的最大值
+    time_step = output_hours * 3600.0 / max(1, int(np.ceil(output_hours * 3600.0 / time_step)))
+
+    config = arguments if arguments.get('reaches') else {
+        **build_default_canal(float(arguments.get('length_km', 1000.0)), float(arguments.get('pool_km', 50.0))),
+        **{key: arguments[key] for key in ('upstream', 'downstream') if arguments.get(key)}
+    }
+    systems, reaches, structures, warnings = build_systems(config, dx)
+    n_sections = sum(len(s['bed']) for s in systems)
+    if n_sections > MAX_SECTIONS:
+        raise ValueError(f"断面数 {n_sections} 超过上限 {MAX_SECTIONS}，请加大断面间距 dx")
+    if progress_callback:
+        progress_callback({'progress': 5, 'message': f'{len(reaches)} 个渠段、{n_sections} 个断面，{len(systems)} 个独立系统开始计算'})
+
+    results = _solve_systems(systems, time_step, theta, duration, output_hours, progress_callback)
+    hours = results[0]['hours']
+
+    # 各渠段首末断面的过程和沿程包络
+    chainage_offset = 0.0
+    reach_results, series = [], {}
+    reach_sections = {}
+    for system, result in zip(systems, results):
+        bed = np.asarray(system['bed'])
+        for position, k in enumerate(system['reaches']):
+            start, end = system['ranges'][position]
+            reach_sections[k] = (result, start, end, bed)
+    all_levels, all_chainage = [], []
+    for k, reach in enumerate(reaches):
+        result, start, end, bed = reach_sections[k]
+        levels = result['levels'][:, start:end + 1]
+        flows = result['flows'][:, start:end + 1]
+        depth = levels - bed[start:end + 1]
+        freeboard = reach['bank_height'] - depth.max()
+        min_depth = float(depth.min())
+        if freeboard < MIN_FREEBOARD:
+            warnings.append(f"{reach['id']} 最高水位超高仅 {freeboard:.2f} m（渠深 {reach['bank_height']:g} m）")
+        if min_depth < MIN_DEPTH_RATIO * reach['target_depth']:
+            warnings.append(f"{reach['id']} 最小水深 {min_depth:.2f} m，低于目标水深的 {MIN_DEPTH_RATIO:.0%}")
+        reach_results.append({
+            'id': reach['id'],
+            'start_km': round(chainage_offset / 1000.0, 2),
+            'length_km': round(reach['length'] / 1000.0, 2),
+            'sections': end - start + 1,
+            'target_depth': round(reach['target_depth'], 3),
+            'upstream_level': {'min': round(float(levels[:, 0].min()), 3), 'max': round(float(levels[:, 0].max()), 3), 'final': round(float(levels[-1, 0]), 3)},
+            'downstream_level': {'min': round(float(levels[:, -1].min()), 3), 'max': round(float(levels[:, -1].max()), 3), 'final': round(float(levels[-1, -1]), 3)},
+            'flow_range': [round(float(flows.min()), 2), round(float(flows.max()), 2)],
+            'min_freeboard': round(float(freeboard), 3),
+            'min_depth': round(min_depth, 3)
+        })
+        series[reach['id']] = {
+            'upstream_level': np.round(levels[:, 0], 3),
+            'downstream_level': np.round(levels[:, -1], 3),
+            'upstream_flow': np.round(flows[:, 0], 2),
+            'downstream_flow': np.round(flows[:, -1], 2)
+        }
+        all_levels.append(levels)
+        all_chainage.append(chainage_offset + np.linspace(0.0, reach['length'], end - start + 1))
+        chainage_offset += reach['length']
+
+    structure_results = []
+    for k, structure in enumerate(structures):
+        upstream = series[reaches[k]['id']]['downstream_level']
+        downstream = series[reaches[k + 1]['id']]['upstream_level']
+        flow = series[reaches[k]['id']]['downstream_flow'] if structure['type'] == 'gate' else np.array([at(structure['flow'], h) for h in hours])
+        item = {
+            'id': structure['id'],
+            'type': structure['type'],
+            'km': reach_results[k + 1]['start_km'],
+            'flow': np.round(flow, 2)
+        }
+        if structure['type'] == 'gate':
+            item['head'] = np.round(upstream - downstream, 3)
+            item['opening'] = round(at(structure['opening'], 0.0), 3)
+            item['opening_derived'] = bool(structure.get('opening_derived'))
+        else:
+            lift = downstream - upstream
+            item['lift'] = np.round(lift, 3)
+            power = 1000.0 * GRAVITY * flow * np.maximum(lift, 0.0) / structure['efficiency'] / 1000.0
+            item['power_kw'] = np.round(power, 1)
+            item['energy_mwh'] = round(float(((power[1:] + power[:-1]) / 2 * np.diff(hours)).sum()) / 1000.0, 2)
+        structure_results.append(item)
+
+    iterations = sum(r['iterations'] for r in results)
+    steps = sum(r['steps'] for r in results)
+    failed = sum(r['failed_steps'] for r in results)
+    if failed:
+        warnings.append(f"{failed} 个时间步 Newton 迭代未收敛，可减小时间步长")
+    head = series[reaches[0]['id']]['upstream_flow']
+    tail = series[reaches[-1]['id']]['downstream_level']
+
+    elapsed = (time.perf_counter() - started) * 1000
+    logger.info(
+        f"✅ 渠道仿真完成: {chainage_offset / 1000:.0f} km, {n_sections} 个断面, {len(systems)} 个系统, "
+        f"{duration:g} 小时, 耗时 {elapsed:.0f} ms"
+    )
+
+    return {
+        'status': 'success',
+        'tool': 'canal_simulation',
+        'message': f'✅ 渠道非恒定流仿真完成（{chainage_offset / 1000:g} km, {len(reaches)} 个渠段, {duration:g} 小时）',
+        'results': {
+            'duration': duration,
+            'hours': hours,
+            'summary': {
+                'total_length_km': round(chainage_offset / 1000.0, 2),
+                'reaches': len(reaches),
+                'gates': sum(1 for s in structures if s['type'] == 'gate'),
+                'pumps': sum(1 for s in structures if s['type'] == 'pump'),
+                'head_flow_range': [round(float(head.min()), 2), round(float(head.max()), 2)],
+                'terminal_level_range': [round(float(tail.min()), 3), round(float(tail.max()), 3)]
+            },
+            'reaches': reach_results,
+            'structures': structure_results,
+            'series': series,
+            'profile': _envelope(np.concatenate(all_levels, axis=1), np.concatenate(all_chainage)),
+            'warnings': warnings
+        },
+        'solver': {
+            'method': f'Preissmann 隐式格式 (θ={theta:g}) / Newton + 带状LU',
+            'sections': n_sections,
+            'unknowns': 2 * n_sections,
+            'bandwidth': [2, 2],
+            'systems': len(systems),
+            'workers': min(WORKERS, len(systems)),
+            'time_step': round(time_step, 2),
+            'steps': int(steps),
+            'newton_iterations': int(iterations),
+            'avg_iterations': round(iterations / max(steps, 1), 2),
+            'system_ms': [r['elapsed_ms'] for r in results],
+            'elapsed_ms': round(elapsed, 1)
+        }
+    }
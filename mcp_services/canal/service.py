@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+渠道非恒定流仿真MCP服务（独立部署）
+
+在仓库根目录运行:
+    python -m mcp_services.canal.service
+
+通过服务清单注册（"name": "canal_simulation", "url": "http://host:8087", "category": "simulation"）后，
+HydroNet 按同一 /execute 约定调用。
+"""
+
+import os
+from datetime import datetime
+
+from flask import Flask, jsonify
+
+from mcp_services.runtime import ServiceRuntime, RuntimeQueueFull, register_task_routes, encode_response, decode_request
+from .engine import MAX_DURATION_HOURS
+
+app = Flask(__name__)
+
+# 单次仿真内的独立系统已经由渠道仿真进程池（MCP_CANAL_WORKERS）并行计算，
+# 默认只用一个任务进程，避免任务进程数 × 系统进程数超过CPU核数
+runtime = ServiceRuntime(
+    {'canal_simulation': 'mcp_services.canal.engine:run_canal_simulation'},
+    max_workers=int(os.environ.get('MCP_RUNTIME_WORKERS', '1'))
+)
+register_task_routes(app, runtime)
+
+# 同步执行接口的最长等待时间（秒），更长的计算请使用 /tasks/submit
+EXECUTE_TIMEOUT = float(os.environ.get('MCP_EXECUTE_TIMEOUT', '300'))
+
+
+@app.route('/execute', methods=['POST'])
+def execute():
+    """
+    执行渠道仿真
+
+    请求体: {"arguments": {...}} 或 {"params": {...}}；
+    不给 reaches 时使用示例干渠（length_km、pool_km 调整规模）
+    """
+    try:
+        data = decode_request()
+        params = data.get('arguments') or data.get('params') or {}
+        return encode_response(runtime.run('canal_simulation', params, timeout=EXECUTE_TIMEOUT))
+
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 400
+    except RuntimeQueueFull as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 429
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 500
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """健康检查接口"""
+    return jsonify({
+        'status': 'healthy',
+        'service': '渠道仿真服务',
+        'version': '1.0.0',
+        'runtime': runtime.get_metrics(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+@app.route('/info', methods=['GET'])
+def info():
+    """服务信息接口"""
+    return jsonify({
+        'name': 'canal_simulation',
+        'type': 'simulation',
+        'description': '长距离输水明渠一维非恒定流仿真（圣维南方程，Preissmann 隐式格式）',
+        'version': '1.0.0',
+        'capabilities': [
+            'Newton 迭代 + 带状LU（下/上带宽 2），计算量随断面数线性增长',
+            '节制闸淹没孔流内边界（与上下游渠段隐式耦合），开度可按时间过程给定',
+            '泵站流量内边界，按泵站拆分的独立系统并行求解',
+            f'分水口流量过程、渠首流量/末端水位边界，最长 {MAX_DURATION_HOURS} 小时'
+        ]
+    })
+
+
+if __name__ == '__main__':
+    port = int(os.environ.get('CANAL_SERVICE_PORT', '8087'))
+    print("=" * 50)
+    print("🛶 渠道仿真MCP服务")
+    print("=" * 50)
+    print(f"服务地址: http://localhost:{port}")
+    print("执行接口: POST /execute")
+    print("异步任务: POST /tasks/submit, GET /tasks/<id>")
+    print("=" * 50)
+
+    runtime.start()
+    app.run(host='0.0.0.0', port=port, threaded=True)
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+控制策略服务
+PID 批量整定（向量化闭环仿真 + 共享频率网格裕度）和凝聚形式MPC
+"""
+
+from .plant import ProcessModel
+from .engine import design_controller
+
+__all__ = [
+    'ProcessModel',
+    'design_controller'
+]
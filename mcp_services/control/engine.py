@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+control 工具入口
+"""
+
+import time
+import logging
+from typing import Dict, Any, Optional, Callable, Tuple
+
+import numpy as np
+
+from .plant import ProcessModel
+from .response import step_metrics
+from .pid import simc_tuning, sample_candidates, simulate_pid, frequency_grid, loop_margins, DERIVATIVE_FILTER
+from .mpc import condensed_matrices, feedback_gains, simulate_mpc, spectral_radius, MAX_PREDICTION_HORIZON
+
+logger = logging.getLogger(__name__)
+
+
+CONTROLLER_TYPES = ('PID', 'MPC')
+# 每轮候选数（PID）和输入变化权重候选数（MPC）
+PID_CANDIDATES = 4096
+MPC_CANDIDATES = 256
+# PID 两轮搜索的对数范围倍数：先粗搜，再在最优解附近细搜
+SEARCH_SPREADS = (10.0, 2.0)
+# 默认鲁棒性要求
+DEFAULT_MAX_SENSITIVITY = 2.0
+DEFAULT_MIN_PHASE_MARGIN = 30.0
+DEFAULT_OVERSHOOT = 10.0
+# 响应曲线返回的点数
+RESPONSE_POINTS = 100
+# MPC 鲁棒性检验：对象增益比预测模型大 30% 时仍需满足超调和调节时间要求
+MPC_GAIN_MISMATCH = 0.3
+
+
+def _select(metrics: Dict[str, np.ndarray], spec: Dict[str, float]) -> Tuple[int, np.ndarray]:
+    """
+    选择满足指标的候选中 IAE 最小者；都不满足时选违反程度最小者
+
+    Returns:
+        (最优候选下标, 满足全部指标的掩码)
+    """
+    violation = np.zeros(len(metrics['iae']))
+    violation += np.maximum(metrics['overshoot'] - spec['overshoot'], 0) / max(spec['overshoot'], 1.0)
+    if spec.get('settling_time'):
+        settling = np.where(np.isfinite(metrics['settling_time']), metrics['settling_time'], 1e9)
+        violation += np.maximum(settling - spec['settling_time'], 0) / spec['settling_time']
+    if 'sensitivity' in metrics:
+        violation += np.maximum(metrics['sensitivity'] - spec['max_sensitivity'], 0)
+        violation += np.maximum(spec['min_phase_margin'] - metrics['phase_margin'], 0) / spec['min_phase_margin']
+    stable = ~metrics['diverged'] & metrics['stable']
+    violation = np.where(stable, violation, np.inf)
+
+    feasible = violation == 0
+    if feasible.any():
+        return int(np.argmin(np.where(feasible, metrics['iae'], np.inf))), feasible
+    return int(np.argmin(violation)), feasible
+
+
+def _round(value: float, digits: int = 4) -> Optional[float]:
+    return round(float(value), digits) if np.isfinite(value) else None
+
+
+def design_controller(
+    arguments: Dict[str, Any],
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    control 工具入口（参数与 MCP服务管理器中的 control 工具定义一致）
+
+    Args:
+        arguments: {
+            'controller_type': 'PID' | 'MPC',
+            'setpoint': 设定值（相对当前工况的阶跃量）,
+            'process_model': {'gain', 'time_constant', 'dead_time', 'time_constant2',
+                              'input_limits': [下限, 上限]}（可直接使用辨识结果）,
+            'performance_spec': {'settling_time': 秒, 'overshoot': %, 'max_sensitivity',
+                                 'min_phase_margin': 度, 'disturbance': 输入端阶跃扰动,
+                                 'structure': 'PI' | 'PID'}
+        }
+    """
+    started = time.perf_counter()
+    controller_type = str(arguments.get('controller_type') or 'PID').upper()
+    if controller_type not in CONTROLLER_TYPES:
+        raise ValueError(f"暂不支持 {controller_type} 控制器设计，可选 {', '.join(CONTROLLER_TYPES)}")
+
+    setpoint = float(arguments.get('setpoint', 1.0))
+    if setpoint == 0:
+        raise ValueError("设定值变化量不能为0")
+    process = arguments.get('process_model') or {}
+    model = ProcessModel.from_arguments(process)
+    spec_args = arguments.get('performance_spec') or {}
+    spec = {
+        'overshoot': float(spec_args.get('overshoot', DEFAULT_OVERSHOOT)),
+        'settling_time': float(spec_args['settling_time']) if spec_args.get('settling_time') else None,
+        'max_sensitivity': float(spec_args.get('max_sensitivity', DEFAULT_MAX_SENSITIVITY)),
+        'min_phase_margin': float(spec_args.get('min_phase_margin', DEFAULT_MIN_PHASE_MARGIN))
+    }
+    limits = process.get('input_limits') or arguments.get('input_limits')
+    limits = (float(limits[0]), float(limits[1])) if limits else None
+    disturbance = float(spec_args.get('disturbance', 0.0))
+
+    # 仿真时长：覆盖对象动态和调节时间要求；有扰动时后半段为扰动响应
+    segment_duration = max(8 * (model.lag + model.dead_time), 2 * (spec['settling_time'] or 0))
+    duration = segment_duration * (2 if disturbance else 1)
+    ts, delay = model.sample_time(duration)
+    n_steps = int(np.ceil(duration / ts))
+    segment = int(np.ceil(segment_duration / ts)) if disturbance else n_steps
+    disturbance_step = segment if disturbance else None
+
+    def report(progress, message):
+        if progress_callback:
+            progress_callback({'progress': progress, 'message': message})
+
+    warnings = []
+    if controller_type == 'PID':
+        derivative = str(spec_args.get('structure', 'PID')).upper() != 'PI'
+        omega = frequency_grid(model, ts)
+        center = simc_tuning(model)
+        evaluated = 0
+        for round_index, spread in enumerate(SEARCH_SPREADS):
+            params = sample_candidates(center, PID_CANDIDATES, spread, derivative, seed=round_index)
+            y, u = simulate_pid(model, params, setpoint, ts, delay, n_steps, limits, disturbance, disturbance_step)
+            metrics = step_metrics(y, u, setpoint, ts, segment)
+            metrics.update(loop_margins(model, params, omega))
+            metrics['stable'] = (metrics['gain_margin'] > 0) & (metrics['phase_margin'] > 0)
+            best, feasible = _select(metrics, spec)
+            center = tuple(params[best])
+            evaluated += len(params)
+            report(
+                40 + 40 * round_index,
+                f'第 {round_index + 1} 轮：评估 {len(params)} 组参数，{int(feasible.sum())} 组满足指标'
+            )
+
+        kc, ti, td = params[best]
+        kp = kc * model.action
+        parameters = {
+            'Kp': round(float(kp), 6),
+            'Ki': round(float(kp / ti), 6),
+            'Kd': round(float(kp * td), 6),
+            'Tf': round(float(td / DERIVATIVE_FILTER), 6),
+            'Ti': round(float(ti), 4),
+            'Td': round(float(td), 4)
+        }
+        stability = {
+            'gain_margin': _round(metrics['gain_margin'][best], 2),
+            'phase_margin': _round(metrics['phase_margin'][best], 2),
+            'crossover_frequency': _round(metrics['crossover'][best], 6),
+            'stable': bool(metrics['stable'][best] and not metrics['diverged'][best])
+        }
+        robustness = {
+            'sensitivity': _round(metrics['sensitivity'][best], 3),
+            'complementary_sensitivity': _round(metrics['complementary_sensitivity'][best], 3)
+        }
+        method = f'Sobol采样 {len(SEARCH_SPREADS)} 轮 × {PID_CANDIDATES} 组（SIMC 为搜索中心），批量闭环仿真 + 频域裕度'
+        cache_hit = None
+
+    else:
+        horizon = int(min(np.ceil((model.dead_time + 3 * model.lag) / ts), MAX_PREDICTION_HORIZON))
+        prediction_horizon = max(horizon, delay + 2)
+        control_horizon = min(int(spec_args.get('control_horizon', 5)), prediction_horizon)
+        matrices, cache_hit = condensed_matrices(model, ts, delay, prediction_horizon, control_horizon)
+        report(30, f'预测矩阵{"复用缓存" if cache_hit else "已构建"}（Np={prediction_horizon}, Nc={control_horizon}）')
+
+        # 输入变化权重 R 按对象增益平方归一化后在对数范围内搜索
+        weights = model.gain ** 2 * np.logspace(-4, 3, MPC_CANDIDATES)
+        gains = feedback_gains(matrices, weights)
+        y, u = simulate_mpc(matrices, gains, setpoint, n_steps, limits, disturbance, disturbance_step)
+        metrics = step_metrics(y, u, setpoint, ts, segment)
+        y_mismatch, u_mismatch = simulate_mpc(
+            matrices, gains, setpoint, n_steps, limits, disturbance, disturbance_step,
+            gain_ratio=1 + MPC_GAIN_MISMATCH
+        )
+        mismatch = step_metrics(y_mismatch, u_mismatch, setpoint, ts, segment)
+        radius = spectral_radius(matrices, gains)
+        # 超调、调节时间和发散判断取名义与失配两种情况中较差者，IAE 按名义情况
+        for name in ('overshoot', 'settling_time'):
+            metrics[name + '_nominal'] = metrics[name]
+            metrics[name] = np.maximum(metrics[name], mismatch[name])
+        metrics['diverged'] = metrics['diverged'] | mismatch['diverged']
+        metrics['stable'] = radius < 1.0
+        best, feasible = _select(metrics, spec)
+        for name in ('overshoot', 'settling_time'):
+            metrics[name] = metrics.pop(name + '_nominal')
+        evaluated = len(weights)
+        report(80, f'评估 {len(weights)} 组权重，{int(feasible.sum())} 组满足指标')
+
+        parameters = {
+            'prediction_horizon': prediction_horizon,
+            'control_horizon': control_horizon,
+            'sample_time': round(ts, 6),
+            'output_weight': 1.0,
+            'move_suppression': float(f'{weights[best]:.6g}'),
+            'feedback_gain': [round(float(v), 6) for v in gains[best][:min(10, prediction_horizon)]]
+        }
+        stability = {
+            'spectral_radius': round(float(radius[best]), 6),
+            'stable': bool(metrics['stable'][best] and not metrics['diverged'][best])
+        }
+        robustness = {
+            'gain_mismatch': MPC_GAIN_MISMATCH,
+            'mismatch_overshoot': _round(mismatch['overshoot'][best], 2),
+            'mismatch_settling_time': _round(mismatch['settling_time'][best], 2)
+        }
+        method = f'凝聚形式MPC（{MPC_CANDIDATES} 组输入变化权重批量求解反馈增益，名义/增益失配闭环仿真）'
+        if limits:
+            warnings.append('输入约束按限幅处理（未在线求解带约束QP）')
+
+    spec_satisfied = bool(feasible[best])
+    if not spec_satisfied:
+        warnings.append('没有候选同时满足全部性能和鲁棒性指标，返回违反程度最小的参数')
+
+    stride = max(1, n_steps // RESPONSE_POINTS)
+    response = {
+        'time': np.round(np.arange(0, n_steps, stride) * ts, 3),
+        'output': np.round(y[best, ::stride], 6),
+        'control': np.round(u[best, ::stride], 6)
+    }
+
+    logger.info(
+        f"✅ 控制器设计完成: {controller_type}, 评估 {evaluated} 组候选, "
+        f"耗时 {(time.perf_counter() - started) * 1000:.0f} ms"
+    )
+
+    return {
+        'status': 'success',
+        'tool': 'control',
+        'message': f'✅ 控制器设计完成（{controller_type}, 评估 {evaluated} 组候选参数）',
+        'results': {
+            'controller_type': controller_type,
+            'parameters': parameters,
+            'performance': {
+                'rise_time': _round(metrics['rise_time'][best], 2),
+                'settling_time': _round(metrics['settling_time'][best], 2),
+                'overshoot': _round(metrics['overshoot'][best], 2),
+                'steady_state_error': _round(metrics['steady_state_error'][best], 6),
+                'iae': _round(metrics['iae'][best], 4)
+            },
+            'stability': stability,
+            'robustness': robustness,
+            'spec_satisfied': spec_satisfied,
+            'feasible_candidates': int(feasible.sum()),
+            'process_model': model.to_dict(),
+            'response': response,
+            'warnings': warnings
+        },
+        'solver': {
+            'method': method,
+            'candidates': evaluated,
+            'sample_time': round(ts, 6),
+            'simulation_steps': n_steps,
+            'model_cached': cache_hit,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+    }
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+MPC（凝聚形式）
+
+增广状态 z = [x, u(k-1), …, u(k-d)] 把纯滞后并入状态方程，预测方程
+    Y = Ψ·z + Θ1·u(k-1) + G·ΔU
+只与模型、采样周期和预测/控制时域有关，按键缓存；不同的权重只改变
+H = GᵀQG + R·I，无约束最优解的第一步是线性反馈 Δu = -k·(Ψz + Θ1·u(k-1) + d̂ - r)。
+多组权重的反馈增益用批量线性求解一次算出，闭环仿真同 PID 一样按候选向量化；
+输入约束按限幅处理，输出扰动 d̂ 取实测值与模型预测之差（DMC）。
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from .plant import ProcessModel
+
+MAX_CACHED_MODELS = 32
+# 预测时域的上限（步）
+MAX_PREDICTION_HORIZON = 120
+
+_cache: 'OrderedDict[tuple, Dict[str, Any]]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def augmented_model(model: ProcessModel, ts: float, delay: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """含纯滞后的增广离散状态空间"""
+    A, B, C = model.discretize(ts)
+    nx = len(B)
+    nz = nx + delay
+    Az = np.zeros((nz, nz))
+    Bz = np.zeros(nz)
+    Cz = np.zeros(nz)
+    Az[:nx, :nx] = A
+    Cz[:nx] = C
+    if delay == 0:
+        Bz[:nx] = B
+    else:
+        # 最早的输入 u(k-d) 进入对象，其余输入依次后移
+        Az[:nx, nz - 1] = B
+        Az[nx + 1:, nx:nz - 1] = np.eye(delay - 1)
+        Bz[nx] = 1.0
+    return Az, Bz, Cz
+
+
+def condensed_matrices(
+    model: ProcessModel,
+    ts: float,
+    delay: int,
+    prediction_horizon: int,
+    control_horizon: int
+) -> Tuple[Dict[str, Any], bool]:
+    """
+    预测矩阵（按模型和时域缓存）
+
+    Returns:
+        ({'A', 'B', 'C', 'Psi', 'Theta1', 'G', 'GtG'}, 是否命中缓存)
+    """
+    key = (model.gain, model.time_constant, model.time_constant2, model.dead_time,
+           round(ts, 9), delay, prediction_horizon, control_horizon)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached, True
+
+    A, B, C = augmented_model(model, ts, delay)
+    Np, Nc = prediction_horizon, control_horizon
+
+    # Ψ 第 i 行 = C·A^(i+1)；markov[i] = C·A^i·B
+    Psi = np.empty((Np, len(B)))
+    markov = np.empty(Np)
+    power = np.eye(len(B))
+    for i in range(Np):
+        markov[i] = C @ power @ B
+        power = A @ power
+        Psi[i] = C @ power
+
+    # Θ 为下三角 Toeplitz：Y 对未来输入 U 的响应；U = 1·u(k-1) + S·ΔU
+    index = np.arange(Np)[:, None] - np.arange(Np)[None, :]
+    Theta = np.where(index >= 0, markov[np.clip(index, 0, None)], 0.0)
+    S = (np.arange(Np)[:, None] >= np.arange(Nc)[None, :]).astype(np.float64)
+    G = Theta @ S
+    matrices = {
+        'A': A, 'B': B, 'C': C,
+        'Psi': Psi,
+        'Theta1': Theta.sum(axis=1),
+        'G': G,
+        'GtG': G.T @ G
+    }
+
+    with _cache_lock:
+        matrices = _cache.setdefault(key, matrices)
+        while len(_cache) > MAX_CACHED_MODELS:
+            _cache.popitem(last=False)
+    return matrices, False
+
+
+def feedback_gains(matrices: Dict[str, Any], weights: np.ndarray) -> np.ndarray:
+    """
+    多组输入变化权重 R 的无约束MPC第一步反馈增益（输出权重 Q = I）
+
+    Returns:
+        (M, Np) 数组，第 m 行 = [(GᵀG + R_m·I)⁻¹·Gᵀ] 的第一行
+    """
+    G, GtG = matrices['G'], matrices['GtG']
+    Nc = GtG.shape[0]
+    H = GtG[None, :, :] + weights[:, None, None] * np.eye(Nc)[None, :, :]
+    rhs = np.broadcast_to(G.T, (len(weights),) + G.T.shape)
+    return np.linalg.solve(H, rhs)[:, 0, :]
+
+
+def simulate_mpc(
+    matrices: Dict[str, Any],
+    gains: np.ndarray,
+    setpoint: float,
+    n_steps: int,
+    input_limits: Optional[Tuple[float, float]] = None,
+    disturbance: float = 0.0,
+    disturbance_step: Optional[int] = None,
+    gain_ratio: float = 1.0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    批量闭环仿真（扰动作用在对象输入端）
+
+    Args:
+        gain_ratio: 对象增益与预测模型增益之比（1 为名义情况，用于检验模型失配下的鲁棒性）
+
+    Returns:
+        (y, u) 均为 (M, n_steps)
+    """
+    A, B, C = matrices['A'], matrices['B'], matrices['C']
+    Psi, Theta1 = matrices['Psi'], matrices['Theta1']
+    M = len(gains)
+    low, high = input_limits if input_limits else (-np.inf, np.inf)
+    # 反馈增益与预测矩阵预先相乘：Δu = -(kΨ·z + kΘ1·u(k-1) + Σk·(d̂ - r))
+    k_psi = gains @ Psi
+    k_theta = gains @ Theta1
+    k_sum = gains.sum(axis=1)
+
+    z_plant = np.zeros((M, len(B)))
+    z_model = np.zeros((M, len(B)))
+    u_prev = np.zeros(M)
+    y_out = np.empty((M, n_steps))
+    u_out = np.empty((M, n_steps))
+
+    with np.errstate(over='ignore', invalid='ignore'):
+        for k in range(n_steps):
+            y = z_plant @ C
+            offset = y - z_model @ C - setpoint
+            du = -((k_psi * z_model).sum(axis=1) + k_theta * u_prev + k_sum * offset)
+            u = np.clip(u_prev + du, low, high)
+            y_out[:, k] = y
+            u_out[:, k] = u
+
+            load = disturbance if disturbance_step is not None and k >= disturbance_step else 0.0
+            z_plant = z_plant @ A.T + (gain_ratio * (u + load))[:, None] * B[None, :]
+            z_model = z_model @ A.T + u[:, None] * B[None, :]
+            u_prev = u
+
+    return y_out, u_out
+
+
+def spectral_radius(matrices: Dict[str, Any], gains: np.ndarray) -> np.ndarray:
+    """
+    无约束名义闭环的谱半径（状态 [z, u(k-1)]，小于1时闭环稳定）
+    """
+    A, B = matrices['A'], matrices['B']
+    k_psi = gains @ matrices['Psi']
+    k_theta = gains @ matrices['Theta1']
+    M, nz = k_psi.shape
+    closed = np.zeros((M, nz + 1, nz + 1))
+    # u(k) = (1 - kΘ1)·u(k-1) - kΨ·z(k)
+    closed[:, :nz, :nz] = A[None] - B[None, :, None] * k_psi[:, None, :]
+    closed[:, :nz, nz] = B[None, :] * (1 - k_theta)[:, None]
+    closed[:, nz, :nz] = -k_psi
+    closed[:, nz, nz] = 1 - k_theta
+    return np.abs(np.linalg.eigvals(closed)).max(axis=1)
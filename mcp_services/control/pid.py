@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+PID 批量整定
+
+候选参数 (Kc, Ti, Td) 以 (M, 3) 数组给出，一次时间循环同时仿真全部候选（每步只有 M 维向量运算），
+稳定裕度在共享频率网格上一次算出 (M, W) 回路频率响应。
+"""
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from scipy.stats import qmc
+
+from .plant import ProcessModel
+
+# 微分滤波系数 Tf = Td / N
+DERIVATIVE_FILTER = 10.0
+# 频率网格点数
+FREQUENCY_POINTS = 400
+
+
+def simc_tuning(model: ProcessModel) -> Tuple[float, float, float]:
+    """SIMC 整定（τc = max(L, 0.1·T)）作为搜索中心"""
+    tau_c = max(model.dead_time, 0.1 * model.lag)
+    kc = model.lag / (abs(model.gain) * (tau_c + model.dead_time))
+    ti = min(model.lag, 4 * (tau_c + model.dead_time))
+    td = model.time_constant2 if model.time_constant2 > 0 else 0.25 * model.dead_time
+    return kc, ti, td
+
+
+def sample_candidates(
+    center: Tuple[float, float, float],
+    count: int,
+    spread: float,
+    derivative: bool,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    在中心值的对数邻域内用 Sobol 序列采样候选参数
+
+    Args:
+        spread: 对数范围倍数（Kc、Ti 在 center/spread ~ center·spread 之间）
+        derivative: False 时 Td 全为0（PI）
+
+    Returns:
+        (count, 3) 数组 [Kc, Ti, Td]
+    """
+    sampler = qmc.Sobol(d=3, scramble=True, seed=seed)
+    unit = sampler.random(count)
+    log_spread = np.log(spread)
+    kc = center[0] * np.exp((2 * unit[:, 0] - 1) * log_spread)
+    ti = center[1] * np.exp((2 * unit[:, 1] - 1) * log_spread)
+    if derivative:
+        # Td 在 0 ~ 0.5·Ti 之间（含中心值附近）
+        td_max = max(center[2] * spread, 1e-9)
+        td = np.minimum(unit[:, 2] * td_max, 0.5 * ti)
+    else:
+        td = np.zeros(count)
+    candidates = np.column_stack((kc, ti, td))
+    candidates[0] = center if derivative else (center[0], center[1], 0.0)
+    return candidates
+
+
+def simulate_pid(
+    model: ProcessModel,
+    params: np.ndarray,
+    setpoint: float,
+    ts: float,
+    delay: int,
+    n_steps: int,
+    input_limits: Optional[Tuple[float, float]] = None,
+    disturbance: float = 0.0,
+    disturbance_step: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    批量闭环仿真（设定值从0阶跃到 setpoint，可选输入端阶跃扰动）
+
+    PID 为位置式，微分作用于测量值并一阶滤波，控制量限幅时停止积分（抗积分饱和）。
+
+    Returns:
+        (y, u) 均为 (M, n_steps)
+    """
+    A, B, C = model.discretize(ts)
+    M = len(params)
+    kc = params[:, 0] * model.action
+    ti = params[:, 1]
+    td = params[:, 2]
+    tf = td / DERIVATIVE_FILTER
+    d_decay = tf / (tf + ts)
+    d_gain = kc * td / (tf + ts)
+    low, high = input_limits if input_limits else (-np.inf, np.inf)
+
+    x = np.zeros((M, len(B)))
+    buffer = np.zeros((M, delay + 1))
+    integral = np.zeros(M)
+    derivative = np.zeros(M)
+    y_prev = np.zeros(M)
+    y_out = np.empty((M, n_steps))
+    u_out = np.empty((M, n_steps))
+
+    with np.errstate(over='ignore', invalid='ignore'):
+        for k in range(n_steps):
+            y = x @ C
+            error = setpoint - y
+            derivative = d_decay * derivative - d_gain * (y - y_prev)
+            candidate = integral + ts * error
+            u_raw = kc * (error + candidate / ti) + derivative
+            u = np.clip(u_raw, low, high)
+            # 饱和且误差会继续推高（压低）控制量时停止积分
+            push = error * model.action
+            windup = ((u_raw > high) & (push > 0)) | ((u_raw < low) & (push < 0))
+            integral = np.where(windup, integral, candidate)
+            y_out[:, k] = y
+            u_out[:, k] = u
+            y_prev = y
+
+            plant_input = u + (disturbance if disturbance_step is not None and k >= disturbance_step else 0.0)
+            buffer[:, k % (delay + 1)] = plant_input
+            delayed = buffer[:, (k - delay) % (delay + 1)]
+            x = x @ A.T + delayed[:, None] * B[None, :]
+
+    return y_out, u_out
+
+
+def frequency_grid(model: ProcessModel, ts: float) -> np.ndarray:
+    """对数频率网格：从 0.01/(T+L) 到采样的奈奎斯特频率"""
+    low = 0.01 / (model.lag + model.dead_time)
+    return np.logspace(np.log10(low), np.log10(np.pi / ts), FREQUENCY_POINTS)
+
+
+def loop_margins(model: ProcessModel, params: np.ndarray, omega: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    共享频率网格上的稳定裕度和灵敏度峰值
+
+    Returns:
+        gain_margin (dB)、phase_margin (度)、crossover (rad/s)、sensitivity (Ms)、
+        complementary_sensitivity (Mt)
+    """
+    g_mag, g_phase = model.frequency_response(omega)
+    kc, ti, td = (params[:, i:i + 1] for i in range(3))
+    s = 1j * omega[None, :]
+    controller = np.abs(kc) * (1 + 1 / (s * ti) + s * td / (1 + s * td / DERIVATIVE_FILTER))
+    loop = controller * (g_mag * np.exp(1j * g_phase))[None, :]
+    magnitude = np.abs(loop)
+    # 控制器相位在 (-90°, 90°) 内，直接相加得到连续相位
+    phase = np.angle(controller) + g_phase[None, :]
+
+    def first_crossing(mask):
+        # 每行第一个满足条件的位置；没有时返回 -1
+        index = np.argmax(mask, axis=1)
+        return np.where(mask.any(axis=1), index, -1)
+
+    rows = np.arange(len(params))
+    phase_cross = first_crossing(phase <= -np.pi)
+    gain_cross = first_crossing(magnitude <= 1.0)
+
+    gm = np.where(phase_cross >= 0, 1.0 / np.maximum(magnitude[rows, phase_cross], 1e-12), np.inf)
+    pm = np.where(gain_cross >= 0, 180.0 + np.degrees(phase[rows, gain_cross]), np.inf)
+    crossover = np.where(gain_cross >= 0, omega[np.maximum(gain_cross, 0)], 0.0)
+
+    return {
+        'gain_margin': 20 * np.log10(gm),
+        'phase_margin': pm,
+        'crossover': crossover,
+        'sensitivity': np.abs(1 / (1 + loop)).max(axis=1),
+        'complementary_sensitivity': np.abs(loop / (1 + loop)).max(axis=1)
+    }
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+过程模型
+
+一阶/二阶惯性加纯滞后: G(s) = K·e^(-Ls) / ((T1·s + 1)(T2·s + 1))
+参数名与 identification 工具的辨识结果一致（gain / time_constant / dead_time），可直接传入。
+"""
+
+from typing import Dict, Any, Tuple
+
+import numpy as np
+from scipy.signal import tf2ss, cont2discrete
+
+
+# 每个仿真最多的时间步数（超过时加大采样周期）
+MAX_SIM_STEPS = 2000
+
+
+class ProcessModel:
+    """连续过程模型及其零阶保持离散化"""
+
+    def __init__(self, gain: float, time_constant: float, dead_time: float = 0.0, time_constant2: float = 0.0):
+        if gain == 0:
+            raise ValueError("过程增益不能为0")
+        if time_constant <= 0:
+            raise ValueError(f"时间常数必须大于0: {time_constant}")
+        if dead_time < 0 or time_constant2 < 0:
+            raise ValueError("纯滞后和第二时间常数不能为负")
+
+        self.gain = float(gain)
+        self.time_constant = float(time_constant)
+        self.time_constant2 = float(time_constant2)
+        self.dead_time = float(dead_time)
+
+    @classmethod
+    def from_arguments(cls, process_model: Dict[str, Any]) -> 'ProcessModel':
+        """
+        Args:
+            process_model: {'gain'|'K', 'time_constant'|'T', 'dead_time'|'L', 'time_constant2'|'T2'}，
+                也可以是 identification 结果中的 identified_parameters
+        """
+        model = process_model.get('identified_parameters', process_model)
+
+        def pick(*names, default=0.0):
+            for name in names:
+                if model.get(name) is not None:
+                    return float(model[name])
+            return default
+
+        return cls(
+            gain=pick('gain', 'K', default=1.0),
+            time_constant=pick('time_constant', 'T', 'T1', default=60.0),
+            dead_time=pick('dead_time', 'L', 'theta'),
+            time_constant2=pick('time_constant2', 'T2')
+        )
+
+    @property
+    def action(self) -> float:
+        """控制器作用方向（正作用 1，反作用 -1）"""
+        return 1.0 if self.gain > 0 else -1.0
+
+    @property
+    def lag(self) -> float:
+        """总惯性时间"""
+        return self.time_constant + self.time_constant2
+
+    def sample_time(self, duration: float) -> Tuple[float, int]:
+        """
+        选择采样周期：惯性时间的1/20、纯滞后的1/2中较小者，且仿真步数不超过 MAX_SIM_STEPS；
+        有纯滞后时调整为纯滞后的整数分之一
+
+        Returns:
+            (采样周期, 纯滞后步数)
+        """
+        ts = min(self.lag / 20.0, self.dead_time / 2.0 if self.dead_time > 0 else np.inf)
+        ts = max(ts, duration / MAX_SIM_STEPS)
+        delay = int(round(self.dead_time / ts))
+        if delay == 0:
+            # 纯滞后不到半个采样周期时忽略
+            return ts, 0
+        return self.dead_time / delay, delay
+
+    def discretize(self, ts: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """不含纯滞后部分的零阶保持离散状态空间 (A, B, C)"""
+        den = np.polymul([self.time_constant, 1.0], [self.time_constant2, 1.0]) if self.time_constant2 > 0 \
+            else np.array([self.time_constant, 1.0])
+        A, B, C, D = tf2ss([self.gain], den)
+        Ad, Bd, Cd, _, _ = cont2discrete((A, B, C, D), ts, method='zoh')
+        return Ad, Bd.ravel(), Cd.ravel()
+
+    def frequency_response(self, omega: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        频率响应幅值和（连续展开的）相位
+
+        控制器作用方向按增益符号取（反作用过程用负的比例增益），
+        回路传递函数中两者符号抵消，这里按 |K| 计算。
+
+        Returns:
+            (|G(jω)|, ∠G(jω) 弧度)
+        """
+        magnitude = abs(self.gain) / np.sqrt(1 + (omega * self.time_constant) ** 2)
+        phase = -np.arctan(omega * self.time_constant) - omega * self.dead_time
+        if self.time_constant2 > 0:
+            magnitude = magnitude / np.sqrt(1 + (omega * self.time_constant2) ** 2)
+            phase = phase - np.arctan(omega * self.time_constant2)
+        return magnitude, phase
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            'gain': self.gain,
+            'time_constant': self.time_constant,
+            'time_constant2': self.time_constant2,
+            'dead_time': self.dead_time
+        }
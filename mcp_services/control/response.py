@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+闭环阶跃响应指标（对一批候选控制器的响应矩阵向量化计算）
+"""
+
+from typing import Dict
+
+import numpy as np
+
+
+# 调节时间的误差带（设定值变化量的 ±2%）
+SETTLING_BAND = 0.02
+
+
+def step_metrics(y: np.ndarray, u: np.ndarray, setpoint: float, ts: float, segment: int) -> Dict[str, np.ndarray]:
+    """
+    Args:
+        y: (M, N) 各候选控制器的被控量响应（从0开始的设定值阶跃）
+        u: (M, N) 控制量
+        setpoint: 设定值
+        ts: 采样周期（秒）
+        segment: 设定值阶跃段的步数（之后为扰动段）
+
+    Returns:
+        每个候选的 overshoot (%)、settling_time、rise_time (s)、steady_state_error、iae、
+        total_variation（控制量总变差）、diverged
+    """
+    M = y.shape[0]
+    ys = y[:, :segment]
+    scale = abs(setpoint) if setpoint != 0 else 1.0
+    normalized = ys / setpoint if setpoint != 0 else ys
+
+    overshoot = np.maximum(normalized.max(axis=1) - 1.0, 0.0) * 100.0
+
+    outside = np.abs(ys - setpoint) > SETTLING_BAND * scale
+    # 最后一次超出误差带的位置；一直在带外时记为无穷大
+    last_outside = segment - 1 - np.argmax(outside[:, ::-1], axis=1)
+    settling_time = np.where(outside.any(axis=1), (last_outside + 1) * ts, 0.0)
+    settling_time = np.where(outside[:, -1], np.inf, settling_time)
+
+    reached_10 = normalized >= 0.1
+    reached_90 = normalized >= 0.9
+    rise_time = np.where(
+        reached_90.any(axis=1),
+        (np.argmax(reached_90, axis=1) - np.argmax(reached_10, axis=1)) * ts,
+        np.inf
+    )
+
+    tail = max(1, segment // 20)
+    steady_state_error = np.abs(setpoint - ys[:, -tail:].mean(axis=1))
+    error = np.abs(y - setpoint)
+    iae = error.sum(axis=1) * ts
+    total_variation = np.abs(np.diff(u, axis=1)).sum(axis=1)
+    diverged = ~np.isfinite(y).all(axis=1) | (np.abs(y[:, -1] - setpoint) > 10 * scale)
+
+    return {
+        'overshoot': overshoot,
+        'settling_time': settling_time,
+        'rise_time': rise_time,
+        'steady_state_error': steady_state_error,
+        'iae': np.where(np.isfinite(iae), iae, np.inf),
+        'total_variation': total_variation,
+        'diverged': diverged if M else np.zeros(0, dtype=bool)
+    }
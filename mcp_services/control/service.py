@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+控制设计MCP服务（独立部署）
+
+在仓库根目录运行:
+    python -m mcp_services.control.service
+
+注册到HydroNet后（服务清单中 "url": "http://host:8084"），
+control 工具改为调用该服务；未注册时管理器在本地直接调用同一引擎。
+"""
+
+import os
+from datetime import datetime
+
+from flask import Flask, jsonify
+
+from mcp_services.runtime import ServiceRuntime, RuntimeQueueFull, register_task_routes, encode_response, decode_request
+
+app = Flask(__name__)
+
+# 每次设计都是数千个候选的批量仿真（CPU密集），在进程池中执行；MPC预测矩阵缓存在各工作进程内
+runtime = ServiceRuntime({'control': 'mcp_services.control.engine:design_controller'})
+register_task_routes(app, runtime)
+
+# 同步执行接口的最长等待时间（秒），更长的计算请使用 /tasks/submit
+EXECUTE_TIMEOUT = float(os.environ.get('MCP_EXECUTE_TIMEOUT', '300'))
+
+
+@app.route('/execute', methods=['POST'])
+def execute():
+    """
+    执行控制器设计
+
+    请求体: {"arguments": {...}} 或 {"params": {...}}，参数同 control 工具定义。
+    process_model 可直接使用 identification 工具返回的 identified_parameters
+    """
+    try:
+        data = decode_request()
+        params = data.get('arguments') or data.get('params') or {}
+        return encode_response(runtime.run('control', params, timeout=EXECUTE_TIMEOUT))
+
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 400
+    except RuntimeQueueFull as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 429
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 500
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """健康检查接口"""
+    return jsonify({
+        'status': 'healthy',
+        'service': '控制设计服务',
+        'version': '1.0.0',
+        'runtime': runtime.get_metrics(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+@app.route('/info', methods=['GET'])
+def info():
+    """服务信息接口"""
+    return jsonify({
+        'name': 'control',
+        'type': 'control',
+        'description': '一阶/二阶惯性加纯滞后对象的PID整定与MPC设计',
+        'version': '1.0.0',
+        'capabilities': [
+            'PID/PI：Sobol采样数千组参数批量闭环仿真',
+            '增益裕度、相位裕度、灵敏度峰值 Ms/Mt',
+            'MPC：凝聚形式预测矩阵缓存，批量求解反馈增益',
+            '超调、调节时间、输入限幅和输入端扰动'
+        ]
+    })
+
+
+if __name__ == '__main__':
+    port = int(os.environ.get('CONTROL_SERVICE_PORT', '8084'))
+    print("=" * 50)
+    print("🎛️ 控制设计MCP服务")
+    print("=" * 50)
+    print(f"服务地址: http://localhost:{port}")
+    print("执行接口: POST /execute")
+    print("异步任务: POST /tasks/submit, GET /tasks/<id>")
+    print("=" * 50)
+
+    runtime.start()
+    app.run(host='0.0.0.0', port=port, threaded=True)
@@ -7,12 +7,43 @@ MCP服务示例 - 展示如何开发一个MCP服务
 您可以基于此模板开发自己的水网仿真、辨识、调度、控制和测试服务。
 """
 
-from flask import Flask, request, jsonify
+import os
+import sys
+from flask import Flask, request, jsonify, Response, stream_with_context
+import json
 import numpy as np
 from datetime import datetime
 
+# 复用平台的传输编解码（内容协商、压缩、列式数组）和进程池运行时
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mcp_codec
+import mcp_digest
+from mcp_services.runtime import ServiceRuntime, RuntimeQueueFull, register_task_routes, encode_response, decode_request
+
+# 同步执行接口的最长等待时间（秒），更长的计算请使用 /tasks/submit
+EXECUTE_TIMEOUT = float(os.environ.get('MCP_EXECUTE_TIMEOUT', '300'))
+
+# 批量仿真：单次请求的情景数上限、每块情景数（限制中间数组内存）
+MAX_BATCH_SCENARIOS = 100000
+BATCH_CHUNK_SIZE = 4096
+TIME_STEPS = 100
+# 同步结果中返回的时间序列点数（完整序列见流式接口）
+SERIES_POINTS = 20
+SAFE_WATER_LEVEL = 15
+# 流式仿真的分块数（每块推送一次进度和部分结果）
+STREAM_BLOCKS = 10
+
+
 app = Flask(__name__)
 
+# 计算在工作进程中执行，Flask线程只负责收发请求（/health 在计算期间保持响应）
+runtime = ServiceRuntime({
+    'simulation': 'mcp_services.example_service:perform_simulation',
+    'simulation_stream': 'mcp_services.example_service:simulate_blocks',
+    'batch': 'mcp_services.example_service:run_batch'
+})
+register_task_routes(app, runtime)
+
 
 @app.route('/execute', methods=['POST'])
 def execute():
@@ -38,20 +69,38 @@ def execute():
     }
     """
     try:
-        data = request.json
+        # 请求体可能经过压缩或使用MessagePack
+        data = decode_request()
         query = data.get('query', '')
-        params = data.get('params', {})
+        # 兼容HydroNet Pro管理器的请求格式（tool_name + arguments）
+        params = data.get('params') or data.get('arguments') or {}
         
-        # 这里实现您的服务逻辑
-        result = perform_simulation(params)
+        # 客户端接受NDJSON时，逐块推送进度和部分结果（同样在工作进程中计算）
+        if data.get('stream') and 'application/x-ndjson' in request.headers.get('Accept', ''):
+            task_id = runtime.submit('simulation_stream', params)['task_id']
+            columnar = request.headers.get(mcp_codec.ARRAY_HEADER) == mcp_codec.ARRAY_ENCODING
+            encoding = mcp_codec.choose_encoding(request.headers.get('Accept-Encoding'))
+            headers = {'Accept-Encoding': ', '.join(mcp_codec.supported_encodings())}
+            if encoding:
+                headers['Content-Encoding'] = encoding
+            return Response(
+                stream_with_context(mcp_codec.compress_stream(stream_task(task_id, columnar=columnar), encoding)),
+                mimetype='application/x-ndjson',
+                headers=headers
+            )
         
-        return jsonify({
+        # 这里实现您的服务逻辑（在工作进程中执行）
+        result = runtime.run('simulation', params, timeout=EXECUTE_TIMEOUT)
+        
+        return encode_response({
             'status': 'success',
             'message': '仿真执行成功',
             'data': result,
             'timestamp': datetime.now().isoformat()
         })
         
+    except RuntimeQueueFull as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 429
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -60,21 +109,192 @@ def execute():
         }), 500
 
 
+@app.route('/execute_batch', methods=['POST'])
+def execute_batch():
+    """
+    批量情景仿真（蒙特卡洛 / 参数扫描）
+
+    请求格式:
+    {
+        "scenarios": [{"flow_rate": 120, "roughness": 0.015}, ...]
+                     或按列给出 {"flow_rate": [...], "roughness": [...], "duration": [...]},
+        "percentiles": [5, 50, 95],     # 可选，按时间步计算水位包络线
+        "chunk_size": 4096              # 可选，每块情景数
+    }
+
+    响应 data:
+    {
+        "count": N,
+        "scenarios": {"max_water_level": [...], "min_water_level": [...],
+                      "mean_water_level": [...], "avg_velocity": [...], "exceeds_safe_level": [...]},
+        "statistics": {...},
+        "envelope": {"time_fraction": [...], "p5": [...], "p50": [...], "p95": [...]}
+    }
+    """
+    try:
+        result = runtime.run('batch', decode_request(), timeout=EXECUTE_TIMEOUT)
+        return encode_response({
+            'status': 'success',
+            'message': f"批量仿真完成（{result['count']} 个情景）",
+            'data': result,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 400
+    except RuntimeQueueFull as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 429
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 500
+
+
+def run_batch(data):
+    """批量仿真任务入口（/execute_batch 和 /tasks/submit 的 batch 工具）"""
+    return perform_batch(
+        data.get('scenarios') or [],
+        percentiles=data.get('percentiles'),
+        chunk_size=int(data.get('chunk_size', BATCH_CHUNK_SIZE))
+    )
+
+
+def _scenario_columns(scenarios):
+    """情景列表或列式字典 -> (flow_rate, duration, roughness) 三个长度为N的数组"""
+    defaults = {'flow_rate': 100.0, 'duration': 3600.0, 'roughness': 0.013}
+
+    if isinstance(scenarios, dict):
+        lengths = {len(np.atleast_1d(v)) for v in scenarios.values()}
+        n = max(lengths) if lengths else 0
+        if lengths - {1, n}:
+            raise ValueError("按列给出的情景参数长度不一致")
+        columns = [
+            np.broadcast_to(np.asarray(scenarios.get(name, default), dtype=float), (n,))
+            for name, default in defaults.items()
+        ]
+    else:
+        columns = [
+            np.fromiter((s.get(name, default) for s in scenarios), dtype=float, count=len(scenarios))
+            for name, default in defaults.items()
+        ]
+
+    n = len(columns[0])
+    if n == 0:
+        raise ValueError("scenarios 不能为空")
+    if n > MAX_BATCH_SCENARIOS:
+        raise ValueError(f"情景数超过上限 {MAX_BATCH_SCENARIOS}: {n}")
+    return columns
+
+
+def _simulate_batch(flow_rate, roughness, steps=TIME_STEPS):
+    """
+    向量化的 _simulate：一次计算 (N, T) 水位矩阵
+
+    水位只依赖归一化时间 t/duration，因此所有情景共享同一时间轴。
+    """
+    phase = np.sin(2 * np.pi * np.linspace(0, 1, steps))
+    water_levels = 10 + 5 * (roughness / 0.013)[:, None] * phase[None, :]
+    velocities = flow_rate / (10 * 5)
+    return water_levels, velocities
+
+
+def perform_batch(scenarios, percentiles=None, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    批量执行仿真，按块广播计算，每块只保留逐情景统计量
+
+    需要包络线时才保存完整 (N, T) 水位矩阵（float32）。
+    """
+    flow_rate, duration, roughness = _scenario_columns(scenarios)
+    n = len(flow_rate)
+    chunk_size = max(1, chunk_size)
+
+    qs = [float(p) for p in percentiles or []]
+    if any(not 0 <= p <= 100 for p in qs):
+        raise ValueError(f"百分位数需在 0-100 之间: {percentiles}")
+
+    summary = {
+        'max_water_level': np.empty(n),
+        'min_water_level': np.empty(n),
+        'mean_water_level': np.empty(n),
+        'avg_velocity': np.empty(n)
+    }
+    levels_all = np.empty((n, TIME_STEPS), dtype=np.float32) if qs else None
+
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        levels, velocities = _simulate_batch(flow_rate[start:end], roughness[start:end])
+        summary['max_water_level'][start:end] = levels.max(axis=1)
+        summary['min_water_level'][start:end] = levels.min(axis=1)
+        summary['mean_water_level'][start:end] = levels.mean(axis=1)
+        summary['avg_velocity'][start:end] = velocities
+        if levels_all is not None:
+            levels_all[start:end] = levels
+
+    exceeds = summary['max_water_level'] >= SAFE_WATER_LEVEL
+    result = {
+        'count': n,
+        'scenarios': {**summary, 'exceeds_safe_level': exceeds},
+        'statistics': {
+            'exceed_probability': float(exceeds.mean()),
+            'max_water_level': {
+                'mean': float(summary['max_water_level'].mean()),
+                'std': float(summary['max_water_level'].std()),
+                'max': float(summary['max_water_level'].max())
+            },
+            'avg_velocity': {
+                'mean': float(summary['avg_velocity'].mean()),
+                'std': float(summary['avg_velocity'].std())
+            }
+        }
+    }
+
+    if levels_all is not None:
+        envelope = np.percentile(levels_all, qs, axis=0)
+        result['envelope'] = {'time_fraction': np.linspace(0, 1, TIME_STEPS)}
+        if np.all(duration == duration[0]):
+            result['envelope']['time'] = np.linspace(0, duration[0], TIME_STEPS)
+        for p, values in zip(qs, envelope):
+            result['envelope'][f'p{p:g}'] = values
+
+    return result
+
+
+def _simulate_steps(params, time_steps):
+    """示例：计算给定时间步的水位"""
+    duration = params.get('duration', 3600)  # 持续时间 秒
+    roughness = params.get('roughness', 0.013)  # 粗糙系数
+    return 10 + 5 * np.sin(2 * np.pi * time_steps / duration) * (roughness / 0.013)
+
+
+def _simulate(params):
+    """示例：简单的水流仿真，返回 (时间, 水位, 流速)"""
+    flow_rate = params.get('flow_rate', 100.0)  # 流量 m³/s
+    duration = params.get('duration', 3600)  # 持续时间 秒
+    
+    # 模拟计算
+    time_steps = np.linspace(0, duration, TIME_STEPS)
+    water_levels = _simulate_steps(params, time_steps)
+    velocities = flow_rate / (10 * 5)  # 简化的速度计算
+    
+    return time_steps, water_levels, velocities
+
+
 def perform_simulation(params):
     """
     执行仿真计算
     
     这是一个示例函数，实际应用中应该包含真实的仿真逻辑
     """
-    # 示例：简单的水流仿真
+    return _summarize(params, *_simulate(params))
+
+
+def _summarize(params, time_steps, water_levels, velocities):
+    """由完整的水位序列生成仿真结果"""
     flow_rate = params.get('flow_rate', 100.0)  # 流量 m³/s
     duration = params.get('duration', 3600)  # 持续时间 秒
     roughness = params.get('roughness', 0.013)  # 粗糙系数
     
-    # 模拟计算
-    time_steps = np.linspace(0, duration, 100)
-    water_levels = 10 + 5 * np.sin(2 * np.pi * time_steps / duration) * (roughness / 0.013)
-    velocities = flow_rate / (10 * 5)  # 简化的速度计算
+    # 保形降采样（LTTB，首末点和最高/最低水位必选），等间隔抽取会漏掉峰谷
+    series = {'time': time_steps, 'water_level': water_levels}
+    keep = mcp_digest.select_indices({'water_level': water_levels}, time_steps, SERIES_POINTS, 'lttb')
     
     return {
         'summary': {
@@ -86,8 +306,7 @@ def perform_simulation(params):
             'avg_velocity': float(velocities)
         },
         'time_series': {
-            'time': time_steps.tolist()[::10],  # 采样10个点
-            'water_level': water_levels.tolist()[::10]
+            name: values[keep].tolist() for name, values in series.items()
         },
         'warnings': [] if np.max(water_levels) < 15 else ['警告：水位超过安全阈值'],
         'recommendations': [
@@ -97,6 +316,61 @@ def perform_simulation(params):
     }
 
 
+def simulate_blocks(params, progress):
+    """
+    分块执行仿真（在工作进程中执行），每算完一块经进度回调推送该块的结果，
+    最后返回完整的响应数据
+    """
+    flow_rate = params.get('flow_rate', 100.0)
+    duration = params.get('duration', 3600)
+    time_steps = np.linspace(0, duration, TIME_STEPS)
+    water_levels = np.empty(TIME_STEPS)
+    series = {'time': time_steps, 'water_level': water_levels}
+    n = len(time_steps)
+    
+    for i, block in enumerate(np.array_split(np.arange(n), STREAM_BLOCKS)):
+        if len(block) == 0:
+            continue
+        water_levels[block[0]:block[-1] + 1] = _simulate_steps(params, time_steps[block[0]:block[-1] + 1])
+        progress({
+            'progress': round(100.0 * (i + 1) / STREAM_BLOCKS, 1),
+            'message': f'已计算 {block[-1] + 1}/{n} 个时间步',
+            'partial': {
+                'offset': int(block[0]),
+                'time_series': {
+                    name: values[block[0]:block[-1] + 1].copy() for name, values in series.items()
+                }
+            }
+        })
+    
+    return {
+        'status': 'success',
+        'message': '仿真执行成功',
+        'data': _summarize(params, time_steps, water_levels, flow_rate / (10 * 5)),
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+def stream_task(task_id, columnar=False):
+    """
+    逐行产出运行时任务的事件（NDJSON），客户端断开时取消任务
+    
+    - {"type": "progress", "progress": 30.0, "message": "...", "partial": {"time_series": {...}, "offset": n}}
+    - {"type": "result", "data": {...}}
+    
+    columnar=True 时数值序列按列式数组块编码（base64小端字节）
+    """
+    encode = mcp_codec.pack_arrays if columnar else mcp_codec.to_jsonable
+    finished = False
+    try:
+        for event in runtime.iter_events(task_id, timeout=EXECUTE_TIMEOUT):
+            finished = event['type'] == 'result'
+            yield json.dumps(encode(event), ensure_ascii=False) + '\n'
+    finally:
+        if not finished:
+            runtime.cancel(task_id)
+
+
 @app.route('/health', methods=['GET'])
 def health():
     """健康检查接口"""
@@ -104,6 +378,7 @@ def health():
         'status': 'healthy',
         'service': 'MCP仿真服务示例',
         'version': '1.0.0',
+        'runtime': runtime.get_metrics(),
         'timestamp': datetime.now().isoformat()
     })
 
@@ -119,7 +394,8 @@ def info():
         'capabilities': [
             '水流仿真',
             '水位预测',
-            '速度计算'
+            '速度计算',
+            '批量情景仿真（/execute_batch）'
         ],
         'parameters': {
             'flow_rate': {
@@ -147,8 +423,12 @@ if __name__ == '__main__':
     print("=" * 50)
     print("服务地址: http://localhost:8080")
     print("执行接口: POST /execute")
+    print("批量仿真: POST /execute_batch")
+    print("异步任务: POST /tasks/submit, GET /tasks/<id>")
     print("健康检查: GET /health")
     print("服务信息: GET /info")
     print("=" * 50)
     
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    runtime.start()
+    # 关闭重载器：重载会再启动一份进程池
+    app.run(host='0.0.0.0', port=8080, debug=True, use_reloader=False, threaded=True)
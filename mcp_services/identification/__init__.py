@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+系统辨识服务
+FOPDT / 水力静态特性 / Hammerstein 模型的向量化最小二乘辨识
+"""
+
+from .models import fit_linear, fit_static, fit_hammerstein
+from .engine import load_observations, identify
+
+__all__ = [
+    'fit_linear',
+    'fit_static',
+    'fit_hammerstein',
+    'load_observations',
+    'identify'
+]
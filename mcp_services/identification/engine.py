@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+identification 工具入口
+"""
+
+import time
+import logging
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Callable, Tuple
+
+import numpy as np
+
+from mcp_services.simulation.network import METERS_PER_MPA
+from .models import (
+    Z_95, fit_linear, simulate_linear, fit_static, predict_static,
+    fit_hammerstein, predict_hammerstein
+)
+
+logger = logging.getLogger(__name__)
+
+
+MODEL_TYPES = ('linear', 'nonlinear', 'hybrid')
+# 未提供时间戳时的默认采样间隔（秒），对应1分钟SCADA数据
+DEFAULT_SAMPLE_INTERVAL = 60.0
+# 前 80% 用于拟合，后 20% 用于验证
+TRAIN_FRACTION = 0.8
+MIN_SAMPLES = 20
+# 海曾-威廉公式流量指数
+HAZEN_WILLIAMS_EXPONENT = 1.852
+
+MODEL_EQUATIONS = {
+    'linear': 'y[k] = a·y[k-1] + b·u[k-1-d] + c  (FOPDT)',
+    'nonlinear': 'p = p0 - r·|Q|^n',
+    'hybrid': 'y[k] = a·y[k-1] + (1-a)·(β[s] - r·|u[k-1-d]|^n)  (Hammerstein + 分段偏置)'
+}
+
+
+def _parse_times(times) -> np.ndarray:
+    """时间列转换为秒（支持数值和ISO时间字符串，整列一次转换）"""
+    values = np.asarray(times)
+    if values.dtype.kind in 'iuf':
+        return values.astype(np.float64)
+    try:
+        stamps = values.astype('datetime64[ms]')
+    except ValueError:
+        stamps = np.array([datetime.fromisoformat(str(v)) for v in values], dtype='datetime64[ms]')
+    return (stamps - stamps[0]).astype(np.float64) / 1000.0
+
+
+def _fill_gaps(values: np.ndarray) -> Tuple[np.ndarray, int]:
+    """缺测值（None/NaN）按线性插值补齐，返回补齐后的序列和缺测个数"""
+    missing = ~np.isfinite(values)
+    count = int(missing.sum())
+    if count == 0:
+        return values, 0
+    if count == len(values):
+        raise ValueError("观测数据全部缺测")
+    index = np.arange(len(values))
+    values = values.copy()
+    values[missing] = np.interp(index[missing], index[~missing], values[~missing])
+    return values, count
+
+
+def load_observations(
+    observed_data,
+    input_signal: str = 'flow',
+    output_signal: str = 'pressure'
+) -> Dict[str, np.ndarray]:
+    """
+    读取观测数据
+
+    Args:
+        observed_data: 记录列表 [{'time', 'flow', 'pressure'}, ...]，
+            或按列组织的字典 {'time': [...], 'flow': [...], 'pressure': [...]}（大数据量推荐，
+            可直接使用 mcp_codec 的列式数组）
+
+    Returns:
+        {'time': 秒, 'input': ..., 'output': ..., 'missing': 缺测数}
+    """
+    if isinstance(observed_data, dict):
+        columns = observed_data
+        if input_signal not in columns or output_signal not in columns:
+            raise ValueError(f"观测数据缺少 {input_signal} 或 {output_signal} 列")
+        u = np.asarray(columns[input_signal], dtype=np.float64)
+        y = np.asarray(columns[output_signal], dtype=np.float64)
+        times = columns.get('time')
+    elif isinstance(observed_data, list) and observed_data:
+        n = len(observed_data)
+        u = np.fromiter(
+            (np.nan if r.get(input_signal) is None else r[input_signal] for r in observed_data),
+            dtype=np.float64, count=n
+        )
+        y = np.fromiter(
+            (np.nan if r.get(output_signal) is None else r[output_signal] for r in observed_data),
+            dtype=np.float64, count=n
+        )
+        times = [r.get('time') for r in observed_data] if 'time' in observed_data[0] else None
+    else:
+        raise ValueError("observed_data 不能为空")
+
+    if len(u) != len(y):
+        raise ValueError(f"{input_signal} 与 {output_signal} 长度不一致")
+    if len(y) < MIN_SAMPLES:
+        raise ValueError(f"观测数据太少（{len(y)} 条），至少需要 {MIN_SAMPLES} 条")
+
+    u, missing_u = _fill_gaps(u)
+    y, missing_y = _fill_gaps(y)
+
+    return {
+        'time': _parse_times(times) if times is not None else None,
+        'input': u,
+        'output': y,
+        'missing': missing_u + missing_y
+    }
+
+
+def _interval(value: float, std: float) -> List[float]:
+    return [value - Z_95 * std, value + Z_95 * std]
+
+
+def _significant(value: float, digits: int = 6) -> float:
+    """按有效数字取整（阻力系数等量级很小的参数不能按小数位取整）"""
+    return float(f'{value:.{digits}g}')
+
+
+def _fit_metrics(observed: np.ndarray, predicted: np.ndarray) -> Dict[str, float]:
+    error = predicted - observed
+    sse = float(error @ error)
+    centered = observed - observed.mean()
+    sst = float(centered @ centered)
+    return {
+        'R2': round(1 - sse / sst, 4) if sst > 0 else 0.0,
+        'RMSE': round(float(np.sqrt(sse / len(error))), 6),
+        'MAE': round(float(np.abs(error).mean()), 6)
+    }
+
+
+def _residual_analysis(residuals: np.ndarray) -> Dict[str, Any]:
+    """Durbin-Watson 统计量检验残差自相关（1.5~2.5 之间视为通过）"""
+    denominator = float(residuals @ residuals)
+    diff = np.diff(residuals)
+    dw = float(diff @ diff) / denominator if denominator > 0 else 2.0
+    return {
+        'residual_analysis': 'passed' if 1.5 <= dw <= 2.5 else 'autocorrelated',
+        'durbin_watson': round(dw, 3),
+        'residual_mean': float(residuals.mean())
+    }
+
+
+def _segments(times: Optional[np.ndarray], n: int, dt: float, segment_hours: float) -> np.ndarray:
+    """按时段长度划分样本（跳过无数据的时段，编号连续）"""
+    seconds = times if times is not None else np.arange(n) * dt
+    raw = np.floor((seconds - seconds[0]) / (segment_hours * 3600.0)).astype(np.int64)
+    return np.unique(raw, return_inverse=True)[1].ravel()
+
+
+def _hazen_williams_c(fit: Dict[str, Any], pipe: Dict[str, Any]) -> Tuple[float, float]:
+    """
+    由阻力系数反算海曾-威廉系数 C
+
+    阻力系数单位 MPa/(m³/h)^1.852，换算为 m/(m³/s)^1.852 后：
+    h = 10.667·L·Q^1.852 / (C^1.852·D^4.871)
+    """
+    length = float(pipe['length'])
+    diameter = float(pipe['diameter'])
+    r = fit['params']['resistance']
+    if r <= 0:
+        raise ValueError("辨识得到的阻力系数为0，无法反算粗糙系数（流量激励不足）")
+    r_si = r * METERS_PER_MPA * 3600.0 ** HAZEN_WILLIAMS_EXPONENT
+    c = (10.667 * length / (r_si * diameter ** 4.871)) ** (1 / HAZEN_WILLIAMS_EXPONENT)
+    std = c / HAZEN_WILLIAMS_EXPONENT * fit['std']['resistance'] / r
+    return float(c), float(std)
+
+
+def identify(
+    arguments: Dict[str, Any],
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    identification 工具入口（参数与 MCP服务管理器中的 identification 工具定义一致）
+
+    Args:
+        arguments: {
+            'observed_data': 记录列表或列字典,
+            'model_type': 'linear' | 'nonlinear' | 'hybrid',
+            'parameters_to_identify': [...](可选，筛选输出参数),
+            'input_signal' / 'output_signal': 输入/输出列名（默认 flow → pressure）,
+            'sample_interval': 采样间隔秒（无时间戳时使用）,
+            'max_dead_time': 最大纯滞后秒数,
+            'segment_hours': hybrid 模型偏置时段长度（默认24小时）,
+            'pipe': {'length': m, 'diameter': m}（nonlinear 模型反算海曾-威廉系数）
+        }
+        progress_callback: 进度回调 {'progress': 百分比, 'message': ...}
+    """
+    started = time.perf_counter()
+    model_type = arguments.get('model_type') or 'linear'
+    if model_type not in MODEL_TYPES:
+        raise ValueError(f"不支持的模型类型: {model_type}，可选 {', '.join(MODEL_TYPES)}")
+
+    def report(progress, message):
+        if progress_callback:
+            progress_callback({'progress': progress, 'message': message})
+
+    data = load_observations(
+        arguments.get('observed_data'),
+        arguments.get('input_signal', 'flow'),
+        arguments.get('output_signal', 'pressure')
+    )
+    u, y, times = data['input'], data['output'], data['time']
+    n = len(y)
+
+    if times is not None and n > 1:
+        dt = float(np.median(np.diff(times)))
+    else:
+        dt = float(arguments.get('sample_interval', DEFAULT_SAMPLE_INTERVAL))
+    if dt <= 0:
+        raise ValueError("时间戳必须递增")
+    max_delay = int(float(arguments.get('max_dead_time', 30 * dt)) // dt)
+
+    warnings = []
+    if data['missing']:
+        warnings.append(f"{data['missing']} 个缺测值已线性插值")
+    report(10, f'已读取 {n} 条观测数据，采样间隔 {dt:g} 秒')
+
+    split = int(n * TRAIN_FRACTION)
+    pipe = arguments.get('pipe')
+
+    if model_type == 'linear':
+        train = fit_linear(u[:split], y[:split], dt, max_delay)
+        report(45, '训练集拟合完成，正在验证')
+        validation_prediction = simulate_linear(train, u, y[0])[split:]
+        fit = fit_linear(u, y, dt, max_delay)
+        prediction = simulate_linear(fit, u, y[0])
+
+    elif model_type == 'nonlinear':
+        exponent = HAZEN_WILLIAMS_EXPONENT if pipe else None
+        train = fit_static(u[:split], y[:split], exponent=exponent)
+        report(45, '训练集拟合完成，正在验证')
+        validation_prediction = predict_static(train, u[split:])
+        fit = fit_static(u, y, exponent=exponent, hint=train['params']['exponent'])
+        prediction = predict_static(fit, u)
+        if pipe:
+            c, std = _hazen_williams_c(fit, pipe)
+            fit['params']['roughness'] = c
+            fit['std']['roughness'] = std
+
+    else:
+        segments = _segments(times, n, dt, float(arguments.get('segment_hours', 24)))
+        delay = fit_linear(u, y, dt, max_delay)['delay']
+        report(20, f'纯滞后 {delay * dt:g} 秒，开始非线性拟合（{int(segments.max()) + 1} 个偏置时段）')
+        train = fit_hammerstein(u[:split], y[:split], segments[:split], delay, dt)
+        report(60, '训练集拟合完成，正在验证')
+        validation_prediction = predict_hammerstein(train, u, y, segments)[split:]
+        fit = fit_hammerstein(u, y, segments, delay, dt, hint=train['params']['exponent'])
+        prediction = predict_hammerstein(fit, u, y, segments)
+        span = float(fit['bias'][-1] - fit['bias'][0])
+        # 单个时段偏置的标准差约为均值标准差的 √S 倍
+        if abs(span) > 3 * fit['std']['static_pressure'] * np.sqrt(len(fit['bias'])):
+            warnings.append(f"基准压力存在漂移 {span:+.4f}（首末时段之差）")
+
+    report(90, '全量拟合完成，正在计算置信区间')
+
+    params = fit['params']
+    requested = arguments.get('parameters_to_identify') or []
+    if requested:
+        unknown = [name for name in requested if name not in params]
+        if unknown:
+            warnings.append(f"{model_type} 模型不包含参数: {', '.join(unknown)}")
+        if 'roughness' in unknown:
+            warnings.append("粗糙系数需使用 nonlinear 模型并提供 pipe: {length, diameter}")
+        params = {name: value for name, value in params.items() if name in requested}
+
+    residuals = y - prediction
+    validation = _residual_analysis(residuals)
+    validation['cross_validation_score'] = _fit_metrics(y[split:], validation_prediction)['R2']
+
+    logger.info(
+        f"✅ 系统辨识完成: {model_type}, {n} 条数据, "
+        f"耗时 {(time.perf_counter() - started) * 1000:.0f} ms"
+    )
+
+    return {
+        'status': 'success',
+        'tool': 'identification',
+        'message': f'✅ 辨识完成（{model_type} 模型, {n} 条观测数据）',
+        'results': {
+            'identified_parameters': {name: _significant(value) for name, value in params.items()},
+            'model_fit': _fit_metrics(y, prediction),
+            'confidence_intervals': {
+                name: [_significant(v) for v in _interval(params[name], fit['std'][name])]
+                for name in params if name in fit['std']
+            },
+            'validation': validation,
+            'model': {
+                'type': model_type,
+                'equation': MODEL_EQUATIONS[model_type],
+                'prediction': 'simulation' if model_type == 'linear' else 'one_step',
+                'samples': n,
+                'sample_interval': dt
+            },
+            'warnings': warnings
+        },
+        'solver': {
+            'method': 'normal equations' if model_type == 'linear' else 'separable least squares',
+            'confidence_level': 0.95,
+            'function_evaluations': train['evaluations'] + fit['evaluations'],
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+    }
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+辨识模型
+
+- linear: 一阶惯性加纯滞后（FOPDT），按ARX形式线性最小二乘，滞后步数用正规方程逐个扫描
+- nonlinear: 管道水力静态特性 p = p0 - r·|Q|^n
+- hybrid: Hammerstein 模型（静态水力特性 + 一阶动态），并为每个时段估计一个基准压力偏置
+
+nonlinear/hybrid 模型除流量指数 n 外对其余参数都是线性的，按可分离最小二乘求解：
+给定 n 时线性参数有闭式解（hybrid 的分段偏置列互不重叠，用分段去均值消去），
+外层对 n 做多初值并行的一维搜索。
+
+所有残差和雅可比都在整段数组上向量化计算；置信区间由最优点的完整雅可比
+（hybrid 为每行4个非零元的稀疏矩阵）得到协方差，再用delta方法换算派生参数。
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import minimize_scalar
+from scipy.signal import lfilter
+
+logger = logging.getLogger(__name__)
+
+
+# 95% 置信区间（样本量很大，取正态分位数）
+Z_95 = 1.96
+# 流量指数的搜索范围和多初值网格
+EXPONENT_BOUNDS = (1.0, 3.0)
+EXPONENT_STARTS = (1.0, 1.5, 1.852, 2.0, 2.5, 3.0)
+EXPONENT_TOLERANCE = 1e-4
+
+
+def _covariance(jac, residuals: np.ndarray, n_params: int) -> np.ndarray:
+    """协方差 σ²·(JᵀJ)⁻¹（JᵀJ 奇异时使用伪逆）"""
+    dof = max(1, len(residuals) - n_params)
+    sigma2 = float(residuals @ residuals) / dof
+    jtj = jac.T @ jac
+    if sp.issparse(jtj):
+        jtj = jtj.toarray()
+    return sigma2 * np.linalg.pinv(jtj)
+
+
+def _abs_pow(u: np.ndarray, n: float) -> Tuple[np.ndarray, np.ndarray]:
+    """|u|^n 及其对 n 的导数 |u|^n·ln|u|（u=0 处取0）"""
+    magnitude = np.abs(u)
+    powered = magnitude ** n
+    log_term = np.log(np.where(magnitude > 0, magnitude, 1.0))
+    return powered, powered * log_term
+
+
+def _search_exponent(sse: Callable[[float], float], hint: Optional[float] = None) -> Tuple[float, int]:
+    """
+    一维搜索流量指数
+
+    先在多初值网格上并行计算残差平方和（NumPy运算期间释放GIL），
+    再在最优网格点的相邻区间内做有界Brent搜索；给定 hint 时只在其附近搜索（热启动）。
+
+    Returns:
+        (最优指数, 目标函数调用次数)
+    """
+    low, high = EXPONENT_BOUNDS
+    if hint is not None:
+        bracket = (max(low, hint - 0.1), min(high, hint + 0.1))
+        evaluations = 0
+    else:
+        grid = np.array(EXPONENT_STARTS)
+        with ThreadPoolExecutor(max_workers=len(grid)) as pool:
+            values = list(pool.map(sse, grid))
+        best = int(np.argmin(values))
+        bracket = (grid[max(best - 1, 0)], grid[min(best + 1, len(grid) - 1)])
+        evaluations = len(grid)
+
+    result = minimize_scalar(sse, bounds=bracket, method='bounded', options={'xatol': EXPONENT_TOLERANCE})
+    return float(result.x), evaluations + int(result.nfev)
+
+
+# ==================== linear: FOPDT / ARX ====================
+
+def fit_linear(u: np.ndarray, y: np.ndarray, dt: float, max_delay: int = 30) -> Dict[str, Any]:
+    """
+    y[k] = a·y[k-1] + b·u[k-1-d] + c
+
+    对每个候选滞后 d 只计算 3×3 正规方程（一次矩阵乘），选残差平方和最小者。
+
+    Returns:
+        {'theta', 'delay', 'params', 'std', 'evaluations'}
+    """
+    n = len(y)
+    max_delay = int(min(max_delay, n // 4))
+    best = None
+
+    for d in range(max_delay + 1):
+        y_prev = y[d:n - 1]
+        target = y[d + 1:]
+        X = np.column_stack((y_prev, u[:n - 1 - d], np.ones_like(y_prev)))
+        xtx = X.T @ X
+        xty = X.T @ target
+        try:
+            theta = np.linalg.solve(xtx, xty)
+        except np.linalg.LinAlgError:
+            continue
+        sse = float(target @ target - theta @ xty)
+        if best is None or sse < best[0]:
+            best = (sse, d, theta, xtx, len(target))
+
+    if best is None:
+        raise ValueError("线性模型拟合失败：输入信号缺少激励")
+
+    sse, delay, theta, xtx, count = best
+    a, b, c = theta
+    if not 0 < a < 1:
+        raise ValueError(f"辨识得到的系统不稳定或非一阶惯性（a={a:.4f}），请尝试 nonlinear/hybrid 模型")
+
+    sigma2 = max(sse, 0.0) / max(1, count - 3)
+    cov = sigma2 * np.linalg.inv(xtx)
+
+    # delta方法：派生参数对 (a, b, c) 的梯度
+    gradients = {
+        'gain': np.array([b / (1 - a) ** 2, 1 / (1 - a), 0.0]),
+        'time_constant': np.array([dt / (a * np.log(a) ** 2), 0.0, 0.0]),
+        'offset': np.array([c / (1 - a) ** 2, 0.0, 1 / (1 - a)])
+    }
+    params = {
+        'gain': float(b / (1 - a)),
+        'time_constant': float(-dt / np.log(a)),
+        'dead_time': float(delay * dt),
+        'offset': float(c / (1 - a))
+    }
+    std = {name: float(np.sqrt(max(g @ cov @ g, 0.0))) for name, g in gradients.items()}
+
+    return {'theta': theta, 'delay': delay, 'params': params, 'std': std, 'evaluations': max_delay + 1}
+
+
+def simulate_linear(fit: Dict[str, Any], u: np.ndarray, y0: float) -> np.ndarray:
+    """自由运行仿真（lfilter，C循环），用于验证和拟合优度"""
+    a, b, c = fit['theta']
+    d = fit['delay']
+    # 输入序列向后平移 d+1 步，缺失部分用首个输入值填充
+    shifted = np.concatenate((np.full(d + 1, u[0]), u[:len(u) - d - 1]))
+    return lfilter([1.0], [1.0, -a], b * shifted + c, zi=np.array([a * y0]))[0]
+
+
+# ==================== nonlinear: 静态水力特性 ====================
+
+def fit_static(
+    u: np.ndarray,
+    y: np.ndarray,
+    exponent: Optional[float] = None,
+    hint: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    p = p0 - r·|Q|^n
+
+    Args:
+        exponent: 固定流量指数（如海曾-威廉 1.852）；为空时一并辨识
+        hint: 流量指数的热启动值（如训练集的辨识结果）
+    """
+    target_sum = float(y.sum())
+
+    def solve_linear(n):
+        # 给定指数时 (p0, r) 的 2×2 正规方程
+        powered = np.abs(u) ** n
+        total = powered.sum()
+        xtx = np.array([[len(u), -total], [-total, powered @ powered]])
+        xty = np.array([target_sum, -(powered @ y)])
+        return np.linalg.solve(xtx, xty), xty
+
+    def sse(n):
+        coef, xty = solve_linear(n)
+        return float(y @ y - coef @ xty)
+
+    fixed = exponent is not None
+    evaluations = 1
+    if not fixed:
+        exponent, evaluations = _search_exponent(sse, hint)
+    (p0, r), _ = solve_linear(exponent)
+
+    powered, dn = _abs_pow(u, exponent)
+    residuals = p0 - r * powered - y
+    columns = [np.ones_like(u), -powered] + ([] if fixed else [-r * dn])
+    cov = _covariance(np.column_stack(columns), residuals, len(columns))
+
+    names = ['static_pressure', 'resistance'] + ([] if fixed else ['exponent'])
+    params = {'static_pressure': float(p0), 'resistance': float(r), 'exponent': float(exponent)}
+    std = {name: float(np.sqrt(max(cov[i, i], 0.0))) for i, name in enumerate(names)}
+
+    return {'x': np.array([p0, r, exponent]), 'params': params, 'std': std, 'evaluations': evaluations}
+
+
+def predict_static(fit: Dict[str, Any], u: np.ndarray) -> np.ndarray:
+    p0, r, exponent = fit['x']
+    return p0 - r * np.abs(u) ** exponent
+
+
+# ==================== hybrid: Hammerstein + 分段偏置 ====================
+
+def _hammerstein_jacobian(
+    a: float, r: float, powered: np.ndarray, dn: np.ndarray,
+    static: np.ndarray, y_prev: np.ndarray, seg: np.ndarray, n_segments: int
+) -> sp.csr_matrix:
+    """残差对 [a, r, n, β_1..β_S] 的稀疏雅可比（每行4个非零元）"""
+    rows = len(seg)
+    indptr = np.arange(0, 4 * rows + 1, 4)
+    indices = np.column_stack((
+        np.zeros(rows, dtype=np.int64),
+        np.ones(rows, dtype=np.int64),
+        np.full(rows, 2, dtype=np.int64),
+        3 + seg
+    )).ravel()
+    data = np.column_stack((
+        y_prev - static,
+        -(1 - a) * powered,
+        -(1 - a) * r * dn,
+        np.full(rows, 1 - a)
+    )).ravel()
+    return sp.csr_matrix((data, indices, indptr), shape=(rows, 3 + n_segments))
+
+
+def fit_hammerstein(
+    u: np.ndarray,
+    y: np.ndarray,
+    segments: np.ndarray,
+    delay: int,
+    dt: float,
+    hint: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    y[k] = a·y[k-1] + (1-a)·(β[s(k)] - r·|u[k-1-d]|^n)
+
+    给定 n 时模型对 (a, ρ=(1-a)·r, γ_s=(1-a)·β_s) 是线性的。分段偏置列互不重叠，
+    先按时段去均值（bincount）消去 γ，只剩 2×2 正规方程。
+
+    Args:
+        segments: 每个样本所属时段编号（0..S-1，连续）
+        delay: 纯滞后步数（由线性模型扫描得到）
+        hint: 流量指数的热启动值
+    """
+    n = len(y)
+    y_prev = y[delay:n - 1]
+    u_lag = u[:n - 1 - delay]
+    target = y[delay + 1:]
+    seg = segments[delay + 1:]
+    n_segments = int(segments.max()) + 1
+    counts = np.maximum(np.bincount(seg, minlength=n_segments), 1)
+
+    def segment_mean(values):
+        return np.bincount(seg, weights=values, minlength=n_segments) / counts
+
+    mean_prev = segment_mean(y_prev)
+    mean_target = segment_mean(target)
+    prev_d = y_prev - mean_prev[seg]
+    target_d = target - mean_target[seg]
+
+    def solve_linear(exponent):
+        powered = np.abs(u_lag) ** exponent
+        mean_powered = segment_mean(powered)
+        powered_d = powered - mean_powered[seg]
+        X = np.column_stack((prev_d, -powered_d))
+        xty = X.T @ target_d
+        theta = np.linalg.solve(X.T @ X, xty)
+        return theta, xty, mean_powered
+
+    def sse(exponent):
+        theta, xty, _ = solve_linear(exponent)
+        return float(target_d @ target_d - theta @ xty)
+
+    exponent, evaluations = _search_exponent(sse, hint)
+    (a, rho), _, mean_powered = solve_linear(exponent)
+    if not 0 < a < 1:
+        raise ValueError(f"辨识得到的动态环节不稳定（a={a:.4f}），请检查输入输出信号或纯滞后设置")
+
+    gamma = mean_target - a * mean_prev + rho * mean_powered
+    r = rho / (1 - a)
+    bias = gamma / (1 - a)
+
+    powered, dn = _abs_pow(u_lag, exponent)
+    static = bias[seg] - r * powered
+    residuals = a * y_prev + (1 - a) * static - target
+    jac = _hammerstein_jacobian(a, r, powered, dn, static, y_prev, seg, n_segments)
+    cov = _covariance(jac, residuals, jac.shape[1])
+
+    params = {
+        'time_constant': float(-dt / np.log(a)),
+        'dead_time': float(delay * dt),
+        'resistance': float(r),
+        'exponent': float(exponent),
+        'static_pressure': float(bias.mean())
+    }
+    std = {
+        'time_constant': float(np.sqrt(max(cov[0, 0], 0.0)) * dt / (a * np.log(a) ** 2)),
+        'resistance': float(np.sqrt(max(cov[1, 1], 0.0))),
+        'exponent': float(np.sqrt(max(cov[2, 2], 0.0))),
+        'static_pressure': float(np.sqrt(max(cov[3:, 3:].sum(), 0.0)) / n_segments)
+    }
+
+    return {
+        'x': np.array([a, r, exponent]),
+        'delay': delay,
+        'params': params,
+        'std': std,
+        'bias': bias,
+        'evaluations': evaluations
+    }
+
+
+def predict_hammerstein(fit: Dict[str, Any], u: np.ndarray, y: np.ndarray, segments: np.ndarray) -> np.ndarray:
+    """单步预测（使用实测的上一时刻输出），超出训练时段的样本使用最后一个时段的偏置"""
+    a, r, exponent = fit['x']
+    bias = fit['bias']
+    d = fit['delay']
+    n = len(y)
+    seg = np.minimum(segments[d + 1:], len(bias) - 1)
+    static = bias[seg] - r * np.abs(u[:n - 1 - d]) ** exponent
+    prediction = np.empty(n)
+    prediction[:d + 1] = y[:d + 1]
+    prediction[d + 1:] = a * y[d:n - 1] + (1 - a) * static
+    return prediction
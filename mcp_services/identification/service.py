@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+系统辨识MCP服务（独立部署）
+
+在仓库根目录运行:
+    python -m mcp_services.identification.service
+
+注册到HydroNet后（服务清单中 "url": "http://host:8082"），
+identification 工具改为调用该服务；未注册时管理器在本地直接调用同一引擎。
+"""
+
+import os
+from datetime import datetime
+
+from flask import Flask, jsonify
+
+from mcp_services.runtime import ServiceRuntime, RuntimeQueueFull, register_task_routes, encode_response, decode_request
+
+app = Flask(__name__)
+
+# 大规模SCADA序列在工作进程中拟合，HTTP线程保持响应
+runtime = ServiceRuntime({'identification': 'mcp_services.identification.engine:identify'})
+register_task_routes(app, runtime)
+
+# 同步执行接口的最长等待时间（秒），更长的计算请使用 /tasks/submit
+EXECUTE_TIMEOUT = float(os.environ.get('MCP_EXECUTE_TIMEOUT', '300'))
+
+
+@app.route('/execute', methods=['POST'])
+def execute():
+    """
+    执行系统辨识
+
+    请求体: {"arguments": {...}} 或 {"params": {...}}，参数同 identification 工具定义。
+    观测数据较多时建议按列提交（{"time": [...], "flow": [...], "pressure": [...]}），
+    并使用 msgpack + 列式数组编码（见 mcp_codec）
+    """
+    try:
+        data = decode_request()
+        params = data.get('arguments') or data.get('params') or {}
+        return encode_response(runtime.run('identification', params, timeout=EXECUTE_TIMEOUT))
+
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 400
+    except RuntimeQueueFull as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 429
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 500
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """健康检查接口"""
+    return jsonify({
+        'status': 'healthy',
+        'service': '系统辨识服务',
+        'version': '1.0.0',
+        'runtime': runtime.get_metrics(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+@app.route('/info', methods=['GET'])
+def info():
+    """服务信息接口"""
+    return jsonify({
+        'name': 'identification',
+        'type': 'identification',
+        'description': '管网系统辨识（向量化最小二乘，雅可比置信区间）',
+        'version': '1.0.0',
+        'capabilities': [
+            'linear: 一阶惯性加纯滞后（FOPDT）',
+            'nonlinear: 水力静态特性 p = p0 - r·|Q|^n，可反算海曾-威廉系数',
+            'hybrid: Hammerstein 模型 + 分段基准压力',
+            '全年1分钟SCADA序列（50万条以上）'
+        ]
+    })
+
+
+if __name__ == '__main__':
+    port = int(os.environ.get('IDENTIFICATION_SERVICE_PORT', '8082'))
+    print("=" * 50)
+    print("📐 系统辨识MCP服务")
+    print("=" * 50)
+    print(f"服务地址: http://localhost:{port}")
+    print("执行接口: POST /execute")
+    print("异步任务: POST /tasks/submit, GET /tasks/<id>")
+    print("=" * 50)
+
+    runtime.start()
+    app.run(host='0.0.0.0', port=port, threaded=True)
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""
+水库调度服务
+月调度规则的随机动态规划（库容×入流类状态网格上的向量化 Bellman 递推，按水库配置缓存规则）
+"""
+
+from .inflow import InflowModel
+from .model import OperationPolicy, get_policy, reservoir_config
+from .engine import optimize_operation
+
+__all__ = [
+    'InflowModel',
+    'OperationPolicy',
+    'get_policy',
+    'reservoir_config',
+    'optimize_operation'
+]
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+reservoir_operation 工具入口
+"""
+
+import time
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable
+
+import numpy as np
+
+from .inflow import InflowModel, MONTHS
+from .model import OBJECTIVE_WEIGHTS, VOLUME_PER_FLOW, reservoir_config, monthly_demand, get_policy
+
+logger = logging.getLogger(__name__)
+
+
+# 默认离散规模：库容 500 级 × 入流 50 类，下泄 64 级；相对值迭代最多 30 年
+DEFAULT_STORAGE_LEVELS = 500
+DEFAULT_INFLOW_CLASSES = 50
+DEFAULT_RELEASE_LEVELS = 64
+DEFAULT_MAX_YEARS = 30
+# 规模上限（月收益张量约 12×N×Q×R×4 字节）
+MAX_STATES = 100000
+MAX_RELEASE_LEVELS = 200
+# 规则模拟：年数、轨迹数
+DEFAULT_SIMULATION_YEARS = 10
+DEFAULT_SIMULATION_TRACES = 1000
+# 调度规则表中列出的库容位置（死库容到总库容的比例）和入流频率（枯/平/丰）
+RULE_STORAGE_POINTS = (0.0, 0.25, 0.5, 0.75, 1.0)
+RULE_INFLOW_QUANTILES = {'dry': 0.1, 'median': 0.5, 'wet': 0.9}
+# 供水缺口不超过需求的 1% 视为满足
+SUPPLY_TOLERANCE = 0.01
+
+
+def _month(value: Any) -> int:
+    month = int(value)
+    if not 1 <= month <= MONTHS:
+        raise ValueError(f"月份需在 1-12 之间，实际 {value}")
+    return month - 1
+
+
+def optimize_operation(arguments: Dict[str, Any], progress_callback: Optional[Callable] = None) -> Dict[str, Any]:
+    """
+    水库调度规则优化（随机动态规划）
+
+    Args:
+        arguments: 工具参数
+            reservoir: 水库参数（覆盖默认值），inflow: 入流参数或 history 历史序列，demand: 逐月供水需求
+            objective: hydropower / water_supply / balanced
+            current_storage: 当前库容 (百万m³)，current_month: 当前月份 (1-12)
+            last_inflow: 上月平均入流，inflow_forecast: 本月入流预报 (m³/s)
+            storage_levels / inflow_classes / release_levels / max_years: 离散规模
+            simulation_years / simulation_traces / seed: 规则模拟设置
+    """
+    started = time.perf_counter()
+    objective = arguments.get('objective', 'balanced')
+    if objective not in OBJECTIVE_WEIGHTS:
+        raise ValueError(f"未知的调度目标: {objective}，可选 {', '.join(OBJECTIVE_WEIGHTS)}")
+
+    reservoir = reservoir_config(arguments.get('reservoir'))
+    inflow = InflowModel.from_arguments(arguments.get('inflow'))
+    demand = monthly_demand(arguments.get('demand'))
+
+    storage_levels = int(arguments.get('storage_levels', DEFAULT_STORAGE_LEVELS))
+    inflow_classes = int(arguments.get('inflow_classes', DEFAULT_INFLOW_CLASSES))
+    release_levels = int(arguments.get('release_levels', DEFAULT_RELEASE_LEVELS))
+    max_years = max(2, int(arguments.get('max_years', DEFAULT_MAX_YEARS)))
+    if storage_levels * inflow_classes > MAX_STATES or release_levels > MAX_RELEASE_LEVELS:
+        raise ValueError(f"离散规模过大：状态数上限 {MAX_STATES}，下泄级数上限 {MAX_RELEASE_LEVELS}")
+
+    month = _month(arguments.get('current_month', datetime.now().month))
+    dead, capacity = reservoir['dead_storage'], reservoir['capacity']
+    storage = float(arguments.get('current_storage', (dead + reservoir['flood_limit']) / 2))
+    if not dead <= storage <= capacity:
+        raise ValueError(f"当前库容 {storage} 超出 [死库容 {dead}, 总库容 {capacity}] 范围")
+
+    if progress_callback:
+        progress_callback({'progress': 5, 'message': f'求解 {storage_levels}×{inflow_classes} 状态的随机动态规划'})
+    policy, cached = get_policy(
+        reservoir, inflow, demand, objective,
+        storage_levels, inflow_classes, release_levels, max_years,
+        progress_callback
+    )
+    if progress_callback:
+        progress_callback({'progress': 90, 'message': '调度规则就绪（复用缓存）' if cached else '调度规则求解完成，开始模拟'})
+
+    # 本月入流类的分布：有预报时取预报所在类；否则按上月入流的条件转移概率，都没有时各类等概率
+    warnings = []
+    previous = (month - 1) % MONTHS
+    z = 0.0
+    last_inflow = arguments.get('last_inflow')
+    if last_inflow is not None:
+        last_inflow = float(last_inflow)
+        if last_inflow <= 0:
+            raise ValueError("上月入流必须大于0")
+        z = float((np.log(last_inflow) - inflow.mu[previous]) / inflow.sigma[previous])
+        probabilities = policy.transitions[previous][inflow.classify(previous, last_inflow, policy.bounds)]
+    else:
+        probabilities = np.full(inflow_classes, 1.0 / inflow_classes)
+        warnings.append("未提供上月入流，按本月入流的气候分布给出建议")
+    forecast = arguments.get('inflow_forecast')
+    forecast_class = None
+    if forecast is not None:
+        forecast_class = inflow.classify(month, float(forecast), policy.bounds)
+        probabilities = np.zeros(inflow_classes)
+        probabilities[forecast_class] = 1.0
+
+    classes = np.arange(inflow_classes)
+    by_class = policy.release(month, storage, classes)
+    expected_release = float(probabilities @ by_class)
+    expected_inflow = float(probabilities @ policy.flows[month])
+    cumulative = np.cumsum(probabilities)
+    low, high = (int(np.clip(np.searchsorted(cumulative, p), 0, inflow_classes - 1)) for p in (0.1, 0.9))
+    end_storage = float(np.clip(storage + (expected_inflow - expected_release) * VOLUME_PER_FLOW, dead, capacity))
+
+    # 规则表：各月在不同库容、枯/平/丰入流下的出库流量
+    points = dead + np.asarray(RULE_STORAGE_POINTS) * (capacity - dead)
+    quantile_classes = {name: min(int(q * inflow_classes), inflow_classes - 1) for name, q in RULE_INFLOW_QUANTILES.items()}
+    rule_table = [
+        {
+            'month': m + 1,
+            'storage': [round(float(s), 1) for s in points],
+            **{
+                f'release_{name}': [round(float(r), 1) for r in policy.release(m, points, q)]
+                for name, q in quantile_classes.items()
+            },
+            'max_end_storage': round(float(policy.reservoir.upper[m]), 1)
+        }
+        for m in range(MONTHS)
+    ]
+
+    # 按规则在连续入流过程上模拟，评估长期效果和未来12个月的库容范围
+    years = max(1, int(arguments.get('simulation_years', DEFAULT_SIMULATION_YEARS)))
+    traces = max(10, int(arguments.get('simulation_traces', DEFAULT_SIMULATION_TRACES)))
+    simulated = policy.simulate(month, storage, z, years, traces, arguments.get('seed'))
+    demand_by_step = np.asarray(demand)[simulated['months']][:, None]
+    outflow = simulated['release'] + simulated['spill']
+    annual_energy = simulated['energy'].reshape(years, MONTHS, traces).sum(axis=1) / 1000.0
+    first_year = simulated['storage'][:MONTHS]
+    storage_range = np.percentile(first_year, [10, 50, 90], axis=1)
+    level = policy.reservoir.level
+
+    logger.info(
+        f"✅ 水库调度优化完成: {objective}, 第 {month + 1} 月, 库容 {storage:.1f}, "
+        f"规则{'缓存' if cached else '新建'}, 耗时 {(time.perf_counter() - started) * 1000:.0f} ms"
+    )
+
+    return {
+        'status': 'success',
+        'tool': 'reservoir_operation',
+        'message': f'✅ 水库调度规则优化完成（{objective}，{month + 1} 月建议出库 {expected_release:.1f} m³/s）',
+        'results': {
+            'recommendation': {
+                'month': month + 1,
+                'current_storage': round(storage, 2),
+                'current_level': round(float(level(storage)), 2),
+                'release': round(expected_release, 2),
+                'release_range': [round(float(by_class[low]), 2), round(float(by_class[high]), 2)],
+                'expected_inflow': round(expected_inflow, 2),
+                'expected_end_storage': round(end_storage, 2),
+                'forecast_class': forecast_class,
+                'demand': round(demand[month], 2)
+            },
+            'rule_table': rule_table,
+            'performance': {
+                'annual_energy_gwh': round(float(annual_energy.mean()), 2),
+                'annual_energy_p10_gwh': round(float(np.percentile(annual_energy, 10)), 2),
+                'annual_energy_p90_gwh': round(float(np.percentile(annual_energy, 90)), 2),
+                'supply_reliability': round(float((simulated['deficit'] <= SUPPLY_TOLERANCE * demand_by_step + 1e-9).mean()), 4),
+                'mean_shortage_ratio': round(float((simulated['deficit'].sum() / max(demand_by_step.sum() * traces, 1e-9))), 4),
+                'ecological_compliance': round(float((outflow >= reservoir['min_release'] - 1e-6).mean()), 4),
+                'mean_spill': round(float(simulated['spill'].mean()), 2),
+                'simulated_years': years,
+                'traces': traces
+            },
+            'storage_outlook': [
+                {
+                    'month': int(simulated['months'][t]) + 1,
+                    'storage_p10': round(float(storage_range[0, t]), 1),
+                    'storage_p50': round(float(storage_range[1, t]), 1),
+                    'storage_p90': round(float(storage_range[2, t]), 1),
+                    'level_p50': round(float(level(storage_range[1, t])), 2)
+                }
+                for t in range(MONTHS)
+            ],
+            'inflow_model': inflow.to_dict(),
+            'warnings': warnings
+        },
+        'solver': {
+            'method': 'SDP / 相对值迭代',
+            'storage_levels': storage_levels,
+            'inflow_classes': inflow_classes,
+            'release_levels': release_levels,
+            'years': policy.years,
+            'converged': policy.converged,
+            'annual_gain': round(policy.gain, 2),
+            'policy_cached': cached,
+            'solve_ms': round(policy.solve_ms, 1),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+    }
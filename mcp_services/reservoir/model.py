@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""
+水库调度的随机动态规划（SDP）
+
+状态为 (月初库容, 本月入流类)，决策为本月下泄流量（hazard-decision：决策时已知本月入流类）。
+库容取 [死库容, 总库容] 上的均匀网格，下泄取离散网格，月末库容落在网格之间时线性插值。
+
+Bellman 递推对整个状态网格向量化：
+    EV_m(s, q)  = Σ_q' P_m(q, q')·V_{m+1}(s, q')          一次 (N×Q)·(Q×Q) 矩阵乘
+    V_m(s, q)   = max_r [R_m(s, q, r) + EV_m(s'(s, q, r), q)]
+均匀网格上 s' - s 只取决于 (q, r)，网格偏移量和插值权重按 (q, r) 计算一次，
+EV 上下按边界值延拓后直接按下标批量取值。月收益张量 R_m (N×Q×R) 在求解前一次算好。
+按年循环做相对值迭代，策略连续两年不变时停止，得到平稳的逐月调度规则。
+
+求解结果（值函数和调度规则）按水库配置缓存，只有当前库容、月份变化时直接查表。
+"""
+
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+from .inflow import InflowModel, MONTHS, SECONDS_PER_MONTH
+
+logger = logging.getLogger(__name__)
+
+
+# 缓存的调度规则个数（每个对应一组水库/入流/目标配置）
+MAX_CACHED_POLICIES = 16
+# 每 m³/s 持续一个月的水量 (百万m³)
+VOLUME_PER_FLOW = SECONDS_PER_MONTH / 1e6
+HOURS_PER_MONTH = SECONDS_PER_MONTH / 3600.0
+# 出力系数 k = 9.81·η (kW / (m³/s·m))
+DEFAULT_OUTPUT_COEFFICIENT = 8.5
+
+# 默认水库：库容单位百万m³（hm³），水位 m，流量 m³/s，装机 MW；汛期按汛限库容控制月末库容
+DEFAULT_RESERVOIR = {
+    'capacity': 1200.0,
+    'dead_storage': 200.0,
+    'flood_limit': 900.0,
+    'flood_months': [6, 7, 8, 9],
+    'level_curve': [[0.0, 150.0], [200.0, 170.0], [600.0, 185.0], [1000.0, 195.0], [1400.0, 202.0]],
+    'tailwater': 140.0,
+    'turbine_capacity': 300.0,
+    'installed_capacity': 120.0,
+    'output_coefficient': DEFAULT_OUTPUT_COEFFICIENT,
+    'min_release': 20.0
+}
+# 下游供水需求（m³/s，逐月）
+DEFAULT_DEMAND = [60, 60, 70, 90, 110, 120, 110, 100, 90, 80, 70, 60]
+
+# 目标权重：(发电量权重, 缺水惩罚权重)；惩罚按满发一个月的电量折算成同一量纲
+OBJECTIVE_WEIGHTS = {
+    'hydropower': (1.0, 0.0),
+    'water_supply': (0.01, 1.0),
+    'balanced': (1.0, 1.0)
+}
+# 低于生态流量的惩罚倍数（所有目标都生效）
+ECOLOGICAL_PENALTY = 10.0
+
+
+def reservoir_config(raw: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """合并默认值并校验水库参数"""
+    config = {**DEFAULT_RESERVOIR, **(raw or {})}
+    for key in ('capacity', 'dead_storage', 'flood_limit', 'tailwater', 'turbine_capacity',
+                'installed_capacity', 'output_coefficient', 'min_release'):
+        config[key] = float(config[key])
+    if not 0 <= config['dead_storage'] < config['capacity']:
+        raise ValueError(f"死库容 {config['dead_storage']} 必须小于总库容 {config['capacity']}")
+    if not config['dead_storage'] < config['flood_limit'] <= config['capacity']:
+        raise ValueError("汛限库容需介于死库容和总库容之间")
+    if config['turbine_capacity'] <= 0 or config['installed_capacity'] <= 0:
+        raise ValueError("机组过流能力和装机容量必须大于0")
+    config['flood_months'] = sorted({int(m) for m in config['flood_months']})
+    if any(not 1 <= m <= MONTHS for m in config['flood_months']):
+        raise ValueError("汛期月份需在 1-12 之间")
+
+    curve = np.asarray(config['level_curve'], dtype=np.float64)
+    if curve.ndim != 2 or curve.shape[1] != 2 or len(curve) < 2 or (np.diff(curve[:, 0]) <= 0).any():
+        raise ValueError("库容-水位曲线需要至少两个 [库容, 水位] 点，库容严格递增")
+    config['level_curve'] = curve.tolist()
+    return config
+
+
+def monthly_demand(demand: Any) -> List[float]:
+    values = np.asarray(DEFAULT_DEMAND if demand is None else demand, dtype=np.float64)
+    if values.ndim == 0:
+        values = np.full(MONTHS, float(values))
+    if values.shape != (MONTHS,) or (values < 0).any():
+        raise ValueError("供水需求需要是非负标量或12个月的列表")
+    return values.tolist()
+
+
+class Reservoir:
+    """水库水量平衡与出力（输入可任意广播）"""
+
+    def __init__(self, config: Dict[str, Any], demand: List[float]):
+        self.config = config
+        self.capacity = config['capacity']
+        self.dead_storage = config['dead_storage']
+        self.demand = np.asarray(demand, dtype=np.float64)
+        curve = np.asarray(config['level_curve'], dtype=np.float64)
+        self.curve_storage = curve[:, 0]
+        self.curve_level = curve[:, 1]
+        # 第 m 月（0-11）月末库容上限：汛期为汛限库容
+        flood = set(config['flood_months'])
+        self.upper = np.array([
+            config['flood_limit'] if m + 1 in flood else config['capacity'] for m in range(MONTHS)
+        ])
+
+    def level(self, storage: np.ndarray) -> np.ndarray:
+        return np.interp(storage, self.curve_storage, self.curve_level)
+
+    def step(self, month: int, storage: np.ndarray, inflow: np.ndarray, release: np.ndarray, upper: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """
+        一个月的水量平衡
+
+        计划下泄超过可用水量时按死库容截断；月末库容超过上限的部分弃水（弃水先经机组发电）。
+
+        Returns:
+            {'storage': 月末库容, 'release': 实际下泄(不含弃水), 'spill': 弃水流量,
+             'energy': 发电量 MWh, 'deficit': 供水缺口 m³/s}
+        """
+        upper = self.upper[month] if upper is None else upper
+        end = storage + (inflow - release) * VOLUME_PER_FLOW
+        shortage = np.maximum(self.dead_storage - end, 0.0)
+        actual = release - shortage / VOLUME_PER_FLOW
+        end = end + shortage
+        spill = np.maximum(end - upper, 0.0) / VOLUME_PER_FLOW
+        end = np.minimum(end, upper)
+
+        outflow = actual + spill
+        head = np.maximum(self.level((storage + end) / 2) - self.config['tailwater'], 0.0)
+        turbine = np.minimum(outflow, self.config['turbine_capacity'])
+        power = np.minimum(self.config['output_coefficient'] * turbine * head / 1000.0, self.config['installed_capacity'])
+        return {
+            'storage': end,
+            'release': actual,
+            'spill': spill,
+            'energy': power * HOURS_PER_MONTH,
+            'deficit': np.maximum(self.demand[month] - outflow, 0.0)
+        }
+
+    def reward(self, month: int, result: Dict[str, np.ndarray], weights: Tuple[float, float]) -> np.ndarray:
+        energy_weight, deficit_weight = weights
+        scale = self.config['installed_capacity'] * HOURS_PER_MONTH
+        reward = energy_weight * result['energy']
+        demand = self.demand[month]
+        if deficit_weight > 0 and demand > 0:
+            reward = reward - deficit_weight * scale * (result['deficit'] / demand) ** 2
+        minimum = self.config['min_release']
+        if minimum > 0:
+            violation = np.maximum(minimum - result['release'] - result['spill'], 0.0) / minimum
+            reward = reward - ECOLOGICAL_PENALTY * scale * violation ** 2
+        return reward
+
+
+class OperationPolicy:
+    """
+    SDP 求解结果：逐月值函数和调度规则
+
+    values[m, i, q]   第 m 月初库容为 storage[i]、本月入流类为 q 时的相对值
+    policy[m, i, q]   对应的最优出库流量（m³/s，含超上限的强制弃水）
+    planned[m, i, q]  对应的计划下泄（m³/s，不超过下泄网格上限）
+    """
+
+    def __init__(
+        self,
+        reservoir: Reservoir,
+        inflow: InflowModel,
+        objective: str,
+        storage_levels: int,
+        inflow_classes: int,
+        release_levels: int,
+        max_years: int
+    ):
+        if objective not in OBJECTIVE_WEIGHTS:
+            raise ValueError(f"未知的调度目标: {objective}，可选 {', '.join(OBJECTIVE_WEIGHTS)}")
+        if storage_levels < 10 or inflow_classes < 2 or release_levels < 5:
+            raise ValueError("库容网格至少10级、入流至少2类、下泄至少5级")
+        self.reservoir = reservoir
+        self.inflow = inflow
+        self.objective = objective
+        self.weights = OBJECTIVE_WEIGHTS[objective]
+        self.storage = np.linspace(reservoir.dead_storage, reservoir.capacity, storage_levels)
+        self.step = self.storage[1] - self.storage[0]
+        top = max(reservoir.config['turbine_capacity'], 1.2 * reservoir.demand.max(), reservoir.config['min_release'])
+        self.releases = np.linspace(0.0, top, release_levels)
+        self.flows, self.transitions, self.bounds = inflow.discretize(inflow_classes)
+        self.max_years = max_years
+        self.values = None
+        self.policy = None
+        self.planned = None
+        self.gain = 0.0
+        self.years = 0
+        self.converged = False
+        self.solve_ms = 0.0
+
+    def _rewards(self, month: int) -> np.ndarray:
+        result = self.reservoir.step(
+            month,
+            self.storage[:, None, None],
+            self.flows[month][None, :, None],
+            self.releases[None, None, :]
+        )
+        return self.reservoir.reward(month, result, self.weights).astype(np.float32)
+
+    def _offsets(self, month: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(q, r) → 网格偏移（整数部分）和插值权重，偏移截断到 ±(N+1)"""
+        n = len(self.storage)
+        shift = (self.flows[month][:, None] - self.releases[None, :]) * VOLUME_PER_FLOW / self.step
+        shift = np.clip(shift, -(n + 1), n)
+        offset = np.floor(shift)
+        return offset.astype(np.int64), (shift - offset).astype(np.float32)
+
+    def solve(self, progress_callback=None) -> 'OperationPolicy':
+        started = time.perf_counter()
+        n, q_count = len(self.storage), self.flows.shape[1]
+        pad = n + 1
+        rewards = [self._rewards(m) for m in range(MONTHS)]
+        offsets = [self._offsets(m) for m in range(MONTHS)]
+        rows = np.arange(n)[:, None, None] * q_count
+        columns = np.arange(q_count)[None, :, None]
+        # 月末库容上限对应的网格下标（向下取整，保证不超过汛限）
+        upper_index = np.floor((self.reservoir.upper - self.reservoir.dead_storage) / self.step + 1e-9).astype(int)
+        padded_rows = [np.clip(np.arange(-pad, n + pad + 1), 0, min(u, n - 1)) for u in upper_index]
+
+        values = np.zeros((MONTHS, n, q_count))
+        policy = np.zeros((MONTHS, n, q_count), dtype=np.int16)
+        following = np.zeros((n, q_count))
+        previous_policy = None
+        previous_total = None
+        stable = 0
+
+        for year in range(1, self.max_years + 1):
+            for m in range(MONTHS - 1, -1, -1):
+                expected = following @ self.transitions[m].T
+                # 延拓后的 EV：网格外侧取边界值（死库容 / 月末上限）
+                extended = expected[padded_rows[m]].astype(np.float32).ravel()
+                offset, weight = offsets[m]
+                index = rows + (offset[None, :, :] + pad) * q_count + columns
+                future = extended[index]
+                future += weight[None] * (extended[index + q_count] - future)
+                total = rewards[m] + future
+                best = total.argmax(axis=2)
+                policy[m] = best
+                values[m] = np.take_along_axis(total, best[..., None], axis=2)[..., 0]
+                following = values[m]
+
+            # 相对值迭代：减去参考状态的值，避免多年累加后数值增大；差值的均值即为年平均收益
+            if previous_total is not None:
+                difference = following - previous_total
+                self.gain = float(difference.mean())
+                span = float(difference.max() - difference.min())
+            else:
+                span = np.inf
+            previous_total = following.copy()
+            reference = following.mean()
+            following = following - reference
+            previous_total -= reference
+            values -= reference
+
+            if previous_policy is not None and np.array_equal(policy, previous_policy) and span <= 1e-3 * max(abs(self.gain), 1.0):
+                stable += 1
+            else:
+                stable = 0
+            previous_policy = policy.copy()
+            self.years = year
+            if progress_callback:
+                progress_callback({
+                    'progress': min(10 + 80 * year / self.max_years, 90),
+                    'message': f'SDP 第 {year} 年迭代完成'
+                })
+            if stable >= 1:
+                self.converged = True
+                break
+
+        # 规则表存总出库流量（计划下泄 + 超上限的强制弃水），满库时各下泄收益相同，直接报出库更直观
+        self.values = values
+        self.planned = self.releases[policy].astype(np.float32)
+        self.policy = np.empty((MONTHS, n, q_count), dtype=np.float32)
+        for m in range(MONTHS):
+            result = self.reservoir.step(m, self.storage[:, None], self.flows[m][None, :], self.releases[policy[m]])
+            self.policy[m] = result['release'] + result['spill']
+        self.solve_ms = (time.perf_counter() - started) * 1000
+        logger.info(
+            f"💧 水库SDP求解完成: {n}×{q_count} 状态, {len(self.releases)} 级下泄, "
+            f"{self.years} 年迭代, 收敛={self.converged}, 耗时 {self.solve_ms:.0f} ms"
+        )
+        return self
+
+    def release(self, month: int, storage: Any, inflow_class: Any, planned: bool = False) -> np.ndarray:
+        """
+        按库容线性插值查调度规则（month 为 0-11，可批量）
+
+        Args:
+            planned: True 时查计划下泄。出库流量表在满库网格点含强制弃水，插值到相邻库容会
+                得到超过下泄上限的流量；模拟时按计划下泄插值，弃水由水量平衡计算
+        """
+        position = np.clip((np.asarray(storage, dtype=np.float64) - self.storage[0]) / self.step, 0, len(self.storage) - 1)
+        lower = np.minimum(np.floor(position).astype(int), len(self.storage) - 2)
+        weight = position - lower
+        table = (self.planned if planned else self.policy)[month]
+        return (1 - weight) * table[lower, inflow_class] + weight * table[lower + 1, inflow_class]
+
+    def simulate(self, month: int, storage: float, z: float, years: int, traces: int, seed: Optional[int]) -> Dict[str, np.ndarray]:
+        """
+        按调度规则在连续的对数正态 AR(1) 入流上做向量化模拟
+
+        Args:
+            month: 起始月份（0-11）
+            z: 起始月上一个月入流的标准化对数值
+        Returns:
+            各量的 (步数, 轨迹数) 数组和逐步月份
+        """
+        rng = np.random.default_rng(seed)
+        steps = years * MONTHS
+        inflow = self.inflow
+        s = np.full(traces, float(storage))
+        z = np.full(traces, float(z))
+        output = {key: np.empty((steps, traces)) for key in ('storage', 'inflow', 'release', 'spill', 'energy', 'deficit')}
+        months = np.empty(steps, dtype=int)
+        for t in range(steps):
+            m = (month + t) % MONTHS
+            rho = inflow.correlation[(m - 1) % MONTHS]
+            z = rho * z + np.sqrt(1 - rho ** 2) * rng.standard_normal(traces)
+            flow = np.exp(inflow.mu[m] + inflow.sigma[m] * z)
+            classes = np.clip(np.searchsorted(self.bounds, z) - 1, 0, len(self.bounds) - 2)
+            result = self.reservoir.step(m, s, flow, self.release(m, s, classes, planned=True))
+            s = result['storage']
+            output['storage'][t] = s
+            output['inflow'][t] = flow
+            for key in ('release', 'spill', 'energy', 'deficit'):
+                output[key][t] = result[key]
+            months[t] = m
+        output['months'] = months
+        return output
+
+
+_policies: 'OrderedDict[str, OperationPolicy]' = OrderedDict()
+_policies_lock = threading.Lock()
+
+
+def get_policy(
+    reservoir: Dict[str, Any],
+    inflow: InflowModel,
+    demand: List[float],
+    objective: str,
+    storage_levels: int,
+    inflow_classes: int,
+    release_levels: int,
+    max_years: int,
+    progress_callback=None
+) -> Tuple[OperationPolicy, bool]:
+    """
+    获取（或求解并缓存）调度规则；当前库容和月份不影响规则，不在缓存键中
+
+    Returns:
+        (调度规则, 是否命中缓存)
+    """
+    key = json.dumps(
+        [reservoir, inflow.to_dict(), [round(d, 6) for d in demand], objective,
+         storage_levels, inflow_classes, release_levels, max_years],
+        sort_keys=True
+    )
+    with _policies_lock:
+        policy = _policies.get(key)
+        if policy is not None:
+            _policies.move_to_end(key)
+            return policy, True
+
+    policy = OperationPolicy(
+        Reservoir(reservoir, demand), inflow, objective,
+        storage_levels, inflow_classes, release_levels, max_years
+    ).solve(progress_callback)
+
+    with _policies_lock:
+        policy = _policies.setdefault(key, policy)
+        while len(_policies) > MAX_CACHED_POLICIES:
+            _policies.popitem(last=False)
+    return policy, False
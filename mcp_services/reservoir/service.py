@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+水库调度MCP服务（独立部署）
+
+在仓库根目录运行:
+    python -m mcp_services.reservoir.service
+
+注册到HydroNet后（服务清单中 "url": "http://host:8086"），
+reservoir_operation 工具改为调用该服务；未注册时管理器在本地直接调用同一引擎。
+"""
+
+import os
+from datetime import datetime
+
+from flask import Flask, jsonify
+
+from mcp_services.runtime import ServiceRuntime, RuntimeQueueFull, register_task_routes, encode_response, decode_request
+
+app = Flask(__name__)
+
+# 调度规则缓存保存在工作进程内；同一水库的后续请求只改变当前库容，
+# 默认单个工作进程以保证这些请求都能命中缓存
+runtime = ServiceRuntime(
+    {'reservoir_operation': 'mcp_services.reservoir.engine:optimize_operation'},
+    max_workers=int(os.environ.get('MCP_RUNTIME_WORKERS', '1'))
+)
+register_task_routes(app, runtime)
+
+# 同步执行接口的最长等待时间（秒），更长的计算请使用 /tasks/submit
+EXECUTE_TIMEOUT = float(os.environ.get('MCP_EXECUTE_TIMEOUT', '300'))
+
+
+@app.route('/execute', methods=['POST'])
+def execute():
+    """
+    执行水库调度优化
+
+    请求体: {"arguments": {...}} 或 {"params": {...}}，参数同 reservoir_operation 工具定义
+    """
+    try:
+        data = decode_request()
+        params = data.get('arguments') or data.get('params') or {}
+        return encode_response(runtime.run('reservoir_operation', params, timeout=EXECUTE_TIMEOUT))
+
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 400
+    except RuntimeQueueFull as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 429
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 500
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """健康检查接口"""
+    return jsonify({
+        'status': 'healthy',
+        'service': '水库调度服务',
+        'version': '1.0.0',
+        'runtime': runtime.get_metrics(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+@app.route('/info', methods=['GET'])
+def info():
+    """服务信息接口"""
+    return jsonify({
+        'name': 'reservoir_operation',
+        'type': 'scheduling',
+        'description': '水库月调度规则的随机动态规划优化',
+        'version': '1.0.0',
+        'capabilities': [
+            '库容×入流类状态网格上的向量化 Bellman 递推（默认 500×50）',
+            '对数正态 AR(1) 入流：等概率分类与解析转移概率，支持由历史序列估计',
+            '发电、供水、综合三类目标，汛限库容与生态流量约束',
+            '调度规则按水库配置缓存，仅当前库容变化时直接查表'
+        ]
+    })
+
+
+if __name__ == '__main__':
+    port = int(os.environ.get('RESERVOIR_SERVICE_PORT', '8086'))
+    print("=" * 50)
+    print("🏞️ 水库调度MCP服务")
+    print("=" * 50)
+    print(f"服务地址: http://localhost:{port}")
+    print("执行接口: POST /execute")
+    print("异步任务: POST /tasks/submit, GET /tasks/<id>")
+    print("=" * 50)
+
+    runtime.start()
+    app.run(host='0.0.0.0', port=port, threaded=True)
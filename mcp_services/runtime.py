@@ -0,0 +1,637 @@
+# -*- coding: utf-8 -*-
+"""
+MCP服务运行时
+在进程池中执行CPU密集型工具，HTTP前端（Flask线程）只负责收发请求，
+/health 等接口在计算期间保持响应，吞吐随CPU核数扩展。
+
+任务接口与 HydroSISMCPClient 一致:
+    POST /tasks/submit        {"tool_name", "arguments", "user_id", "callback_url"}
+                              -> {"task_id", "status": "submitted"}
+    GET  /tasks/<task_id>     -> {"task_id", "status", "progress", "message",
+                                  "partial_results", "results", "error", "execution_time"}
+    POST /tasks/<task_id>/cancel  或  DELETE /tasks/<task_id>
+
+工具函数签名为 fn(arguments) 或 fn(arguments, progress_callback)，
+以 "模块:函数" 字符串注册，在工作进程中导入。
+"""
+
+import os
+import time
+import uuid
+import queue
+import inspect
+import logging
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Any, Iterator, Callable
+
+import mcp_codec
+
+logger = logging.getLogger(__name__)
+
+
+TERMINAL_STATES = ('completed', 'failed', 'cancelled')
+
+
+class RuntimeQueueFull(Exception):
+    """任务队列已满"""
+
+
+class JobCancelled(Exception):
+    """任务在执行中被取消（由工作进程的进度回调抛出）"""
+
+
+# ==================== 工作进程 ====================
+
+_worker = {}
+
+
+def _resolve(spec: str):
+    """导入 "模块:函数"，返回 (函数, 是否接受进度回调)，结果按进程缓存"""
+    tools = _worker.setdefault('tools', {})
+    if spec not in tools:
+        module_name, function_name = spec.split(':', 1)
+        function = getattr(importlib.import_module(module_name), function_name)
+        tools[spec] = (function, len(inspect.signature(function).parameters) >= 2)
+    return tools[spec]
+
+
+def _init_worker(events, cancel_flags, preload: List[str], warmup: Optional[str]):
+    """工作进程初始化：预先导入工具模块并执行预热函数（加载模型、构建缓存等）"""
+    _worker['events'] = events
+    _worker['cancel_flags'] = cancel_flags
+    for spec in preload:
+        _resolve(spec)
+    if warmup:
+        _resolve(warmup)[0]()
+
+
+def _available_cpus() -> int:
+    # 容器中按CPU亲和性计算可用核数
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _run_job(task_id: str, slot: int, spec: str, arguments: Dict[str, Any]):
+    events = _worker['events']
+    cancel_flags = _worker['cancel_flags']
+    events.put(('start', task_id, time.time()))
+    try:
+        function, wants_progress = _resolve(spec)
+        if not wants_progress:
+            return function(arguments)
+
+        def progress(update: Dict[str, Any]):
+            # 进度回调同时是取消检查点
+            if cancel_flags[slot]:
+                raise JobCancelled(task_id)
+            events.put(('progress', task_id, update))
+
+        return function(arguments, progress)
+    finally:
+        # 结束标记与进度事件经同一队列按序到达，父进程收到它时之前的进度都已汇总
+        events.put(('end', task_id, None))
+
+
+# ==================== 运行时 ====================
+
+class ServiceRuntime:
+    """
+    进程池服务运行时
+
+    - 工作进程启动时预先导入工具模块并执行 warmup，之后常驻复用
+    - 排队 + 执行中的任务数超过 max_workers + max_queue 时拒绝（RuntimeQueueFull）
+    - 排队中的任务直接取消；执行中的任务在下一次进度回调时中止
+    - 已结束的任务保留 result_ttl 秒供查询
+    """
+
+    def __init__(
+        self,
+        tools: Dict[str, str],
+        max_workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        warmup: Optional[str] = None,
+        result_ttl: float = 3600.0,
+        start_method: Optional[str] = None
+    ):
+        """
+        Args:
+            tools: {工具名: "模块:函数"}
+            max_workers: 工作进程数（默认 MCP_RUNTIME_WORKERS 或CPU核数）
+            max_queue: 最大排队任务数（默认 MCP_RUNTIME_QUEUE 或 4×工作进程数）
+            warmup: 工作进程预热函数 "模块:函数"
+            result_ttl: 已结束任务的保留时间（秒）
+            start_method: 进程启动方式（默认 MCP_RUNTIME_START_METHOD 或 spawn）
+        """
+        self.tools = tools
+        self.max_workers = max_workers or int(os.environ.get('MCP_RUNTIME_WORKERS', '0')) or _available_cpus()
+        self.max_queue = max_queue if max_queue is not None else int(
+            os.environ.get('MCP_RUNTIME_QUEUE', str(4 * self.max_workers))
+        )
+        self.warmup = warmup
+        self.result_ttl = result_ttl
+        self.start_method = start_method or os.environ.get('MCP_RUNTIME_START_METHOD', 'spawn')
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._free_slots = list(range(self.max_workers + self.max_queue))
+        self._pool = None
+        self._events = None
+        self._cancel_flags = None
+        self._collector = None
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'cancelled': 0, 'rejected': 0}
+
+    # ==================== 生命周期 ====================
+
+    def start(self):
+        """启动进程池并预热全部工作进程（首次提交任务时也会自动启动）"""
+        with self._lock:
+            if self._pool is not None:
+                return
+            context = multiprocessing.get_context(self.start_method)
+            if self._events is None:
+                self._events = context.Queue()
+                self._cancel_flags = context.Array('b', len(self._free_slots), lock=False)
+                self._collector = threading.Thread(target=self._collect, name='mcp-runtime-events', daemon=True)
+                self._collector.start()
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._events, self._cancel_flags, list(self.tools.values()), self.warmup)
+            )
+            pool = self._pool
+
+        # 同时提交与工作进程数相同的空任务，使所有进程立即启动并完成初始化
+        started = time.perf_counter()
+        pids = {future.result() for future in [pool.submit(_ping) for _ in range(self.max_workers)]}
+        logger.info(
+            f"✅ MCP服务运行时已启动: {len(pids)} 个工作进程 ({self.start_method}), "
+            f"预热 {time.perf_counter() - started:.2f} 秒"
+        )
+
+    def shutdown(self, wait: bool = True):
+        """关闭进程池（取消排队中的任务）"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+    # ==================== 任务 ====================
+
+    def submit(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        user_id: Optional[str] = None,
+        callback_url: Optional[str] = None,
+        listener: Optional[Callable[[str, Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        提交任务
+
+        Args:
+            listener: 事件监听函数 listener(kind, payload)，在事件汇总线程中调用，不能阻塞:
+                ('progress', 进度更新) ... ('result', {'status', 'results', 'error', 'exception'})
+
+        Raises:
+            KeyError: 工具不存在
+            RuntimeQueueFull: 排队已满
+        """
+        if tool_name not in self.tools:
+            raise KeyError(f"工具不存在: {tool_name}")
+        if self._pool is None:
+            self.start()
+
+        task_id = uuid.uuid4().hex
+        with self._lock:
+            if not self._free_slots:
+                self._stats['rejected'] += 1
+                raise RuntimeQueueFull(f"任务队列已满（{self.max_workers} 个执行中，{self.max_queue} 个排队）")
+            slot = self._free_slots.pop()
+            self._cancel_flags[slot] = 0
+
+            job = {
+                'task_id': task_id,
+                'tool_name': tool_name,
+                'user_id': user_id,
+                'callback_url': callback_url,
+                'listener': listener,
+                'status': 'queued',
+                'progress': 0.0,
+                'message': None,
+                'partials': [],
+                'partial_cursor': 0,
+                'results': None,
+                'error': None,
+                'slot': slot,
+                'future': None,
+                'outcome': None,
+                'ended': False,
+                'cancel_requested': False,
+                'submitted_at': time.time(),
+                'started_at': None,
+                'finished_at': None
+            }
+            self._jobs[task_id] = job
+            self._stats['submitted'] += 1
+
+        spec = self.tools[tool_name]
+        try:
+            future = self._pool_submit(task_id, slot, spec, arguments)
+        except BrokenProcessPool:
+            # 工作进程异常退出：重建进程池后重试一次
+            logger.warning("⚠️ 进程池已损坏，正在重建")
+            with self._lock:
+                self._pool = None
+            self.start()
+            future = self._pool_submit(task_id, slot, spec, arguments)
+
+        with self._lock:
+            job['future'] = future
+            cancel_requested = job['cancel_requested']
+        if cancel_requested:
+            future.cancel()
+        future.add_done_callback(lambda done: self._finish(task_id, done))
+        logger.info(f"📥 任务已提交: {tool_name} ({task_id})")
+        return {'task_id': task_id, 'status': 'submitted'}
+
+    def _pool_submit(self, task_id: str, slot: int, spec: str, arguments: Dict[str, Any]):
+        with self._lock:
+            pool = self._pool
+        if pool is None:
+            raise BrokenProcessPool("进程池未启动")
+        return pool.submit(_run_job, task_id, slot, spec, arguments)
+
+    def _finish(self, task_id: str, future):
+        """
+        进程池完成回调
+
+        任务执行过的工作进程会在进度事件之后发出结束标记，此时可能还有进度事件在队列中，
+        等事件汇总线程收到结束标记后再发布结果；未开始就被取消或进程池损坏时没有结束标记，直接发布
+        """
+        with self._lock:
+            job = self._jobs.get(task_id)
+            if job is None:
+                return
+            job['outcome'] = future
+            job['outcome_at'] = time.monotonic()
+            if not (job['ended'] or future.cancelled() or isinstance(future.exception(), BrokenProcessPool)):
+                return
+            notify = self._publish(job)
+        if notify:
+            threading.Thread(target=self._notify_callback, args=(job,), daemon=True).start()
+
+    def _publish(self, job: Dict[str, Any]) -> bool:
+        """按进程池结果结束任务并唤醒等待者（持锁调用），返回是否需要回调通知"""
+        future = job['outcome']
+        job['finished_at'] = time.time()
+        try:
+            job['results'] = future.result()
+            job['status'] = 'completed'
+            job['progress'] = 100.0
+        except (CancelledError, JobCancelled):
+            job['status'] = 'cancelled'
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+            job['exception'] = e
+            if isinstance(e, BrokenProcessPool):
+                self._pool = None
+            logger.error(f"❌ 任务失败 {job['tool_name']} ({job['task_id']}): {e}")
+
+        self._emit(job, 'result', {
+            'status': job['status'],
+            'results': job['results'],
+            'error': job['error'],
+            'exception': job.get('exception')
+        })
+        job['listener'] = None
+        self._stats[job['status']] += 1
+        self._free_slots.append(job['slot'])
+        self._changed.notify_all()
+        return bool(job['callback_url'])
+
+    def _publish_stale(self, max_age: float = 5.0) -> List[Dict[str, Any]]:
+        """结果已返回但迟迟没有结束标记的任务直接发布（持锁调用），返回需要回调通知的任务"""
+        now = time.monotonic()
+        notify = []
+        for job in self._jobs.values():
+            if job['outcome'] is not None and job['status'] not in TERMINAL_STATES and now - job['outcome_at'] > max_age:
+                if self._publish(job):
+                    notify.append(job)
+        return notify
+
+    def _collect(self):
+        """汇总工作进程发来的开始/进度事件，并定期清理过期任务"""
+        last_cleanup = time.monotonic()
+        while True:
+            try:
+                kind, task_id, payload = self._events.get(timeout=5.0)
+            except queue.Empty:
+                kind = None
+            except (EOFError, OSError):
+                return
+
+            notify = []
+            with self._lock:
+                job = self._jobs.get(task_id) if kind else None
+                if job is not None and kind == 'end':
+                    job['ended'] = True
+                    if job['outcome'] is not None and job['status'] not in TERMINAL_STATES:
+                        if self._publish(job):
+                            notify.append(job)
+                elif job is not None and kind == 'start':
+                    # 开始事件可能晚于完成回调到达，只在未结束时更新状态
+                    job['started_at'] = payload
+                    if job['status'] == 'queued':
+                        job['status'] = 'running'
+                    self._changed.notify_all()
+                elif job is not None and job['status'] not in TERMINAL_STATES:
+                    if kind == 'progress':
+                        job['status'] = 'running'
+                        if payload.get('progress') is not None:
+                            job['progress'] = float(payload['progress'])
+                        job['message'] = payload.get('message', job['message'])
+                        if payload.get('partial') is not None:
+                            job['partials'].append(payload['partial'])
+                        self._emit(job, 'progress', payload)
+                    self._changed.notify_all()
+
+                if kind is None or time.monotonic() - last_cleanup > 60:
+                    notify.extend(self._publish_stale())
+                if time.monotonic() - last_cleanup > 60:
+                    self._cleanup()
+                    last_cleanup = time.monotonic()
+
+            for finished in notify:
+                threading.Thread(target=self._notify_callback, args=(finished,), daemon=True).start()
+
+    @staticmethod
+    def _emit(job: Dict[str, Any], kind: str, payload: Dict[str, Any]):
+        """通知任务监听函数（持锁调用），监听函数出错不影响任务"""
+        if job['listener'] is None:
+            return
+        try:
+            job['listener'](kind, payload)
+        except Exception as e:
+            logger.debug(f"任务监听函数出错 ({job['task_id']}): {e}")
+
+    def _cleanup(self):
+        """删除超过保留时间的已结束任务（持锁调用）"""
+        expired_before = time.time() - self.result_ttl
+        for task_id in [
+            task_id for task_id, job in self._jobs.items()
+            if job['finished_at'] and job['finished_at'] < expired_before
+        ]:
+            del self._jobs[task_id]
+
+    @staticmethod
+    def _notify_callback(job: Dict[str, Any]):
+        import requests
+        try:
+            requests.post(job['callback_url'], json={
+                'task_id': job['task_id'],
+                'status': job['status'],
+                'error': job['error']
+            }, timeout=10)
+        except Exception as e:
+            logger.warning(f"⚠️ 任务回调失败 {job['callback_url']}: {e}")
+
+    def cancel(self, task_id: str) -> bool:
+        """
+        取消任务
+
+        Returns:
+            任务是否存在且尚未结束
+        """
+        with self._lock:
+            job = self._jobs.get(task_id)
+            if job is None or job['status'] in TERMINAL_STATES:
+                return False
+            # 执行中的任务在下一次进度回调时中止；尚未拿到 future 时由 submit 补发取消
+            self._cancel_flags[job['slot']] = 1
+            job['cancel_requested'] = True
+            future = job['future']
+        if future is not None:
+            future.cancel()
+        logger.info(f"🛑 取消任务: {task_id}")
+        return True
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查询任务状态
+
+        partial_results 为自上次查询以来的新增部分结果（时间序列块合并为一块）
+        """
+        with self._lock:
+            job = self._jobs.get(task_id)
+            if job is None:
+                return None
+            partials = job['partials'][job['partial_cursor']:]
+            job['partial_cursor'] = len(job['partials'])
+            return self._public(job, merge_partials(partials))
+
+    @staticmethod
+    def _public(job: Dict[str, Any], partial_results=None) -> Dict[str, Any]:
+        execution_time = None
+        if job['started_at']:
+            execution_time = round((job['finished_at'] or time.time()) - job['started_at'], 3)
+        return {
+            'task_id': job['task_id'],
+            'tool_name': job['tool_name'],
+            'status': job['status'],
+            'progress': job['progress'],
+            'message': job['message'],
+            'partial_results': partial_results,
+            'results': job['results'],
+            'error': job['error'],
+            'execution_time': execution_time
+        }
+
+    def iter_events(self, task_id: str, timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        逐个产出任务事件（用于NDJSON流式响应）:
+        {"type": "progress", "progress", "message", "partial"} ... {"type": "result", "data": {...}}
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        cursor = 0
+        while True:
+            with self._lock:
+                job = self._jobs.get(task_id)
+                if job is None:
+                    raise KeyError(f"任务不存在: {task_id}")
+                while (
+                    len(job['partials']) <= cursor
+                    and job['status'] not in TERMINAL_STATES
+                    and (deadline is None or time.monotonic() < deadline)
+                ):
+                    self._changed.wait(1.0 if deadline is None else max(0.0, min(1.0, deadline - time.monotonic())))
+                partials = job['partials'][cursor:]
+                cursor = len(job['partials'])
+                snapshot = self._public(job)
+
+            for partial in partials:
+                yield {
+                    'type': 'progress',
+                    'progress': snapshot['progress'],
+                    'message': snapshot['message'],
+                    'partial': partial
+                }
+
+            if snapshot['status'] in TERMINAL_STATES:
+                yield {'type': 'result', 'data': self._result_payload(snapshot)}
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                self.cancel(task_id)
+                yield {'type': 'result', 'data': {'status': 'error', 'message': f'任务执行超时（>{timeout}秒）'}}
+                return
+
+    def run(self, tool_name: str, arguments: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """
+        同步执行并返回工具结果（只阻塞当前请求线程，不阻塞其他请求）
+
+        Raises:
+            TimeoutError: 超时（任务随即被取消）
+            RuntimeError: 任务被取消
+            工具函数抛出的异常: 任务失败
+        """
+        task_id = self.submit(tool_name, arguments)['task_id']
+        deadline = time.monotonic() + timeout if timeout else None
+
+        with self._lock:
+            job = self._jobs[task_id]
+            while job['status'] not in TERMINAL_STATES:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            status, results, exception = job['status'], job['results'], job.get('exception')
+
+        if status == 'completed':
+            return results
+        if status not in TERMINAL_STATES:
+            self.cancel(task_id)
+            raise TimeoutError(f"任务执行超时（>{timeout}秒）")
+        # 失败时抛出工具函数自身的异常（如参数错误的 ValueError）
+        raise exception or RuntimeError('任务已取消')
+
+    @staticmethod
+    def _result_payload(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        if snapshot['status'] == 'completed':
+            return snapshot['results']
+        return {
+            'status': 'error',
+            'message': snapshot['error'] or f"任务已{'取消' if snapshot['status'] == 'cancelled' else '失败'}",
+            'task_id': snapshot['task_id']
+        }
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """运行时指标"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+            waits = [j['started_at'] - j['submitted_at'] for j in jobs if j['started_at']]
+            runs = [j['finished_at'] - j['started_at'] for j in jobs if j['started_at'] and j['finished_at']]
+            return {
+                **self._stats,
+                'workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'queued': sum(1 for j in jobs if j['status'] == 'queued'),
+                'running': sum(1 for j in jobs if j['status'] == 'running'),
+                'avg_queue_wait': round(sum(waits) / len(waits), 4) if waits else 0.0,
+                'avg_run_time': round(sum(runs) / len(runs), 4) if runs else 0.0,
+                'pool_alive': self._pool is not None
+            }
+
+
+def merge_partials(partials: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """合并多个部分结果：时间序列块首尾拼接，其他字段取最新值"""
+    if not partials:
+        return None
+    if len(partials) == 1:
+        return partials[0]
+
+    merged = dict(partials[-1])
+    blocks = [p['time_series'] for p in partials if isinstance(p.get('time_series'), dict)]
+    if blocks:
+        merged['offset'] = next(p.get('offset') for p in partials if isinstance(p.get('time_series'), dict))
+        merged['time_series'] = {
+            name: [value for block in blocks for value in mcp_codec.to_jsonable(block.get(name, []))]
+            for name in blocks[0]
+        }
+    return merged
+
+
+# ==================== HTTP接口 ====================
+
+def encode_response(payload, status: int = 200):
+    """按请求的 Accept / Accept-Encoding / X-MCP-Array-Encoding 编码Flask响应"""
+    from flask import request, Response
+
+    body, headers = mcp_codec.encode_body(
+        payload,
+        accept=request.headers.get('Accept'),
+        accept_encoding=request.headers.get('Accept-Encoding'),
+        array_encoding=request.headers.get(mcp_codec.ARRAY_HEADER)
+    )
+    return Response(body, status=status, headers=headers)
+
+
+def decode_request() -> Dict[str, Any]:
+    """解压并解析Flask请求体（JSON/MessagePack）"""
+    from flask import request
+
+    return mcp_codec.decode_body(
+        request.get_data(),
+        request.content_type,
+        request.headers.get('Content-Encoding')
+    ) or {}
+
+
+def register_task_routes(app, runtime: ServiceRuntime):
+    """在Flask应用上注册 /tasks 接口和 /runtime/metrics"""
+    from flask import jsonify
+
+    @app.route('/tasks/submit', methods=['POST'])
+    def submit_task():
+        data = decode_request()
+        try:
+            return jsonify(runtime.submit(
+                data.get('tool_name'),
+                data.get('arguments') or data.get('params') or {},
+                user_id=data.get('user_id'),
+                callback_url=data.get('callback_url')
+            ))
+        except KeyError as e:
+            return jsonify({'status': 'error', 'message': str(e.args[0])}), 404
+        except RuntimeQueueFull as e:
+            response = jsonify({'status': 'error', 'message': str(e)})
+            response.headers['Retry-After'] = '5'
+            return response, 429
+
+    @app.route('/tasks/<task_id>', methods=['GET'])
+    def get_task(task_id):
+        status = runtime.get(task_id)
+        if status is None:
+            return jsonify({'status': 'error', 'message': f'任务不存在: {task_id}'}), 404
+        return encode_response(status)
+
+    @app.route('/tasks/<task_id>/cancel', methods=['POST'])
+    @app.route('/tasks/<task_id>', methods=['DELETE'])
+    def cancel_task(task_id):
+        if not runtime.cancel(task_id):
+            return jsonify({'status': 'error', 'message': f'任务不存在或已结束: {task_id}'}), 404
+        return jsonify({'task_id': task_id, 'status': 'cancelling'})
+
+    @app.route('/runtime/metrics', methods=['GET'])
+    def runtime_metrics():
+        return jsonify(runtime.get_metrics())
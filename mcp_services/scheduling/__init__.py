@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+优化调度服务
+泵站-水池分时电价调度（稀疏LP/MILP，HiGHS求解，结构缓存与热启动）
+"""
+
+from .model import ScheduleStructure, get_structure, HIGHS_AVAILABLE
+from .engine import run_scheduling
+
+__all__ = [
+    'ScheduleStructure',
+    'get_structure',
+    'HIGHS_AVAILABLE',
+    'run_scheduling'
+]
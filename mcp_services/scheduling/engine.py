@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+scheduling 工具入口
+"""
+
+import os
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Callable
+
+import numpy as np
+
+from mcp_services.simulation.network import DEFAULT_DIURNAL_PATTERN, METERS_PER_MPA
+from .model import get_structure
+
+logger = logging.getLogger(__name__)
+
+
+OBJECTIVES = ('minimize_cost', 'minimize_energy', 'maximize_efficiency', 'balance')
+MAX_HORIZON_HOURS = 168
+# 单次求解时间上限（秒）和MILP相对间隙
+TIME_LIMIT = float(os.environ.get('MCP_SCHEDULING_TIME_LIMIT', '10'))
+MIP_GAP = float(os.environ.get('MCP_SCHEDULING_MIP_GAP', '0.005'))
+
+# 默认分时电价（元/kWh）：峰 8-11、18-23 点，谷 23-7 点，其余为平段
+DEFAULT_TARIFF = {
+    'default': 0.68,
+    'periods': [
+        {'start': 23, 'end': 7, 'price': 0.32},
+        {'start': 8, 'end': 11, 'price': 1.12},
+        {'start': 18, 'end': 23, 'price': 1.12}
+    ]
+}
+DEFAULT_PUMPS = [
+    {'id': 'P1', 'flow': 80.0, 'power': 30.0, 'efficiency': 0.78},
+    {'id': 'P2', 'flow': 80.0, 'power': 30.0, 'efficiency': 0.78},
+    {'id': 'P3', 'flow': 120.0, 'power': 41.0, 'efficiency': 0.84}
+]
+# 水池：面积 m²，水位 m，elevation 为池底相对供水区的高差 m
+DEFAULT_TANK = {'area': 1500.0, 'min_level': 1.0, 'max_level': 6.0, 'initial_level': 3.5, 'elevation': 40.0}
+# 每次启动折合的满负荷运行小时数（启停损耗）
+STARTUP_HOURS = 0.25
+# balance 目标的需量电价（元/kW·月）：计费月内的最大需量决定整月需量电费，不按调度时长折算
+DEMAND_CHARGE = float(os.environ.get('MCP_SCHEDULING_DEMAND_CHARGE', '35'))
+
+
+def hourly_prices(tariff: Optional[Any]) -> np.ndarray:
+    """
+    分时电价 → 24小时电价数组
+
+    Args:
+        tariff: 24个小时电价的列表，或 {'default': 价格, 'periods': [{'start', 'end', 'price'}]}，
+            时段可跨零点（start > end）
+    """
+    if tariff is None:
+        tariff = DEFAULT_TARIFF
+    if isinstance(tariff, (list, tuple)):
+        if len(tariff) != 24:
+            raise ValueError(f"电价列表需要24个小时值，实际 {len(tariff)} 个")
+        return np.asarray(tariff, dtype=np.float64)
+
+    hours = np.arange(24)
+    prices = np.full(24, float(tariff.get('default', DEFAULT_TARIFF['default'])))
+    for period in tariff.get('periods', []):
+        start, end = int(period['start']) % 24, int(period['end']) % 24
+        mask = (hours >= start) & (hours < end) if start < end else (hours >= start) | (hours < end)
+        prices[mask] = float(period['price'])
+    return prices
+
+
+def demand_profile(forecast: Optional[List[float]], hours_of_day: np.ndarray, average: float) -> np.ndarray:
+    """
+    需求预测 (m³/h)
+
+    Args:
+        forecast: 与时段数相同的预测序列；24个值时按小时循环；其他长度按时间线性插值；
+            为空时按平均需求和日变化系数生成
+        hours_of_day: 每个时段的起始小时（0-24）
+    """
+    n_steps = len(hours_of_day)
+    if not forecast:
+        return average * np.asarray(DEFAULT_DIURNAL_PATTERN)[hours_of_day.astype(int) % 24]
+    values = np.asarray(forecast, dtype=np.float64)
+    if len(values) == n_steps:
+        return values
+    if len(values) == 24:
+        return values[hours_of_day.astype(int) % 24]
+    return np.interp(np.linspace(0, 1, n_steps), np.linspace(0, 1, len(values)), values)
+
+
+def demand_following(demand: np.ndarray, flows: np.ndarray, powers: np.ndarray) -> np.ndarray:
+    """
+    基准方案：不利用水池调蓄，每个时段按单位能耗从低到高开泵满足需求
+
+    Returns:
+        (P, T) 运行比例
+    """
+    order = np.argsort(powers / flows)
+    capacity_before = np.concatenate(([0.0], np.cumsum(flows[order])[:-1]))
+    x = np.empty((len(flows), len(demand)))
+    x[order] = np.clip((demand[None, :] - capacity_before[:, None]) / flows[order, None], 0.0, 1.0)
+    return x
+
+
+def _parse_start(value: Optional[str], step_hours: float) -> datetime:
+    """调度起点（默认当前时间向下取整到时段）"""
+    if value:
+        return datetime.fromisoformat(str(value))
+    now = datetime.now().replace(second=0, microsecond=0)
+    step_minutes = max(1, int(round(step_hours * 60)))
+    minutes = (now.hour * 60 + now.minute) // step_minutes * step_minutes
+    return now.replace(hour=0, minute=0) + timedelta(minutes=minutes)
+
+
+def run_scheduling(
+    arguments: Dict[str, Any],
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    scheduling 工具入口（参数与 MCP服务管理器中的 scheduling 工具定义一致）
+
+    Args:
+        arguments: {
+            'objective': minimize_cost | minimize_energy | maximize_efficiency | balance,
+            'constraints': {'max_flow': m³/h, 'min_pressure': MPa, 'max_power': kW},
+            'time_horizon': 小时（1-168）,
+            'time_step': 时段长度（小时，默认1，滚动优化可用0.25）,
+            'start_time': 调度起点（ISO时间，默认当前时段）,
+            'demand_forecast': 需求预测 (m³/h),
+            'tariff': 分时电价, 'pumps': 泵组, 'tank': 水池,
+            'discrete': 泵按启停（MILP）而非运行比例（LP）调度,
+            'schedule_id': 滚动优化的调度标识（同一标识的上一轮结果用于热启动）
+        }
+    """
+    started = time.perf_counter()
+    objective = arguments.get('objective') or 'minimize_cost'
+    if objective not in OBJECTIVES:
+        raise ValueError(f"不支持的优化目标: {objective}，可选 {', '.join(OBJECTIVES)}")
+    horizon = float(arguments.get('time_horizon', 24))
+    if not 1 <= horizon <= MAX_HORIZON_HOURS:
+        raise ValueError(f"调度时间范围需在 1-{MAX_HORIZON_HOURS} 小时之间: {horizon}")
+    step_hours = float(arguments.get('time_step', 1.0))
+    if step_hours <= 0 or step_hours > horizon:
+        raise ValueError(f"时段长度无效: {step_hours}")
+
+    constraints = arguments.get('constraints') or {}
+    pumps = arguments.get('pumps') or DEFAULT_PUMPS
+    tank = dict(DEFAULT_TANK, **(arguments.get('tank') or {}))
+    discrete = bool(arguments.get('discrete', False))
+    schedule_id = str(arguments.get('schedule_id', 'default'))
+    warnings = []
+
+    flows = np.array([float(p['flow']) for p in pumps])
+    powers = np.array([float(p['power']) for p in pumps])
+    efficiencies = np.array([float(p.get('efficiency', 0.8)) for p in pumps])
+    if (flows <= 0).any() or (powers <= 0).any():
+        raise ValueError("泵的流量和功率必须大于0")
+
+    n_steps = int(round(horizon / step_hours))
+    start = _parse_start(arguments.get('start_time'), step_hours)
+    offsets = np.arange(n_steps) * step_hours
+    hours_of_day = (start.hour + start.minute / 60.0 + offsets) % 24
+    prices = hourly_prices(arguments.get('tariff'))[hours_of_day.astype(int)]
+    demand = demand_profile(arguments.get('demand_forecast'), hours_of_day, 0.55 * flows.sum())
+
+    # 最低服务压力折算为最低水位
+    area = float(tank['area'])
+    min_level = float(tank['min_level'])
+    max_level = float(tank['max_level'])
+    min_pressure = constraints.get('min_pressure')
+    if min_pressure is not None:
+        pressure_level = float(min_pressure) * METERS_PER_MPA - float(tank['elevation'])
+        if pressure_level > max_level:
+            raise ValueError(f"最低压力 {min_pressure} MPa 需要水位 {pressure_level:.2f} m，超过最高水位 {max_level} m")
+        if pressure_level > min_level:
+            warnings.append(f"为满足最低压力 {min_pressure} MPa，最低水位提高到 {pressure_level:.2f} m")
+            min_level = pressure_level
+    initial_volume = area * min(max(float(tank['initial_level']), min_level), max_level)
+    final_volume = area * float(tank.get('final_level', tank['initial_level']))
+
+    max_flow = constraints.get('max_flow')
+    max_power = constraints.get('max_power')
+    initial_state = np.asarray(arguments.get('initial_state') or np.zeros(len(pumps)), dtype=np.float64)
+
+    switching = objective in ('maximize_efficiency', 'balance')
+    peak = objective == 'balance'
+    structure, cached = get_structure(
+        list(flows), list(powers), n_steps, step_hours, switching, peak, discrete
+    )
+
+    # 目标系数：能耗 (kWh) 或电费（元）；启停按 STARTUP_HOURS 满负荷折算
+    energy = step_hours * powers[:, None] * np.ones(n_steps)
+    if objective == 'minimize_energy':
+        c = structure.costs(energy)
+    elif objective == 'maximize_efficiency':
+        c = structure.costs(energy, STARTUP_HOURS * powers[:, None] * np.ones(n_steps))
+    elif objective == 'balance':
+        c = structure.costs(
+            energy * prices,
+            STARTUP_HOURS * powers[:, None] * prices[None, :],
+            DEMAND_CHARGE
+        )
+    else:
+        c = structure.costs(energy * prices)
+
+    bounds = structure.bounds(
+        demand, initial_volume, area * min_level, area * max_level, final_volume,
+        None if max_flow is None else float(max_flow),
+        None if max_power is None else float(max_power),
+        initial_state
+    )
+    if progress_callback:
+        progress_callback({'progress': 20, 'message': f'模型就绪（{structure.n_cols} 个变量，{"复用缓存结构" if cached else "新建结构"}），开始求解'})
+
+    with structure.lock:
+        # 滚动优化：同一调度的上一轮结果平移到当前起点作为初始解
+        previous = structure.last.get(schedule_id)
+        start_values = None
+        if previous is not None and discrete:
+            shift = int(round((start.timestamp() - previous['start']) / 3600.0 / step_hours))
+            if 0 <= shift < n_steps:
+                x0 = np.concatenate((previous['x'][:, shift:], np.repeat(previous['x'][:, -1:], shift, axis=1)), axis=1)
+                start_values = structure.complete(x0, demand, initial_volume, initial_state)
+
+        solved = structure.solve(c, *bounds, start=start_values, time_limit=TIME_LIMIT, mip_gap=MIP_GAP)
+        if solved['values'] is None:
+            raise ValueError(
+                f"调度问题无可行解（{solved['status']}）：请检查需求预测、流量/功率上限和水位范围"
+            )
+        values = solved['values']
+        x = values[structure.x_slice].reshape(len(pumps), n_steps)
+        structure.last[schedule_id] = {'start': start.timestamp(), 'x': x.copy()}
+
+    volume = values[structure.v_slice]
+    levels = volume / area
+    station_flow = flows @ x
+    station_power = powers @ x
+    step_energy = station_power * step_hours
+    step_cost = step_energy * prices
+
+    baseline = demand_following(demand, flows, powers)
+    baseline_power = powers @ baseline
+    baseline_energy = float(baseline_power.sum() * step_hours)
+    baseline_cost = float((baseline_power * step_hours * prices).sum())
+    if (demand > flows.sum()).any():
+        warnings.append("部分时段需求超过泵站总能力，基准方案按满负荷计算")
+
+    total_energy = float(step_energy.sum())
+    total_cost = float(step_cost.sum())
+    pumped = float(station_flow.sum() * step_hours)
+    if objective in ('minimize_cost', 'balance'):
+        improvement = (baseline_cost - total_cost) / baseline_cost if baseline_cost > 0 else 0.0
+    else:
+        improvement = (baseline_energy - total_energy) / baseline_energy if baseline_energy > 0 else 0.0
+    baseline_peak = float(baseline_power.max())
+
+    tolerance = 1e-6
+    satisfied = bool(
+        (max_flow is None or (station_flow <= float(max_flow) + tolerance).all())
+        and (max_power is None or (station_power <= float(max_power) + tolerance).all())
+        and (levels >= min_level - tolerance).all() and (levels <= max_level + tolerance).all()
+    )
+
+    logger.info(
+        f"✅ 调度优化完成: {objective}, {n_steps} 个时段, {solved['backend']}, "
+        f"结构{'缓存' if cached else '新建'}, 热启动={solved['warm_start']}, "
+        f"耗时 {(time.perf_counter() - started) * 1000:.0f} ms"
+    )
+
+    ids = [str(p.get('id', f'P{i + 1}')) for i, p in enumerate(pumps)]
+    return {
+        'status': 'success',
+        'tool': 'scheduling',
+        'message': f'✅ 调度优化完成（{objective}, {horizon:g} 小时, {n_steps} 个时段）',
+        'results': {
+            'objective_value': round(solved['objective'], 2),
+            'improvement': f'{improvement * 100:.1f}%',
+            'schedule': [
+                {
+                    'time': (start + timedelta(hours=float(offset))).strftime('%Y-%m-%d %H:%M'),
+                    'flow': round(float(station_flow[t]), 2),
+                    'power': round(float(station_power[t]), 2),
+                    'cost': round(float(step_cost[t]), 2),
+                    'price': float(prices[t]),
+                    'demand': round(float(demand[t]), 2),
+                    'level': round(float(levels[t]), 3),
+                    'pumps': {pump_id: round(float(x[i, t]), 3) for i, pump_id in enumerate(ids)}
+                }
+                for t, offset in enumerate(offsets)
+            ],
+            'constraints_satisfied': satisfied,
+            'kpis': {
+                'total_cost': round(total_cost, 2),
+                'total_energy': round(total_energy, 2),
+                'specific_energy': round(total_energy / pumped, 4) if pumped > 0 else 0.0,
+                'avg_efficiency': round(float((efficiencies @ (flows[:, None] * x)).sum() / max(station_flow.sum(), 1e-9)), 3),
+                'peak_demand_reduction': f'{(baseline_peak - station_power.max()) / baseline_peak * 100:.0f}%' if baseline_peak > 0 else '0%',
+                'baseline_cost': round(baseline_cost, 2),
+                'baseline_energy': round(baseline_energy, 2)
+            },
+            'warnings': warnings
+        },
+        'solver': {
+            'method': f"{'MILP' if discrete else 'LP'} / {solved['backend']}",
+            'status': solved['status'],
+            'variables': structure.n_cols,
+            'constraints': structure.n_rows,
+            'nonzeros': int(structure.matrix.nnz),
+            'structure_cached': cached,
+            'warm_start': solved['warm_start'],
+            'simplex_iterations': solved['iterations'],
+            'mip_gap': round(solved['mip_gap'], 5),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+    }
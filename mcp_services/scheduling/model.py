@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+泵站-水池调度的稀疏LP/MILP模型
+
+变量（按列排列）:
+    x[i, t]  泵 i 在时段 t 的运行比例（LP，0~1）或启停状态（MILP，0/1）
+    v[t]     时段 t 末的水池蓄水量 (m³)
+    s[i, t]  泵 i 在时段 t 的启动量（仅含启停惩罚的目标）
+    peak     时段最大功率 (kW)（仅 balance 目标）
+
+约束矩阵只取决于泵组参数、时段数、步长和目标类型（ScheduleStructure），
+需求预测、电价、水位和流量/功率上限只改变目标系数和上下界。
+结构按键缓存，滚动优化时只更新系数和边界；安装 highspy 时每个结构保留一个
+HiGHS 实例，LP 从上一次的最优基热启动，MILP 以平移后的上一轮调度作为初始可行解。
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import milp, LinearConstraint, Bounds
+
+logger = logging.getLogger(__name__)
+
+try:
+    import highspy
+    HIGHS_AVAILABLE = True
+except ImportError:
+    HIGHS_AVAILABLE = False
+
+
+# 缓存的模型结构个数（每个结构对应一组泵参数/时段设置）
+MAX_CACHED_STRUCTURES = 16
+
+
+class ScheduleStructure:
+    """
+    调度模型结构
+
+    列顺序: x (P×T, 按泵优先) | v (T) | s (P×T, 可选) | peak (1, 可选)
+    行顺序: 水量平衡 (T) | 流量上限 (T) | 功率上限 (T) | 启动 (P×T, 可选) | 峰值 (T, 可选)
+    """
+
+    def __init__(
+        self,
+        pump_flows: Tuple[float, ...],
+        pump_powers: Tuple[float, ...],
+        n_steps: int,
+        step_hours: float,
+        switching: bool,
+        peak: bool,
+        discrete: bool
+    ):
+        self.pump_flows = np.asarray(pump_flows, dtype=np.float64)
+        self.pump_powers = np.asarray(pump_powers, dtype=np.float64)
+        self.n_pumps = len(pump_flows)
+        self.n_steps = n_steps
+        self.step_hours = step_hours
+        self.switching = switching
+        self.peak = peak
+        self.discrete = discrete
+
+        P, T = self.n_pumps, n_steps
+        self.x_slice = slice(0, P * T)
+        self.v_slice = slice(P * T, P * T + T)
+        offset = P * T + T
+        self.s_slice = slice(offset, offset + P * T) if switching else slice(offset, offset)
+        offset = self.s_slice.stop
+        self.peak_index = offset if peak else None
+        self.n_cols = offset + (1 if peak else 0)
+
+        self.n_rows = 3 * T + (P * T if switching else 0) + (T if peak else 0)
+        self.matrix = self._build_matrix()
+
+        self.integrality = np.zeros(self.n_cols, dtype=np.int64)
+        if discrete:
+            self.integrality[self.x_slice] = 1
+
+        self.lock = threading.Lock()
+        self.highs = None
+        # 每个调度ID最近一次的解 {'start': 时间戳秒, 'x': (P, T)}
+        self.last: Dict[str, Dict[str, Any]] = {}
+
+    def _build_matrix(self) -> sp.csc_matrix:
+        """向量化组装约束矩阵（COO → CSC）"""
+        P, T, dt = self.n_pumps, self.n_steps, self.step_hours
+        q, w = self.pump_flows, self.pump_powers
+        t = np.arange(T)
+        x_cols = (np.arange(P)[:, None] * T + t[None, :])        # (P, T)
+        v_cols = self.v_slice.start + t
+        rows, cols, vals = [], [], []
+
+        def add(r, c, v):
+            r, c = np.broadcast_arrays(r, c)
+            rows.append(r.ravel())
+            cols.append(c.ravel())
+            vals.append(np.broadcast_to(v, r.shape).ravel())
+
+        # 水量平衡: v[t] - v[t-1] - Δ·Σ q_i·x[i,t] = -Δ·d[t]（t=0 时 v[-1] 移到右端）
+        add(t, v_cols, 1.0)
+        add(t[1:], v_cols[:-1], -1.0)
+        add(np.broadcast_to(t, (P, T)), x_cols, -dt * q[:, None])
+        # 流量上限 / 功率上限
+        add(np.broadcast_to(T + t, (P, T)), x_cols, np.broadcast_to(q[:, None], (P, T)))
+        add(np.broadcast_to(2 * T + t, (P, T)), x_cols, np.broadcast_to(w[:, None], (P, T)))
+        row = 3 * T
+
+        if self.switching:
+            # 启动量: s[i,t] - x[i,t] + x[i,t-1] >= 0（t=0 时 x[i,-1] 移到右端）
+            switch_rows = row + np.arange(P * T).reshape(P, T)
+            add(switch_rows, self.s_slice.start + x_cols, 1.0)
+            add(switch_rows, x_cols, -1.0)
+            add(switch_rows[:, 1:], x_cols[:, :-1], 1.0)
+            row += P * T
+
+        if self.peak:
+            # 峰值功率: peak - Σ w_i·x[i,t] >= 0
+            add(row + t, self.peak_index, 1.0)
+            add(np.broadcast_to(row + t, (P, T)), x_cols, np.broadcast_to(-w[:, None], (P, T)))
+
+        return sp.csc_matrix(
+            (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(self.n_rows, self.n_cols)
+        )
+
+    def bounds(
+        self,
+        demand: np.ndarray,
+        initial_volume: float,
+        min_volume: float,
+        max_volume: float,
+        final_volume: float,
+        max_flow: Optional[float],
+        max_power: Optional[float],
+        initial_state: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """列和行的上下界（需求、水位和上限都只出现在这里）"""
+        P, T, dt = self.n_pumps, self.n_steps, self.step_hours
+        col_lower = np.zeros(self.n_cols)
+        col_upper = np.full(self.n_cols, np.inf)
+        col_upper[self.x_slice] = 1.0
+        col_lower[self.v_slice] = min_volume
+        col_upper[self.v_slice] = max_volume
+        col_lower[self.v_slice.stop - 1] = max(min_volume, min(final_volume, max_volume))
+        col_upper[self.s_slice] = 1.0
+
+        row_lower = np.full(self.n_rows, -np.inf)
+        row_upper = np.full(self.n_rows, np.inf)
+        balance = -dt * demand
+        balance[0] += initial_volume
+        row_lower[:T] = row_upper[:T] = balance
+        row_upper[T:2 * T] = np.inf if max_flow is None else max_flow
+        row_upper[2 * T:3 * T] = np.inf if max_power is None else max_power
+        if self.switching:
+            switch = np.zeros((P, T))
+            switch[:, 0] = -initial_state
+            row_lower[3 * T:3 * T + P * T] = switch.ravel()
+        if self.peak:
+            row_lower[self.n_rows - T:] = 0.0
+
+        return col_lower, col_upper, row_lower, row_upper
+
+    def costs(self, energy_cost: np.ndarray, startup_cost: Optional[np.ndarray] = None, peak_cost: float = 0.0) -> np.ndarray:
+        """
+        Args:
+            energy_cost: (P, T) 每个 x[i,t] 的系数
+            startup_cost: (P, T) 每次启动的代价
+            peak_cost: 峰值功率单价
+        """
+        c = np.zeros(self.n_cols)
+        c[self.x_slice] = energy_cost.ravel()
+        if self.switching and startup_cost is not None:
+            c[self.s_slice] = startup_cost.ravel()
+        if self.peak:
+            c[self.peak_index] = peak_cost
+        return c
+
+    def complete(self, x: np.ndarray, demand: np.ndarray, initial_volume: float, initial_state: np.ndarray) -> np.ndarray:
+        """由泵组决策补全其余变量（作为MILP初始解）"""
+        dt = self.step_hours
+        values = np.zeros(self.n_cols)
+        values[self.x_slice] = x.ravel()
+        inflow = self.pump_flows @ x
+        values[self.v_slice] = initial_volume + np.cumsum(dt * (inflow - demand))
+        if self.switching:
+            previous = np.concatenate((initial_state[:, None], x[:, :-1]), axis=1)
+            values[self.s_slice] = np.maximum(x - previous, 0.0).ravel()
+        if self.peak:
+            values[self.peak_index] = float((self.pump_powers @ x).max())
+        return values
+
+    def solve(
+        self,
+        c: np.ndarray,
+        col_lower: np.ndarray,
+        col_upper: np.ndarray,
+        row_lower: np.ndarray,
+        row_upper: np.ndarray,
+        start: Optional[np.ndarray] = None,
+        time_limit: float = 10.0,
+        mip_gap: float = 0.005
+    ) -> Dict[str, Any]:
+        """
+        求解（调用方持有 self.lock）
+
+        Returns:
+            {'values', 'status', 'objective', 'backend', 'warm_start', 'iterations', 'mip_gap'}
+        """
+        if HIGHS_AVAILABLE:
+            return self._solve_highspy(c, col_lower, col_upper, row_lower, row_upper, start, time_limit, mip_gap)
+        return self._solve_scipy(c, col_lower, col_upper, row_lower, row_upper, time_limit, mip_gap)
+
+    def _solve_highspy(self, c, col_lower, col_upper, row_lower, row_upper, start, time_limit, mip_gap):
+        inf = highspy.kHighsInf
+        warm = self.highs is not None
+
+        if not warm:
+            h = highspy.Highs()
+            h.setOptionValue('output_flag', False)
+            lp = highspy.HighsLp()
+            lp.num_col_ = self.n_cols
+            lp.num_row_ = self.n_rows
+            lp.col_cost_ = c
+            lp.col_lower_ = col_lower
+            lp.col_upper_ = np.where(np.isinf(col_upper), inf, col_upper)
+            lp.row_lower_ = np.where(np.isinf(row_lower), -inf, row_lower)
+            lp.row_upper_ = np.where(np.isinf(row_upper), inf, row_upper)
+            lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+            lp.a_matrix_.start_ = self.matrix.indptr
+            lp.a_matrix_.index_ = self.matrix.indices
+            lp.a_matrix_.value_ = self.matrix.data
+            if self.discrete:
+                lp.integrality_ = [
+                    highspy.HighsVarType.kInteger if flag else highspy.HighsVarType.kContinuous
+                    for flag in self.integrality
+                ]
+            h.passModel(lp)
+            self.highs = h
+        else:
+            # 结构不变：只更新目标系数和上下界，HiGHS 保留上一次的基
+            h = self.highs
+            cols = np.arange(self.n_cols, dtype=np.int32)
+            rows = np.arange(self.n_rows, dtype=np.int32)
+            h.changeColsCost(self.n_cols, cols, c)
+            h.changeColsBounds(self.n_cols, cols, col_lower, np.where(np.isinf(col_upper), inf, col_upper))
+            h.changeRowsBounds(
+                self.n_rows, rows,
+                np.where(np.isinf(row_lower), -inf, row_lower),
+                np.where(np.isinf(row_upper), inf, row_upper)
+            )
+
+        h.setOptionValue('time_limit', float(time_limit))
+        h.setOptionValue('mip_rel_gap', float(mip_gap))
+        if self.discrete and start is not None:
+            solution = highspy.HighsSolution()
+            solution.col_value = start
+            solution.value_valid = True
+            h.setSolution(solution)
+            warm = True
+
+        h.run()
+        status = h.getModelStatus()
+        info = h.getInfo()
+        feasible = status == highspy.HighsModelStatus.kOptimal or (
+            self.discrete and info.primal_solution_status == 2
+        )
+        return {
+            'values': np.asarray(h.getSolution().col_value) if feasible else None,
+            'status': h.modelStatusToString(status),
+            'objective': float(info.objective_function_value) if feasible else None,
+            'backend': 'HiGHS (highspy)',
+            'warm_start': warm,
+            'iterations': int(info.simplex_iteration_count),
+            'mip_gap': float(info.mip_gap) if self.discrete else 0.0
+        }
+
+    def _solve_scipy(self, c, col_lower, col_upper, row_lower, row_upper, time_limit, mip_gap):
+        result = milp(
+            c,
+            constraints=LinearConstraint(self.matrix, row_lower, row_upper),
+            bounds=Bounds(col_lower, col_upper),
+            integrality=self.integrality,
+            options={'time_limit': time_limit, 'mip_rel_gap': mip_gap}
+        )
+        return {
+            'values': result.x,
+            'status': result.message,
+            'objective': float(result.fun) if result.x is not None else None,
+            'backend': 'HiGHS (scipy)',
+            'warm_start': False,
+            'iterations': 0,
+            'mip_gap': float(getattr(result, 'mip_gap', 0.0) or 0.0)
+        }
+
+
+_structures: 'OrderedDict[tuple, ScheduleStructure]' = OrderedDict()
+_structures_lock = threading.Lock()
+
+
+def get_structure(
+    pump_flows: List[float],
+    pump_powers: List[float],
+    n_steps: int,
+    step_hours: float,
+    switching: bool,
+    peak: bool,
+    discrete: bool
+) -> Tuple[ScheduleStructure, bool]:
+    """
+    获取（或构建并缓存）模型结构
+
+    Returns:
+        (结构, 是否命中缓存)
+    """
+    key = (tuple(pump_flows), tuple(pump_powers), n_steps, step_hours, switching, peak, discrete)
+    with _structures_lock:
+        structure = _structures.get(key)
+        if structure is not None:
+            _structures.move_to_end(key)
+            return structure, True
+
+    started = time.perf_counter()
+    structure = ScheduleStructure(*key)
+    logger.info(
+        f"🧱 调度模型结构已构建: {structure.n_cols} 个变量, {structure.n_rows} 个约束, "
+        f"{(time.perf_counter() - started) * 1000:.1f} ms"
+    )
+
+    with _structures_lock:
+        structure = _structures.setdefault(key, structure)
+        while len(_structures) > MAX_CACHED_STRUCTURES:
+            _structures.popitem(last=False)
+    return structure, False
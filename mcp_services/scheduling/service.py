@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+优化调度MCP服务（独立部署）
+
+在仓库根目录运行:
+    python -m mcp_services.scheduling.service
+
+注册到HydroNet后（服务清单中 "url": "http://host:8083"），
+scheduling 工具改为调用该服务；未注册时管理器在本地直接调用同一引擎。
+"""
+
+import os
+from datetime import datetime
+
+from flask import Flask, jsonify
+
+from mcp_services.runtime import ServiceRuntime, RuntimeQueueFull, register_task_routes, encode_response, decode_request
+from .model import HIGHS_AVAILABLE
+
+app = Flask(__name__)
+
+# 模型结构缓存和热启动状态保存在工作进程内；滚动优化的调度请求较轻，
+# 默认单个工作进程以保证同一 schedule_id 的每一轮都能复用上一轮的解
+runtime = ServiceRuntime(
+    {'scheduling': 'mcp_services.scheduling.engine:run_scheduling'},
+    max_workers=int(os.environ.get('MCP_RUNTIME_WORKERS', '1'))
+)
+register_task_routes(app, runtime)
+
+# 同步执行接口的最长等待时间（秒），更长的计算请使用 /tasks/submit
+EXECUTE_TIMEOUT = float(os.environ.get('MCP_EXECUTE_TIMEOUT', '300'))
+
+
+@app.route('/execute', methods=['POST'])
+def execute():
+    """
+    执行调度优化
+
+    请求体: {"arguments": {...}} 或 {"params": {...}}，参数同 scheduling 工具定义。
+    滚动优化时每轮携带相同的 schedule_id 和新的 start_time / demand_forecast
+    """
+    try:
+        data = decode_request()
+        params = data.get('arguments') or data.get('params') or {}
+        return encode_response(runtime.run('scheduling', params, timeout=EXECUTE_TIMEOUT))
+
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 400
+    except RuntimeQueueFull as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 429
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 500
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """健康检查接口"""
+    return jsonify({
+        'status': 'healthy',
+        'service': '优化调度服务',
+        'version': '1.0.0',
+        'runtime': runtime.get_metrics(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+@app.route('/info', methods=['GET'])
+def info():
+    """服务信息接口"""
+    return jsonify({
+        'name': 'scheduling',
+        'type': 'scheduling',
+        'description': '泵站-水池分时电价优化调度（稀疏LP/MILP）',
+        'version': '1.0.0',
+        'solver': 'HiGHS (highspy)' if HIGHS_AVAILABLE else 'HiGHS (scipy)',
+        'capabilities': [
+            'minimize_cost / minimize_energy / maximize_efficiency / balance',
+            '流量、功率上限和最低服务压力约束',
+            '最长168小时，支持15分钟时段滚动优化',
+            '模型结构缓存和热启动'
+        ]
+    })
+
+
+if __name__ == '__main__':
+    port = int(os.environ.get('SCHEDULING_SERVICE_PORT', '8083'))
+    print("=" * 50)
+    print("📅 优化调度MCP服务")
+    print("=" * 50)
+    print(f"服务地址: http://localhost:{port}")
+    print("执行接口: POST /execute")
+    print("异步任务: POST /tasks/submit, GET /tasks/<id>")
+    print("=" * 50)
+
+    runtime.start()
+    app.run(host='0.0.0.0', port=port, threaded=True)
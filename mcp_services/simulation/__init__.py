@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""
+水网仿真服务
+有压管网GGA水力求解器（SciPy稀疏矩阵）和延时模拟
+"""
+
+from .network import PipeNetwork, build_default_network
+from .gga import GGASolver
+from .eps import ExtendedPeriodSimulation, run_simulation
+
+__all__ = [
+    'PipeNetwork',
+    'build_default_network',
+    'GGASolver',
+    'ExtendedPeriodSimulation',
+    'run_simulation'
+]
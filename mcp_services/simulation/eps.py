@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+延时模拟（EPS）和 simulation 工具入口
+"""
+
+import time
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable
+
+import numpy as np
+
+from .network import PipeNetwork, build_default_network, METERS_PER_MPA
+from .gga import GGASolver
+
+logger = logging.getLogger(__name__)
+
+
+MAX_DURATION_HOURS = 168
+# 低于该压力（MPa）的节点计入低压告警
+LOW_PRESSURE_MPA = 0.14
+
+
+class ExtendedPeriodSimulation:
+    """
+    延时模拟
+
+    每个水力时段用上一时段的流量热启动GGA（通常2-3次迭代收敛），
+    时段之间按净入流更新水池水位。求解器的稀疏结构在整个模拟中复用。
+    """
+
+    def __init__(
+        self,
+        network: PipeNetwork,
+        duration: float = 24,
+        hydraulic_step: float = 1.0,
+        accuracy: float = 1e-3
+    ):
+        """
+        Args:
+            network: 管网模型
+            duration: 模拟时长（小时，最长168）
+            hydraulic_step: 水力时间步长（小时）
+            accuracy: GGA收敛精度
+        """
+        if not 0 < duration <= MAX_DURATION_HOURS:
+            raise ValueError(f"模拟时长需在 0-{MAX_DURATION_HOURS} 小时之间: {duration}")
+        if hydraulic_step <= 0:
+            raise ValueError(f"水力时间步长必须大于0: {hydraulic_step}")
+
+        self.network = network
+        self.duration = duration
+        self.hydraulic_step = hydraulic_step
+        self.solver = GGASolver(network, accuracy=accuracy)
+
+    def run(self, progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, np.ndarray]:
+        """
+        执行延时模拟
+
+        Args:
+            progress_callback: 每个时段结束后调用，参数为
+                {'progress': 百分比, 'message': ..., 'partial': {'offset': n, 'time_series': {...}}}
+
+        Returns:
+            各时段结果数组: hours, source_flow (m³/h), pressures (时段 × 节点, MPa),
+            tank_levels (时段 × 已知水头节点, m), iterations, solve_time, converged
+        """
+        net = self.network
+        hours = np.arange(0.0, self.duration + 1e-9, self.hydraulic_step)
+        n_steps = len(hours)
+
+        pressures = np.empty((n_steps, net.n_junctions))
+        source_flow = np.empty(n_steps)
+        tank_levels = np.empty((n_steps, net.n_fixed))
+        iterations = np.empty(n_steps, dtype=np.int64)
+        solve_time = np.empty(n_steps)
+        converged = np.empty(n_steps, dtype=bool)
+
+        level = np.where(net.tank_mask, net.tank_init_level, 0.0)
+        flows = None
+        dt = self.hydraulic_step * 3600.0
+        report_every = max(1, n_steps // 10)
+        reported = 0
+
+        for step, hour in enumerate(hours):
+            demands = net.demands_at(hour) / 3600.0
+            state = self.solver.solve(demands, net.fixed_elevations + level, flows=flows)
+            flows = state['flows']
+
+            inflows = self.solver.fixed_node_inflows(flows)
+            pressures[step] = (state['heads'] - net.elevations) / METERS_PER_MPA
+            source_flow[step] = -inflows[~net.tank_mask].sum() * 3600.0
+            tank_levels[step] = level
+            iterations[step] = state['iterations']
+            solve_time[step] = state['solve_time']
+            converged[step] = state['converged']
+
+            # 水池水位按净入流更新，限制在最高/最低水位之间
+            if net.tank_mask.any():
+                level = np.where(
+                    net.tank_mask,
+                    np.clip(level + inflows * dt / net.tank_area, net.tank_min_level, net.tank_max_level),
+                    0.0
+                )
+
+            if progress_callback and ((step + 1) % report_every == 0 or step + 1 == n_steps):
+                # 每块只包含上次推送之后的时段
+                start, reported = reported, step + 1
+                progress_callback({
+                    'progress': round(100.0 * (step + 1) / n_steps, 1),
+                    'message': f'已完成 {step + 1}/{n_steps} 个水力时段',
+                    'partial': {
+                        'offset': start,
+                        'time_series': {
+                            'hour': hours[start:step + 1],
+                            'flow': source_flow[start:step + 1],
+                            'pressure': pressures[start:step + 1].mean(axis=1)
+                        }
+                    }
+                })
+
+        return {
+            'hours': hours,
+            'source_flow': source_flow,
+            'pressures': pressures,
+            'tank_levels': tank_levels,
+            'iterations': iterations,
+            'solve_time': solve_time,
+            'converged': converged
+        }
+
+
+def run_simulation(
+    arguments: Dict[str, Any],
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    simulation 工具入口（参数与 MCP服务管理器中的 simulation 工具定义一致）
+
+    Args:
+        arguments: {'network_config': {...}, 'boundary_conditions': {'inflow', 'pressure'},
+                    'duration': 小时, 'hydraulic_step': 小时(可选)}
+        progress_callback: 进度回调（见 ExtendedPeriodSimulation.run）
+    """
+    started = time.perf_counter()
+    boundary = arguments.get('boundary_conditions') or {}
+    duration = float(arguments.get('duration', 24))
+    network_config = arguments.get('network_config')
+
+    if network_config and network_config.get('nodes'):
+        network = PipeNetwork.from_config(network_config)
+    else:
+        network = build_default_network(
+            inflow=float(boundary.get('inflow', 150.0)),
+            pressure=float(boundary.get('pressure', 0.5))
+        )
+
+    simulation = ExtendedPeriodSimulation(
+        network,
+        duration=duration,
+        hydraulic_step=float(arguments.get('hydraulic_step', 1.0))
+    )
+    results = simulation.run(progress_callback)
+
+    pressures = results['pressures']
+    mean_pressure = pressures.mean(axis=1)
+    min_pressure = pressures.min(axis=1)
+    peak_step = int(np.argmin(min_pressure))
+    critical = np.argsort(pressures[peak_step])[:5]
+
+    warnings = []
+    if not results['converged'].all():
+        warnings.append(f"{int((~results['converged']).sum())} 个时段水力计算未收敛")
+    low = pressures.min(axis=0) < LOW_PRESSURE_MPA
+    if low.any():
+        warnings.append(f"{int(low.sum())} 个节点最低压力低于 {LOW_PRESSURE_MPA} MPa")
+    if (pressures < 0).any():
+        warnings.append('存在负压节点，请检查管径或水源压力')
+
+    logger.info(
+        f"✅ 管网仿真完成: {network.n_pipes} 根管道, {len(results['hours'])} 个时段, "
+        f"平均每时段 {results['solve_time'].mean() * 1000:.1f} ms"
+    )
+
+    return {
+        'status': 'success',
+        'tool': 'simulation',
+        'message': f'✅ 仿真完成（{network.n_junctions} 个节点, {network.n_pipes} 根管道, {duration:g} 小时）',
+        'results': {
+            'simulation_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'duration': duration,
+            'metrics': {
+                'average_flow': round(float(results['source_flow'].mean()), 2),
+                'max_flow': round(float(results['source_flow'].max()), 2),
+                'average_pressure': round(float(mean_pressure.mean()), 4),
+                'max_pressure': round(float(pressures.max()), 4),
+                'min_pressure': round(float(pressures.min()), 4)
+            },
+            'time_series': [
+                {
+                    'hour': float(hour),
+                    'flow': round(float(flow), 2),
+                    'pressure': round(float(p_mean), 4),
+                    'min_pressure': round(float(p_min), 4)
+                }
+                for hour, flow, p_mean, p_min in zip(results['hours'], results['source_flow'], mean_pressure, min_pressure)
+            ],
+            'critical_nodes': [
+                {'id': network.junction_ids[i], 'pressure': round(float(pressures[peak_step, i]), 4)}
+                for i in critical
+            ],
+            'tank_levels': {
+                network.fixed_ids[i]: results['tank_levels'][:, i]
+                for i in np.flatnonzero(network.tank_mask)
+            },
+            'warnings': warnings
+        },
+        'solver': {
+            'method': f'GGA ({simulation.solver.method})',
+            'headloss': network.headloss,
+            'junctions': network.n_junctions,
+            'pipes': network.n_pipes,
+            'steps': len(results['hours']),
+            'total_iterations': int(results['iterations'].sum()),
+            'avg_step_ms': round(float(results['solve_time'].mean() * 1000), 2),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+    }
+
+
+def warmup():
+    """工作进程预热：导入SciPy稀疏求解器并完成一次小规模求解"""
+    run_simulation({'boundary_conditions': {}, 'duration': 1})
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+有压管网模型
+将 network_config（节点、管道拓扑）转换为求解器使用的数组形式
+"""
+
+import logging
+from typing import Dict, List, Any
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# 1 MPa 对应的水柱高度（米）
+METERS_PER_MPA = 101.97
+
+# 默认日变化系数（24小时，使用时按均值归一化）
+DEFAULT_DIURNAL_PATTERN = [
+    0.62, 0.55, 0.52, 0.50, 0.55, 0.72, 1.05, 1.32, 1.28, 1.15, 1.08, 1.10,
+    1.18, 1.12, 1.02, 0.98, 1.05, 1.25, 1.40, 1.35, 1.18, 1.00, 0.85, 0.68
+]
+
+
+class PipeNetwork:
+    """
+    有压管网
+
+    节点分为两类:
+    - 未知水头节点（junction）：需求已知，求解水头
+    - 已知水头节点（reservoir/tank）：水头已知，水池水位随时间变化
+
+    network_config 格式:
+    {
+        "headloss": "H-W" | "D-W",          # 海曾-威廉 / 达西-魏斯巴赫
+        "nodes": [
+            {"id": "J1", "type": "junction", "elevation": 5, "demand": 12.5, "pattern": "res"},
+            {"id": "R1", "type": "reservoir", "head": 60},
+            {"id": "T1", "type": "tank", "elevation": 40, "init_level": 3,
+             "min_level": 0.5, "max_level": 6, "diameter": 15}
+        ],
+        "pipes": [
+            {"id": "P1", "from": "R1", "to": "J1", "length": 800, "diameter": 0.3,
+             "roughness": 120, "minor_loss": 0, "status": "open"}
+        ],
+        "patterns": {"res": [0.8, 1.0, ...]}     # 每小时一个系数，循环使用
+    }
+
+    单位: 长度/高程/水头 m，管径 m，需求 m³/h；H-W粗糙度为C值，D-W粗糙度为mm。
+    """
+
+    def __init__(
+        self,
+        junction_ids: List[str],
+        elevations: np.ndarray,
+        base_demands: np.ndarray,
+        demand_patterns: np.ndarray,
+        fixed_ids: List[str],
+        fixed_elevations: np.ndarray,
+        tank_mask: np.ndarray,
+        tank_init_level: np.ndarray,
+        tank_min_level: np.ndarray,
+        tank_max_level: np.ndarray,
+        tank_area: np.ndarray,
+        pipe_ids: List[str],
+        pipe_from: np.ndarray,
+        pipe_to: np.ndarray,
+        length: np.ndarray,
+        diameter: np.ndarray,
+        roughness: np.ndarray,
+        minor_loss: np.ndarray,
+        pipe_open: np.ndarray,
+        headloss: str = 'H-W'
+    ):
+        """
+        pipe_from / pipe_to 为统一编号：[0, 节点数) 为未知水头节点，
+        [节点数, 节点数 + 已知水头节点数) 为已知水头节点。
+        demand_patterns 形状为 (节点数, 周期)，需求 = base_demands × 当前小时系数。
+        """
+        self.junction_ids = junction_ids
+        self.elevations = elevations
+        self.base_demands = base_demands
+        self.demand_patterns = demand_patterns
+        self.fixed_ids = fixed_ids
+        self.fixed_elevations = fixed_elevations
+        self.tank_mask = tank_mask
+        self.tank_init_level = tank_init_level
+        self.tank_min_level = tank_min_level
+        self.tank_max_level = tank_max_level
+        self.tank_area = tank_area
+        self.pipe_ids = pipe_ids
+        self.pipe_from = pipe_from
+        self.pipe_to = pipe_to
+        self.length = length
+        self.diameter = diameter
+        self.roughness = roughness
+        self.minor_loss = minor_loss
+        self.pipe_open = pipe_open
+        self.headloss = headloss
+
+    @property
+    def n_junctions(self) -> int:
+        return len(self.junction_ids)
+
+    @property
+    def n_fixed(self) -> int:
+        return len(self.fixed_ids)
+
+    @property
+    def n_pipes(self) -> int:
+        return len(self.pipe_ids)
+
+    def demands_at(self, hour: float) -> np.ndarray:
+        """指定时刻的节点需求（m³/h）"""
+        period = self.demand_patterns.shape[1]
+        return self.base_demands * self.demand_patterns[:, int(hour) % period]
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'PipeNetwork':
+        """从 network_config 构建管网"""
+        nodes = config.get('nodes') or []
+        pipes = config.get('pipes') or config.get('links') or []
+        if not nodes or not pipes:
+            raise ValueError("network_config 需要包含 nodes 和 pipes")
+
+        headloss = str(config.get('headloss', 'H-W')).upper()
+        if headloss not in ('H-W', 'D-W'):
+            raise ValueError(f"不支持的水头损失公式: {headloss}（可选 H-W / D-W）")
+
+        junctions = [n for n in nodes if n.get('type', 'junction') == 'junction']
+        fixed = [n for n in nodes if n.get('type', 'junction') in ('reservoir', 'tank')]
+        if not fixed:
+            raise ValueError("管网至少需要一个水库（reservoir）或水池（tank）")
+
+        index = {}
+        for i, node in enumerate(junctions + fixed):
+            if node['id'] in index:
+                raise ValueError(f"节点ID重复: {node['id']}")
+            index[node['id']] = i
+
+        patterns = config.get('patterns') or {}
+        period = max([len(p) for p in patterns.values()] + [1])
+        demand_patterns = np.ones((len(junctions), period))
+        for i, node in enumerate(junctions):
+            name = node.get('pattern')
+            if name is None:
+                continue
+            if name not in patterns:
+                raise ValueError(f"节点 {node['id']} 引用了不存在的模式: {name}")
+            demand_patterns[i] = np.resize(np.asarray(patterns[name], dtype=float), period)
+
+        is_tank = np.array([n.get('type') == 'tank' for n in fixed])
+        fixed_elevations = np.array([
+            float(n.get('elevation', 0.0)) if n.get('type') == 'tank' else float(n.get('head', n.get('elevation', 0.0)))
+            for n in fixed
+        ])
+
+        try:
+            pipe_from = np.array([index[p['from']] for p in pipes], dtype=np.int64)
+            pipe_to = np.array([index[p['to']] for p in pipes], dtype=np.int64)
+        except KeyError as e:
+            raise ValueError(f"管道引用了不存在的节点: {e.args[0]}")
+
+        default_roughness = 120.0 if headloss == 'H-W' else 0.1
+
+        return cls(
+            junction_ids=[n['id'] for n in junctions],
+            elevations=np.array([float(n.get('elevation', 0.0)) for n in junctions]),
+            base_demands=np.array([float(n.get('demand', 0.0)) for n in junctions]),
+            demand_patterns=demand_patterns,
+            fixed_ids=[n['id'] for n in fixed],
+            fixed_elevations=fixed_elevations,
+            tank_mask=is_tank,
+            tank_init_level=np.array([float(n.get('init_level', 0.0)) for n in fixed]),
+            tank_min_level=np.array([float(n.get('min_level', 0.0)) for n in fixed]),
+            tank_max_level=np.array([float(n.get('max_level', np.inf)) for n in fixed]),
+            tank_area=np.array([np.pi * float(n.get('diameter', 10.0)) ** 2 / 4 for n in fixed]),
+            pipe_ids=[str(p.get('id', i)) for i, p in enumerate(pipes)],
+            pipe_from=pipe_from,
+            pipe_to=pipe_to,
+            length=np.array([float(p.get('length', 100.0)) for p in pipes]),
+            diameter=np.array([float(p['diameter']) for p in pipes]),
+            roughness=np.array([float(p.get('roughness', default_roughness)) for p in pipes]),
+            minor_loss=np.array([float(p.get('minor_loss', 0.0)) for p in pipes]),
+            pipe_open=np.array([p.get('status', 'open') != 'closed' for p in pipes]),
+            headloss=headloss
+        )
+
+
+def build_default_network(
+    inflow: float = 150.0,
+    pressure: float = 0.5,
+    grid_size: int = 6,
+    spacing: float = 300.0
+) -> PipeNetwork:
+    """
+    未提供 network_config 时使用的示例环状管网
+
+    一座水库经干管接入 grid_size × grid_size 的环状配水管网，
+    总平均需求等于入流量，需求按 DEFAULT_DIURNAL_PATTERN 日变化。
+
+    Args:
+        inflow: 平均入流量 (m³/h)
+        pressure: 水库出口压力 (MPa)
+        grid_size: 每边节点数
+        spacing: 节点间距 (m)
+    """
+    n = grid_size
+    ids = [f'J{r}_{c}' for r in range(n) for c in range(n)]
+    rows, cols = np.divmod(np.arange(n * n), n)
+
+    # 按平均流速约1 m/s确定干管管径，支管按比例缩小
+    trunk_d = max(0.1, float(np.sqrt(4 * inflow / 3600.0 / np.pi)))
+    main_d = max(0.1, trunk_d * 0.6)
+    branch_d = max(0.08, trunk_d * 0.4)
+
+    pipe_from, pipe_to, diameters = [], [], []
+    for i in range(n * n):
+        r, c = rows[i], cols[i]
+        # 第一行和第一列为主管，其余为支管
+        if c + 1 < n:
+            pipe_from.append(i)
+            pipe_to.append(i + 1)
+            diameters.append(main_d if r == 0 else branch_d)
+        if r + 1 < n:
+            pipe_from.append(i)
+            pipe_to.append(i + n)
+            diameters.append(main_d if c == 0 else branch_d)
+
+    # 水库通过干管接入 J0_0
+    pipe_from.append(n * n)
+    pipe_to.append(0)
+    diameters.append(trunk_d)
+
+    n_pipes = len(pipe_from)
+    return PipeNetwork(
+        junction_ids=ids,
+        elevations=(rows + cols) * 0.5,
+        base_demands=np.full(n * n, inflow / (n * n)),
+        # 按均值归一化，平均需求严格等于入流量
+        demand_patterns=np.tile(np.divide(DEFAULT_DIURNAL_PATTERN, np.mean(DEFAULT_DIURNAL_PATTERN)), (n * n, 1)),
+        fixed_ids=['R1'],
+        fixed_elevations=np.array([pressure * METERS_PER_MPA]),
+        tank_mask=np.array([False]),
+        tank_init_level=np.zeros(1),
+        tank_min_level=np.zeros(1),
+        tank_max_level=np.full(1, np.inf),
+        tank_area=np.ones(1),
+        pipe_ids=[f'P{i + 1}' for i in range(n_pipes)],
+        pipe_from=np.array(pipe_from, dtype=np.int64),
+        pipe_to=np.array(pipe_to, dtype=np.int64),
+        length=np.full(n_pipes, spacing),
+        diameter=np.array(diameters),
+        roughness=np.full(n_pipes, 120.0),
+        minor_loss=np.zeros(n_pipes),
+        pipe_open=np.ones(n_pipes, dtype=bool),
+        headloss='H-W'
+    )
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+水网仿真MCP服务（独立部署）
+
+在仓库根目录运行:
+    python -m mcp_services.simulation.service
+
+注册到HydroNet后（服务清单中 "url": "http://host:8081"），
+simulation 工具改为调用该服务；未注册时管理器在本地直接调用同一引擎。
+"""
+
+import os
+import json
+from datetime import datetime
+
+from flask import Flask, request, jsonify, Response, stream_with_context
+
+import mcp_codec
+from mcp_services.runtime import ServiceRuntime, RuntimeQueueFull, register_task_routes, encode_response, decode_request
+from .eps import MAX_DURATION_HOURS
+
+app = Flask(__name__)
+
+# 仿真在预热过的工作进程中执行，HTTP线程保持响应
+runtime = ServiceRuntime(
+    {'simulation': 'mcp_services.simulation.eps:run_simulation'},
+    warmup='mcp_services.simulation.eps:warmup'
+)
+register_task_routes(app, runtime)
+
+# 同步执行接口的最长等待时间（秒），更长的计算请使用 /tasks/submit
+EXECUTE_TIMEOUT = float(os.environ.get('MCP_EXECUTE_TIMEOUT', '300'))
+
+
+def stream_events(task_id, columnar=False):
+    """把运行时任务事件编码为NDJSON行"""
+    encode = mcp_codec.pack_arrays if columnar else mcp_codec.to_jsonable
+    for event in runtime.iter_events(task_id, timeout=EXECUTE_TIMEOUT):
+        yield json.dumps(encode(event), ensure_ascii=False) + '\n'
+
+
+@app.route('/execute', methods=['POST'])
+def execute():
+    """
+    执行仿真
+
+    请求体: {"arguments": {...}} 或 {"params": {...}}，参数同 simulation 工具定义
+    客户端 Accept 包含 application/x-ndjson 且 stream=true 时按NDJSON流式返回
+    """
+    try:
+        data = decode_request()
+        params = data.get('arguments') or data.get('params') or {}
+
+        if data.get('stream') and 'application/x-ndjson' in request.headers.get('Accept', ''):
+            columnar = request.headers.get(mcp_codec.ARRAY_HEADER) == mcp_codec.ARRAY_ENCODING
+            encoding = mcp_codec.choose_encoding(request.headers.get('Accept-Encoding'))
+            headers = {'Accept-Encoding': ', '.join(mcp_codec.supported_encodings())}
+            if encoding:
+                headers['Content-Encoding'] = encoding
+            task_id = runtime.submit('simulation', params)['task_id']
+            return Response(
+                stream_with_context(mcp_codec.compress_stream(stream_events(task_id, columnar), encoding)),
+                mimetype='application/x-ndjson',
+                headers=headers
+            )
+
+        return encode_response(runtime.run('simulation', params, timeout=EXECUTE_TIMEOUT))
+
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 400
+    except RuntimeQueueFull as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 429
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 500
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """健康检查接口"""
+    return jsonify({
+        'status': 'healthy',
+        'service': '水网仿真服务',
+        'version': '1.0.0',
+        'runtime': runtime.get_metrics(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+@app.route('/info', methods=['GET'])
+def info():
+    """服务信息接口"""
+    return jsonify({
+        'name': 'simulation',
+        'type': 'simulation',
+        'description': '有压管网水力仿真（GGA稀疏求解 + 延时模拟）',
+        'version': '1.0.0',
+        'capabilities': [
+            '稳态水力计算',
+            f'延时模拟（最长{MAX_DURATION_HOURS}小时）',
+            '海曾-威廉 / 达西-魏斯巴赫水头损失',
+            '水池水位变化'
+        ]
+    })
+
+
+if __name__ == '__main__':
+    port = int(os.environ.get('SIMULATION_SERVICE_PORT', '8081'))
+    print("=" * 50)
+    print("🌊 水网仿真MCP服务")
+    print("=" * 50)
+    print(f"服务地址: http://localhost:{port}")
+    print("执行接口: POST /execute")
+    print("异步任务: POST /tasks/submit, GET /tasks/<id>")
+    print("=" * 50)
+
+    runtime.start()
+    app.run(host='0.0.0.0', port=port, threaded=True)
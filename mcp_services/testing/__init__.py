@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+测试服务
+可靠性、压力、能效、稳定性的并行蒙特卡洛测试（独立随机流，置信区间收敛后提前停止）
+"""
+
+from .system import station_config, DEFAULT_COMPONENTS
+from .montecarlo import run_ensemble
+from .engine import run_testing
+
+__all__ = [
+    'station_config',
+    'DEFAULT_COMPONENTS',
+    'run_ensemble',
+    'run_testing'
+]
@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+"""
+testing 工具入口
+"""
+
+import time
+import logging
+from typing import Dict, List, Any, Optional, Callable
+
+import numpy as np
+from scipy.stats import norm
+
+from .system import station_config
+from .kernels import LOAD_GRID, stability_steps
+from .montecarlo import run_ensemble, proportion_interval, mean_interval
+
+logger = logging.getLogger(__name__)
+
+
+TEST_TYPES = ('stress', 'reliability', 'efficiency', 'stability')
+# 未指定时的测试时长（小时）：可靠性按一年，稳定性按一周；压力、能效测试为稳态抽样，与时长无关
+DEFAULT_DURATIONS = {'reliability': 8760.0, 'stress': 24.0, 'efficiency': 24.0, 'stability': 168.0}
+MAX_DURATION_HOURS = 87600.0
+DEFAULT_TRIALS = 1000000
+MAX_TRIALS = 10000000
+# 主指标置信区间半宽达到该值时提前停止（概率指标为绝对值，效率为效率值）
+DEFAULT_PRECISION = 0.001
+DEFAULT_CONFIDENCE = 0.95
+# 压力测试：供水能力不足概率不超过该值的最大负荷视为可承受
+STRESS_RISK = 0.01
+
+DEFAULT_TARGETS = {
+    'availability': 0.995,
+    'reliability': 0.9,
+    'group_failure': 0.05,
+    'interruption': 0.01,
+    'recovery_hours': 12.0,
+    'efficiency': 0.7,
+    'low_efficiency_share': 0.1,
+    'supply_ratio': 0.999,
+    'excursion': 0.01,
+    'starts_per_day': 6.0
+}
+
+METHODS = {
+    'reliability': '可修系统交替更新过程抽样（威布尔寿命 + 指数修复），k-out-of-n 部件组事件扫描',
+    'stress': '设备稳态可用状态 × 需求波动 × 突增峰值/持续时间联合抽样，水池调节容量缓冲',
+    'efficiency': '随机时刻、需求和设备状态下按最少台数开泵，水泵效率曲线 + 管路特性',
+    'stability': '水位分级启停闭环逐步仿真，AR(1) 需求波动与水泵随机故障/修复'
+}
+
+
+def _check(name: str, value: float, threshold: float, higher_is_better: bool, severity: str = 'failed') -> Dict[str, Any]:
+    """单项检查：不满足时按 severity 记为 failed 或 warning"""
+    ok = value >= threshold if higher_is_better else value <= threshold
+    return {
+        'name': name,
+        'value': round(float(value), 6),
+        'threshold': threshold,
+        'status': 'passed' if ok else severity
+    }
+
+
+def _summary(checks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    total = len(checks)
+    passed = sum(1 for c in checks if c['status'] == 'passed')
+    return {
+        'total_tests': total,
+        'passed': passed,
+        'failed': sum(1 for c in checks if c['status'] == 'failed'),
+        'warnings': sum(1 for c in checks if c['status'] == 'warning'),
+        'success_rate': round(100.0 * passed / total, 1) if total else 100.0
+    }
+
+
+def _interval(low: float, high: float, digits: int = 6) -> List[float]:
+    return [round(float(low), digits), round(float(high), digits)]
+
+
+# ==================== 收敛判据：主指标置信区间半宽 ====================
+
+def _proportion_half_width(successes: float, trials: float, z: float) -> float:
+    _, low, high = proportion_interval(successes, trials, z)
+    return (high - low) / 2
+
+
+HALF_WIDTHS = {
+    'reliability': lambda s, z: _proportion_half_width(s['survived'], s['trials'], z),
+    'stress': lambda s, z: _proportion_half_width(s['interrupted'], s['trials'], z),
+    'efficiency': lambda s, z: mean_interval(s['efficiency'], s['efficiency_sq'], s['operating'], z)[1],
+    'stability': lambda s, z: _proportion_half_width(s['excursion'], s['trials'], z)
+}
+
+
+# ==================== 结果整理 ====================
+
+def _reliability(stats, config, z, targets):
+    """可靠度、可用度、MTBF 和各部件组的停运贡献"""
+    n, horizon = stats['trials'], config['duration']
+    reliability, low, high = proportion_interval(stats['survived'], n, z)
+    downtime, half = mean_interval(stats['downtime'], stats['downtime_sq'], n, z)
+    availability = 1.0 - downtime / horizon
+    uptime = n * horizon - stats['downtime']
+    mtbf = uptime / stats['failures'] if stats['failures'] else None
+    mttr = stats['downtime'] / stats['failures'] if stats['failures'] else None
+
+    total_group_downtime = stats['group_downtime'].sum()
+    components = []
+    for g, group in enumerate(config['components']):
+        components.append({
+            'name': group['name'],
+            'configuration': f"{group['count']}取{group['required']}",
+            'failure_probability': round(float(stats['group_failed'][g] / n), 6),
+            'unavailability': round(float(stats['group_downtime'][g] / (n * horizon)), 8),
+            'downtime_share': round(float(stats['group_downtime'][g] / total_group_downtime), 4)
+            if total_group_downtime > 0 else 0.0
+        })
+
+    checks = [
+        _check('系统可用度', availability, targets['availability'], True),
+        _check('任务期可靠度', reliability, targets['reliability'], True)
+    ]
+    checks += [
+        _check(f"{c['name']}失效概率", c['failure_probability'], targets['group_failure'], False, 'warning')
+        for c in components
+    ]
+
+    recommendations = []
+    worst = max(range(len(components)), key=lambda g: components[g]['downtime_share'])
+    group = config['components'][worst]
+    share = components[worst]['downtime_share'] * 100
+    if group['count'] == group['required']:
+        recommendations.append(f"{group['name']}无冗余，停运占系统停运时间的 {share:.0f}%，建议增加备用")
+    elif group['shape'] > 1:
+        recommendations.append(f"{group['name']}为磨损型失效，停运占系统停运时间的 {share:.0f}%，建议按运行小时做预防性维护")
+    else:
+        recommendations.append(f"{group['name']}停运占系统停运时间的 {share:.0f}%，建议缩短修复时间（当前 {group['mttr']:.0f} 小时）")
+
+    results = {
+        'performance_metrics': {
+            'reliability': round(reliability, 6),
+            'availability': round(availability, 6),
+            'mtbf': round(mtbf, 1) if mtbf else None,
+            'mttr': round(mttr, 2) if mttr else None,
+            'failures_per_year': round(stats['failures'] / n * 8760.0 / horizon, 4)
+        },
+        'confidence_intervals': {
+            'reliability': _interval(low, high),
+            'availability': _interval(1.0 - (downtime + half) / horizon, 1.0 - (downtime - half) / horizon)
+        },
+        'component_analysis': components
+    }
+    return results, checks, recommendations
+
+
+def _stress(stats, config, z, targets):
+    """负荷-缺口概率曲线、突增中断概率和恢复时间"""
+    n = stats['trials']
+    shortfall = stats['shortfall'] / n
+    handled = np.nonzero(shortfall <= STRESS_RISK)[0]
+    broken = np.nonzero(shortfall >= 0.5)[0]
+    max_load = float(LOAD_GRID[handled[-1]]) if len(handled) else None
+    failure_point = float(LOAD_GRID[broken[0]]) if len(broken) else None
+
+    interruption, low, high = proportion_interval(stats['interrupted'], n, z)
+    recovery, half = mean_interval(stats['recovery'], stats['recovery_sq'], stats['drained'], z)
+    surge_factor = float(config['surge']['factor'])
+
+    checks = [
+        _check('可承受负荷倍数', max_load or 0.0, surge_factor, True),
+        _check('突增中断供水概率', interruption, targets['interruption'], False),
+        _check('平均恢复时间(h)', recovery, targets['recovery_hours'], False, 'warning')
+    ]
+    recommendations = []
+    if max_load is None or max_load < surge_factor:
+        recommendations.append(
+            f"可承受负荷低于设计突增倍数 {surge_factor:.0%}，建议增加备用泵或提高单泵能力"
+        )
+    if interruption > targets['interruption']:
+        tank = config['station']['tank']
+        recommendations.append(
+            f"突增时中断供水概率 {interruption:.2%}，建议扩大水池调节容量（当前 "
+            f"{tank['area'] * (tank['initial_level'] - tank['min_level']):.0f} m³）"
+        )
+    if recovery > targets['recovery_hours']:
+        recommendations.append(f"水池平均恢复时间 {recovery:.1f} 小时，建议突增后临时加开备用泵回充")
+
+    step = 10
+    results = {
+        'performance_metrics': {
+            'interruption_probability': round(interruption, 6),
+            'unrecoverable_probability': round(stats['unrecoverable'] / n, 6),
+            'expected_unserved_volume': round(stats['unserved_volume'] / n, 3),
+            'mean_recovery_time': round(recovery, 3)
+        },
+        'stress_test': {
+            'max_load_handled': f'{max_load:.0%}' if max_load else f'<{LOAD_GRID[0]:.0%}',
+            'failure_point': f'{failure_point:.0%}' if failure_point else f'>{LOAD_GRID[-1]:.0%}',
+            'recovery_time': round(recovery, 2),
+            'max_recovery_time': round(stats['recovery_max'], 2)
+        },
+        'confidence_intervals': {
+            'interruption_probability': _interval(low, high),
+            'mean_recovery_time': _interval(recovery - half, recovery + half, 3)
+        },
+        'load_curve': [
+            {'load': float(LOAD_GRID[i]), 'shortfall_probability': round(float(shortfall[i]), 6)}
+            for i in range(0, len(LOAD_GRID), step)
+        ]
+    }
+    return results, checks, recommendations
+
+
+def _efficiency(stats, config, z, targets):
+    """水泵平均效率、泵站综合效率和单位能耗"""
+    mean, half = mean_interval(stats['efficiency'], stats['efficiency_sq'], stats['operating'], z)
+    station_efficiency = stats['hydraulic_power'] / stats['shaft_power'] if stats['shaft_power'] else 0.0
+    low_share = stats['low_efficiency'] / max(stats['operating'], 1)
+    supply_ratio = stats['served'] / stats['demand']
+    specific_energy = stats['shaft_power'] / stats['served'] if stats['served'] else None
+
+    checks = [
+        _check('泵站综合效率', station_efficiency, targets['efficiency'], True),
+        _check('低效运行占比', low_share, targets['low_efficiency_share'], False, 'warning'),
+        _check('需求满足率', supply_ratio, targets['supply_ratio'], True)
+    ]
+    recommendations = []
+    if station_efficiency < targets['efficiency'] or low_share > targets['low_efficiency_share']:
+        recommendations.append('低需求时段单泵偏离高效区，建议配置小泵或变频调速')
+    if supply_ratio < targets['supply_ratio']:
+        recommendations.append(f"设备故障时需求满足率 {supply_ratio:.2%}，建议提高水泵可用度")
+
+    results = {
+        'performance_metrics': {
+            'mean_pump_efficiency': round(mean, 6),
+            'station_efficiency': round(station_efficiency, 6),
+            'specific_energy': round(specific_energy, 6) if specific_energy else None,
+            'low_efficiency_share': round(low_share, 6),
+            'supply_ratio': round(supply_ratio, 6)
+        },
+        'confidence_intervals': {
+            'mean_pump_efficiency': _interval(mean - half, mean + half)
+        }
+    }
+    return results, checks, recommendations
+
+
+def _stability(stats, config, z, targets):
+    """水位越限概率、越限时间占比和水泵启停频次"""
+    n, days = stats['trials'], config['duration'] / 24.0
+    pumps = config['components'][config['pump_group']]['count']
+    excursion, low, high = proportion_interval(stats['excursion'], n, z)
+    level_std, half = mean_interval(stats['level_std'], stats['level_std_sq'], n, z)
+    starts = stats['starts'] / n / days / pumps
+
+    checks = [
+        _check('水位越限概率', excursion, targets['excursion'], False),
+        _check('单泵日启停次数', starts, targets['starts_per_day'], False, 'warning')
+    ]
+    recommendations = []
+    if excursion > targets['excursion']:
+        recommendations.append('水位越限风险偏高，建议调整启停泵水位或增加调节容积')
+    if starts > targets['starts_per_day']:
+        recommendations.append('水泵启停频繁，建议加大启停水位间距或采用变频调速')
+
+    results = {
+        'performance_metrics': {
+            'excursion_probability': round(excursion, 6),
+            'time_out_of_band': round(stats['out_fraction'] / n, 8),
+            'pump_starts_per_day': round(starts, 3),
+            'level_std': round(level_std, 4)
+        },
+        'confidence_intervals': {
+            'excursion_probability': _interval(low, high),
+            'level_std': _interval(level_std - half, level_std + half, 4)
+        }
+    }
+    return results, checks, recommendations
+
+
+ANALYSES = {
+    'reliability': _reliability,
+    'stress': _stress,
+    'efficiency': _efficiency,
+    'stability': _stability
+}
+
+
+def run_testing(
+    arguments: Dict[str, Any],
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    testing 工具入口（参数与 MCP服务管理器中的 testing 工具定义一致）
+
+    Args:
+        arguments: {
+            'test_type': 'stress' | 'reliability' | 'efficiency' | 'stability',
+            'test_duration': 测试时长（小时）,
+            'test_scenario': 场景描述,
+            'trials': 最大试验次数（默认100万）, 'precision': 主指标置信区间半宽,
+            'confidence': 置信水平, 'seed': 随机种子,
+            'components' / 'station' / 'surge' / 'targets': 覆盖默认泵站、突增场景和考核指标
+        }
+    """
+    started = time.perf_counter()
+    test_type = str(arguments.get('test_type') or 'stress').lower()
+    if test_type not in TEST_TYPES:
+        raise ValueError(f"不支持的测试类型: {test_type}，可选 {', '.join(TEST_TYPES)}")
+
+    duration = float(arguments.get('test_duration') or DEFAULT_DURATIONS[test_type])
+    if not 0 < duration <= MAX_DURATION_HOURS:
+        raise ValueError(f"测试时长需在 0 ~ {MAX_DURATION_HOURS:.0f} 小时之间")
+    trials = int(arguments.get('trials') or DEFAULT_TRIALS)
+    if not 1 <= trials <= MAX_TRIALS:
+        raise ValueError(f"试验次数需在 1 ~ {MAX_TRIALS} 之间")
+    precision = float(arguments.get('precision', DEFAULT_PRECISION))
+    confidence = float(arguments.get('confidence', DEFAULT_CONFIDENCE))
+    if not 0 < confidence < 1:
+        raise ValueError("置信水平需在 0 ~ 1 之间")
+    z = float(norm.ppf(0.5 + confidence / 2))
+    targets = {**DEFAULT_TARGETS, **(arguments.get('targets') or {})}
+    seed = arguments.get('seed')
+
+    config = station_config(arguments, duration, test_type)
+    half_width = HALF_WIDTHS[test_type]
+    stats, ensemble = run_ensemble(
+        test_type, config, trials,
+        converged=lambda s: half_width(s, z) <= precision,
+        seed=int(seed) if seed is not None else None,
+        progress_callback=progress_callback
+    )
+    results, checks, recommendations = ANALYSES[test_type](stats, config, z, targets)
+    if not ensemble['converged'] and precision > 0:
+        recommendations.append(f"达到试验次数上限 {trials:,} 仍未收敛到 ±{precision}，可增加 trials 或放宽 precision")
+
+    summary = _summary(checks)
+    logger.info(
+        f"✅ {test_type} 测试完成: {ensemble['trials']:,} 次试验, {ensemble['batches']} 批, "
+        f"{ensemble['workers']} 个进程, 耗时 {(time.perf_counter() - started) * 1000:.0f} ms"
+    )
+
+    method = METHODS[test_type]
+    if test_type == 'stability':
+        dt, steps = stability_steps(duration)
+        method += f'（步长 {dt:g} 小时 × {steps} 步）'
+
+    return {
+        'status': 'success',
+        'tool': 'testing',
+        'message': f"✅ 性能测试完成（{test_type}, {ensemble['trials']:,} 次蒙特卡洛试验）",
+        'results': {
+            'test_type': test_type,
+            'test_duration': duration,
+            'test_scenario': arguments.get('test_scenario'),
+            'summary': summary,
+            **results,
+            'checks': checks,
+            'recommendations': recommendations,
+            'confidence_level': confidence
+        },
+        'solver': {
+            'method': method,
+            'trials': ensemble['trials'],
+            'max_trials': trials,
+            'batches': ensemble['batches'],
+            'converged': ensemble['converged'],
+            'precision': precision,
+            'seed': ensemble['seed'],
+            'workers': ensemble['workers'],
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+    }
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+蒙特卡洛试验核函数
+
+每个核函数 kernel(config, rng, n) 一次向量化计算 n 次独立试验，
+只返回可相加的充分统计量（计数、和、平方和），批次之间直接求和合并。
+"""
+
+import math
+from typing import Dict, Any, Tuple
+
+import numpy as np
+from scipy.stats import poisson
+
+from mcp_services.simulation.network import DEFAULT_DIURNAL_PATTERN
+
+# 可靠性仿真中每台设备预生成的故障-修复周期数按泊松分布的该尾概率确定
+CYCLE_TAIL_PROBABILITY = 1e-7
+# 压力测试的负荷倍数网格（100% ~ 300%）
+LOAD_GRID = np.round(np.arange(1.0, 3.0001, 0.01), 2)
+# 低效运行阈值（水泵效率）
+LOW_EFFICIENCY = 0.6
+# 最高效率点流量占额定流量（最大连续运行流量）的比例
+BEST_EFFICIENCY_FLOW = 0.85
+# 稳定性仿真步长（小时）和最多步数
+STABILITY_STEP_HOURS = 0.25
+MAX_STABILITY_STEPS = 2000
+# 需求波动的 AR(1) 自相关系数（每步）
+DEMAND_AUTOCORRELATION = 0.9
+GRAVITY = 9.81
+
+_DIURNAL = np.asarray(DEFAULT_DIURNAL_PATTERN)
+
+
+# ==================== 可靠性 ====================
+
+def _lifetimes(rng: np.random.Generator, mean: float, shape: float, size) -> np.ndarray:
+    """给定均值的威布尔寿命（shape=1 为指数分布）"""
+    if shape == 1.0:
+        return rng.exponential(mean, size)
+    return mean / math.gamma(1.0 + 1.0 / shape) * rng.weibull(shape, size)
+
+
+def _cycles(group: Dict[str, Any], horizon: float) -> int:
+    """每台设备需要预生成的故障次数上限"""
+    expected = horizon / group['mtbf'] / min(group['shape'], 1.0)
+    return int(poisson.ppf(1.0 - CYCLE_TAIL_PROBABILITY, expected)) + 1
+
+
+def _sweep(times: np.ndarray, deltas: np.ndarray, threshold: int, horizon: float) -> Tuple[np.ndarray, ...]:
+    """
+    按时间排序事件并累加状态变化，得到 "同时停运数 ≥ threshold" 的区间
+
+    Returns:
+        (排序后的时间, 区间开始掩码, 区间结束掩码, 各试验停运总时长)
+    """
+    order = np.argsort(times, axis=1, kind='stable')
+    times = np.take_along_axis(times, order, axis=1)
+    level = np.cumsum(np.take_along_axis(deltas, order, axis=1), axis=1)
+    down = level >= threshold
+    before = np.zeros_like(down)
+    before[:, 1:] = down[:, :-1]
+    span = np.diff(times, axis=1, append=np.full((len(times), 1), horizon))
+    return times, down & ~before, before & ~down, (span * down).sum(axis=1)
+
+
+def _group_outages(rng: np.random.Generator, group: Dict[str, Any], horizon: float, n: int):
+    """
+    部件组在 [0, horizon] 内的停运区间（交替更新过程：寿命 → 修复 → 寿命 …）
+
+    Returns:
+        (事件时间, +1/-1 状态变化, 各试验停运总时长)，停运开始为 +1、结束为 -1，其余事件为 0
+    """
+    units, cycles = group['count'], _cycles(group, horizon)
+    up = _lifetimes(rng, group['mtbf'], group['shape'], (n, units, cycles))
+    repair = rng.exponential(group['mttr'], (n, units, cycles)) if group['mttr'] > 0 else np.zeros_like(up)
+    restored = np.cumsum(up + repair, axis=2)
+    failed = restored - repair
+    valid = failed < horizon
+    # 去掉本批所有试验都用不到的周期
+    cycles = int(valid.any(axis=(0, 1)).nonzero()[0].max(initial=-1)) + 1
+    if cycles == 0:
+        return np.full((n, 0), horizon), np.zeros((n, 0), dtype=np.int8), np.zeros(n)
+    failed, valid = failed[:, :, :cycles], valid[:, :, :cycles]
+    restored = np.minimum(restored[:, :, :cycles], horizon)
+
+    times = np.concatenate((failed, restored), axis=2).reshape(n, -1)
+    deltas = np.concatenate((valid, valid), axis=2).astype(np.int8)
+    deltas[:, :, cycles:] *= -1
+    deltas = deltas.reshape(n, -1)
+    times = np.where(deltas != 0, times, horizon)
+
+    if units == 1:
+        # 单台设备的故障、修复事件本身已按时间交替排列，不需要排序
+        return times, deltas, ((restored - failed) * valid).sum(axis=(1, 2))
+
+    threshold = units - group['required'] + 1
+    times, start, end, downtime = _sweep(times, deltas, threshold, horizon)
+    changes = start.astype(np.int8) - end.astype(np.int8)
+    return np.where(changes != 0, times, horizon), changes, downtime
+
+
+def reliability_kernel(config: Dict[str, Any], rng: np.random.Generator, n: int) -> Dict[str, Any]:
+    """
+    可修系统任务期内的故障过程
+
+    每台设备的寿命和修复时间逐周期抽样，部件组按 k-out-of-n 合成停运区间，
+    系统停运区间为各组停运区间的并集。
+    """
+    horizon = config['duration']
+    groups = config['components']
+    event_times, event_changes = [], []
+    group_failed = np.zeros(len(groups))
+    group_downtime = np.zeros(len(groups))
+    for g, group in enumerate(groups):
+        times, changes, downtime = _group_outages(rng, group, horizon, n)
+        group_failed[g] = (changes > 0).any(axis=1).sum()
+        group_downtime[g] = downtime.sum()
+        # 只保留发生过停运的列，系统层排序的事件数与停运次数同量级
+        keep = (changes != 0).any(axis=0)
+        event_times.append(times[:, keep])
+        event_changes.append(changes[:, keep])
+
+    times, start, _, downtime = _sweep(
+        np.concatenate(event_times, axis=1), np.concatenate(event_changes, axis=1), 1, horizon
+    )
+    failures = start.sum(axis=1)
+    return {
+        'trials': n,
+        'survived': int((failures == 0).sum()),
+        'failures': int(failures.sum()),
+        'downtime': float(downtime.sum()),
+        'downtime_sq': float((downtime ** 2).sum()),
+        'group_failed': group_failed,
+        'group_downtime': group_downtime
+    }
+
+
+# ==================== 供水能力 ====================
+
+def _steady_state_units(rng: np.random.Generator, group: Dict[str, Any], n: int) -> np.ndarray:
+    """稳态下各试验的可用台数（每台可用度 mtbf / (mtbf + mttr)）"""
+    availability = group['mtbf'] / (group['mtbf'] + group['mttr'])
+    return rng.binomial(group['count'], availability, n)
+
+
+def _capacity(config: Dict[str, Any], rng: np.random.Generator, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    随机设备状态下的供水能力
+
+    Returns:
+        (供水能力 m³/h, 可用水泵台数)
+    """
+    capacity = np.full(n, np.inf)
+    pumps = None
+    for g, group in enumerate(config['components']):
+        units = _steady_state_units(rng, group, n)
+        if g == config['pump_group']:
+            pumps = units
+        if 'capacity' in group:
+            capacity = np.minimum(capacity, units * group['capacity'])
+        else:
+            capacity = np.where(units >= group['required'], capacity, 0.0)
+    return capacity, pumps
+
+
+def stress_kernel(config: Dict[str, Any], rng: np.random.Generator, n: int) -> Dict[str, Any]:
+    """
+    需求突增压力测试
+
+    - 负荷曲线：随机设备状态和需求波动下，负荷倍数 L 时供水能力不足的概率（LOAD_GRID 上计数）
+    - 突增场景：峰值倍数和持续时间随机，缺口先由水池调节容量补充，超出则中断供水；
+      突增结束后按富余能力回充水池，计算恢复时间
+    """
+    station, surge = config['station'], config['surge']
+    tank = station['tank']
+    demand = float(station['demand'])
+    capacity, _ = _capacity(config, rng, n)
+    noise = rng.lognormal(0.0, float(station['demand_sigma']), n)
+
+    ratio = np.sort(capacity / (demand * noise))
+    shortfall = np.searchsorted(ratio, LOAD_GRID, side='left')
+
+    peak = float(surge['factor']) * rng.lognormal(0.0, float(surge['sigma']), n) * demand * noise
+    hours = rng.exponential(float(surge['hours']), n)
+    deficit = np.maximum(peak - capacity, 0.0) * hours
+    reserve = float(tank['area']) * (float(tank['initial_level']) - float(tank['min_level']))
+    interrupted = deficit > reserve
+    spare = capacity - demand * noise
+    drained = (deficit > 0) & (spare > 0)
+    recovery = np.minimum(deficit[drained], reserve) / spare[drained]
+
+    return {
+        'trials': n,
+        'shortfall': shortfall.astype(np.float64),
+        'interrupted': int(interrupted.sum()),
+        'unserved_volume': float(np.maximum(deficit - reserve, 0.0).sum()),
+        'drained': int(drained.sum()),
+        'unrecoverable': int(((deficit > 0) & (spare <= 0)).sum()),
+        'recovery': float(recovery.sum()),
+        'recovery_sq': float((recovery ** 2).sum()),
+        'recovery_max': float(recovery.max()) if len(recovery) else 0.0
+    }
+
+
+# ==================== 能效 ====================
+
+def _pump_efficiency(flow_ratio: np.ndarray, best: float) -> np.ndarray:
+    """水泵效率曲线 η = η_best·(2x - x²)，x 为流量与最高效率点流量之比"""
+    return best * np.clip(2.0 * flow_ratio - flow_ratio ** 2, 0.05, 1.0)
+
+
+def efficiency_kernel(config: Dict[str, Any], rng: np.random.Generator, n: int) -> Dict[str, Any]:
+    """
+    随机工况下的泵站能效
+
+    每次试验随机抽取一天中的时刻、需求波动和设备状态，按需求开最少台数的水泵
+    （每台不超过额定流量），由水泵效率曲线和管路特性计算轴功率。
+    """
+    station = config['station']
+    pump = config['components'][config['pump_group']]
+    rated = pump['capacity']
+    demand_mean = float(station['demand'])
+    static_head = float(station['static_head'])
+    resistance = (float(station['design_head']) - static_head) / demand_mean ** 2
+
+    capacity, pumps = _capacity(config, rng, n)
+    hour = rng.integers(0, 24, n)
+    demand = demand_mean * _DIURNAL[hour] * rng.lognormal(0.0, float(station['demand_sigma']), n)
+    served = np.minimum(demand, capacity)
+    running = np.minimum(np.ceil(served / rated), pumps)
+    active = (running > 0) & (served > 0)
+
+    running, served = running[active], served[active]
+    efficiency = _pump_efficiency(served / running / (BEST_EFFICIENCY_FLOW * rated), float(station['pump_efficiency']))
+    head = static_head + resistance * served ** 2
+    hydraulic = GRAVITY * served / 3600.0 * head
+    shaft = hydraulic / efficiency
+
+    return {
+        'trials': n,
+        'operating': int(active.sum()),
+        'efficiency': float(efficiency.sum()),
+        'efficiency_sq': float((efficiency ** 2).sum()),
+        'low_efficiency': int((efficiency < LOW_EFFICIENCY).sum()),
+        'hydraulic_power': float(hydraulic.sum()),
+        'shaft_power': float(shaft.sum()),
+        'served': float(served.sum()),
+        'demand': float(demand.sum())
+    }
+
+
+# ==================== 稳定性 ====================
+
+def stability_steps(duration: float) -> Tuple[float, int]:
+    """稳定性仿真的 (步长, 步数)"""
+    steps = int(math.ceil(duration / STABILITY_STEP_HOURS))
+    if steps > MAX_STABILITY_STEPS:
+        return duration / MAX_STABILITY_STEPS, MAX_STABILITY_STEPS
+    return STABILITY_STEP_HOURS, max(steps, 1)
+
+
+def stability_kernel(config: Dict[str, Any], rng: np.random.Generator, n: int) -> Dict[str, Any]:
+    """
+    水池水位闭环稳定性
+
+    水泵按水位分级启停（低于下启泵线加开一台，高于上停泵线停一台），
+    需求为日变化乘以 AR(1) 对数波动，运行中水泵按故障率随机停运、按修复率恢复。
+    """
+    station = config['station']
+    tank = station['tank']
+    pump = config['components'][config['pump_group']]
+    area = float(tank['area'])
+    low, high = float(tank['min_level']), float(tank['max_level'])
+    start_level = low + 0.25 * (high - low)
+    stop_level = high - 0.25 * (high - low)
+    dt, steps = stability_steps(config['duration'])
+
+    failure_probability = -math.expm1(-dt / pump['mtbf'])
+    repair_probability = -math.expm1(-dt / pump['mttr']) if pump['mttr'] > 0 else 1.0
+    sigma = float(station['demand_sigma'])
+    innovation = sigma * math.sqrt(1.0 - DEMAND_AUTOCORRELATION ** 2)
+
+    level = np.full(n, float(tank['initial_level']))
+    available = np.full(n, pump['count'])
+    wanted = np.full(n, min(math.ceil(float(station['demand']) / pump['capacity']), pump['count']))
+    running = np.minimum(wanted, available)
+    noise = rng.normal(0.0, sigma, n)
+    excursion = np.zeros(n, dtype=bool)
+    out_steps = np.zeros(n)
+    starts = np.zeros(n)
+    level_sum = np.zeros(n)
+    level_sq = np.zeros(n)
+    hour0 = rng.uniform(0.0, 24.0, n)
+
+    for k in range(steps):
+        hour = ((hour0 + k * dt) % 24).astype(np.intp)
+        demand = float(station['demand']) * _DIURNAL[hour] * np.exp(noise)
+        level = level + (running * pump['capacity'] - demand) * dt / area
+        level = np.clip(level, 0.0, high + 0.5)
+        outside = (level < low) | (level > high)
+        excursion |= outside
+        out_steps += outside
+        level_sum += level
+        level_sq += level ** 2
+
+        wanted = np.clip(wanted + (level < start_level) - (level > stop_level), 0, pump['count'])
+        failed = rng.binomial(available, failure_probability)
+        repaired = rng.binomial(pump['count'] - available, repair_probability)
+        available = available - failed + repaired
+        previous = running
+        running = np.minimum(wanted, available)
+        starts += np.maximum(running - previous, 0)
+        noise = DEMAND_AUTOCORRELATION * noise + rng.normal(0.0, innovation, n)
+
+    level_mean = level_sum / steps
+    level_std = np.sqrt(np.maximum(level_sq / steps - level_mean ** 2, 0.0))
+    return {
+        'trials': n,
+        'excursion': int(excursion.sum()),
+        'out_fraction': float((out_steps / steps).sum()),
+        'starts': float(starts.sum()),
+        'level_std': float(level_std.sum()),
+        'level_std_sq': float((level_std ** 2).sum())
+    }
+
+
+KERNELS = {
+    'reliability': reliability_kernel,
+    'stress': stress_kernel,
+    'efficiency': efficiency_kernel,
+    'stability': stability_kernel
+}
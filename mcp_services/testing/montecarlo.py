@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+并行蒙特卡洛集合
+
+试验按固定大小分批，第 i 批使用 SeedSequence(seed).spawn(批数)[i] 的独立随机流，
+在进程池中并行计算；主进程按批次序号依次合并充分统计量并检查置信区间，
+收敛后取消其余批次。合并顺序和停止位置与工作进程数无关，同一 seed 的结果可复现。
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+import multiprocessing
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Optional, Callable, Tuple
+
+import numpy as np
+
+from .kernels import KERNELS
+
+logger = logging.getLogger(__name__)
+
+
+def _available_cpus() -> int:
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# 每批试验数、工作进程数（1 时在当前进程内顺序计算）
+BATCH_SIZE = int(os.environ.get('MCP_TESTING_BATCH_SIZE', '50000'))
+WORKERS = int(os.environ.get('MCP_TESTING_WORKERS', '0')) or _available_cpus()
+# 至少完成的试验数（之前不做收敛判断）
+MIN_TRIALS = 10000
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """常驻进程池（spawn 启动，调用方可能是多线程的Web进程）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context('spawn'))
+            # 在运行时的工作进程中使用时，进程退出不会执行 ProcessPoolExecutor 的 atexit 清理，
+            # 需要在 multiprocessing 等待子进程结束之前关闭进程池，否则退出时一直阻塞；
+            # 优先级高于任务队列的清理（10），关闭信号才能在队列关闭前发出
+            multiprocessing.util.Finalize(None, _reset_pool, kwargs={'wait': True}, exitpriority=100)
+            logger.info(f"🚀 蒙特卡洛进程池已启动: {WORKERS} 个工作进程")
+        return _pool
+
+
+def _reset_pool(wait: bool = False):
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
+
+
+def _run_batch(kernel: str, config: Dict[str, Any], seed: np.random.SeedSequence, n: int) -> Dict[str, Any]:
+    return KERNELS[kernel](config, np.random.default_rng(seed), n)
+
+
+def merge_stats(total: Optional[Dict[str, Any]], batch: Dict[str, Any]) -> Dict[str, Any]:
+    """合并两批充分统计量（*_max 取最大值，其余求和）"""
+    if total is None:
+        return dict(batch)
+    return {
+        key: max(total[key], value) if key.endswith('_max') else total[key] + value
+        for key, value in batch.items()
+    }
+
+
+def proportion_interval(successes: float, trials: float, z: float) -> Tuple[float, float, float]:
+    """
+    比例的 Wilson 置信区间（小概率事件也不会给出负下限）
+
+    Returns:
+        (估计值, 下限, 上限)
+    """
+    if trials <= 0:
+        return 0.0, 0.0, 1.0
+    p = successes / trials
+    denominator = 1 + z ** 2 / trials
+    center = (p + z ** 2 / (2 * trials)) / denominator
+    half = z * math.sqrt(p * (1 - p) / trials + z ** 2 / (4 * trials ** 2)) / denominator
+    return p, max(center - half, 0.0), min(center + half, 1.0)
+
+
+def mean_interval(total: float, total_sq: float, count: float, z: float) -> Tuple[float, float]:
+    """
+    由和与平方和计算均值及置信区间半宽
+
+    Returns:
+        (均值, 半宽)
+    """
+    if count <= 0:
+        return 0.0, math.inf
+    mean = total / count
+    if count < 2:
+        return mean, math.inf
+    variance = max(total_sq - count * mean ** 2, 0.0) / (count - 1)
+    return mean, z * math.sqrt(variance / count)
+
+
+def run_ensemble(
+    kernel: str,
+    config: Dict[str, Any],
+    max_trials: int,
+    converged: Callable[[Dict[str, Any]], bool],
+    seed: Optional[int] = None,
+    batch_size: int = BATCH_SIZE,
+    workers: int = WORKERS,
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    执行蒙特卡洛集合直到置信区间收敛或达到试验次数上限
+
+    Args:
+        kernel: KERNELS 中的核函数名
+        config: 可序列化的核函数配置
+        converged: 根据已合并的统计量判断是否收敛
+        seed: 根随机种子（为空时随机生成，结果中返回以便复现）
+
+    Returns:
+        (合并后的统计量, {'trials', 'batches', 'converged', 'seed', 'workers', 'elapsed_ms'})
+    """
+    started = time.perf_counter()
+    root = np.random.SeedSequence(seed)
+    n_batches = max(1, math.ceil(max_trials / batch_size))
+    streams = root.spawn(n_batches)
+    sizes = [min(batch_size, max_trials - i * batch_size) for i in range(n_batches)]
+    parallel = min(workers, n_batches)
+
+    total = None
+    done = 0
+    stopped = False
+
+    def accept(batch: Dict[str, Any]) -> bool:
+        nonlocal total, done
+        total = merge_stats(total, batch)
+        done += 1
+        finished = total['trials'] >= MIN_TRIALS and converged(total)
+        if progress_callback:
+            progress_callback({
+                'progress': round(100.0 * total['trials'] / max_trials, 1),
+                'message': f"已完成 {total['trials']:,} 次试验（{done}/{n_batches} 批）"
+            })
+        return finished
+
+    if parallel <= 1:
+        for i in range(n_batches):
+            if accept(_run_batch(kernel, config, streams[i], sizes[i])):
+                stopped = True
+                break
+    else:
+        pool = _get_pool()
+        pending = {}
+        submitted = 0
+        try:
+            while done < n_batches:
+                # 保持每个工作进程有两批在途，合并仍按序号进行
+                while submitted < n_batches and submitted - done < 2 * parallel:
+                    pending[submitted] = pool.submit(_run_batch, kernel, config, streams[submitted], sizes[submitted])
+                    submitted += 1
+                if accept(pending.pop(done).result()):
+                    stopped = True
+                    break
+        except BrokenProcessPool:
+            _reset_pool()
+            raise
+        finally:
+            for future in pending.values():
+                future.cancel()
+
+    return total, {
+        'trials': int(total['trials']),
+        'batches': done,
+        'converged': stopped,
+        'seed': int(root.entropy),
+        'workers': parallel,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
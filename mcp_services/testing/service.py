@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能测试MCP服务（独立部署）
+
+在仓库根目录运行:
+    python -m mcp_services.testing.service
+
+注册到HydroNet后（服务清单中 "url": "http://host:8085"），
+testing 工具改为调用该服务；未注册时管理器在本地直接调用同一引擎。
+"""
+
+import os
+from datetime import datetime
+
+from flask import Flask, jsonify
+
+from mcp_services.runtime import ServiceRuntime, RuntimeQueueFull, register_task_routes, encode_response, decode_request
+from .montecarlo import WORKERS
+
+app = Flask(__name__)
+
+# 单个测试的试验批次已经由蒙特卡洛进程池（MCP_TESTING_WORKERS）并行计算，
+# 默认只用一个任务进程，避免任务进程数 × 批次进程数超过CPU核数
+runtime = ServiceRuntime(
+    {'testing': 'mcp_services.testing.engine:run_testing'},
+    max_workers=int(os.environ.get('MCP_RUNTIME_WORKERS', '1'))
+)
+register_task_routes(app, runtime)
+
+# 同步执行接口的最长等待时间（秒），更长的计算请使用 /tasks/submit
+EXECUTE_TIMEOUT = float(os.environ.get('MCP_EXECUTE_TIMEOUT', '300'))
+
+
+@app.route('/execute', methods=['POST'])
+def execute():
+    """
+    执行性能测试
+
+    请求体: {"arguments": {...}} 或 {"params": {...}}，参数同 testing 工具定义。
+    100万次以上的试验建议使用 /tasks/submit 异步提交并轮询进度
+    """
+    try:
+        data = decode_request()
+        params = data.get('arguments') or data.get('params') or {}
+        return encode_response(runtime.run('testing', params, timeout=EXECUTE_TIMEOUT))
+
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 400
+    except RuntimeQueueFull as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 429
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e), 'data': None}), 500
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """健康检查接口"""
+    return jsonify({
+        'status': 'healthy',
+        'service': '性能测试服务',
+        'version': '1.0.0',
+        'runtime': runtime.get_metrics(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+@app.route('/info', methods=['GET'])
+def info():
+    """服务信息接口"""
+    return jsonify({
+        'name': 'testing',
+        'type': 'testing',
+        'description': '泵站可靠性、压力、能效、稳定性的并行蒙特卡洛测试',
+        'version': '1.0.0',
+        'monte_carlo_workers': WORKERS,
+        'capabilities': [
+            'reliability：可修系统 k-out-of-n 部件组故障过程，可靠度/可用度/MTBF',
+            'stress：负荷-缺口概率曲线、需求突增中断概率和恢复时间',
+            'efficiency / stability：随机工况能效、水位闭环越限概率',
+            '独立随机流并行批次，置信区间收敛后提前停止'
+        ]
+    })
+
+
+if __name__ == '__main__':
+    port = int(os.environ.get('TESTING_SERVICE_PORT', '8085'))
+    print("=" * 50)
+    print("🧪 性能测试MCP服务")
+    print("=" * 50)
+    print(f"服务地址: http://localhost:{port}")
+    print("执行接口: POST /execute")
+    print("异步任务: POST /tasks/submit, GET /tasks/<id>")
+    print("=" * 50)
+
+    runtime.start()
+    app.run(host='0.0.0.0', port=port, threaded=True)
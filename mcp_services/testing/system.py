@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+被测系统描述
+
+泵站按部件组串联：每组 count 台同型设备，至少 required 台可用时该组正常（k-out-of-n），
+任何一组失效则系统失效。有 capacity 的组（水泵、输水管）同时决定供水能力。
+"""
+
+from typing import Dict, List, Any, Optional
+
+# 默认泵站：3 台泵至少 2 台可用（两用一备），双回路供电，双管输水；mtbf/mttr 单位为小时，
+# shape 为威布尔寿命形状参数（1 为指数分布）
+DEFAULT_COMPONENTS = [
+    {'name': '水泵', 'count': 3, 'required': 2, 'mtbf': 4000.0, 'mttr': 24.0, 'shape': 1.5, 'capacity': 100.0},
+    {'name': '输水管', 'count': 2, 'required': 1, 'mtbf': 20000.0, 'mttr': 48.0, 'capacity': 300.0},
+    {'name': '供电回路', 'count': 2, 'required': 1, 'mtbf': 8000.0, 'mttr': 4.0},
+    {'name': '出水控制阀', 'count': 1, 'required': 1, 'mtbf': 30000.0, 'mttr': 8.0},
+    {'name': 'PLC控制系统', 'count': 1, 'required': 1, 'mtbf': 50000.0, 'mttr': 2.0}
+]
+
+# 默认运行参数：平均需求 m³/h，静扬程/设计扬程 m，水泵最高效率点效率；
+# 水池面积 m²、报警水位 m；需求波动为对数正态标准差
+DEFAULT_STATION = {
+    'demand': 150.0,
+    'static_head': 30.0,
+    'design_head': 45.0,
+    'pump_efficiency': 0.80,
+    'demand_sigma': 0.10,
+    'tank': {'area': 400.0, 'min_level': 1.0, 'max_level': 5.0, 'initial_level': 3.0}
+}
+
+# 默认突增场景：峰值倍数中位数、对数正态标准差、平均持续时间（小时）
+DEFAULT_SURGE = {'factor': 1.5, 'sigma': 0.15, 'hours': 3.0}
+
+
+def _component(raw: Dict[str, Any], index: int) -> Dict[str, Any]:
+    count = int(raw.get('count', 1))
+    required = int(raw.get('required', count))
+    if count < 1 or not 1 <= required <= count:
+        raise ValueError(f"部件组 {raw.get('name', index)} 的台数设置无效: count={count}, required={required}")
+    mtbf = float(raw.get('mtbf', 0))
+    mttr = float(raw.get('mttr', 0))
+    if mtbf <= 0 or mttr < 0:
+        raise ValueError(f"部件组 {raw.get('name', index)} 的 mtbf 必须大于0、mttr 不能为负")
+    shape = float(raw.get('shape', 1.0))
+    if shape <= 0:
+        raise ValueError(f"部件组 {raw.get('name', index)} 的寿命形状参数必须大于0")
+    component = {
+        'name': str(raw.get('name', f'部件组{index + 1}')),
+        'count': count,
+        'required': required,
+        'mtbf': mtbf,
+        'mttr': mttr,
+        'shape': shape
+    }
+    if raw.get('capacity') is not None:
+        component['capacity'] = float(raw['capacity'])
+    return component
+
+
+def station_config(arguments: Dict[str, Any], duration: float, test_type: str) -> Dict[str, Any]:
+    """
+    合并工具参数与默认泵站，得到可序列化（传给工作进程）的配置
+
+    Args:
+        arguments: 工具参数，可选 components、station、surge 覆盖默认值
+        duration: 测试时长（小时）
+    """
+    components = [_component(c, i) for i, c in enumerate(arguments.get('components') or DEFAULT_COMPONENTS)]
+    station = {**DEFAULT_STATION, **(arguments.get('station') or {})}
+    station['tank'] = {**DEFAULT_STATION['tank'], **(station.get('tank') or {})}
+    surge = {**DEFAULT_SURGE, **(arguments.get('surge') or {})}
+
+    pumps = _pump_group(components)
+    if test_type != 'reliability' and pumps is None:
+        raise ValueError(f"{test_type} 测试需要一组带 capacity 的水泵")
+    if station['demand'] <= 0:
+        raise ValueError("平均需求必须大于0")
+
+    return {
+        'test_type': test_type,
+        'duration': float(duration),
+        'components': components,
+        'pump_group': pumps,
+        'station': station,
+        'surge': surge
+    }
+
+
+def _pump_group(components: List[Dict[str, Any]]) -> Optional[int]:
+    """水泵组的下标：第一个名称含“泵”的带容量部件组，没有时取第一个带容量的组"""
+    with_capacity = [i for i, c in enumerate(components) if 'capacity' in c]
+    for i in with_capacity:
+        if '泵' in components[i]['name'] or 'pump' in components[i]['name'].lower():
+            return i
+    return with_capacity[0] if with_capacity else None
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+本地 DashScope 模拟服务（压测、联调用，不消耗真实 token）
+
+实现通义千问文本生成接口 POST /api/v1/services/aigc/text-generation/generation：
+    - 非流式：qwen_client.QwenClient 的 REST 调用
+    - 流式（X-DashScope-SSE: enable 或 Accept: text/event-stream）：dashscope.Generation.call(stream=True)，
+      支持 incremental_output 和 result_format='message'/'text'
+可配置首 token 延迟、输出速度、回答长度、工具调用概率和错误注入（如 429 限流、500）。
+模拟前缀缓存：系统消息 + 工具定义与之前的请求逐字节相同时，usage 返回
+prompt_tokens_details.cached_tokens。
+GET /stats 返回累计的请求、错误、工具调用和 token 数。
+
+用法:
+    python mock_dashscope.py --port 8089 --ttft 0.4 --tokens-per-second 40 --tool-call-rate 0.3 --error-rate 0.02
+
+    # 应用指向模拟服务（dashscope SDK 和 qwen_client 都读取 DASHSCOPE_HTTP_BASE_URL）
+    DASHSCOPE_HTTP_BASE_URL=http://127.0.0.1:8089/api/v1 ALIYUN_API_KEY=mock python app_hydronet_pro.py
+
+压测方法见 benchmark_chat.py。
+"""
+
+import json
+import time
+import uuid
+import random
+import argparse
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Any
+
+from rate_limiter import estimate_tokens, CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+
+GENERATION_PATH = '/api/v1/services/aigc/text-generation/generation'
+REPLY_TEXT = (
+    "根据当前水网运行状态，上游水库水位保持在正常蓄水位附近，主干渠各节制闸开度稳定，"
+    "下游分水口流量满足灌溉需求。建议继续按现行调度方案运行，并关注未来三天的降雨预报，"
+    "必要时提前预泄以腾出防洪库容。"
+)
+
+
+class MockConfig:
+    """模拟服务的行为参数"""
+
+    def __init__(
+        self,
+        ttft: float = 0.3,
+        ttft_jitter: float = 0.1,
+        tokens_per_second: float = 50.0,
+        reply_tokens: int = 120,
+        chunk_tokens: int = 4,
+        tool_call_rate: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 429,
+        prefix_cache: bool = True,
+        seed: Optional[int] = None
+    ):
+        self.ttft = ttft
+        self.ttft_jitter = ttft_jitter
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.tool_call_rate = tool_call_rate
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.prefix_cache = prefix_cache
+        self._prefixes = set()
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {
+            'requests': 0, 'streamed': 0, 'errors': 0, 'tool_calls': 0,
+            'input_tokens': 0, 'output_tokens': 0, 'cached_tokens': 0
+        }
+
+    def draw(self) -> float:
+        with self._lock:
+            return self.random.random()
+
+    def cached_prefix(self, messages: List[Dict], tools: List[Dict]) -> int:
+        """系统消息 + 工具定义命中过时返回其 token 数，否则记下该前缀并返回 0"""
+        if not self.prefix_cache or not messages or messages[0].get('role') != 'system':
+            return 0
+        tools_text = json.dumps(tools, ensure_ascii=False) if tools else ''
+        prefix = json.dumps(messages[0], ensure_ascii=False) + tools_text
+        with self._lock:
+            if prefix in self._prefixes:
+                return estimate_tokens(messages[:1]) + int(len(tools_text) / CHARS_PER_TOKEN)
+            if len(self._prefixes) >= 1000:
+                self._prefixes.clear()
+            self._prefixes.add(prefix)
+        return 0
+
+    def count(self, **amounts):
+        with self._lock:
+            for key, amount in amounts.items():
+                self.stats[key] += amount
+
+
+ERRORS = {
+    429: ('Throttling.RateQuota', 'Requests rate limit exceeded, please try again later.'),
+    500: ('InternalError', 'An internal error has occured, please try again later.'),
+    503: ('ServiceUnavailable', 'The service is temporarily unavailable.')
+}
+
+
+def _placeholder(schema: Dict[str, Any]) -> Any:
+    """按 JSON Schema 类型生成占位参数"""
+    kind = schema.get('type')
+    if 'enum' in schema:
+        return schema['enum'][0]
+    return {'string': 'mock', 'number': 1.0, 'integer': 1, 'boolean': True, 'array': [], 'object': {}}.get(kind, 'mock')
+
+
+def _tool_arguments(tool: Dict[str, Any]) -> str:
+    parameters = tool.get('function', {}).get('parameters') or {}
+    properties = parameters.get('properties') or {}
+    return json.dumps(
+        {name: _placeholder(properties.get(name, {})) for name in parameters.get('required', [])},
+        ensure_ascii=False
+    )
+
+
+class MockDashScopeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config: MockConfig = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    # ==================== 路由 ====================
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._send_json(200, self.config.stats)
+        else:
+            self._send_json(404, {'code': 'NotFound', 'message': self.path})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path.split('?')[0] != GENERATION_PATH:
+            self._send_json(404, {'code': 'NotFound', 'message': self.path})
+            return
+        try:
+            request = json.loads(body or b'{}')
+        except json.JSONDecodeError as e:
+            self._send_json(400, {'code': 'InvalidParameter', 'message': str(e)})
+            return
+
+        config = self.config
+        config.count(requests=1)
+        stream = self.headers.get('X-DashScope-SSE', '').lower() == 'enable' or \
+            'text/event-stream' in self.headers.get('Accept', '')
+        if config.draw() < config.error_rate:
+            config.count(errors=1)
+            code, message = ERRORS.get(config.error_status, ('InternalError', 'Injected error'))
+            self._send_json(config.error_status, {'code': code, 'message': message, 'request_id': str(uuid.uuid4())})
+            return
+
+        messages = (request.get('input') or {}).get('messages') or []
+        parameters = request.get('parameters') or {}
+        tools = parameters.get('tools') or []
+        # 只在用户提问后调用工具（收到工具结果后给出文字回答，避免无限循环）
+        call_tools = bool(tools) and bool(messages) and messages[-1].get('role') == 'user' and \
+            config.draw() < config.tool_call_rate
+        plan = self._plan(messages, tools if call_tools else [], parameters)
+        if tools:
+            plan['input_tokens'] += int(len(json.dumps(tools, ensure_ascii=False)) / CHARS_PER_TOKEN)
+        plan['cached_tokens'] = min(plan['input_tokens'], config.cached_prefix(messages, tools))
+        if stream:
+            config.count(streamed=1)
+            self._stream(plan, parameters)
+        else:
+            time.sleep(self._ttft() + plan['output_tokens'] / config.tokens_per_second)
+            self._send_json(200, self._frame(plan, parameters, plan['text'], plan['tool_calls'], final=True))
+        config.count(
+            input_tokens=plan['input_tokens'],
+            output_tokens=plan['output_tokens'],
+            cached_tokens=plan['cached_tokens']
+        )
+
+    # ==================== 响应构造 ====================
+
+    def _ttft(self) -> float:
+        jitter = self.config.ttft_jitter
+        return max(0.0, self.config.ttft + (self.config.draw() * 2 - 1) * jitter)
+
+    def _plan(self, messages: List[Dict], tools: List[Dict], parameters: Dict) -> Dict[str, Any]:
+        """确定本次回答：文本或工具调用，以及 token 数（输出按每字 1 token 计）"""
+        config = self.config
+        if tools:
+            tool = tools[int(config.draw() * len(tools)) % len(tools)]
+            tool_calls = [{
+                'index': 0,
+                'id': f'call_{uuid.uuid4().hex[:12]}',
+                'type': 'function',
+                'function': {'name': tool.get('function', {}).get('name', 'mock_tool'), 'arguments': _tool_arguments(tool)}
+            }]
+            config.count(tool_calls=1)
+            text = ''
+            output = len(tool_calls[0]['function']['arguments']) + 8
+        else:
+            tool_calls = []
+            limit = int(parameters.get('max_tokens') or config.reply_tokens)
+            length = min(config.reply_tokens, limit)
+            text = (REPLY_TEXT * (length // len(REPLY_TEXT) + 1))[:length]
+            output = len(text)
+        return {
+            'text': text,
+            'tool_calls': tool_calls,
+            'input_tokens': estimate_tokens(messages),
+            'output_tokens': output,
+            'request_id': str(uuid.uuid4())
+        }
+
+    def _frame(
+        self,
+        plan: Dict,
+        parameters: Dict,
+        text: str,
+        tool_calls: List[Dict],
+        final: bool,
+        output_tokens: Optional[int] = None
+    ) -> Dict[str, Any]:
+        finish_reason = ('tool_calls' if plan['tool_calls'] else 'stop') if final else 'null'
+        output_tokens = plan['output_tokens'] if output_tokens is None else output_tokens
+        # 未指定 result_format 时按新版模型的默认值返回 message 格式（qwen_client 的 REST 调用不指定）
+        if parameters.get('result_format', 'message') == 'message':
+            message = {'role': 'assistant', 'content': text}
+            if tool_calls:
+                message['tool_calls'] = tool_calls
+            output = {'choices': [{'message': message, 'finish_reason': finish_reason}]}
+        else:
+            output = {'text': text, 'finish_reason': finish_reason}
+        return {
+            'output': output,
+            'usage': {
+                'input_tokens': plan['input_tokens'],
+                'output_tokens': output_tokens,
+                'total_tokens': plan['input_tokens'] + output_tokens,
+                'prompt_tokens_details': {'cached_tokens': plan.get('cached_tokens', 0)}
+            },
+            'request_id': plan['request_id']
+        }
+
+    def _stream(self, plan: Dict, parameters: Dict):
+        """按 DashScope SSE 格式分块输出（incremental_output=False 时每帧为累计内容）"""
+        config = self.config
+        incremental = bool(parameters.get('incremental_output'))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream;charset=UTF-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        time.sleep(self._ttft())
+        step = config.chunk_tokens
+        frames = []
+        if plan['tool_calls']:
+            # 参数分两段发送（调用方需要按序号拼接）
+            call = plan['tool_calls'][0]
+            arguments = call['function']['arguments']
+            half = len(arguments) // 2
+            first = {**call, 'function': {'name': call['function']['name'], 'arguments': arguments[:half]}}
+            frames.append(('', [first], half))
+            frames.append(('', [{'index': 0, 'function': {'arguments': arguments[half:]}}], len(arguments)))
+        else:
+            text = plan['text']
+            for end in range(step, len(text) + step, step):
+                frames.append((text[end - step:end] if incremental else text[:end], [], min(end, len(text))))
+        if not frames:
+            frames.append(('', [], 0))
+
+        try:
+            for number, (text, tool_calls, produced) in enumerate(frames, 1):
+                if number > 1:
+                    time.sleep(step / config.tokens_per_second)
+                data = self._frame(plan, parameters, text, tool_calls, final=number == len(frames), output_tokens=produced)
+                self._write_chunk(
+                    f"id:{number}\nevent:result\n:HTTP_STATUS/200\n"
+                    f"data:{json.dumps(data, ensure_ascii=False)}\n\n"
+                )
+            self._write_chunk('')
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("客户端提前断开")
+
+    def _write_chunk(self, payload: str):
+        data = payload.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, body: Dict[str, Any]):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def create_server(host: str = '127.0.0.1', port: int = 8089, config: Optional[MockConfig] = None) -> ThreadingHTTPServer:
+    """创建模拟服务（调用方负责 serve_forever）"""
+    handler = type('ConfiguredHandler', (MockDashScopeHandler,), {'config': config or MockConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 DashScope 模拟服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--ttft', type=float, default=0.3, help='首 token 延迟（秒）')
+    parser.add_argument('--ttft-jitter', type=float, default=0.1, help='首 token 延迟的随机波动（秒）')
+    parser.add_argument('--tokens-per-second', type=float, default=50.0, help='输出速度')
+    parser.add_argument('--reply-tokens', type=int, default=120, help='回答长度（token）')
+    parser.add_argument('--chunk-tokens', type=int, default=4, help='每个流式帧的 token 数')
+    parser.add_argument('--tool-call-rate', type=float, default=0.0, help='带工具的请求中返回工具调用的比例')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='注入错误的请求比例')
+    parser.add_argument('--error-status', type=int, default=429, choices=sorted(ERRORS), help='注入错误的状态码')
+    parser.add_argument('--no-prefix-cache', action='store_true', help='关闭前缀缓存模拟')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    config = MockConfig(
+        ttft=args.ttft,
+        ttft_jitter=args.ttft_jitter,
+        tokens_per_second=args.tokens_per_second,
+        reply_tokens=args.reply_tokens,
+        chunk_tokens=args.chunk_tokens,
+        tool_call_rate=args.tool_call_rate,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        prefix_cache=not args.no_prefix_cache,
+        seed=args.seed
+    )
+    server = create_server(args.host, args.port, config)
+    logger.info(f"🧪 DashScope 模拟服务: http://{args.host}:{args.port}/api/v1")
+    logger.info(f"   首token {args.ttft}s，{args.tokens_per_second} token/s，工具调用 {args.tool_call_rate:.0%}，错误 {args.error_rate:.0%}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+大模型路由
+
+按每轮对话的廉价特征选择够用的最便宜模型（qwen-turbo < qwen-plus < qwen-max）：
+    - 消息长度、是否带数值参数
+    - 是否可能调用工具（关键词命中且本轮有可用工具）、是否为多步任务
+    - 对话深度（已有的用户轮数）
+    - 套餐允许的最高档模型（plans.PLAN_LIMITS['max_model']）
+打分落在档位边界附近（置信度低）时直接上调一档；调用失败或回答质量不足
+（被截断、答非所问）时按顺序升级到下一档重试。
+
+每条路由（档位 + 理由）记录次数、延迟、token、升级和失败次数，用于按数据调整阈值。
+MODEL_ROUTING=false 时关闭路由，始终使用配置的模型。
+"""
+
+import os
+import re
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Any
+
+from plans import PLAN_LIMITS
+
+logger = logging.getLogger(__name__)
+
+
+# 按价格从低到高
+MODEL_TIERS = ('qwen-turbo', 'qwen-plus', 'qwen-max')
+ROUTING_ENABLED = os.environ.get('MODEL_ROUTING', 'true').lower() == 'true'
+# 路由的最低档（如 qwen-turbo 效果不满意时设为 qwen-plus）
+MIN_MODEL = os.environ.get('MODEL_ROUTING_MIN', 'qwen-turbo')
+
+# 打分阈值：score < TURBO_MAX 用 turbo，< PLUS_MAX 用 plus，否则 max；低于所选档位上界不足 MARGIN 视为低置信度
+TURBO_MAX = float(os.environ.get('MODEL_ROUTING_TURBO_MAX', '1.0'))
+PLUS_MAX = float(os.environ.get('MODEL_ROUTING_PLUS_MAX', '3.0'))
+CONFIDENCE_MARGIN = 0.25
+
+# 特征权重
+FEATURE_WEIGHTS = {
+    'length': 1.0,        # 每 200 字
+    'numbers': 0.5,       # 带数值参数
+    'tool': 1.5,          # 可能调用工具
+    'multi_step': 1.5,    # 多步/多工具任务
+    'depth': 0.1,         # 每轮已有对话
+    'faq': -0.5           # 概念性问答
+}
+LENGTH_UNIT = 200
+MAX_DEPTH_SCORE = 1.0
+
+# 需要调用工具的任务词，概念问答的句式，多步任务的连接词
+TOOL_KEYWORDS = (
+    '仿真', '模拟', '辨识', '率定', '校准', '调度', '优化', '控制器', '整定', '测试', '评估',
+    '计算', '预测', '水库', '渠道', '泵站', '闸门', '方案', '蒙特卡洛', '设计'
+)
+FAQ_PATTERN = re.compile(r'^(什么是|什么叫|请?介绍|解释|为什么|怎么|如何|.{0,12}(是什么|有哪些|的区别|的原理))')
+MULTI_STEP_PATTERN = re.compile(r'(然后|再|并且|同时|接着|之后|对比|比较|分别|多个|先.+再)')
+NUMBER_PATTERN = re.compile(r'\d+(\.\d+)?\s*(m³/s|m3/s|m|米|小时|h|天|%|万|亿|kW|km|公里|方)?')
+
+# 回答质量不足的信号（触发升级）：只认开头的完整拒答句式，正文中出现"无法"、"不确定性"等不算
+REFUSAL_PATTERN = re.compile(
+    r'^(?:(?:抱歉|对不起|很抱歉).{0,10}(?:无法|不能|没有办法)|我(?:无法|不能)回答|没有足够的信息)'
+)
+# 未正常结束（finish_reason 不是 stop）时，短于该长度的回答视为不完整
+MIN_ANSWER_CHARS = 8
+# 每条路由保留的延迟样本数（计算分位数）
+LATENCY_SAMPLES = 500
+
+
+def model_rank(model: str) -> int:
+    """模型档位（未知模型视为最高档，不参与升级）"""
+    return MODEL_TIERS.index(model) if model in MODEL_TIERS else len(MODEL_TIERS) - 1
+
+
+class RouteDecision:
+    """一次路由结果：按顺序尝试的模型列表和打分依据"""
+
+    def __init__(self, candidates: List[str], score: float, reason: str, features: Dict[str, Any], confident: bool):
+        self.candidates = candidates
+        self.score = score
+        self.reason = reason
+        self.features = features
+        self.confident = confident
+
+    @property
+    def model(self) -> str:
+        return self.candidates[0]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'model': self.model,
+            'candidates': self.candidates,
+            'score': round(self.score, 3),
+            'reason': self.reason,
+            'confident': self.confident,
+            'features': self.features
+        }
+
+
+class ModelRouter:
+    """按轮选择模型，并统计各路由的效果"""
+
+    def __init__(self, default_model: str, enabled: bool = ROUTING_ENABLED):
+        self.default_model = default_model
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Dict[str, Any]] = {}
+
+    def features(
+        self,
+        message: str,
+        history: Optional[List[Dict[str, Any]]] = None,
+        tools_available: int = 0
+    ) -> Dict[str, Any]:
+        text = message or ''
+        tool_hits = sum(1 for keyword in TOOL_KEYWORDS if keyword in text)
+        return {
+            'length': len(text),
+            'numbers': len(NUMBER_PATTERN.findall(text)),
+            'tool_hits': tool_hits if tools_available else 0,
+            'multi_step': bool(MULTI_STEP_PATTERN.search(text)),
+            'faq': bool(FAQ_PATTERN.search(text.strip())) and tool_hits <= 1,
+            'depth': sum(1 for m in (history or []) if m.get('role') == 'user')
+        }
+
+    def score(self, features: Dict[str, Any]) -> float:
+        w = FEATURE_WEIGHTS
+        score = w['length'] * features['length'] / LENGTH_UNIT
+        score += w['numbers'] * min(features['numbers'], 4) / 2
+        if features['tool_hits']:
+            score += w['tool'] + 0.5 * (min(features['tool_hits'], 3) - 1)
+            if features['multi_step']:
+                score += w['multi_step']
+        score += min(w['depth'] * features['depth'], MAX_DEPTH_SCORE)
+        if features['faq']:
+            score += w['faq']
+        return score
+
+    def route(
+        self,
+        message: str,
+        history: Optional[List[Dict[str, Any]]] = None,
+        tools_available: int = 0,
+        plan: Optional[str] = None
+    ) -> RouteDecision:
+        """
+        为本轮选择模型
+
+        Args:
+            message: 用户消息
+            history: 本轮之前的对话消息
+            tools_available: 本轮可用的工具数
+            plan: 套餐（决定可升级到的最高档）
+
+        Returns:
+            RouteDecision，candidates 为首选模型及可升级的更高档模型
+        """
+        ceiling = model_rank(PLAN_LIMITS.get(plan, {}).get('max_model', MODEL_TIERS[-1]))
+        if not self.enabled or self.default_model not in MODEL_TIERS:
+            return RouteDecision([self.default_model], 0.0, 'fixed', {}, True)
+
+        features = self.features(message, history, tools_available)
+        score = self.score(features)
+        if score < TURBO_MAX:
+            rank, reason = 0, 'simple'
+        elif score < PLUS_MAX:
+            rank, reason = 1, 'tools' if features['tool_hits'] else 'standard'
+        else:
+            rank, reason = 2, 'complex'
+        # 工具调用至少用 plus（turbo 的函数调用参数容易出错）
+        if features['tool_hits'] and rank == 0:
+            rank, reason = 1, 'tools'
+        # 低置信度：分数刚好低于所选档位的上界
+        upper = (TURBO_MAX, PLUS_MAX, float('inf'))[rank]
+        confident = upper - score >= CONFIDENCE_MARGIN
+        if not confident:
+            rank += 1
+            reason += '+margin'
+        rank = max(rank, model_rank(MIN_MODEL))
+        rank = min(rank, ceiling)
+        candidates = list(MODEL_TIERS[rank:ceiling + 1])
+        return RouteDecision(candidates, score, f'{MODEL_TIERS[rank]}:{reason}', features, confident)
+
+    @staticmethod
+    def needs_escalation(content: Optional[str], finish_reason: Optional[str] = None) -> bool:
+        """回答是否质量不足（空、过短、被截断或拒答），需要换更高档模型重答"""
+        text = (content or '').strip()
+        if finish_reason == 'length' or not text:
+            return True
+        if REFUSAL_PATTERN.match(text):
+            return True
+        # 模型正常结束的简短回答（如"是的"、"42 m³/s"）不升级
+        return finish_reason != 'stop' and len(text) < MIN_ANSWER_CHARS
+
+    def record(
+        self,
+        decision: RouteDecision,
+        model: str,
+        latency: float,
+        tokens: Optional[int] = None,
+        escalations: int = 0,
+        failed: bool = False
+    ):
+        """记录一次路由的结果（latency 为秒）"""
+        route = decision.reason.split(':', 1)[-1]
+        key = f'{model}:{route}'
+        with self._lock:
+            stats = self._routes.get(key)
+            if stats is None:
+                stats = self._routes[key] = {
+                    'count': 0, 'failed': 0, 'escalations': 0, 'tokens': 0,
+                    'latency': deque(maxlen=LATENCY_SAMPLES)
+                }
+            stats['count'] += 1
+            stats['failed'] += int(failed)
+            stats['escalations'] += escalations
+            stats['tokens'] += int(tokens or 0)
+            stats['latency'].append(latency)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各路由的次数、失败/升级次数、平均 token、延迟分位数（毫秒）"""
+        with self._lock:
+            routes = {}
+            for key, stats in sorted(self._routes.items()):
+                samples = sorted(stats['latency'])
+                count = stats['count']
+                routes[key] = {
+                    'count': count,
+                    'failed': stats['failed'],
+                    'escalations': stats['escalations'],
+                    'avg_tokens': round(stats['tokens'] / count, 1) if count else 0,
+                    'latency_p50_ms': round(samples[len(samples) // 2] * 1000, 1) if samples else None,
+                    'latency_p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1) if samples else None
+                }
+            return {
+                'enabled': self.enabled,
+                'default_model': self.default_model,
+                'thresholds': {'turbo_max': TURBO_MAX, 'plus_max': PLUS_MAX},
+                'routes': routes
+            }
+
+
+_routers: Dict[str, ModelRouter] = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(default_model: str) -> ModelRouter:
+    """本进程共享的路由器（按配置的默认模型区分）"""
+    with _routers_lock:
+        router = _routers.get(default_model)
+        if router is None:
+            router = _routers[default_model] = ModelRouter(default_model)
+        return router
+
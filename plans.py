@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+套餐定义
+不依赖Flask扩展和数据库，供配额模块和MCP工具调度共同使用
+"""
+
+
+# ==================== 套餐限制 ====================
+
+PLAN_LIMITS = {
+    'free': {
+        'api_calls_per_month': 1000,
+        'requests_per_minute': 10,
+        'storage_mb': 100,
+        'users': 1,
+        'mcp_services': 1,
+        'max_conversation_length': 10,  # 对话轮数
+        'tool_concurrency': 1,  # 同时执行的工具调用数
+        'tool_queue_depth': 5,  # 排队等待的工具调用数上限
+        'tool_queue_weight': 1,  # 公平队列权重
+        'max_model': 'qwen-plus'  # 模型路由可升级到的最高档模型
+    },
+    'basic': {
+        'api_calls_per_month': 10000,
+        'requests_per_minute': 50,
+        'storage_mb': 1000,
+        'users': 5,
+        'mcp_services': 5,
+        'max_conversation_length': 50,
+        'tool_concurrency': 2,
+        'tool_queue_depth': 10,
+        'tool_queue_weight': 2,
+        'max_model': 'qwen-plus'
+    },
+    'pro': {
+        'api_calls_per_month': 100000,
+        'requests_per_minute': 200,
+        'storage_mb': 10000,
+        'users': 20,
+        'mcp_services': 20,
+        'max_conversation_length': 100,
+        'tool_concurrency': 4,
+        'tool_queue_depth': 20,
+        'tool_queue_weight': 4,
+        'max_model': 'qwen-max'
+    },
+    'enterprise': {
+        'api_calls_per_month': -1,  # 无限制
+        'requests_per_minute': 1000,
+        'storage_mb': -1,
+        'users': -1,
+        'mcp_services': -1,
+        'max_conversation_length': -1,
+        'tool_concurrency': 16,
+        'tool_queue_depth': 100,
+        'tool_queue_weight': 8,
+        'max_model': 'qwen-max'
+    }
+}
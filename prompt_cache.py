@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+提示词前缀缓存
+
+DashScope 对请求中重复的前缀（系统提示词 + 工具定义 + 较早的对话）做上下文缓存，命中部分按折扣计费、
+首 token 更快。前提是前缀逐字节相同，这里负责：
+    - 工具定义按规范键序重建（各层字典的键排序），同一份服务目录每次序列化结果相同
+    - 显式缓存模式（PROMPT_CACHE_MODE=explicit）下给系统消息加 cache_control 标记；
+      默认 implicit 只保证前缀稳定，由服务端自动匹配
+    - 对话历史超长时按块裁剪（一次多裁 TRIM_STEP 条），而不是每轮滑动一条，
+      使历史部分的前缀在之后几轮保持不变
+    - 统计命中率：响应 usage 中的 cached_tokens（prompt_tokens_details.cached_tokens）占输入 token 的比例
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+
+# implicit：只保证前缀稳定；explicit：系统消息加 cache_control（需模型支持显式缓存）
+CACHE_MODE = os.environ.get('PROMPT_CACHE_MODE', 'implicit').lower()
+# 历史超长时一次多裁掉的条数
+TRIM_STEP = int(os.environ.get('PROMPT_CACHE_TRIM_STEP', '10'))
+# 统计中保留的不同前缀数
+MAX_TRACKED_PREFIXES = 100
+
+
+def canonical(value: Any) -> Any:
+    """按键排序重建嵌套结构（json.dumps 按插入顺序输出，重建后序列化结果固定）"""
+    return json.loads(json.dumps(value, ensure_ascii=False, sort_keys=True))
+
+
+def canonical_tools(tools: List[Dict]) -> List[Dict]:
+    """工具定义的规范形式（保持工具顺序，只规范每个定义内部的键序）"""
+    return [canonical(tool) for tool in tools]
+
+
+def prefix_fingerprint(system_prompt: str, tools: List[Dict]) -> str:
+    """系统提示词 + 工具定义的指纹（用于统计前缀是否稳定）"""
+    data = json.dumps([system_prompt, tools], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+
+
+def mark_cacheable(messages: List[Dict]) -> List[Dict]:
+    """显式缓存模式下把系统消息转为带 cache_control 的内容块（返回新列表，不修改原消息）"""
+    if CACHE_MODE != 'explicit' or not messages or messages[0].get('role') != 'system':
+        return messages
+    system = messages[0]
+    if not isinstance(system.get('content'), str):
+        return messages
+    marked = {
+        **system,
+        'content': [{'type': 'text', 'text': system['content'], 'cache_control': {'type': 'ephemeral'}}]
+    }
+    return [marked] + messages[1:]
+
+
+def trim_history(messages: List[Dict], max_messages: int) -> List[Dict]:
+    """
+    限制历史长度：保留系统消息和最近的对话
+
+    超过 max_messages 时一次裁到 max_messages - TRIM_STEP 条，裁剪后从用户消息开始。
+    """
+    if len(messages) <= max_messages:
+        return messages
+    system_msgs = [m for m in messages if m.get('role') == 'system']
+    keep = max(2, max_messages - TRIM_STEP)
+    recent_msgs = [m for m in messages[-keep:] if m.get('role') != 'system']
+    while recent_msgs and recent_msgs[0].get('role') != 'user':
+        recent_msgs.pop(0)
+    return system_msgs + recent_msgs
+
+
+def cached_tokens(usage: Any) -> Optional[int]:
+    """从响应 usage 中取出命中缓存的输入 token 数（没有该字段时返回 None）"""
+    if not usage:
+        return None
+
+    def get(obj, key):
+        if isinstance(obj, dict):
+            return obj.get(key)
+        return getattr(obj, key, None)
+
+    details = get(usage, 'prompt_tokens_details')
+    value = get(details, 'cached_tokens') if details else None
+    if value is None:
+        value = get(usage, 'cached_tokens')
+    return int(value) if value is not None else None
+
+
+class PrefixCacheStats:
+    """前缀缓存命中统计（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.reported = 0
+        self.hits = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self._prefixes: 'OrderedDict[str, int]' = OrderedDict()
+
+    def record(self, fingerprint: str, input_tokens: int, cached: Optional[int]):
+        """
+        记录一次模型调用
+
+        Args:
+            fingerprint: 前缀指纹
+            input_tokens: 输入 token 数
+            cached: 命中缓存的 token 数（响应没有该字段时为 None，不计入命中率）
+        """
+        with self._lock:
+            self.calls += 1
+            self._prefixes[fingerprint] = self._prefixes.pop(fingerprint, 0) + 1
+            while len(self._prefixes) > MAX_TRACKED_PREFIXES:
+                self._prefixes.popitem(last=False)
+            if cached is None:
+                return
+            self.reported += 1
+            self.hits += int(cached > 0)
+            self.input_tokens += int(input_tokens or 0)
+            self.cached_tokens += cached
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'mode': CACHE_MODE,
+                'calls': self.calls,
+                'calls_with_usage': self.reported,
+                'hit_calls': self.hits,
+                'input_tokens': self.input_tokens,
+                'cached_tokens': self.cached_tokens,
+                'cached_ratio': round(self.cached_tokens / self.input_tokens, 4) if self.input_tokens else 0.0,
+                'distinct_prefixes': len(self._prefixes)
+            }
+
+
+_stats: Optional[PrefixCacheStats] = None
+_stats_lock = threading.Lock()
+
+
+def get_prefix_stats() -> PrefixCacheStats:
+    """本进程共享的前缀缓存统计"""
+    global _stats
+    if _stats is None:
+        with _stats_lock:
+            if _stats is None:
+                _stats = PrefixCacheStats()
+    return _stats
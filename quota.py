@@ -10,6 +10,7 @@ from flask_limiter.util import get_remote_address
 import logging
 
 from models import Tenant, UsageStats
+from plans import PLAN_LIMITS
 
 logger = logging.getLogger(__name__)
 
@@ -30,44 +31,6 @@ limiter = Limiter(
 )
 
 
-# ==================== 套餐限制 ====================
-
-PLAN_LIMITS = {
-    'free': {
-        'api_calls_per_month': 1000,
-        'requests_per_minute': 10,
-        'storage_mb': 100,
-        'users': 1,
-        'mcp_services': 1,
-        'max_conversation_length': 10  # 对话轮数
-    },
-    'basic': {
-        'api_calls_per_month': 10000,
-        'requests_per_minute': 50,
-        'storage_mb': 1000,
-        'users': 5,
-        'mcp_services': 5,
-        'max_conversation_length': 50
-    },
-    'pro': {
-        'api_calls_per_month': 100000,
-        'requests_per_minute': 200,
-        'storage_mb': 10000,
-        'users': 20,
-        'mcp_services': 20,
-        'max_conversation_length': 100
-    },
-    'enterprise': {
-        'api_calls_per_month': -1,  # 无限制
-        'requests_per_minute': 1000,
-        'storage_mb': -1,
-        'users': -1,
-        'mcp_services': -1,
-        'max_conversation_length': -1
-    }
-}
-
-
 # ==================== 配额管理器 ====================
 
 class QuotaManager:
@@ -3,15 +3,90 @@
 阿里云通义千问大模型客户端
 """
 
+import os
 import json
+import time
+import random
 import logging
+import threading
+from email.utils import parsedate_to_datetime
 from typing import Dict, List, Optional
 import requests
+from requests.adapters import HTTPAdapter
 from http import HTTPStatus
 
+from rate_limiter import RateLimitTimeout, estimate_tokens
+from llm_dispatcher import get_dispatcher
+from response_cache import get_response_cache
+from conversation_store import HISTORY_NAMESPACE, get_conversation_store
+from model_router import get_router
+import prompt_cache
+
 logger = logging.getLogger(__name__)
 
 
+# API 地址（与 dashscope SDK 读取同一环境变量，压测时可指向 mock_dashscope.py）
+BASE_URL = os.environ.get('DASHSCOPE_HTTP_BASE_URL', 'https://dashscope.aliyuncs.com/api/v1').rstrip('/')
+# 连接池大小（同时在途的请求数，微信/SaaS 版按 Web 线程数设置）
+HTTP_POOL_SIZE = int(os.environ.get('QWEN_HTTP_POOL_SIZE', '10'))
+# 超时：连接、读取（秒）
+CONNECT_TIMEOUT = float(os.environ.get('QWEN_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.environ.get('QWEN_READ_TIMEOUT', '30'))
+# 重试：次数、指数退避基数和上限（秒），Retry-After 最多等待的秒数
+MAX_RETRIES = int(os.environ.get('QWEN_MAX_RETRIES', '3'))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+MAX_RETRY_AFTER = 30.0
+RETRY_STATUS = {
+    HTTPStatus.TOO_MANY_REQUESTS,
+    HTTPStatus.INTERNAL_SERVER_ERROR,
+    HTTPStatus.BAD_GATEWAY,
+    HTTPStatus.SERVICE_UNAVAILABLE,
+    HTTPStatus.GATEWAY_TIMEOUT
+}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """进程内共享的HTTP会话（连接池 + keep-alive，避免每次调用重新握手TLS）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # 重试由 _post 统一处理（需要配合限流和 Retry-After），适配器本身不重试
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def _retry_after(response: Optional[requests.Response]) -> Optional[float]:
+    """解析 Retry-After（秒数或 HTTP 日期），最多 MAX_RETRY_AFTER 秒；没有或无法解析时返回 None"""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if not retry_after:
+        return None
+    try:
+        delay = float(retry_after)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(delay, 0.0), MAX_RETRY_AFTER)
+
+
+def _retry_delay(attempt: int, response: Optional[requests.Response] = None) -> float:
+    """第 attempt 次重试前的等待：优先服从 Retry-After，否则为带全抖动的指数退避"""
+    delay = _retry_after(response)
+    if delay is not None:
+        return delay
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
 class QwenClient:
     """阿里云通义千问大模型客户端"""
     
@@ -25,10 +100,10 @@ class QwenClient:
         """
         self.api_key = api_key
         self.model = model
-        self.api_url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
+        self.api_url = f"{BASE_URL}/services/aigc/text-generation/generation"
         
-        # 对话历史存储 {conversation_id: [messages]}
-        self.conversations: Dict[str, List[Dict]] = {}
+        # 对话历史存储（进程内LRU + 多进程共享层，未命中时由应用从消息表重建）
+        self.conversations = get_conversation_store()
         
         logger.info(f"阿里云通义千问客户端初始化成功 - 模型: {model}")
     
@@ -42,7 +117,10 @@ class QwenClient:
         conversation_id: Optional[str] = None,
         system_prompt: Optional[str] = None,
         temperature: float = 0.7,
-        max_tokens: int = 2000
+        max_tokens: int = 2000,
+        tenant_id: Optional[str] = None,
+        plan: Optional[str] = None,
+        priority: str = 'interactive'
     ) -> Dict:
         """
         发送聊天消息
@@ -53,6 +131,9 @@ class QwenClient:
             system_prompt: 系统提示词
             temperature: 温度参数 0-2
             max_tokens: 最大token数
+            tenant_id: 租户ID（回复缓存按租户隔离）
+            plan: 套餐（决定模型路由可升级到的最高档）
+            priority: 调用优先级（interactive / wechat / batch，见 llm_dispatcher.py）
             
         Returns:
             包含模型响应的字典
@@ -67,12 +148,11 @@ class QwenClient:
                 conversation_id = str(uuid.uuid4())
             
             # 获取对话历史
-            if conversation_id not in self.conversations:
-                self.conversations[conversation_id] = []
-                
+            history = self.conversations.load(HISTORY_NAMESPACE, conversation_id) or []
+            if not history or history[0].get('role') != 'system':
                 # 添加系统提示词
                 if system_prompt:
-                    self.conversations[conversation_id].append({
+                    history.insert(0, {
                         "role": "system",
                         "content": system_prompt
                     })
@@ -93,13 +173,38 @@ class QwenClient:
 - 提供结果解读
 
 保持回答的专业性和实用性。"""
-                    self.conversations[conversation_id].append({
+                    history.insert(0, {
                         "role": "system",
                         "content": default_prompt
                     })
             
+            # 从消息表重建的历史可能已包含本条消息（路由先写库再调用模型）
+            if history[-1] == {"role": "user", "content": message}:
+                history.pop()
+            
+            # 相同问题（同样的系统提示词和上文）直接返回缓存的回答
+            cache = get_response_cache()
+            cache_key = None
+            if cache is not None:
+                system = next((m['content'] for m in history if m['role'] == 'system'), '')
+                cache_key = cache.make_key(self.model, system, history, message, tenant_id=tenant_id)
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    history.append({"role": "user", "content": message})
+                    history.append({"role": "assistant", "content": cached['content']})
+                    self._save_history(conversation_id, history)
+                    logger.info(f"⚡ 命中回复缓存（{cached['match']}）: {message[:50]}...")
+                    return {
+                        'content': cached['content'],
+                        'conversation_id': conversation_id,
+                        'model': self.model,
+                        'usage': {},
+                        'finish_reason': cached.get('finish_reason', 'stop'),
+                        'cached': cached['match']
+                    }
+            
             # 添加用户消息
-            self.conversations[conversation_id].append({
+            history.append({
                 "role": "user",
                 "content": message
             })
@@ -113,7 +218,7 @@ class QwenClient:
             payload = {
                 "model": self.model,
                 "input": {
-                    "messages": self.conversations[conversation_id]
+                    "messages": prompt_cache.mark_cacheable(history)
                 },
                 "parameters": {
                     "temperature": temperature,
@@ -122,53 +227,83 @@ class QwenClient:
                 }
             }
             
-            # 调用API
-            logger.info(f"发送消息到通义千问: {message[:50]}...")
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            
-            # 检查响应
-            if response.status_code != HTTPStatus.OK:
-                error_msg = f"API调用失败: {response.status_code} - {response.text}"
-                logger.error(error_msg)
-                raise Exception(error_msg)
-            
-            # 解析响应
-            result = response.json()
-            
-            if result.get('output') and result['output'].get('choices'):
-                assistant_message = result['output']['choices'][0]['message']['content']
+            # 按本轮特征选择模型；调用失败或回答质量不足时升级到更高档模型重答
+            router = get_router(self.model)
+            decision = router.route(message, history[:-1], plan=plan)
+            logger.info(f"发送消息到通义千问（{decision.reason}）: {message[:50]}...")
+            estimated = estimate_tokens(history, max_tokens)
+            started = time.perf_counter()
+            tokens = 0
+            for attempt, model in enumerate(decision.candidates):
+                last = attempt == len(decision.candidates) - 1
+                payload["model"] = model
+                try:
+                    response = self._post(headers, payload, estimated, priority)
+                except requests.exceptions.RequestException as e:
+                    if last:
+                        router.record(decision, model, time.perf_counter() - started, tokens, attempt, failed=True)
+                        raise
+                    logger.warning(f"⤴️ {model} 调用失败（{type(e).__name__}），升级到 {decision.candidates[attempt + 1]}")
+                    continue
                 
-                # 保存助手回复到历史
-                self.conversations[conversation_id].append({
-                    "role": "assistant",
-                    "content": assistant_message
-                })
+                # 检查响应
+                if response.status_code != HTTPStatus.OK:
+                    get_dispatcher().settle(estimated, 0)
+                    error_msg = f"API调用失败: {response.status_code} - {response.text}"
+                    if not last:
+                        logger.warning(f"⤴️ {model} {error_msg[:100]}，升级到 {decision.candidates[attempt + 1]}")
+                        continue
+                    router.record(decision, model, time.perf_counter() - started, tokens, attempt, failed=True)
+                    logger.error(error_msg)
+                    raise Exception(error_msg)
                 
-                # 限制历史长度
-                max_history = 20  # 保留最近20条消息
-                if len(self.conversations[conversation_id]) > max_history:
-                    # 保留系统消息和最近的对话
-                    system_msgs = [m for m in self.conversations[conversation_id] if m["role"] == "system"]
-                    recent_msgs = self.conversations[conversation_id][-max_history:]
-                    self.conversations[conversation_id] = system_msgs + recent_msgs
+                # 解析响应
+                result = response.json()
+                usage = result.get('usage') or {}
+                get_dispatcher().settle(estimated, usage.get('total_tokens'))
+                prompt_cache.get_prefix_stats().record(
+                    prompt_cache.prefix_fingerprint(history[0]['content'], []),
+                    usage.get('input_tokens', 0),
+                    prompt_cache.cached_tokens(usage)
+                )
+                tokens += result.get('usage', {}).get('total_tokens') or 0
+                if not (result.get('output') and result['output'].get('choices')):
+                    raise Exception(f"模型响应格式异常: {result}")
                 
-                logger.info(f"收到模型响应: {assistant_message[:50]}...")
-                
-                return {
-                    'content': assistant_message,
-                    'conversation_id': conversation_id,
-                    'model': self.model,
-                    'usage': result.get('usage', {}),
-                    'finish_reason': result['output']['choices'][0].get('finish_reason', 'stop')
-                }
-            else:
-                raise Exception(f"模型响应格式异常: {result}")
+                assistant_message = result['output']['choices'][0]['message']['content']
+                finish_reason = result['output']['choices'][0].get('finish_reason', 'stop')
+                if not last and router.needs_escalation(assistant_message, finish_reason):
+                    logger.warning(f"⤴️ {model} 回答质量不足（{finish_reason}），升级到 {decision.candidates[attempt + 1]}")
+                    continue
+                break
+            router.record(decision, model, time.perf_counter() - started, tokens, attempt)
+            
+            # 保存助手回复到历史
+            history.append({
+                "role": "assistant",
+                "content": assistant_message
+            })
             
+            if cache_key is not None and finish_reason == 'stop':
+                cache.put(cache_key, assistant_message, {'finish_reason': finish_reason})
+            
+            # 限制历史长度并写回存储
+            self._save_history(conversation_id, history)
+            
+            logger.info(f"收到模型响应（{model}）: {assistant_message[:50]}...")
+            
+            return {
+                'content': assistant_message,
+                'conversation_id': conversation_id,
+                'model': model,
+                'route': decision.reason,
+                'usage': result.get('usage', {}),
+                'finish_reason': finish_reason
+            }
+            
+        except RateLimitTimeout as e:
+            logger.warning(f"⏳ {e}")
+            raise Exception("模型调用繁忙，请稍后重试")
         except requests.exceptions.Timeout:
             logger.error("调用通义千问超时")
             raise Exception("模型调用超时，请稍后重试")
@@ -179,15 +314,63 @@ class QwenClient:
             logger.error(f"处理消息失败: {str(e)}", exc_info=True)
             raise
     
+    def _post(self, headers: Dict, payload: Dict, estimated_tokens: int, priority: str = 'interactive') -> requests.Response:
+        """
+        经调度器排队后发送请求；429 时调度器整体冷却，5xx 和连接错误按退避重试
+
+        Returns:
+            最后一次的响应（重试用尽时可能仍为错误状态）
+        """
+        dispatcher = get_dispatcher()
+        session = get_session()
+        for attempt in range(MAX_RETRIES + 1):
+            # 首次按估算取 token，重试只占请求数（token 在结算时按实际用量扣）
+            ticket = dispatcher.acquire(estimated_tokens if attempt == 0 else 0, priority)
+            try:
+                response = session.post(
+                    self.api_url,
+                    headers=headers,
+                    json=payload,
+                    timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                ticket.release()
+                if attempt == MAX_RETRIES:
+                    dispatcher.settle(estimated_tokens, 0)
+                    raise
+                delay = _retry_delay(attempt)
+                logger.warning(f"🔁 通义千问连接失败（{type(e).__name__}），{delay:.1f}秒后第{attempt + 1}次重试")
+                time.sleep(delay)
+                continue
+            
+            if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+                # 冷却期间所有排队的调用一起等待，重试在下一次 acquire 时排到冷却结束
+                ticket.throttle(_retry_after(response))
+            ticket.release()
+            if response.status_code not in RETRY_STATUS or attempt == MAX_RETRIES:
+                return response
+            response.close()
+            if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+                logger.warning(f"🔁 通义千问返回 429，冷却后第{attempt + 1}次重试")
+                continue
+            delay = _retry_delay(attempt, response)
+            logger.warning(f"🔁 通义千问返回 {response.status_code}，{delay:.1f}秒后第{attempt + 1}次重试")
+            time.sleep(delay)
+        return response
+    
+    def _save_history(self, conversation_id: str, messages: List[Dict], max_history: int = 20):
+        """限制历史长度（保留系统消息和最近的对话，按块裁剪保持缓存前缀稳定）后写回存储"""
+        messages = prompt_cache.trim_history(messages, max_history)
+        self.conversations.save(HISTORY_NAMESPACE, conversation_id, messages)
+    
     def clear_conversation(self, conversation_id: str):
         """清除对话历史"""
-        if conversation_id in self.conversations:
-            del self.conversations[conversation_id]
-            logger.info(f"已清除对话历史: {conversation_id}")
+        self.conversations.delete(HISTORY_NAMESPACE, conversation_id)
+        logger.info(f"已清除对话历史: {conversation_id}")
     
     def get_conversation_history(self, conversation_id: str) -> List[Dict]:
         """获取对话历史"""
-        return self.conversations.get(conversation_id, [])
+        return self.conversations.load(HISTORY_NAMESPACE, conversation_id) or []
     
     def get_models_info(self) -> Dict:
         """获取可用模型信息"""
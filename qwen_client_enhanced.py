@@ -4,16 +4,306 @@
 参考HydroSIS云服务架构方案中的ChatService设计
 """
 
+import os
 import json
+import time
+import asyncio
 import logging
+import itertools
 from typing import Dict, List, Optional, AsyncGenerator, Callable
 import dashscope
 from dashscope import Generation
 from http import HTTPStatus
 
+from mcp_codec import to_jsonable
+import mcp_digest
+from response_cache import get_response_cache
+from conversation_store import HISTORY_NAMESPACE, get_conversation_store
+from model_router import get_router
+from rate_limiter import estimate_tokens, CHARS_PER_TOKEN
+from llm_dispatcher import get_dispatcher
+import prompt_cache
+
 logger = logging.getLogger(__name__)
 
 
+# 开场说明：模型决定调用工具时，先用快速模型流式说明将计算什么、为什么，与工具执行并行
+PREAMBLE_ENABLED = os.environ.get('CHAT_PREAMBLE', 'false').lower() == 'true'
+PREAMBLE_MODEL = os.environ.get('CHAT_PREAMBLE_MODEL', 'qwen-turbo')
+PREAMBLE_MAX_TOKENS = int(os.environ.get('CHAT_PREAMBLE_MAX_TOKENS', '120'))
+# 工具执行完后最多再等开场说明多久（秒），超时丢弃剩余部分
+PREAMBLE_WAIT = float(os.environ.get('CHAT_PREAMBLE_WAIT', '5'))
+# 系统提示词（修改内容时递增版本号；已有对话在下一轮换用新版本）
+SYSTEM_PROMPT_VERSION = 1
+SYSTEM_PROMPT = """你是HydroNet水网智能助手，专门帮助用户进行水网分析和管理。
+
+你可以使用以下专业工具：
+- simulation: 水网仿真模拟（预测流量、水位、压力等）
+- identification: 系统辨识（识别管网参数、校准模型）
+- scheduling: 优化调度（生成最优调度方案，降低能耗）
+- control: 控制策略（设计PID、MPC等控制器）
+- testing: 性能测试（评估系统可靠性和效率）
+- reservoir_operation: 水库调度（优化水库月调度规则，给出本月下泄建议）
+
+**重要指导原则**：
+1. 当用户询问具体的计算、分析任务时，主动调用相应工具
+2. 解释清楚每个工具的用途和所需参数
+3. 对工具返回的结果进行专业解读
+4. 用简洁、专业、友好的中文回答
+
+**示例场景**：
+- 用户说"帮我模拟一下水网运行"→ 调用simulation工具
+- 用户说"优化调度方案"→ 调用scheduling工具
+- 用户说"设计一个PID控制器"→ 调用control工具
+- 用户说"水库这个月该放多少水"→ 调用reservoir_operation工具"""
+
+# 流式调用不设 max_tokens，向调度器预取额度时按此估算输出 token（返回后按实际用量结算）
+STREAM_OUTPUT_ESTIMATE = 1000
+# 多轮工具调用：单次用户消息内最多的工具调用轮数和总时长（秒），超出后要求模型基于现有结果作答
+AGENT_MAX_ROUNDS = max(1, int(os.environ.get('AGENT_MAX_ROUNDS', '5')))
+AGENT_TIME_BUDGET = float(os.environ.get('AGENT_TIME_BUDGET', '180'))
+# 早期轮次的工具结果在上下文中压缩到的每序列点数
+COMPACT_POINTS = mcp_digest.MIN_POINTS
+PREAMBLE_PROMPT = (
+    "你是HydroNet水网智能体。系统正在调用下列工具来回答用户的问题。"
+    "请用一两句话告诉用户接下来要计算什么、为什么这样做。"
+    "不要给出任何计算结果、数值或结论，结果出来后会另行解读。"
+)
+
+
+def _field(obj, key: str):
+    """读取响应对象的字段（SDK 返回的工具调用可能是字典或对象）"""
+    if isinstance(obj, dict):
+        return obj.get(key)
+    return getattr(obj, key, None)
+
+
+def _merge_tool_call_deltas(pending: Dict[int, Dict], deltas):
+    """把流式响应中的工具调用增量按序号拼接为 {序号: {'id', 'name', 'arguments'}}"""
+    for position, delta in enumerate(deltas):
+        index = _field(delta, 'index')
+        call = pending.setdefault(position if index is None else index, {'id': None, 'name': '', 'arguments': ''})
+        call['id'] = _field(delta, 'id') or call['id']
+        function = _field(delta, 'function') or {}
+        call['name'] = _field(function, 'name') or call['name']
+        call['arguments'] += _field(function, 'arguments') or ''
+
+
+def iterate_sync(events):
+    """
+    在独立的事件循环中逐个驱动异步生成器（供 Flask/SocketIO 的同步处理函数使用）
+
+    正常结束、出错或调用方中途 close（客户端断开）时都会关闭生成器、收尾嵌套的异步生成器
+    并取消残留任务，生成器中的 finally（归还工具执行许可、调度器名额等）一定执行。
+    调用方不再迭代时应 close 返回的生成器，不要依赖垃圾回收。
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        while True:
+            try:
+                item = loop.run_until_complete(events.__anext__())
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        try:
+            loop.run_until_complete(events.aclose())
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        finally:
+            loop.close()
+
+
+async def _tagged(kind: str, events):
+    """与 ToolPreamble.merge 的产出格式一致：(kind, 事件)"""
+    async for event in events:
+        yield kind, event
+
+
+class TurnUsage:
+    """
+    一轮对话的 token 用量（工具调用轮 + 最终回答轮累加）
+
+    DashScope 流式响应的 usage 是截至当前帧的累计值，每次调用取最后一帧；
+    没有返回 usage 时按字符数本地估算，并标记 estimated。cached_tokens 为命中前缀缓存的输入 token。
+    """
+
+    def __init__(self):
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.calls = 0
+        self.estimated = False
+
+    @staticmethod
+    def read(response) -> Optional[Dict]:
+        """取出响应帧中的 usage（没有时返回 None）"""
+        usage = getattr(response, 'usage', None)
+        if not usage:
+            return None
+        get = usage.get if isinstance(usage, dict) else lambda k: getattr(usage, k, None)
+        if get('input_tokens') is None and get('output_tokens') is None:
+            return None
+        return {
+            'input_tokens': get('input_tokens') or 0,
+            'output_tokens': get('output_tokens') or 0,
+            'cached_tokens': prompt_cache.cached_tokens(usage)
+        }
+
+    def add_call(self, messages: List[Dict], content: str, usage: Optional[Dict]):
+        """累加一次模型调用的用量"""
+        self.calls += 1
+        if usage is None:
+            self.estimated = True
+            usage = {
+                'input_tokens': estimate_tokens(messages),
+                'output_tokens': int(len(content) / CHARS_PER_TOKEN)
+            }
+        self.input_tokens += usage['input_tokens']
+        self.output_tokens += usage['output_tokens']
+        self.cached_tokens += usage.get('cached_tokens') or 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def to_dict(self) -> Dict:
+        return {
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'total_tokens': self.total_tokens,
+            'cached_tokens': self.cached_tokens,
+            'calls': self.calls,
+            'estimated': self.estimated
+        }
+
+
+def _dispatched(ticket, responses):
+    """透传响应流，读完或中途关闭时归还调度器名额并按 usage 结算"""
+    usage = None
+    try:
+        for response in responses:
+            usage = TurnUsage.read(response) or usage
+            yield response
+    finally:
+        ticket.release(usage['input_tokens'] + usage['output_tokens'] if usage else None)
+
+
+class ToolPreamble:
+    """
+    工具执行期间的开场说明
+
+    后台线程调用快速模型，增量文本经事件循环放入队列；merge 把它和工具执行事件
+    按到达顺序合并，remaining 在工具执行完后取出剩余部分。开场说明不写入对话历史，
+    也不进入最终回答的上下文，最终回答与关闭此功能时相同。
+    """
+
+    def __init__(self, message: str, tool_calls: List[Dict]):
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.content = ""
+        self.usage = None
+        self.done = False
+        self._pending = None
+        planned = '\n'.join(f"- {c['name']}({c['arguments']})" for c in tool_calls)
+        self.messages = [
+            {"role": "system", "content": PREAMBLE_PROMPT},
+            {"role": "user", "content": f"用户问题：{message}\n将调用的工具：\n{planned}"}
+        ]
+        self.loop.run_in_executor(None, self._run)
+
+    def _put(self, item):
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+        except RuntimeError:
+            pass  # 事件循环已关闭（客户端断开）
+
+    def _run(self):
+        try:
+            estimated = estimate_tokens(self.messages, PREAMBLE_MAX_TOKENS)
+            # 开场说明超过 PREAMBLE_WAIT 就会被丢弃，排队也不必等得更久
+            with get_dispatcher().slot(estimated, 'interactive', timeout=PREAMBLE_WAIT) as ticket:
+                responses = Generation.call(
+                    model=PREAMBLE_MODEL,
+                    messages=self.messages,
+                    result_format='message',
+                    stream=True,
+                    incremental_output=True,
+                    max_tokens=PREAMBLE_MAX_TOKENS
+                )
+                for response in responses:
+                    if response.status_code != HTTPStatus.OK:
+                        if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+                            ticket.throttle()
+                        logger.warning(f"⚠️ 开场说明生成失败: {response.code} - {response.message}")
+                        break
+                    self.usage = TurnUsage.read(response) or self.usage
+                    delta = response.output.choices[0].message.content
+                    if delta:
+                        self.content += delta
+                        self._put(delta)
+                ticket.release(self.usage['input_tokens'] + self.usage['output_tokens'] if self.usage else None)
+        except Exception as e:
+            logger.warning(f"⚠️ 开场说明生成失败: {e}")
+        finally:
+            self._put(None)
+
+    def _next(self) -> asyncio.Future:
+        # 等待中的取队列任务跨 merge/remaining 保留，已取出的文本不会丢失
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self.queue.get())
+        return self._pending
+
+    def _take(self) -> Optional[str]:
+        text = self._pending.result()
+        self._pending = None
+        if text is None:
+            self.done = True
+        return text
+
+    async def merge(self, events):
+        """合并工具执行事件与开场说明，产出 ('event', 事件) 或 ('preamble', 文本)"""
+        next_event = asyncio.ensure_future(events.__anext__())
+        while True:
+            waiting = {next_event} if self.done else {next_event, self._next()}
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            if self._pending is not None and self._pending in done:
+                text = self._take()
+                if text is not None:
+                    yield 'preamble', text
+            if next_event in done:
+                try:
+                    event = next_event.result()
+                except StopAsyncIteration:
+                    return
+                yield 'event', event
+                next_event = asyncio.ensure_future(events.__anext__())
+
+    async def remaining(self, timeout: Optional[float] = None):
+        """取出剩余的开场说明（最多等 timeout 秒，默认 PREAMBLE_WAIT）"""
+        deadline = self.loop.time() + (PREAMBLE_WAIT if timeout is None else timeout)
+        while not self.done:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._next()), max(0.0, deadline - self.loop.time()))
+            except asyncio.TimeoutError:
+                logger.warning("⚠️ 开场说明超时，丢弃剩余部分")
+                return
+            text = self._take()
+            if text is not None:
+                yield text
+
+    def close(self):
+        """不再接收开场说明（超时后迟到的部分不会在后续轮次中输出）"""
+        self.done = True
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+
+
 class QwenChatService:
     """
     增强版通义千问对话服务
@@ -40,39 +330,38 @@ class QwenChatService:
         self.model = model
         self.mcp_manager = mcp_manager
         
-        # 对话历史存储 {conversation_id: messages}
-        self.conversations: Dict[str, List[Dict]] = {}
+        # 对话历史存储（进程内LRU + 多进程共享层，未命中时由应用从消息表重建）
+        self.conversations = get_conversation_store()
+        
+        # 通义千问格式的工具列表缓存 {(tenant_id, features_key): tools}，随服务目录版本失效
+        self._tools_cache: Dict[tuple, List[Dict]] = {}
+        self._tools_cache_version = None
         
         logger.info(f"✅ 通义千问对话服务初始化成功 - 模型: {model}")
     
     def _build_system_prompt(self) -> str:
-        """构建系统提示词"""
-        return """你是HydroNet水网智能助手，专门帮助用户进行水网分析和管理。
-
-你可以使用以下专业工具：
-- simulation: 水网仿真模拟（预测流量、水位、压力等）
-- identification: 系统辨识（识别管网参数、校准模型）
-- scheduling: 优化调度（生成最优调度方案，降低能耗）
-- control: 控制策略（设计PID、MPC等控制器）
-- testing: 性能测试（评估系统可靠性和效率）
-
-**重要指导原则**：
-1. 当用户询问具体的计算、分析任务时，主动调用相应工具
-2. 解释清楚每个工具的用途和所需参数
-3. 对工具返回的结果进行专业解读
-4. 用简洁、专业、友好的中文回答
-
-**示例场景**：
-- 用户说"帮我模拟一下水网运行"→ 调用simulation工具
-- 用户说"优化调度方案"→ 调用scheduling工具
-- 用户说"设计一个PID控制器"→ 调用control工具"""
+        """构建系统提示词（固定版本，保证请求前缀逐字节相同）"""
+        return SYSTEM_PROMPT
     
-    def _get_mcp_tools(self) -> List[Dict]:
-        """获取MCP工具列表（转换为通义千问格式）"""
+    def _get_mcp_tools(self, tenant_id: Optional[str] = None, features=None) -> List[Dict]:
+        """
+        获取MCP工具列表（转换为通义千问格式）
+        
+        按租户和套餐功能过滤，转换结果缓存到服务目录变化为止
+        """
         if not self.mcp_manager:
             return []
         
-        mcp_services = self.mcp_manager.get_tools_list()
+        version = self.mcp_manager.catalogue_version
+        if version != self._tools_cache_version:
+            self._tools_cache = {}
+            self._tools_cache_version = version
+        
+        key = (tenant_id, self.mcp_manager.features_key(features))
+        if key in self._tools_cache:
+            return self._tools_cache[key]
+        
+        mcp_services = self.mcp_manager.get_tools_list(tenant_id, features)
         
         # 转换为通义千问Function格式
         tools = []
@@ -91,7 +380,9 @@ class QwenChatService:
             }
             tools.append(tool)
         
-        logger.info(f"📦 加载了 {len(tools)} 个MCP工具")
+        tools = prompt_cache.canonical_tools(tools)
+        self._tools_cache[key] = tools
+        logger.info(f"📦 加载了 {len(tools)} 个MCP工具 (租户: {tenant_id or '全局'})")
         return tools
     
     async def chat_stream(
@@ -99,7 +390,13 @@ class QwenChatService:
         user_id: str,
         conversation_id: str,
         message: str,
-        on_chunk: Optional[Callable] = None
+        on_chunk: Optional[Callable] = None,
+        tenant_id: Optional[str] = None,
+        plan: Optional[str] = None,
+        features=None,
+        preamble: Optional[bool] = None,
+        priority: str = 'interactive',
+        usage: Optional[TurnUsage] = None
     ) -> AsyncGenerator[Dict, None]:
         """
         流式对话（支持工具调用）
@@ -109,191 +406,296 @@ class QwenChatService:
             conversation_id: 对话ID
             message: 用户消息
             on_chunk: 回调函数（处理每个chunk）
+            tenant_id: 租户ID（工具调用按租户公平排队）
+            plan: 套餐（决定工具调用并发和排队权重）
+            features: 套餐允许的功能列表（只向模型提供可用的工具）
+            preamble: 调用工具时是否先流式输出开场说明（默认按 CHAT_PREAMBLE 配置）
+            priority: 模型调用的排队优先级（interactive / wechat / batch，见 llm_dispatcher.py）
+            usage: 本轮用量累加器（调用方传入时，出错或中途关闭后仍可读取已产生的用量）
             
         Yields:
             消息chunk字典:
-            - type: 'text' | 'tool_call' | 'tool_result' | 'complete'
+            - type: 'preamble' | 'text' | 'tool_call' | 'tool_progress' | 'tool_result' | 'complete'
             - content: 内容
-            - tool_name: 工具名称（仅tool_call/tool_result）
+            - usage/rounds: 本轮 token 用量和工具调用轮数（仅complete）
+            - tool_name: 工具名称（仅tool_call/tool_progress/tool_result）
+            - tool_call_id/round: 工具调用ID和所在轮次（同一轮的多个工具并行执行）
             - status: running | completed | failed
+            - progress/stage/message/partial: 工具执行进度和部分结果（仅tool_progress）
+            - result/result_ref: 降采样后的工具结果及完整结果的引用ID（仅tool_result）
         """
         try:
             # 1. 初始化对话历史
-            if conversation_id not in self.conversations:
-                self.conversations[conversation_id] = [
-                    {"role": "system", "content": self._build_system_prompt()}
-                ]
+            history = self.conversations.load(HISTORY_NAMESPACE, conversation_id) or []
+            system_prompt = self._build_system_prompt()
+            if not history or history[0].get('role') != 'system':
+                history.insert(0, {"role": "system", "content": system_prompt})
+            elif history[0]['content'] != system_prompt:
+                # 旧版本提示词开始的对话换用当前版本，与其他对话共享缓存前缀
+                history[0] = {"role": "system", "content": system_prompt}
             
-            # 2. 添加用户消息
-            self.conversations[conversation_id].append({
-                "role": "user",
-                "content": message
-            })
+            # 2. 添加用户消息（从消息表重建的历史可能已包含本条：路由先写库再调用模型）
+            if history[-1] != {"role": "user", "content": message}:
+                history.append({
+                    "role": "user",
+                    "content": message
+                })
             
             # 3. 获取MCP工具列表
-            tools = self._get_mcp_tools()
+            tools = self._get_mcp_tools(tenant_id, features)
             
-            # 4. 调用通义千问（流式 + Function Calling）
-            logger.info(f"💬 用户 {user_id} 发送消息: {message[:50]}...")
+            # 相同问题（同样的上文和可用工具）直接返回缓存的回答，不调用模型
+            cache = get_response_cache()
+            cache_key = None
+            if cache is not None:
+                cache_key = cache.make_key(
+                    self.model, history[0]['content'], history[:-1], message,
+                    tenant_id=tenant_id,
+                    extra=sorted(t['function']['name'] for t in tools)
+                )
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"⚡ 命中回复缓存（{cached['match']}）: {message[:50]}...")
+                    history.append({"role": "assistant", "content": cached['content']})
+                    self._save_history(conversation_id, history)
+                    for chunk in (
+                        {'type': 'text', 'content': cached['content'], 'cached': cached['match']},
+                        {'type': 'complete', 'conversation_id': conversation_id, 'cached': cached['match'],
+                         'usage': TurnUsage().to_dict()}
+                    ):
+                        if on_chunk:
+                            on_chunk(chunk)
+                        yield chunk
+                    return
             
-            responses = Generation.call(
-                model=self.model,
-                messages=self.conversations[conversation_id],
-                tools=tools if tools else None,
-                result_format='message',
-                stream=True,
-                incremental_output=True
-            )
+            # 4. 调用通义千问（流式 + Function Calling），按本轮特征选择模型
+            router = get_router(self.model)
+            decision = router.route(message, history[:-1], tools_available=len(tools), plan=plan)
+            logger.info(f"💬 用户 {user_id} 发送消息（{decision.reason}）: {message[:50]}...")
+            started = time.perf_counter()
+            prefix = prompt_cache.prefix_fingerprint(system_prompt, tools)
+            prefix_stats = prompt_cache.get_prefix_stats()
             
-            # 5. 处理响应流
+            # 5. 多轮工具调用：每轮模型可并行调用多个工具，结果加入上下文后继续，
+            #    直到模型直接回答，或达到轮数/时间上限后不再提供工具、要求其作答
+            messages = list(history)
             assistant_content = ""
-            tool_calls = []
+            usage = usage if usage is not None else TurnUsage()
+            use_preamble = PREAMBLE_ENABLED if preamble is None else preamble
+            tool_preamble = None
+            tool_messages = []  # (工具消息, 完整结果, 结果引用)，早期轮次的结果在后续轮次中压缩
+            model = None
+            escalations = 0
+            rounds = 0
             
-            for response in responses:
-                if response.status_code == HTTPStatus.OK:
-                    choice = response.output.choices[0]
-                    message_obj = choice.message
+            while True:
+                allow_tools = bool(tools) and rounds < AGENT_MAX_ROUNDS and \
+                    time.perf_counter() - started < AGENT_TIME_BUDGET
+                if rounds and not allow_tools:
+                    logger.info(f"⏱️ 已执行 {rounds} 轮工具调用，要求模型基于现有结果作答")
+                candidates = decision.candidates[decision.candidates.index(model):] if model else None
+                ticket = await get_dispatcher().acquire_async(
+                    estimate_tokens(messages, STREAM_OUTPUT_ESTIMATE), priority
+                )
+                model, responses, attempts = self._open_stream(
+                    router, decision, messages, tools if allow_tools else [], started, candidates, ticket
+                )
+                escalations += attempts
+                
+                content = ""
+                pending = {}
+                call_usage = None
+                try:
+                    for response in responses:
+                        if response.status_code != HTTPStatus.OK:
+                            logger.error(f"API调用失败: {response.code} - {response.message}")
+                            raise Exception(f"API调用失败: {response.message}")
+                        call_usage = TurnUsage.read(response) or call_usage
+                        message_obj = response.output.choices[0].message
                     
-                    # 处理工具调用
-                    if hasattr(message_obj, 'tool_calls') and message_obj.tool_calls:
-                        for tool_call in message_obj.tool_calls:
-                            tool_name = tool_call.function.name
-                            tool_args = json.loads(tool_call.function.arguments)
-                            
-                            logger.info(f"🔧 调用工具: {tool_name}")
-                            
-                            # 通知前端工具调用开始
-                            chunk = {
-                                'type': 'tool_call',
-                                'tool_name': tool_name,
-                                'status': 'running',
-                                'arguments': tool_args
-                            }
-                            
-                            if on_chunk:
-                                on_chunk(chunk)
-                            yield chunk
-                            
-                            # 执行MCP工具
-                            try:
-                                result = await self.mcp_manager.call_tool(
-                                    tool_name,
-                                    tool_args,
-                                    user_id=user_id
-                                )
-                                
-                                logger.info(f"✅ 工具 {tool_name} 执行成功")
-                                
-                                # 通知前端工具执行完成
-                                result_chunk = {
-                                    'type': 'tool_result',
-                                    'tool_name': tool_name,
-                                    'status': 'completed',
-                                    'result': result
-                                }
-                                
-                                if on_chunk:
-                                    on_chunk(result_chunk)
-                                yield result_chunk
-                                
-                                # 保存工具调用结果
-                                tool_calls.append({
-                                    "tool_call_id": tool_call.id,
-                                    "role": "tool",
-                                    "name": tool_name,
-                                    "content": json.dumps(result, ensure_ascii=False)
-                                })
-                                
-                            except Exception as e:
-                                logger.error(f"❌ 工具 {tool_name} 执行失败: {e}")
-                                error_chunk = {
-                                    'type': 'tool_result',
-                                    'tool_name': tool_name,
-                                    'status': 'failed',
-                                    'error': str(e)
-                                }
-                                if on_chunk:
-                                    on_chunk(error_chunk)
-                                yield error_chunk
+                        # 工具调用的参数按增量到达，按序号拼接
+                        if getattr(message_obj, 'tool_calls', None):
+                            _merge_tool_call_deltas(pending, message_obj.tool_calls)
                     
-                    # 处理文本内容（流式输出）
-                    if hasattr(message_obj, 'content') and message_obj.content:
-                        delta_content = message_obj.content
+                        # 处理文本内容（流式输出）
+                        delta_content = getattr(message_obj, 'content', None)
                         if delta_content:
-                            assistant_content += delta_content
-                            
+                            content += delta_content
                             text_chunk = {
                                 'type': 'text',
                                 'content': delta_content
                             }
-                            
                             if on_chunk:
                                 on_chunk(text_chunk)
                             yield text_chunk
-                else:
-                    logger.error(f"API调用失败: {response.code} - {response.message}")
-                    raise Exception(f"API调用失败: {response.message}")
-            
-            # 6. 如果有工具调用，需要再次调用LLM生成最终回答
-            if tool_calls:
-                logger.info(f"🔄 基于工具结果生成最终回答...")
+                except BaseException:
+                    # 出错或调用方中途关闭：本次调用已产生的用量同样计入
+                    usage.add_call(messages, content, call_usage)
+                    raise
                 
-                # 将工具调用和结果添加到历史
-                messages_with_tools = self.conversations[conversation_id].copy()
-                messages_with_tools.append({
-                    "role": "assistant",
-                    "content": "",
-                    "tool_calls": tool_calls
-                })
-                messages_with_tools.extend(tool_calls)
+                calls = [pending[index] for index in sorted(pending)]
+                usage.add_call(messages, content + ''.join(c['arguments'] for c in calls), call_usage)
+                if call_usage is not None:
+                    prefix_stats.record(prefix, call_usage['input_tokens'], call_usage['cached_tokens'])
+                if not calls:
+                    assistant_content = content
+                    break
                 
-                # 再次调用LLM
-                final_responses = Generation.call(
-                    model=self.model,
-                    messages=messages_with_tools,
-                    result_format='message',
-                    stream=True,
-                    incremental_output=True
-                )
+                rounds += 1
+                logger.info(f"🔧 第 {rounds} 轮工具调用: {', '.join(c['name'] for c in calls)}")
+                for call in calls:
+                    try:
+                        call['args'] = json.loads(call['arguments'] or '{}')
+                    except json.JSONDecodeError as e:
+                        call['args'] = None
+                        call['error'] = f"工具参数不是有效的JSON: {e}"
+                    
+                    # 通知前端工具调用开始
+                    chunk = {
+                        'type': 'tool_call',
+                        'tool_name': call['name'],
+                        'tool_call_id': call['id'],
+                        'round': rounds,
+                        'status': 'running',
+                        'arguments': call['args']
+                    }
+                    if on_chunk:
+                        on_chunk(chunk)
+                    yield chunk
                 
-                final_content = ""
-                for response in final_responses:
-                    if response.status_code == HTTPStatus.OK:
-                        choice = response.output.choices[0]
-                        if hasattr(choice.message, 'content') and choice.message.content:
-                            delta = choice.message.content
-                            final_content += delta
-                            
-                            text_chunk = {
-                                'type': 'text',
-                                'content': delta
-                            }
-                            
-                            if on_chunk:
-                                on_chunk(text_chunk)
-                            yield text_chunk
+                if use_preamble and tool_preamble is None:
+                    tool_preamble = ToolPreamble(message, calls)
+                
+                # 执行本轮工具（互不依赖，并行执行；转发执行进度和部分结果）
+                results = {}
+                events = self._run_tools(calls, user_id, tenant_id, plan, features)
+                if tool_preamble is not None and not tool_preamble.done:
+                    events = tool_preamble.merge(events)
+                else:
+                    events = _tagged('event', events)
+                async for kind, event in events:
+                    if kind == 'preamble':
+                        preamble_chunk = {'type': 'preamble', 'content': event}
+                        if on_chunk:
+                            on_chunk(preamble_chunk)
+                        yield preamble_chunk
+                        continue
+                    
+                    index, event = event
+                    call = calls[index]
+                    if event['event'] == 'result':
+                        # 列式数组解码为NumPy后，在发往前端/模型前转回列表
+                        results[index] = to_jsonable(event['result'])
+                        logger.info(f"✅ 工具 {call['name']} 执行成功")
+                        
+                        # 完整结果留在服务端，前端和模型各拿按自身预算降采样的版本
+                        result_ref = mcp_digest.result_store.put(results[index], owner=user_id)
+                        call['ref'] = result_ref
+                        result_chunk = {
+                            'type': 'tool_result',
+                            'tool_name': call['name'],
+                            'tool_call_id': call['id'],
+                            'round': rounds,
+                            'status': 'completed',
+                            'result': mcp_digest.for_ui(results[index], result_ref),
+                            'result_ref': result_ref
+                        }
+                    elif event['event'] == 'error':
+                        logger.error(f"❌ 工具 {call['name']} 执行失败: {event['error']}")
+                        call['error'] = event['error']
+                        result_chunk = {
+                            'type': 'tool_result',
+                            'tool_name': call['name'],
+                            'tool_call_id': call['id'],
+                            'round': rounds,
+                            'status': 'failed',
+                            'error': event['error']
+                        }
+                    else:
+                        result_chunk = {
+                            'type': 'tool_progress',
+                            'tool_name': call['name'],
+                            'tool_call_id': call['id'],
+                            'status': 'running',
+                            'progress': event.get('progress'),
+                            'stage': event.get('stage'),
+                            'message': event.get('message'),
+                            'partial': to_jsonable(event.get('partial'))
+                        }
+                    if on_chunk:
+                        on_chunk(result_chunk)
+                    yield result_chunk
+                
+                # 开场说明在下一次模型输出之前输出完
+                if tool_preamble is not None and rounds == 1:
+                    async for text in tool_preamble.remaining():
+                        preamble_chunk = {'type': 'preamble', 'content': text}
+                        if on_chunk:
+                            on_chunk(preamble_chunk)
+                        yield preamble_chunk
+                    tool_preamble.close()
+                    usage.add_call(tool_preamble.messages, tool_preamble.content, tool_preamble.usage)
                 
-                assistant_content = final_content
+                # 6. 早期轮次的结果压缩为少量点 + 统计量，本轮结果按常规预算加入上下文
+                for tool_message, result, result_ref in tool_messages:
+                    if result is not None:
+                        tool_message['content'] = json.dumps(
+                            mcp_digest.for_llm(result, result_ref, budget=COMPACT_POINTS), ensure_ascii=False
+                        )
+                messages.append({
+                    "role": "assistant",
+                    "content": content,
+                    "tool_calls": [
+                        {
+                            "id": call['id'],
+                            "type": "function",
+                            "function": {"name": call['name'], "arguments": call['arguments']}
+                        }
+                        for call in calls
+                    ]
+                })
+                for index, call in enumerate(calls):
+                    result = results.get(index)
+                    if result is None:
+                        body = {'error': call.get('error') or '工具没有返回结果'}
+                    else:
+                        body = mcp_digest.for_llm(result, call['ref'])
+                    tool_message = {
+                        "role": "tool",
+                        "tool_call_id": call['id'],
+                        "name": call['name'],
+                        "content": json.dumps(body, ensure_ascii=False)
+                    }
+                    messages.append(tool_message)
+                    tool_messages.append((tool_message, result, call.get('ref')))
+                logger.info(f"🔄 基于第 {rounds} 轮工具结果继续...")
             
-            # 7. 保存助手回复到历史
-            self.conversations[conversation_id].append({
+            # 7. 保存助手回复到历史（工具调用的中间过程不写入历史）
+            history.append({
                 "role": "assistant",
                 "content": assistant_content
             })
             
-            # 8. 限制历史长度
-            self._trim_history(conversation_id, max_messages=30)
+            # 没有工具调用的回答写入缓存（工具结果依赖实时数据，不缓存）
+            if cache_key is not None and not rounds:
+                cache.put(cache_key, assistant_content)
+            
+            # 8. 限制历史长度并写回存储
+            self._save_history(conversation_id, history)
             
             # 9. 发送完成信号
             complete_chunk = {
                 'type': 'complete',
-                'conversation_id': conversation_id
+                'conversation_id': conversation_id,
+                'rounds': rounds,
+                'usage': usage.to_dict()
             }
             if on_chunk:
                 on_chunk(complete_chunk)
             yield complete_chunk
             
-            logger.info(f"✅ 对话完成: {conversation_id}")
+            router.record(decision, model, time.perf_counter() - started, usage.total_tokens, escalations)
+            logger.info(f"✅ 对话完成: {conversation_id}（{model}，{rounds} 轮工具调用，{usage.calls} 次模型调用）")
             
         except Exception as e:
             logger.error(f"❌ 对话处理失败: {e}", exc_info=True)
@@ -305,26 +707,123 @@ class QwenChatService:
                 on_chunk(error_chunk)
             yield error_chunk
     
-    def _trim_history(self, conversation_id: str, max_messages: int = 30):
-        """限制对话历史长度"""
-        if conversation_id in self.conversations:
-            messages = self.conversations[conversation_id]
-            if len(messages) > max_messages:
-                # 保留系统消息和最近的对话
-                system_msgs = [m for m in messages if m.get("role") == "system"]
-                recent_msgs = messages[-max_messages:]
-                self.conversations[conversation_id] = system_msgs + recent_msgs
-                logger.info(f"📝 对话历史已裁剪至 {max_messages} 条")
+    async def _run_tools(self, calls: List[Dict], user_id: str, tenant_id: Optional[str], plan: Optional[str], features):
+        """
+        并行执行一轮的工具调用
+
+        Yields:
+            (调用序号, 事件)：执行进度、{'event': 'result'} 或 {'event': 'error', 'error': 信息}
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        async def run(index: int, call: Dict):
+            try:
+                if call.get('error'):
+                    raise ValueError(call['error'])
+                async for event in self.mcp_manager.call_tool_stream(
+                    call['name'],
+                    call['args'],
+                    user_id=user_id,
+                    tenant_id=tenant_id,
+                    plan=plan,
+                    features=features
+                ):
+                    await queue.put((index, event))
+            except Exception as e:
+                await queue.put((index, {'event': 'error', 'error': str(e)}))
+            finally:
+                await queue.put((index, None))
+        
+        tasks = [asyncio.ensure_future(run(index, call)) for index, call in enumerate(calls)]
+        running = len(tasks)
+        try:
+            while running:
+                index, event = await queue.get()
+                if event is None:
+                    running -= 1
+                    continue
+                yield index, event
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            # 等被取消的工具任务退出（释放执行许可）后再结束
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def _open_stream(
+        self,
+        router,
+        decision,
+        history: List[Dict],
+        tools: List[Dict],
+        started: float,
+        candidates: Optional[List[str]] = None,
+        ticket=None
+    ):
+        """
+        按路由候选顺序开启流式调用
+
+        先读取第一个响应块：出错（限流、模型不可用等）时升级到下一档模型，
+        此时还没有内容推送给前端，可以无缝重试。
+
+        Args:
+            candidates: 依次尝试的模型（默认为路由结果；后续轮次从当前模型开始）
+            ticket: 调度器放行的名额，响应流读完（或调用失败）时归还并按实际用量结算
+
+        Returns:
+            (实际使用的模型, 响应流, 升级次数)
+        """
+        candidates = candidates or decision.candidates
+        for attempt, model in enumerate(candidates):
+            last = attempt == len(candidates) - 1
+            try:
+                responses = Generation.call(
+                    model=model,
+                    messages=prompt_cache.mark_cacheable(history),
+                    tools=tools if tools else None,
+                    result_format='message',
+                    stream=True,
+                    incremental_output=True
+                )
+                first = next(responses, None)
+            except Exception as e:
+                # 连接错误等异常同样升级到下一档模型，名额留给下一次尝试
+                if last:
+                    if ticket is not None:
+                        ticket.release(0)
+                    router.record(decision, model, time.perf_counter() - started, escalations=attempt, failed=True)
+                    raise
+                logger.warning(f"⤴️ {model} 调用失败（{type(e).__name__}），升级到 {candidates[attempt + 1]}")
+                continue
+            if first is not None and first.status_code == HTTPStatus.OK:
+                stream = itertools.chain([first], responses)
+                return model, _dispatched(ticket, stream) if ticket is not None else stream, attempt
+            error = f"{first.code} - {first.message}" if first is not None else '空响应'
+            if ticket is not None and first is not None and first.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+                ticket.throttle()
+            if last:
+                if ticket is not None:
+                    ticket.release(0)
+                router.record(decision, model, time.perf_counter() - started, escalations=attempt, failed=True)
+                logger.error(f"API调用失败: {error}")
+                raise Exception(f"API调用失败: {first.message if first is not None else error}")
+            logger.warning(f"⤴️ {model} 调用失败（{error}），升级到 {candidates[attempt + 1]}")
+    
+    def _save_history(self, conversation_id: str, messages: List[Dict], max_messages: int = 30):
+        """限制对话历史长度后写回存储（按块裁剪，保持缓存前缀稳定）"""
+        trimmed = prompt_cache.trim_history(messages, max_messages)
+        if len(trimmed) < len(messages):
+            logger.info(f"📝 对话历史已裁剪至 {len(trimmed)} 条")
+        self.conversations.save(HISTORY_NAMESPACE, conversation_id, trimmed)
     
     def clear_conversation(self, conversation_id: str):
         """清除对话历史"""
-        if conversation_id in self.conversations:
-            del self.conversations[conversation_id]
-            logger.info(f"🗑️ 已清除对话历史: {conversation_id}")
+        self.conversations.delete(HISTORY_NAMESPACE, conversation_id)
+        logger.info(f"🗑️ 已清除对话历史: {conversation_id}")
     
     def get_conversation_history(self, conversation_id: str) -> List[Dict]:
         """获取对话历史"""
-        return self.conversations.get(conversation_id, [])
+        return self.conversations.load(HISTORY_NAMESPACE, conversation_id) or []
     
     def is_available(self) -> bool:
         """检查服务是否可用"""
@@ -346,7 +845,6 @@ class QwenClient:
     def chat(self, message: str, conversation_id: Optional[str] = None, 
              system_prompt: Optional[str] = None, **kwargs) -> Dict:
         """同步chat方法（为了兼容）"""
-        import asyncio
         import uuid
         
         if not conversation_id:
@@ -355,17 +853,14 @@ class QwenClient:
         # 简单实现：收集所有流式响应
         content = ""
         
-        async def collect_stream():
-            nonlocal content
-            user_id = kwargs.get('user_id', 'default')
-            async for chunk in self.service.chat_stream(user_id, conversation_id, message):
+        user_id = kwargs.get('user_id', 'default')
+        events = iterate_sync(self.service.chat_stream(user_id, conversation_id, message))
+        try:
+            for chunk in events:
                 if chunk['type'] == 'text':
                     content += chunk['content']
-        
-        # 运行异步函数
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(collect_stream())
+        finally:
+            events.close()
         
         return {
             'content': content,
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+大模型API出站限流（进程内令牌桶）
+
+DashScope 按 API Key 限制每秒请求数（QPS）和每分钟 token 数（TPM），超限时返回 429。
+每个进程在发请求前先从两个令牌桶取令牌：
+    - 请求桶：每次调用取 1 个
+    - token桶：按提示词估算的 token 数预取，响应返回后按 usage 实际值多退少补
+多进程部署时按进程数分摊额度（DASHSCOPE_PROCESSES），保证合计不超过账号配额。
+调用方不直接使用本模块，而是经 llm_dispatcher.py 按优先级排队取额度；入站请求的限流见 quota.py。
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# 账号配额（整个API Key），按进程数分摊；设置了 DASHSCOPE_RPM 时以它为准
+DASHSCOPE_QPS = float(os.environ.get('DASHSCOPE_RPM') or 0) / 60.0 or float(os.environ.get('DASHSCOPE_QPS', '10'))
+DASHSCOPE_TPM = float(os.environ.get('DASHSCOPE_TPM', '300000'))
+DASHSCOPE_PROCESSES = max(1, int(os.environ.get('DASHSCOPE_PROCESSES', '1')))
+# 令牌不足时最长等待（秒），超时抛出 RateLimitTimeout
+RATE_LIMIT_WAIT = float(os.environ.get('DASHSCOPE_RATE_LIMIT_WAIT', '30'))
+# 中文约 1 字 1 token、英文约 4 字符 1 token，按每 token 1.5 字符保守估算
+CHARS_PER_TOKEN = 1.5
+
+
+class RateLimitTimeout(Exception):
+    """等待令牌超时（本进程的调用额度已用满）"""
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶
+
+    以 rate 个/秒的速度补充，最多积累 capacity 个。余额可以为负（事后补扣实际用量），
+    为负时后续请求等到余额回正。
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("令牌桶的速率和容量必须大于0")
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, amount: float = 1.0, reserve: float = 0.0) -> float:
+        """
+        尝试取出 amount 个令牌
+
+        Args:
+            reserve: 取出后桶内至少还要剩下的令牌数（留给高优先级调用）
+
+        Returns:
+            0 表示已取出；否则为还需等待的秒数（未取出）
+        """
+        # 单次需求超过容量时按容量计，避免永远等不到
+        amount = min(float(amount), self.capacity)
+        needed = min(amount + reserve, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= needed:
+                self._tokens -= amount
+                return 0.0
+            return (needed - self._tokens) / self.rate
+
+    def adjust(self, amount: float):
+        """补扣（amount>0）或退还（amount<0）令牌"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class ModelRateLimiter:
+    """请求数 + token 数双令牌桶"""
+
+    def __init__(self, qps: float, tpm: float, max_wait: float = RATE_LIMIT_WAIT):
+        # 请求桶允许 1 秒的突发；token 桶允许一整分钟的额度
+        self.requests = TokenBucket(qps, max(1.0, qps))
+        self.tokens = TokenBucket(tpm / 60.0, tpm)
+        self.max_wait = max_wait
+        self.waited = 0.0
+        self.throttled = 0
+
+    def acquire(self, estimated_tokens: int = 0, timeout: Optional[float] = None) -> float:
+        """
+        阻塞直到请求和 token 额度都足够
+
+        Returns:
+            实际等待的秒数
+
+        Raises:
+            RateLimitTimeout: 超过 timeout（默认 max_wait）仍无额度
+        """
+        timeout = self.max_wait if timeout is None else timeout
+        started = time.monotonic()
+        while True:
+            wait = self.try_take(estimated_tokens)
+            if wait == 0.0:
+                waited = time.monotonic() - started
+                if waited > 0.001:
+                    self.waited += waited
+                    self.throttled += 1
+                return waited
+            if time.monotonic() - started + wait > timeout:
+                raise RateLimitTimeout(f"大模型调用额度已满，预计需等待 {wait:.1f} 秒")
+            time.sleep(min(wait, 1.0))
+
+    def try_take(self, estimated_tokens: int = 0, reserve: float = 0.0) -> float:
+        """
+        不等待地同时取出 1 个请求和 estimated_tokens 个 token（要么都取出，要么都不取）
+
+        Returns:
+            0 表示已取出；否则为还需等待的秒数
+        """
+        wait = self.tokens.try_acquire(estimated_tokens, reserve) if estimated_tokens > 0 else 0.0
+        if wait == 0.0:
+            wait = self.requests.try_acquire(1)
+            if wait > 0 and estimated_tokens > 0:
+                self.tokens.adjust(-estimated_tokens)
+        return wait
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """响应返回后按实际用量结算预取的 token"""
+        if actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def get_stats(self) -> Dict[str, float]:
+        return {
+            'qps': self.requests.rate,
+            'tpm': round(self.tokens.rate * 60.0),
+            'available_requests': round(self.requests.available, 2),
+            'available_tokens': round(self.tokens.available),
+            'throttled': self.throttled,
+            'waited_seconds': round(self.waited, 3)
+        }
+
+
+def estimate_tokens(messages, max_tokens: int = 0) -> int:
+    """按消息字符数估算输入 token，再加上输出上限"""
+    chars = sum(len(str(m.get('content') or '')) for m in messages)
+    return int(chars / CHARS_PER_TOKEN) + int(max_tokens)
+
+
+_limiter: Optional[ModelRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> ModelRateLimiter:
+    """本进程共享的 DashScope 限流器"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = ModelRateLimiter(
+                    DASHSCOPE_QPS / DASHSCOPE_PROCESSES,
+                    DASHSCOPE_TPM / DASHSCOPE_PROCESSES
+                )
+                logger.info(
+                    f"🚦 DashScope限流: {_limiter.requests.rate:g} QPS, "
+                    f"{_limiter.tokens.rate * 60:.0f} TPM（每进程）"
+                )
+    return _limiter
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+大模型回复缓存
+
+运维人员和公众号用户反复提相同的问题（"什么是MPC控制?"、"怎么做水网仿真?"），
+命中缓存时直接返回已有回答，毫秒级响应且不消耗 token。
+
+两级缓存，均按租户隔离、带过期时间：
+    - 精确匹配：键为（模型、系统提示词、最近几轮上下文、归一化后的问题、附加条件如工具列表）的哈希
+    - 语义匹配（可选，RESPONSE_CACHE_SEMANTIC=true）：只用于对话的第一问（没有上文），
+      问题向量与已缓存问题的余弦相似度超过阈值、且数字和英文词完全相同时才命中
+      （"这个月/下个月"、"2号/3号闸门"这类字面相近但意思不同的问题不会串答）。
+      默认使用字符 n-gram 哈希向量（无需额外依赖，适合短问句）；
+      安装 sentence-transformers 并设置 RESPONSE_CACHE_EMBEDDING_MODEL 时改用该模型
+
+只有不含工具调用的回答才写入缓存（工具结果依赖实时数据）。
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Tuple
+
+import numpy as np
+
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '86400'))
+CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '5000'))
+# 键中包含的最近上下文消息条数（不含系统提示词和本次问题）
+CONTEXT_MESSAGES = int(os.environ.get('RESPONSE_CACHE_CONTEXT_MESSAGES', '4'))
+SEMANTIC_ENABLED = os.environ.get('RESPONSE_CACHE_SEMANTIC', 'false').lower() == 'true'
+# 相似度阈值：未设置时哈希向量取 0.92（只容忍标点、语气词等细微差别），模型向量取 0.9
+SEMANTIC_THRESHOLD = os.environ.get('RESPONSE_CACHE_SIMILARITY')
+HASHING_THRESHOLD = 0.92
+MODEL_THRESHOLD = 0.9
+EMBEDDING_MODEL = os.environ.get('RESPONSE_CACHE_EMBEDDING_MODEL', '')
+# 每个租户语义索引的最大条数
+SEMANTIC_SIZE = int(os.environ.get('RESPONSE_CACHE_SEMANTIC_SIZE', '2000'))
+
+# 哈希向量维度和 n-gram 长度
+HASH_DIMENSIONS = 1024
+NGRAM_SIZES = (1, 2, 3)
+
+_PUNCTUATION = re.compile(r'[\s\?？!！。．.,，、;；:：~～…"“”\'‘’()（）]+')
+_LITERAL_TOKEN = re.compile(r'\d+(?:\.\d+)?|[a-z]+')
+
+
+def normalize_text(text: str) -> str:
+    """问题归一化：全半角统一、小写、去掉空白和标点"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return _PUNCTUATION.sub('', text)
+
+
+def literal_tokens(text: str) -> Tuple[str, ...]:
+    """问题中的数字和英文词（排序后），语义命中要求两边完全一致"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return tuple(sorted(_LITERAL_TOKEN.findall(text)))
+
+
+class HashingEmbedder:
+    """字符 n-gram 特征哈希向量（L2 归一化），不依赖外部模型"""
+
+    def __init__(self, dimensions: int = HASH_DIMENSIONS, ngrams=NGRAM_SIZES):
+        self.dimensions = dimensions
+        self.ngrams = ngrams
+
+    def encode(self, text: str) -> np.ndarray:
+        text = normalize_text(text)
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for n in self.ngrams:
+            for i in range(len(text) - n + 1):
+                digest = hashlib.blake2b(text[i:i + n].encode('utf-8'), digest_size=8).digest()
+                value = int.from_bytes(digest, 'little')
+                # 最高位决定符号，减少哈希冲突的偏差
+                vector[value % self.dimensions] += 1.0 if value >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+
+class ModelEmbedder:
+    """sentence-transformers 模型向量"""
+
+    def __init__(self, model_name: str):
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, text: str) -> np.ndarray:
+        return np.asarray(self.model.encode(text, normalize_embeddings=True), dtype=np.float32)
+
+
+class _SemanticIndex:
+    """单个命名空间（租户+模型+系统提示词+附加条件）的问题向量索引"""
+
+    def __init__(self, dimensions: int, capacity: int):
+        self.vectors = np.zeros((0, dimensions), dtype=np.float32)
+        self.keys: List[str] = []
+        self.tokens: List[Tuple[str, ...]] = []
+        self.capacity = capacity
+
+    def add(self, key: str, vector: np.ndarray, tokens: Tuple[str, ...]):
+        if key in self.keys:
+            return
+        self.vectors = np.vstack((self.vectors[-(self.capacity - 1):], vector[None, :]))
+        self.keys = self.keys[-(self.capacity - 1):] + [key]
+        self.tokens = self.tokens[-(self.capacity - 1):] + [tokens]
+
+    def search(self, vector: np.ndarray, tokens: Tuple[str, ...]) -> Tuple[Optional[str], float]:
+        """在数字和英文词相同的问题中找最相似的一条"""
+        candidates = [i for i, t in enumerate(self.tokens) if t == tokens]
+        if not candidates:
+            return None, 0.0
+        scores = self.vectors[candidates] @ vector
+        best = int(np.argmax(scores))
+        return self.keys[candidates[best]], float(scores[best])
+
+
+class ResponseCache:
+    """两级回复缓存（精确 + 语义），线程安全"""
+
+    def __init__(
+        self,
+        max_entries: int = CACHE_SIZE,
+        ttl: float = CACHE_TTL,
+        semantic: bool = SEMANTIC_ENABLED,
+        threshold: Optional[float] = None,
+        context_messages: int = CONTEXT_MESSAGES
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.context_messages = context_messages
+        self.embedder = None
+        default_threshold = HASHING_THRESHOLD
+        if semantic:
+            if EMBEDDING_MODEL and SENTENCE_TRANSFORMERS_AVAILABLE:
+                self.embedder = ModelEmbedder(EMBEDDING_MODEL)
+                default_threshold = MODEL_THRESHOLD
+            else:
+                if EMBEDDING_MODEL:
+                    logger.warning("⚠️ 未安装 sentence-transformers，语义缓存改用字符 n-gram 哈希向量")
+                self.embedder = HashingEmbedder()
+        if threshold is None:
+            threshold = float(SEMANTIC_THRESHOLD) if SEMANTIC_THRESHOLD else default_threshold
+        self.threshold = threshold
+        # 键 → (过期时刻, 租户, 回答内容, 附加信息)
+        self._entries: 'OrderedDict[str, Tuple[float, str, str, Dict[str, Any]]]' = OrderedDict()
+        self._indexes: Dict[str, _SemanticIndex] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    # ---------- 键 ----------
+
+    def _namespace(self, tenant_id: Optional[str], model: str, system_prompt: str, extra: Any) -> str:
+        payload = json.dumps([tenant_id or '', model, system_prompt or '', extra], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _context(self, messages: List[Dict[str, Any]]) -> List[List[str]]:
+        """最近几轮上文（只取角色和归一化文本）"""
+        history = [m for m in messages if m.get('role') in ('user', 'assistant') and m.get('content')]
+        recent = history[-self.context_messages:] if self.context_messages > 0 else []
+        return [[m['role'], normalize_text(m['content'])] for m in recent]
+
+    def make_key(
+        self,
+        model: str,
+        system_prompt: str,
+        context: List[Dict[str, Any]],
+        message: str,
+        tenant_id: Optional[str] = None,
+        extra: Any = None
+    ) -> Dict[str, Any]:
+        """
+        构造缓存键
+
+        Args:
+            context: 本次问题之前的对话消息（系统消息会被忽略）
+            extra: 其他影响回答的条件（如可用工具名列表）
+
+        Returns:
+            {'key', 'namespace', 'tenant', 'message', 'standalone'}，用于 get/put
+        """
+        namespace = self._namespace(tenant_id, model, system_prompt, extra)
+        recent = self._context(context)
+        normalized = normalize_text(message)
+        key = hashlib.sha256(
+            json.dumps([namespace, recent, normalized], ensure_ascii=False).encode('utf-8')
+        ).hexdigest()
+        return {
+            'key': key,
+            'namespace': namespace,
+            'tenant': tenant_id or '',
+            'message': message,
+            'standalone': not recent
+        }
+
+    # ---------- 读写 ----------
+
+    def get(self, cache_key: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        查找缓存的回答
+
+        Returns:
+            {'content', 'match': 'exact'|'semantic', 'similarity', ...写入时的附加信息}，未命中返回 None
+        """
+        tenant = cache_key['tenant']
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(cache_key['key'])
+            match, similarity = 'exact', 1.0
+            if entry is None and self.embedder is not None and cache_key['standalone']:
+                index = self._indexes.get(cache_key['namespace'])
+                if index is not None:
+                    # 向量计算在锁内进行：哈希向量很快，模型向量时并发本就受限于模型
+                    key, similarity = index.search(
+                        self.embedder.encode(cache_key['message']), literal_tokens(cache_key['message'])
+                    )
+                    if key is not None and similarity >= self.threshold:
+                        entry = self._entries.get(key)
+                        match = 'semantic'
+            stats = self._stats.setdefault(tenant, {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0, 'stores': 0})
+            if entry is None:
+                stats['misses'] += 1
+                return None
+            stats[f'{match}_hits'] += 1
+            return {**entry[3], 'content': entry[2], 'match': match, 'similarity': round(similarity, 4)}
+
+    def put(self, cache_key: Dict[str, Any], content: str, metadata: Optional[Dict[str, Any]] = None):
+        """写入回答（调用方保证本轮没有工具调用）"""
+        if not content:
+            return
+        vector = None
+        if self.embedder is not None and cache_key['standalone']:
+            vector = self.embedder.encode(cache_key['message'])
+        with self._lock:
+            self._entries[cache_key['key']] = (time.monotonic() + self.ttl, cache_key['tenant'], content, metadata or {})
+            self._entries.move_to_end(cache_key['key'])
+            if vector is not None:
+                index = self._indexes.get(cache_key['namespace'])
+                if index is None:
+                    index = self._indexes[cache_key['namespace']] = _SemanticIndex(len(vector), SEMANTIC_SIZE)
+                index.add(cache_key['key'], vector, literal_tokens(cache_key['message']))
+            self._stats.setdefault(
+                cache_key['tenant'], {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0, 'stores': 0}
+            )['stores'] += 1
+            self._expire()
+
+    def invalidate(self, tenant_id: Optional[str] = None):
+        """清空某个租户（None 为全部）的缓存"""
+        with self._lock:
+            if tenant_id is None:
+                self._entries.clear()
+                self._indexes.clear()
+                return
+            for key in [k for k, entry in self._entries.items() if entry[1] == tenant_id]:
+                del self._entries[key]
+
+    def _expire(self):
+        # 过期时长相同且只在写入时调整顺序，队首即最早过期的条目
+        now = time.monotonic()
+        while self._entries and next(iter(self._entries.values()))[0] < now:
+            self._entries.popitem(last=False)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        # 语义索引中指向已淘汰条目的键在命中时会查不到，按需清理即可
+
+    def get_stats(self, tenant_id: Optional[str] = None) -> Dict[str, Any]:
+        """命中率统计（指定租户或全部汇总）"""
+        with self._lock:
+            if tenant_id is not None:
+                groups = [self._stats.get(tenant_id, {})]
+            else:
+                groups = list(self._stats.values())
+            total = {name: sum(g.get(name, 0) for g in groups) for name in ('exact_hits', 'semantic_hits', 'misses', 'stores')}
+            lookups = total['exact_hits'] + total['semantic_hits'] + total['misses']
+            total['hit_rate'] = round((total['exact_hits'] + total['semantic_hits']) / lookups, 4) if lookups else 0.0
+            total['entries'] = len(self._entries)
+            total['semantic'] = self.embedder is not None
+            return total
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """本进程共享的回复缓存；RESPONSE_CACHE_ENABLED=false 时返回 None"""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+                logger.info(f"🗃️ 回复缓存已启用（语义匹配: {'开' if _cache.embedder else '关'}）")
+    return _cache
@@ -363,6 +363,8 @@ class HydroNetApp {
         
         let assistantMessageElement = null;
         let assistantContent = '';
+        let preambleContent = '';
+        let buffer = '';
         
         // 移除加载动画
         this.hideTypingIndicator();
@@ -372,23 +374,31 @@ class HydroNetApp {
                 const { done, value } = await reader.read();
                 if (done) break;
                 
-                const chunk = decoder.decode(value);
-                const lines = chunk.split('\n');
+                // 事件可能跨多个数据块，保留最后一行不完整的内容
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
                 
                 for (const line of lines) {
                     if (line.startsWith('data: ')) {
                         const data = JSON.parse(line.slice(6));
                         
-                        if (data.type === 'text') {
-                            // 文本内容
+                        if (data.type === 'text' || data.type === 'preamble') {
+                            // 文本内容（开场说明显示在最终回答之前，工具执行期间先行输出）
                             if (!assistantMessageElement) {
                                 assistantMessageElement = this.createMessageElement('assistant', '');
                                 document.getElementById('messagesList').appendChild(assistantMessageElement);
                             }
                             
-                            assistantContent += data.content;
+                            if (data.type === 'preamble') {
+                                preambleContent += data.content;
+                            } else {
+                                assistantContent += data.content;
+                            }
                             const contentDiv = assistantMessageElement.querySelector('.message-content');
-                            contentDiv.textContent = assistantContent;
+                            contentDiv.textContent = preambleContent && assistantContent
+                                ? `${preambleContent}\n\n${assistantContent}`
+                                : preambleContent + assistantContent;
                             
                             this.scrollToBottom();
                             
@@ -396,6 +406,10 @@ class HydroNetApp {
                             // 工具调用
                             this.showToolCall(data);
                             
+                        } else if (data.type === 'tool_progress') {
+                            // 工具执行进度/部分结果
+                            this.updateToolProgress(data);
+                            
                         } else if (data.type === 'tool_result') {
                             // 工具结果
                             this.updateToolCall(data);
@@ -446,6 +460,8 @@ class HydroNetApp {
             // 追加文本...
         } else if (chunk.type === 'tool_call') {
             this.showToolCall(chunk);
+        } else if (chunk.type === 'tool_progress') {
+            this.updateToolProgress(chunk);
         } else if (chunk.type === 'tool_result') {
             this.updateToolCall(chunk);
         }
@@ -535,6 +551,9 @@ class HydroNetApp {
         const toolDiv = document.createElement('div');
         toolDiv.className = 'tool-call';
         toolDiv.id = `tool-${tool_name}-${Date.now()}`;
+        if (data.tool_call_id) {
+            toolDiv.dataset.toolCallId = data.tool_call_id;
+        }
         
         toolDiv.innerHTML = `
             <div class="tool-call-header">
@@ -544,6 +563,7 @@ class HydroNetApp {
                 <div class="tool-call-status ${status}">${this.getStatusText(status)}</div>
             </div>
             ${args ? `<div class="tool-call-args">参数: ${JSON.stringify(args, null, 2)}</div>` : ''}
+            <div class="tool-call-progress-container"></div>
             <div class="tool-call-result-container"></div>
         `;
         
@@ -553,15 +573,79 @@ class HydroNetApp {
         return toolDiv;
     }
     
+    findToolCallElement(toolName, toolCallId = null) {
+        // 找到对应的工具调用元素（按调用ID匹配，同一轮可能并行调用同名工具；没有ID时取同名工具最近一次调用）
+        const toolDivs = Array.from(document.querySelectorAll('.tool-call'));
+        if (toolCallId) {
+            const matched = toolDivs.find(div => div.dataset.toolCallId === toolCallId);
+            if (matched) return matched;
+        }
+        return toolDivs.reverse().find(div => 
+            div.querySelector('.tool-call-name').textContent.includes(this.getToolDisplayName(toolName))
+        );
+    }
+    
+    updateToolProgress(data) {
+        const { tool_name, progress, message, partial } = data;
+        
+        const toolDiv = this.findToolCallElement(tool_name, data.tool_call_id);
+        if (!toolDiv) return;
+        
+        const container = toolDiv.querySelector('.tool-call-progress-container');
+        if (!container.firstChild) {
+            container.innerHTML = `
+                <div class="tool-call-progress"><div class="tool-call-progress-fill"></div></div>
+                <div class="tool-call-progress-text"></div>
+                <div class="tool-call-partial"></div>
+            `;
+            toolDiv.partialSeries = {};
+        }
+        
+        const percent = Math.max(0, Math.min(100, Number(progress) || 0));
+        container.querySelector('.tool-call-progress-fill').style.width = `${percent}%`;
+        
+        let text = `${percent.toFixed(1)}%`;
+        if (message) text += ` · ${message}`;
+        if (partial && partial.iteration !== undefined) {
+            // 校准迭代：显示当前迭代和目标函数值
+            text += ` · 第${partial.iteration}次迭代`;
+            if (partial.objective !== undefined) text += `，目标函数 ${Number(partial.objective).toPrecision(4)}`;
+        }
+        container.querySelector('.tool-call-progress-text').textContent = text;
+        
+        // 部分时间序列块：追加后重绘
+        if (partial && partial.time_series) {
+            Object.entries(partial.time_series).forEach(([name, values]) => {
+                if (name === 'time' || !Array.isArray(values)) return;
+                toolDiv.partialSeries[name] = (toolDiv.partialSeries[name] || []).concat(values);
+            });
+            container.querySelector('.tool-call-partial').innerHTML =
+                Object.entries(toolDiv.partialSeries)
+                    .map(([name, values]) => this.renderSparkline(name, values))
+                    .join('');
+        }
+        
+        this.scrollToBottom();
+    }
+    
+    renderSparkline(name, values) {
+        const numbers = values.map(Number).filter(v => Number.isFinite(v));
+        if (numbers.length < 2) return '';
+        
+        const min = Math.min(...numbers);
+        const max = Math.max(...numbers);
+        const span = max - min || 1;
+        const points = numbers.map((v, i) =>
+            `${(i / (numbers.length - 1) * 300).toFixed(1)},${(58 - (v - min) / span * 56).toFixed(1)}`
+        ).join(' ');
+        
+        return `<svg viewBox="0 0 300 60" preserveAspectRatio="none"><title>${this.escapeHtml(name)}</title><polyline points="${points}"/></svg>`;
+    }
+    
     updateToolCall(data) {
         const { tool_name, status, result, error } = data;
         
-        // 找到对应的工具调用元素
-        const toolDivs = document.querySelectorAll('.tool-call');
-        const toolDiv = Array.from(toolDivs).find(div => 
-            div.querySelector('.tool-call-name').textContent.includes(this.getToolDisplayName(tool_name))
-        );
-        
+        const toolDiv = this.findToolCallElement(tool_name, data.tool_call_id);
         if (!toolDiv) return;
         
         // 更新状态
@@ -569,6 +653,11 @@ class HydroNetApp {
         statusSpan.className = `tool-call-status ${status}`;
         statusSpan.textContent = this.getStatusText(status);
         
+        const progressFill = toolDiv.querySelector('.tool-call-progress-fill');
+        if (progressFill && status === 'completed') {
+            progressFill.style.width = '100%';
+        }
+        
         // 显示结果
         const resultContainer = toolDiv.querySelector('.tool-call-result-container');
         if (result) {
@@ -590,7 +679,8 @@ class HydroNetApp {
             'identification': '系统辨识',
             'scheduling': '优化调度',
             'control': '控制策略',
-            'testing': '性能测试'
+            'testing': '性能测试',
+            'reservoir_operation': '水库调度'
         };
         return names[toolName] || toolName;
     }
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""测试环境：对话状态只放内存，关闭回复缓存，模块从仓库根目录导入"""
+
+import os
+import sys
+
+os.environ.setdefault('CONVERSATION_STORE_URL', 'memory://')
+os.environ.setdefault('RESPONSE_CACHE_ENABLED', 'false')
+os.environ.setdefault('MODEL_ROUTING', 'false')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
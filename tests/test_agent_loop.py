@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""多轮工具调用：轮数和时间上限、同一轮工具并行执行、早期轮次结果压缩、开场说明只输出一次、调用异常时升级模型"""
+
+import json
+import time
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import mcp_digest
+import qwen_client_enhanced
+from qwen_client_enhanced import QwenChatService, iterate_sync, COMPACT_POINTS, PREAMBLE_MODEL
+
+TOOLS = [
+    {'type': 'function', 'function': {'name': name, 'description': name, 'parameters': {'type': 'object', 'properties': {}}}}
+    for name in ('simulation', 'scheduling')
+]
+SERIES_POINTS = 500
+
+
+def _frame(content=None, tool_calls=None, usage=None):
+    message = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(
+        status_code=200, code='', message='', usage=usage,
+        output=SimpleNamespace(choices=[SimpleNamespace(message=message)])
+    )
+
+
+class StubGeneration:
+    """
+    替代 dashscope.Generation：提供工具时每次都并行调用两个工具，不提供工具时直接作答；
+    开场说明模型先输出一段，再在 late 秒后输出迟到的一段
+    """
+
+    def __init__(self, late=0.0):
+        self.calls = []
+        self.late = late
+
+    def call(self, model, messages, tools=None, **kwargs):
+        if model == PREAMBLE_MODEL:
+            return self._preamble()
+        self.calls.append({'messages': json.loads(json.dumps(messages)), 'tools': tools})
+        usage = {'input_tokens': 100, 'output_tokens': 10}
+        if not tools:
+            return iter([_frame('根据计算结果', usage=usage), _frame('，水位正常。', usage=usage)])
+        round_index = len(self.calls)
+        deltas = [
+            {'index': i, 'id': f'call_{round_index}_{i}', 'function': {'name': name, 'arguments': '{}'}}
+            for i, name in enumerate(('simulation', 'scheduling'))
+        ]
+        return iter([_frame(tool_calls=deltas, usage=usage)])
+
+    def _preamble(self):
+        yield _frame('先做一次仿真。', usage={'input_tokens': 20, 'output_tokens': 5})
+        time.sleep(self.late)
+        yield _frame('（迟到的说明）', usage={'input_tokens': 20, 'output_tokens': 9})
+
+
+def _result(tool_name):
+    hours = np.arange(SERIES_POINTS, dtype=float)
+    return {'tool': tool_name, 'series': {'hour': hours, 'flow': np.sin(hours / 20.0)}}
+
+
+class ToolManager:
+    """每个工具运行 delay 秒（可按轮次给出列表）后返回一条长时间序列，记录同时运行的工具数"""
+
+    def __init__(self, delay=0.05):
+        self.delays = delay if isinstance(delay, list) else None
+        self.delay = delay
+        self.started = 0
+        self.running = 0
+        self.max_running = 0
+
+    async def call_tool_stream(self, tool_name, arguments, user_id=None, tenant_id=None, plan=None, features=None):
+        # 每轮两个工具
+        delay = self.delays[self.started // 2] if self.delays else self.delay
+        self.started += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.running -= 1
+        yield {'event': 'result', 'result': _result(tool_name)}
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    generation = StubGeneration()
+    monkeypatch.setattr(qwen_client_enhanced, 'Generation', generation)
+    return generation
+
+
+def _chat(manager, conversation_id, **kwargs):
+    service = QwenChatService('test-key', mcp_manager=manager)
+    service._get_mcp_tools = lambda tenant_id=None, features=None: TOOLS
+    kwargs.setdefault('preamble', False)
+    return list(iterate_sync(service.chat_stream('u1', conversation_id, '模拟并优化调度', **kwargs)))
+
+
+def _flow_points(tool_message):
+    return len(json.loads(tool_message['content'])['series']['flow'])
+
+
+def test_max_rounds_then_answer_without_tools(stub, monkeypatch):
+    monkeypatch.setattr(qwen_client_enhanced, 'AGENT_MAX_ROUNDS', 2)
+    chunks = _chat(ToolManager(), 'agent-rounds')
+
+    complete = chunks[-1]
+    assert complete['type'] == 'complete'
+    assert complete['rounds'] == 2
+    assert complete['usage']['calls'] == 3
+    assert [bool(call['tools']) for call in stub.calls] == [True, True, False]
+    assert ''.join(c['content'] for c in chunks if c['type'] == 'text') == '根据计算结果，水位正常。'
+    assert sorted({(c['round'], c['status']) for c in chunks if c['type'] == 'tool_result'}) == [(1, 'completed'), (2, 'completed')]
+
+
+def test_time_budget_stops_tool_rounds(stub, monkeypatch):
+    monkeypatch.setattr(qwen_client_enhanced, 'AGENT_TIME_BUDGET', 0.2)
+    chunks = _chat(ToolManager(delay=0.3), 'agent-budget')
+
+    assert chunks[-1]['rounds'] == 1
+    assert [bool(call['tools']) for call in stub.calls] == [True, False]
+
+
+def test_tools_in_one_round_run_in_parallel(stub, monkeypatch):
+    monkeypatch.setattr(qwen_client_enhanced, 'AGENT_MAX_ROUNDS', 1)
+    manager = ToolManager(delay=0.3)
+    started = time.perf_counter()
+    chunks = _chat(manager, 'agent-parallel')
+
+    assert manager.max_running == 2
+    assert time.perf_counter() - started < 0.55
+    results = [c for c in chunks if c['type'] == 'tool_result']
+    assert {c['tool_name'] for c in results} == {'simulation', 'scheduling'}
+
+
+def test_earlier_round_results_are_compacted(stub, monkeypatch):
+    monkeypatch.setattr(qwen_client_enhanced, 'AGENT_MAX_ROUNDS', 2)
+    _chat(ToolManager(), 'agent-compact')
+
+    second, final = stub.calls[1]['messages'], stub.calls[2]['messages']
+    tool_messages = [m for m in final if m['role'] == 'tool']
+    assert [m['tool_call_id'] for m in tool_messages] == ['call_1_0', 'call_1_1', 'call_2_0', 'call_2_1']
+    # 第二轮调用时第一轮结果按常规预算；最终回答时第一轮已压缩，第二轮仍按常规预算
+    full = len(mcp_digest.for_llm(_result('simulation'))['series']['flow'])
+    compact = len(mcp_digest.for_llm(_result('simulation'), budget=COMPACT_POINTS)['series']['flow'])
+    assert compact < full < SERIES_POINTS
+    assert [_flow_points(m) for m in second if m['role'] == 'tool'] == [full, full]
+    assert [_flow_points(m) for m in tool_messages] == [compact, compact, full, full]
+
+
+def test_preamble_is_not_merged_again_in_later_rounds(stub, monkeypatch):
+    monkeypatch.setattr(qwen_client_enhanced, 'AGENT_MAX_ROUNDS', 2)
+    monkeypatch.setattr(qwen_client_enhanced, 'PREAMBLE_WAIT', 0.05)
+    stub.late = 0.2
+    # 第一轮工具很快结束，开场说明的迟到部分超时丢弃；第二轮工具执行期间迟到部分才到达
+    chunks = _chat(ToolManager(delay=[0.0, 0.4]), 'agent-preamble', preamble=True)
+
+    preambles = [i for i, c in enumerate(chunks) if c['type'] == 'preamble']
+    second_round = min(i for i, c in enumerate(chunks) if c['type'] == 'tool_call' and c['round'] == 2)
+    assert ''.join(chunks[i]['content'] for i in preambles) == '先做一次仿真。'
+    assert all(i < second_round for i in preambles)
+    assert chunks[-1]['type'] == 'complete'
+
+
+class _Ticket:
+    def __init__(self):
+        self.released = []
+
+    def release(self, tokens=None):
+        self.released.append(tokens)
+
+    def throttle(self):
+        pass
+
+
+class _Router:
+    def __init__(self):
+        self.records = []
+
+    def record(self, decision, model, elapsed, tokens=0, escalations=0, failed=False):
+        self.records.append((model, escalations, failed))
+
+
+class _FailingGeneration:
+    """前 failures 个模型调用直接抛出连接错误，之后正常返回"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.models = []
+
+    def call(self, model, **kwargs):
+        self.models.append(model)
+        if len(self.models) <= self.failures:
+            raise ConnectionError('connection reset')
+        return iter([_frame('好的', usage={'input_tokens': 10, 'output_tokens': 2})])
+
+
+def test_open_stream_escalates_when_call_raises(monkeypatch):
+    generation = _FailingGeneration(failures=1)
+    monkeypatch.setattr(qwen_client_enhanced, 'Generation', generation)
+    service = QwenChatService('test-key')
+    decision = SimpleNamespace(candidates=['qwen-turbo', 'qwen-plus'])
+    ticket, router = _Ticket(), _Router()
+
+    model, responses, attempts = service._open_stream(router, decision, [], [], time.perf_counter(), ticket=ticket)
+
+    assert (model, attempts) == ('qwen-plus', 1)
+    assert generation.models == ['qwen-turbo', 'qwen-plus']
+    # 失败的尝试不归还名额，响应流读完时按实际用量归还一次
+    assert ticket.released == []
+    list(responses)
+    assert ticket.released == [12]
+    assert router.records == []
+
+
+def test_open_stream_releases_ticket_when_last_call_raises(monkeypatch):
+    monkeypatch.setattr(qwen_client_enhanced, 'Generation', _FailingGeneration(failures=2))
+    service = QwenChatService('test-key')
+    decision = SimpleNamespace(candidates=['qwen-turbo', 'qwen-plus'])
+    ticket, router = _Ticket(), _Router()
+
+    with pytest.raises(ConnectionError):
+        service._open_stream(router, decision, [], [], time.perf_counter(), ticket=ticket)
+
+    assert ticket.released == [0]
+    assert router.records == [('qwen-plus', 1, True)]
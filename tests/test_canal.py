@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""渠道非恒定流：恒定来水下收敛到均匀流水深，沿程水量守恒"""
+
+import numpy as np
+import pytest
+
+from mcp_services.canal.channel import DEFAULT_SECTION, build_systems, normal_depth
+from mcp_services.canal.preissmann import PreissmannSolver
+
+FLOW = 150.0
+LENGTH_KM = 20.0
+TIME_STEP = 300.0
+
+
+def _system(upstream, offtakes=None):
+    section = DEFAULT_SECTION
+    depth = normal_depth(FLOW, section['bottom_width'], section['side_slope'], section['manning'], section['slope'])
+    bed_downstream = 100.0 - section['slope'] * LENGTH_KM * 1000.0
+    systems, _, _, _ = build_systems({
+        'reaches': [{'length': LENGTH_KM}],
+        'upstream': {'type': 'flow', 'value': upstream},
+        'downstream': {'type': 'level', 'value': bed_downstream + depth},
+        'offtakes': offtakes or []
+    }, dx=500.0)
+    return systems[0], depth
+
+
+def _volume(solver):
+    area = solver.geometry(solver.levels)[0]
+    return float(((area[solver.left] + area[solver.right]) / 2 * solver.dx).sum())
+
+
+def test_constant_inflow_converges_to_normal_depth():
+    # 初始为 100 m³/s 的壅水曲线，2 小时内来水增加到 150 m³/s 后保持不变
+    system, depth = _system([[0.0, 100.0], [2.0, FLOW]])
+    solver = PreissmannSolver(system, TIME_STEP)
+    initial_depth = solver.levels - solver.bed
+    assert np.abs(initial_depth - depth).max() > 0.1
+
+    result = solver.run(duration_hours=72, output_hours=6)
+
+    assert result['failed_steps'] == 0
+    np.testing.assert_allclose(result['flows'][-1], FLOW, rtol=1e-3)
+    np.testing.assert_allclose(result['levels'][-1] - solver.bed, depth, atol=0.01)
+    # 最后 12 小时已基本稳定
+    assert np.abs(result['levels'][-1] - result['levels'][-3]).max() < 5e-3
+
+
+def test_unsteady_flow_conserves_mass():
+    theta = 0.6
+    system, _ = _system(
+        [[0.0, 100.0], [3.0, 180.0], [6.0, 120.0]],
+        offtakes=[{'reach': 0, 'position': 8.0, 'flow': [[0.0, 5.0], [4.0, 15.0]]}]
+    )
+    solver = PreissmannSolver(system, TIME_STEP, theta)
+    segment = system['offtakes'][0]['segment']
+
+    def boundary_inflow():
+        return solver.flows[0] - solver.flows[-1]
+
+    start = _volume(solver)
+    inflow_volume = 0.0
+    previous = boundary_inflow()
+    for k in range(1, int(6 * 3600 / TIME_STEP) + 1):
+        hour = k * TIME_STEP / 3600.0
+        solver.step(hour)
+        current = boundary_inflow()
+        # 连续方程沿程求和：边界流量按 θ 加权，分水取时段末
+        offtake = solver._lateral(hour)[segment] * solver.dx[segment]
+        inflow_volume += TIME_STEP * (theta * current + (1 - theta) * previous + offtake)
+        previous = current
+
+    assert solver.failed_steps == 0
+    change = _volume(solver) - start
+    assert abs(change) > 5e4
+    assert change == pytest.approx(inflow_volume, rel=1e-4)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""客户端中途断开时，工具执行许可必须归还"""
+
+import asyncio
+from types import SimpleNamespace
+
+from tool_admission import ToolAdmissionController
+from qwen_client_enhanced import QwenChatService, TurnUsage, iterate_sync
+
+
+TOOL = {
+    'type': 'function',
+    'function': {'name': 'simulation', 'description': '水网仿真', 'parameters': {'type': 'object', 'properties': {}}}
+}
+
+
+class SlowToolManager:
+    """每次调用先取得执行许可、推送一次进度，然后一直运行"""
+
+    def __init__(self, admission: ToolAdmissionController):
+        self.admission = admission
+
+    async def call_tool_stream(self, tool_name, arguments, user_id=None, tenant_id=None, plan=None, features=None):
+        async with self.admission.admit(tenant_id, plan):
+            yield {'event': 'progress', 'progress': 10.0, 'message': '开始计算'}
+            await asyncio.sleep(3600)
+
+
+def _tool_call_stream(router, decision, history, tools, started, candidates=None, ticket=None):
+    """模型第一轮直接返回一次工具调用"""
+    if ticket is not None:
+        ticket.release(0)
+    delta = {'index': 0, 'id': 'call_1', 'function': {'name': 'simulation', 'arguments': '{}'}}
+    message = SimpleNamespace(content=None, tool_calls=[delta])
+    response = SimpleNamespace(status_code=200, usage=None, output=SimpleNamespace(choices=[SimpleNamespace(message=message)]))
+    return 'qwen-plus', iter([response]), 0
+
+
+def test_disconnect_mid_tool_releases_admission():
+    admission = ToolAdmissionController()
+    service = QwenChatService('test-key', mcp_manager=SlowToolManager(admission))
+    service._get_mcp_tools = lambda tenant_id=None, features=None: [TOOL]
+    service._open_stream = _tool_call_stream
+
+    events = iterate_sync(service.chat_stream('u1', 'c1', '模拟一下水网', tenant_id='t1', plan='free', preamble=False))
+    for chunk in events:
+        if chunk['type'] == 'tool_progress':
+            break
+    assert admission._tenant_running == {'t1': 1}
+
+    # 客户端断开：Flask 关闭 SSE 生成器
+    events.close()
+
+    assert admission._tenant_running == {'t1': 0}
+    assert admission._backend_running == {'local': 0}
+
+
+def _text_stream(router, decision, history, tools, started, candidates=None, ticket=None):
+    """模型逐段输出文本，每帧带累计 usage"""
+    if ticket is not None:
+        ticket.release(0)
+
+    def frames():
+        for i in range(1, 100):
+            message = SimpleNamespace(content='水位', tool_calls=None)
+            yield SimpleNamespace(
+                status_code=200,
+                usage={'input_tokens': 50, 'output_tokens': i},
+                output=SimpleNamespace(choices=[SimpleNamespace(message=message)])
+            )
+    return 'qwen-plus', frames(), 0
+
+
+def test_disconnect_mid_answer_keeps_usage():
+    service = QwenChatService('test-key', mcp_manager=SlowToolManager(ToolAdmissionController()))
+    service._get_mcp_tools = lambda tenant_id=None, features=None: []
+    service._open_stream = _text_stream
+    usage = TurnUsage()
+
+    events = iterate_sync(service.chat_stream('u1', 'c2', '现在水位多少', preamble=False, usage=usage))
+    received = [next(events) for _ in range(3)]
+    events.close()
+
+    assert [c['type'] for c in received] == ['text'] * 3
+    assert usage.calls == 1
+    assert usage.total_tokens == 50 + 3
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""控制器设计引擎：枚举的控制器类型、PID 性能指标、MPC 预测矩阵复用"""
+
+import numpy as np
+import pytest
+
+from mcp_manager_enhanced import MCPServiceManager
+from mcp_registry import MCPServiceRegistry
+from mcp_services.control import ProcessModel, design_controller, mpc
+from mcp_services.control.pid import simulate_pid
+from mcp_services.control.response import step_metrics
+
+PLANT = {'gain': 2.0, 'time_constant': 60.0, 'dead_time': 10.0}
+
+
+@pytest.fixture(scope='module')
+def control_schema(tmp_path_factory):
+    registry = MCPServiceRegistry(services_dir=str(tmp_path_factory.mktemp('services')), poll_interval=0)
+    manager = MCPServiceManager(registry)
+    return manager.services['control']['parameters']['properties']
+
+
+def test_every_advertised_controller_type_is_supported(control_schema):
+    for controller_type in control_schema['controller_type']['enum']:
+        result = design_controller({'controller_type': controller_type, 'setpoint': 1.0, 'process_model': PLANT})
+        assert result['status'] == 'success'
+        assert result['results']['controller_type'] == controller_type
+
+
+def test_designed_pid_meets_performance_spec():
+    spec = {'overshoot': 5.0, 'settling_time': 300.0}
+    result = design_controller({'controller_type': 'PID', 'setpoint': 1.0, 'process_model': PLANT,
+                                'performance_spec': spec})['results']
+
+    assert result['spec_satisfied']
+    assert result['stability']['stable']
+    assert result['performance']['overshoot'] <= spec['overshoot']
+    assert result['performance']['settling_time'] <= spec['settling_time']
+
+    # 用返回的参数独立复算阶跃响应（不依赖设计过程中的候选矩阵）
+    model = ProcessModel.from_arguments(PLANT)
+    ts, delay = model.sample_time(2 * spec['settling_time'])
+    n_steps = int(np.ceil(2 * spec['settling_time'] / ts))
+    p = result['parameters']
+    params = np.array([[p['Kp'] * model.action, p['Ti'], p['Td']]])
+    y, u = simulate_pid(model, params, 1.0, ts, delay, n_steps)
+    metrics = step_metrics(y, u, 1.0, ts, n_steps)
+    assert metrics['overshoot'][0] <= spec['overshoot'] + 0.1
+    assert metrics['settling_time'][0] <= spec['settling_time']
+    assert metrics['steady_state_error'][0] < 0.02
+
+
+def test_mpc_reuses_condensed_matrices():
+    mpc._cache.clear()
+    arguments = {'controller_type': 'MPC', 'setpoint': 1.0, 'process_model': PLANT}
+    first = design_controller(arguments)
+    key = next(iter(mpc._cache))
+    matrices = mpc._cache[key]
+    second = design_controller(arguments)
+
+    assert first['solver']['model_cached'] is False
+    assert second['solver']['model_cached'] is True
+    assert len(mpc._cache) == 1 and mpc._cache[key] is matrices
+    assert second['results']['parameters'] == first['results']['parameters']
+
+    # 只换性能指标不改变预测矩阵，同样命中缓存
+    third = design_controller(dict(arguments, performance_spec={'overshoot': 2.0}))
+    assert third['solver']['model_cached'] is True
+    assert len(mpc._cache) == 1
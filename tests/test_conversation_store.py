@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""对话状态存储：LRU 字节计量、空闲超时、多进程共享层版本校验、未命中时按 loader 重建"""
+
+import os
+import sys
+import time
+import subprocess
+
+from conversation_store import ConversationStore, MemoryTier, SQLiteBackend, create_backend
+
+
+def _shared_pair(tmp_path):
+    """两个共享同一 SQLite 文件的存储实例（相当于两个工作进程）"""
+    path = str(tmp_path / 'state.db')
+    return ConversationStore(SQLiteBackend(path)), ConversationStore(SQLiteBackend(path))
+
+
+def test_memory_tier_counts_utf8_bytes_and_evicts_least_recent():
+    tier = MemoryTier(max_bytes=100, idle_ttl=3600)
+    tier.put('a', 1, 'x' * 40)
+    tier.put('b', 1, '水' * 10)  # 30 字节
+    assert tier.bytes == 70
+
+    tier.get('a')
+    tier.put('c', 1, 'y' * 40)
+    # b 最久未访问，被淘汰
+    assert tier.get('b') is None
+    assert tier.bytes == 80 and len(tier) == 2
+
+    tier.put('a', 2, 'z' * 10)
+    assert tier.bytes == 50
+    assert tier.get('a') == (2, 'z' * 10)
+
+    # 超过上限的值不缓存，同时丢弃旧值
+    tier.put('c', 2, 'w' * 101)
+    assert tier.get('c') is None
+    assert tier.bytes == 10
+
+
+def test_memory_tier_expires_idle_entries():
+    tier = MemoryTier(max_bytes=1000, idle_ttl=0.2)
+    tier.put('a', 1, 'x')
+    tier.put('b', 1, 'y')
+
+    time.sleep(0.12)
+    assert tier.get('a') == (1, 'x')  # 访问会刷新空闲计时
+    time.sleep(0.12)
+    assert tier.get('a') == (1, 'x')
+    assert tier.get('b') is None
+    assert tier.bytes == 1
+
+    time.sleep(0.25)
+    assert tier.get('a') is None
+    assert tier.bytes == 0 and len(tier) == 0
+
+
+def test_memory_store_returns_copies():
+    store = ConversationStore(create_backend('memory://'))
+    store.save('history', 'c1', [{'role': 'user', 'content': '你好'}])
+
+    loaded = store.load('history', 'c1')
+    loaded.append({'role': 'assistant', 'content': '未保存'})
+    assert store.load('history', 'c1') == [{'role': 'user', 'content': '你好'}]
+    assert store.get_stats()['memory_hits'] == 2
+
+
+def test_shared_version_detects_write_from_other_process(tmp_path):
+    first, second = _shared_pair(tmp_path)
+    first.save('history', 'c1', ['v1'])
+
+    assert second.load('history', 'c1') == ['v1']
+    assert second.get_stats()['shared_hits'] == 1
+    assert second.load('history', 'c1') == ['v1']
+    assert second.get_stats()['memory_hits'] == 1
+
+    # 另一进程写入后版本号变化，本进程缓存失效
+    first.save('history', 'c1', ['v1', 'v2'])
+    assert second.load('history', 'c1') == ['v1', 'v2']
+    assert second.get_stats()['shared_hits'] == 2
+
+    # 本进程写入后另一进程同样读到新值
+    second.save('history', 'c1', ['v3'])
+    assert first.load('history', 'c1') == ['v3']
+
+    first.delete('history', 'c1')
+    assert second.load('history', 'c1') is None
+
+
+def test_loader_rebuilds_on_miss_once(tmp_path):
+    calls = []
+
+    def loader(key):
+        calls.append(key)
+        return [{'role': 'user', 'content': key}] if key != 'missing' else None
+
+    store = ConversationStore(create_backend('memory://'))
+    store.set_loader('history', loader)
+
+    assert store.load('history', 'c1') == [{'role': 'user', 'content': 'c1'}]
+    assert store.load('history', 'c1') == [{'role': 'user', 'content': 'c1'}]
+    assert store.load('history', 'missing') is None
+    assert calls == ['c1', 'missing']
+    stats = store.get_stats()
+    assert (stats['rebuilt'], stats['memory_hits'], stats['misses']) == (1, 1, 1)
+    # loader 只对注册的命名空间生效
+    assert store.load('wechat', 'c1') is None
+
+    # 共享层：一个进程重建后写回，另一个进程直接读共享层，不再调用自己的 loader
+    first, second = _shared_pair(tmp_path)
+    first.set_loader('history', loader)
+    second.set_loader('history', loader)
+    calls.clear()
+    assert first.load('history', 'c2') == [{'role': 'user', 'content': 'c2'}]
+    assert second.load('history', 'c2') == [{'role': 'user', 'content': 'c2'}]
+    assert calls == ['c2']
+    assert second.get_stats()['shared_hits'] == 1
+
+
+def test_write_from_child_process_invalidates_cache(tmp_path):
+    path = str(tmp_path / 'state.db')
+    store = ConversationStore(SQLiteBackend(path))
+    store.save('wechat', 'openid', {'turns': 1})
+    assert store.load('wechat', 'openid') == {'turns': 1}
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = (
+        'from conversation_store import ConversationStore, SQLiteBackend\n'
+        f'store = ConversationStore(SQLiteBackend({path!r}))\n'
+        'state = store.load("wechat", "openid")\n'
+        'state["turns"] += 1\n'
+        'store.save("wechat", "openid", state)\n'
+    )
+    subprocess.run([sys.executable, '-c', code], cwd=root, check=True, timeout=60)
+
+    assert store.load('wechat', 'openid') == {'turns': 2}
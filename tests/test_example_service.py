@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""示例服务：NDJSON 流式仿真经运行时执行，逐块推送部分结果"""
+
+import json
+
+import pytest
+
+from mcp_services import example_service
+
+
+@pytest.fixture(scope='module')
+def client():
+    yield example_service.app.test_client()
+    example_service.runtime.shutdown()
+
+
+def test_stream_runs_in_runtime_and_sends_every_block(client):
+    response = client.post(
+        '/execute',
+        json={'stream': True, 'params': {'flow_rate': 120, 'duration': 3600}},
+        headers={'Accept': 'application/x-ndjson'}
+    )
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert [e['type'] for e in events] == ['progress'] * example_service.STREAM_BLOCKS + ['result']
+    levels = [v for e in events[:-1] for v in e['partial']['time_series']['water_level']]
+    assert len(levels) == example_service.TIME_STEPS
+    assert events[-1]['data']['status'] == 'success'
+    assert events[-1]['data']['data']['summary']['max_water_level'] == pytest.approx(max(levels))
+    assert example_service.runtime.get_metrics()['completed'] >= 1
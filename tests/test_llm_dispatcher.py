@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""大模型调用调度：优先级放行顺序、429 整体冷却、协程取消归还名额、batch 预留额度"""
+
+import time
+import asyncio
+import threading
+
+import pytest
+
+import llm_dispatcher
+from llm_dispatcher import LLMDispatcher
+from rate_limiter import ModelRateLimiter, RateLimitTimeout
+
+
+def _dispatcher(max_in_flight=8, tpm=600000.0):
+    return LLMDispatcher(ModelRateLimiter(qps=1000.0, tpm=tpm), max_in_flight=max_in_flight)
+
+
+def _wait_queued(dispatcher, count, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        priorities = dispatcher.get_stats()['priorities']
+        if sum(p['queued'] for p in priorities.values()) == count:
+            return
+        time.sleep(0.005)
+    raise AssertionError(f'排队数未达到 {count}')
+
+
+def test_interactive_admitted_before_queued_wechat_and_batch():
+    dispatcher = _dispatcher(max_in_flight=1)
+    held = dispatcher.acquire(priority='interactive')
+    order = []
+
+    def call(priority):
+        ticket = dispatcher.acquire(priority=priority, timeout=5)
+        order.append(priority)
+        ticket.release()
+
+    threads = []
+    # 低优先级先到，交互请求最后到
+    for count, priority in enumerate(('batch', 'wechat', 'wechat', 'interactive'), start=1):
+        threads.append(threading.Thread(target=call, args=(priority,)))
+        threads[-1].start()
+        _wait_queued(dispatcher, count)
+
+    held.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ['interactive', 'wechat', 'wechat', 'batch']
+    assert dispatcher.get_stats()['in_flight'] == 0
+
+
+def test_throttle_pauses_all_waiters_and_doubles_without_retry_after(monkeypatch):
+    monkeypatch.setattr(llm_dispatcher, 'COOLDOWN_BASE', 0.1)
+    dispatcher = _dispatcher()
+
+    first = dispatcher.acquire()
+    first.throttle()
+    paused = dispatcher.get_stats()['paused_seconds']
+    assert 0.05 < paused <= 0.1
+
+    # 冷却期间所有排队请求一起等待，冷却结束后才放行
+    started = time.monotonic()
+    admitted = []
+
+    def call(priority):
+        ticket = dispatcher.acquire(priority=priority)
+        admitted.append((priority, time.monotonic() - started, ticket))
+
+    threads = [threading.Thread(target=call, args=(p,)) for p in ('interactive', 'wechat', 'batch')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(admitted) == 3
+    assert all(waited >= paused - 0.02 for _, waited, _ in admitted)
+
+    # 冷却结束后仍然 429：翻倍到 0.2 秒
+    second, third, fourth = (ticket for _, _, ticket in admitted)
+    second.throttle()
+    assert 0.15 < dispatcher.get_stats()['paused_seconds'] <= 0.2
+    # 冷却期间陆续返回的 429 来自之前发出的请求，不再翻倍
+    third.throttle()
+    assert dispatcher.get_stats()['paused_seconds'] <= 0.2
+    time.sleep(0.25)
+    fourth.throttle()
+    assert 0.3 < dispatcher.get_stats()['paused_seconds'] <= 0.4
+    # 有 Retry-After 时按服务端要求
+    first.throttle(retry_after=1.5)
+    assert 1.4 < dispatcher.get_stats()['paused_seconds'] <= 1.5
+    assert dispatcher.get_stats()['throttled'] == 5
+
+    # 一次正常完成的调用清零连续次数
+    for ticket in (first, second, third, fourth):
+        ticket.release()
+    dispatcher._paused_until = 0.0
+    ok = dispatcher.acquire()
+    ok.release()
+    dispatcher.acquire().throttle()
+    assert dispatcher.get_stats()['paused_seconds'] <= 0.1
+
+
+def test_cancelled_acquire_async_returns_the_slot():
+    dispatcher = _dispatcher(max_in_flight=1)
+    held = dispatcher.acquire()
+
+    async def abandon():
+        task = asyncio.ensure_future(dispatcher.acquire_async(priority='wechat', timeout=5))
+        while dispatcher.get_stats()['priorities']['wechat']['queued'] == 0:
+            await asyncio.sleep(0.005)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    # 事件循环随调用方一起结束（客户端断开后的私有循环）；排队线程立即出队，不等到排队超时
+    started = time.monotonic()
+    asyncio.run(abandon())
+    assert time.monotonic() - started < 1.0
+    _wait_queued(dispatcher, 0, timeout=0.5)
+    held.release()
+
+    ticket = dispatcher.acquire(timeout=1)
+    assert dispatcher.get_stats()['in_flight'] == 1
+    ticket.release()
+    assert dispatcher.get_stats()['in_flight'] == 0
+
+
+def test_batch_keeps_token_reserve_for_interactive():
+    # token 桶 1000：batch 取额度后至少留 20%（200）
+    dispatcher = _dispatcher(tpm=1000.0)
+    dispatcher.acquire(estimated_tokens=750).release()
+
+    with pytest.raises(RateLimitTimeout):
+        dispatcher.acquire(estimated_tokens=100, priority='batch', timeout=0.1)
+    interactive = dispatcher.acquire(estimated_tokens=100, priority='interactive', timeout=0.1)
+    interactive.release()
+
+    stats = dispatcher.get_stats()
+    assert stats['priorities']['batch']['timeouts'] == 1
+    assert stats['budget']['available_tokens'] < 200
+    # 余额补回到预留量以上后 batch 可以发出
+    dispatcher.settle(900, 0)
+    dispatcher.acquire(estimated_tokens=100, priority='batch', timeout=0.1).release()
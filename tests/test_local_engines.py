@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""本地计算引擎在进程池中执行：进度转为事件，调用方关闭时取消任务并归还执行许可"""
+
+import time
+
+import pytest
+
+import mcp_manager_enhanced
+from mcp_manager_enhanced import MCPServiceManager
+from mcp_registry import MCPServiceRegistry
+from qwen_client_enhanced import iterate_sync
+
+
+def steps(arguments, progress):
+    """按步推送进度，每步耗时 arguments['delay'] 秒"""
+    for i in range(arguments['steps']):
+        time.sleep(arguments['delay'])
+        progress({'progress': 100.0 * (i + 1) / arguments['steps'], 'message': f'第{i + 1}步'})
+    return {'status': 'success', 'steps': arguments['steps']}
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(mcp_manager_enhanced, 'LOCAL_ENGINES', {'simulation': (__name__, 'steps')})
+    monkeypatch.setattr(mcp_manager_enhanced, 'LOCAL_ENGINE_WORKERS', 1)
+    manager = MCPServiceManager(MCPServiceRegistry(services_dir=str(tmp_path), poll_interval=0))
+    yield manager
+    if manager._local_runtime is not None:
+        manager._local_runtime.shutdown()
+
+
+def test_local_engine_streams_progress_then_result(manager):
+    events = list(iterate_sync(manager.call_tool_stream('simulation', {'steps': 3, 'delay': 0.01}, tenant_id='t1')))
+
+    assert [e['event'] for e in events] == ['progress'] * 3 + ['result']
+    assert events[-1]['result'] == {'status': 'success', 'steps': 3}
+
+
+def test_closing_stream_cancels_engine_and_releases_admission(manager):
+    events = iterate_sync(manager.call_tool_stream('simulation', {'steps': 1000, 'delay': 0.05}, tenant_id='t1'))
+    assert next(events)['event'] == 'progress'
+    assert manager.admission._tenant_running == {'t1': 1}
+
+    events.close()
+
+    assert manager.admission._tenant_running == {'t1': 0}
+    runtime = manager._local_runtime
+    deadline = time.monotonic() + 10
+    while runtime.get_metrics()['cancelled'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert runtime.get_metrics()['cancelled'] == 1
+
+
+def test_timeout_cancels_engine(manager):
+    with pytest.raises(Exception, match='超时'):
+        list(iterate_sync(manager.call_tool_stream('simulation', {'steps': 1000, 'delay': 0.05}, timeout=1)))
+
+    runtime = manager._local_runtime
+    deadline = time.monotonic() + 10
+    while runtime.get_metrics()['cancelled'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert runtime.get_metrics()['cancelled'] == 1
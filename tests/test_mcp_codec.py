@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""列式数组编码的往返精度"""
+
+import numpy as np
+import pytest
+
+import mcp_codec
+
+
+def _round_trip(obj, **kwargs):
+    body, headers = mcp_codec.encode_body(
+        obj, accept=mcp_codec.JSON_TYPE, array_encoding=mcp_codec.ARRAY_ENCODING, **kwargs
+    )
+    return mcp_codec.decode_body(body, headers['Content-Type'], headers.get('Content-Encoding'))
+
+
+def test_large_integers_round_trip_exactly():
+    ids = list(range(16777215, 16777215 + 100))
+    stamps = [1700000000123 + 1000 * i for i in range(100)]
+    decoded = _round_trip({'ids': ids, 'timestamps': stamps})
+
+    assert decoded['ids'].dtype == np.int64
+    assert decoded['ids'].tolist() == ids
+    assert decoded['timestamps'].tolist() == stamps
+
+
+def test_floats_default_to_float64():
+    values = [0.1 * i + 1e-9 for i in range(100)]
+    decoded = _round_trip({'water_level': values})
+
+    assert decoded['water_level'].dtype == np.float64
+    assert decoded['water_level'].tolist() == values
+
+
+def test_float32_is_per_field_opt_in():
+    values = [0.1 * i for i in range(100)]
+    decoded = _round_trip({'water_level': values, 'flow': values}, float32_fields={'water_level'})
+
+    assert decoded['water_level'].dtype == np.float32
+    assert decoded['flow'].dtype == np.float64
+    assert decoded['flow'].tolist() == values
+
+
+@pytest.mark.parametrize('odd', ['n/a', None, True, 2 ** 70])
+def test_lists_with_non_numeric_elements_stay_lists(odd):
+    values = [float(i) for i in range(100)]
+    values[50] = odd
+    decoded = _round_trip({'values': values})
+
+    assert decoded['values'] == values
+
+
+def test_short_lists_are_not_packed():
+    assert mcp_codec.pack_arrays({'values': [1, 2, 3]}) == {'values': [1, 2, 3]}
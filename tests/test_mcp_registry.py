@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""服务注册中心：服务名和租户ID校验（拼进清单文件名之前）"""
+
+import pytest
+
+from mcp_registry import MCPServiceRegistry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return MCPServiceRegistry(services_dir=str(tmp_path / 'services'), poll_interval=0, builtin_dir=None)
+
+
+@pytest.mark.parametrize('spec', [
+    {'name': '../evil', 'url': 'http://x'},
+    {'name': 'a/b', 'url': 'http://x'},
+    {'name': 'ok', 'url': 'http://x', 'tenant_id': '../../etc'},
+    {'name': 'ok\n', 'url': 'http://x'},
+])
+@pytest.mark.parametrize('persist', [True, False])
+def test_invalid_identifiers_rejected_before_writing(registry, tmp_path, spec, persist):
+    with pytest.raises(ValueError):
+        registry.register(spec, persist=persist)
+
+    assert not (tmp_path / 'services').exists()
+    assert registry.get('ok', spec.get('tenant_id')) is None
+
+
+def test_valid_tenant_service_is_written(registry, tmp_path):
+    tenant_id = '3f2b6c1e-8d4a-4c2e-9a7b-1d2e3f4a5b6c'
+    service = registry.register({'name': 'pump_sim-2', 'url': 'http://x', 'tenant_id': tenant_id})
+
+    assert service['tenant_id'] == tenant_id
+    assert (tmp_path / 'services' / f'{tenant_id}__pump_sim-2.json').exists()
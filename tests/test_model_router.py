@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""回答质量判定（是否升级到更高档模型）"""
+
+import pytest
+
+from model_router import ModelRouter
+
+
+@pytest.mark.parametrize('content', [
+    '参数不确定性分析通常采用GLUE方法，步骤如下',
+    '好的，但我无法保证精度，下面给出估算结果',
+    '是的',
+    '42 m³/s',
+])
+def test_normal_answers_do_not_escalate(content):
+    assert not ModelRouter.needs_escalation(content, 'stop')
+
+
+@pytest.mark.parametrize('content, finish_reason', [
+    ('抱歉，我无法访问实时监测数据', 'stop'),
+    ('对不起，这个问题我不能回答', 'stop'),
+    ('', 'stop'),
+    ('是的', None),
+    ('水库调度方案如下：一、' * 20, 'length'),
+])
+def test_poor_answers_escalate(content, finish_reason):
+    assert ModelRouter.needs_escalation(content, finish_reason)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""水库调度：小规模 SDP 与逐状态穷举的 Bellman 方程一致，下泄不越界"""
+
+import numpy as np
+import pytest
+
+from mcp_services.reservoir import model
+from mcp_services.reservoir.engine import optimize_operation
+from mcp_services.reservoir.inflow import InflowModel, MONTHS
+from mcp_services.reservoir.model import OperationPolicy, Reservoir, reservoir_config, monthly_demand
+
+# 汛限库容取总库容，月末上限正好落在网格上，穷举时直接按网格插值
+TINY = {'flood_limit': 1200.0}
+
+
+@pytest.fixture(scope='module')
+def tiny_policy():
+    reservoir = Reservoir(reservoir_config(TINY), monthly_demand(None))
+    return OperationPolicy(
+        reservoir, InflowModel.from_arguments(None), 'balanced',
+        storage_levels=10, inflow_classes=2, release_levels=5, max_years=50
+    ).solve()
+
+
+def _brute_force(policy, following):
+    """从给定的下一年初值函数出发，逐状态、逐下泄穷举一年的 Bellman 递推"""
+    reservoir, storage = policy.reservoir, policy.storage
+    values = np.empty((MONTHS,) + following.shape)
+    outflows = np.empty((MONTHS,) + following.shape)
+    unique = np.ones((MONTHS,) + following.shape, dtype=bool)
+    for m in range(MONTHS - 1, -1, -1):
+        expected = following @ policy.transitions[m].T
+        for i, s in enumerate(storage):
+            for q, flow in enumerate(policy.flows[m]):
+                totals, outs = [], []
+                for release in policy.releases:
+                    result = reservoir.step(m, np.float64(s), np.float64(flow), np.float64(release))
+                    future = np.interp(result['storage'], storage, expected[:, q])
+                    totals.append(float(reservoir.reward(m, result, policy.weights)) + future)
+                    outs.append(float(result['release'] + result['spill']))
+                totals = np.array(totals)
+                best = int(totals.argmax())
+                values[m, i, q] = totals[best]
+                outflows[m, i, q] = outs[best]
+                # 并列最优（如满库时不同下泄都弃水到同一库容）时不比较具体出库
+                unique[m, i, q] = (np.sort(totals)[-2] < totals[best] - 1e-3 * abs(totals[best]) - 1.0)
+        following = values[m]
+    return values, outflows, unique
+
+
+def test_tiny_sdp_matches_brute_force_bellman(tiny_policy):
+    assert tiny_policy.converged
+    values, outflows, unique = _brute_force(tiny_policy, tiny_policy.values[0])
+
+    # 收敛后再递推一年，各状态的值只整体增加一个年平均收益
+    shift = values - tiny_policy.values
+    scale = tiny_policy.reservoir.config['installed_capacity'] * model.HOURS_PER_MONTH
+    assert np.ptp(shift) < 1e-2 * scale
+    assert shift.mean() == pytest.approx(tiny_policy.gain, rel=1e-2)
+    assert unique.any()
+    np.testing.assert_allclose(tiny_policy.policy[unique], outflows[unique], rtol=1e-5, atol=1e-3)
+
+
+def test_policy_releases_stay_within_bounds(tiny_policy):
+    reservoir = tiny_policy.reservoir
+    low, top = tiny_policy.releases[0], tiny_policy.releases[-1]
+    assert tiny_policy.planned.min() >= low and tiny_policy.planned.max() <= top
+
+    # 连续入流模拟：相邻网格点一个满库弃水、一个不弃水时，插值的下泄也不能超过上限
+    simulated = tiny_policy.simulate(0, 600.0, 0.0, years=5, traces=200, seed=3)
+    release, storage = simulated['release'], simulated['storage']
+    assert (release >= low - 1e-9).all() and (release <= top + 1e-9).all()
+    assert (storage >= reservoir.dead_storage - 1e-6).all()
+    assert (storage <= reservoir.upper[simulated['months']][:, None] + 1e-6).all()
+    # 超过下泄上限的出库只能来自满库弃水
+    excess = release + simulated['spill'] > top + 1e-6
+    np.testing.assert_allclose(storage[excess], reservoir.upper[simulated['months']][:, None].repeat(200, 1)[excess])
+
+    result = optimize_operation({
+        'reservoir': TINY, 'storage_levels': 10, 'inflow_classes': 2, 'release_levels': 5,
+        'current_month': 4, 'current_storage': 600.0, 'simulation_years': 2, 'seed': 1
+    })['results']
+    first, last = result['recommendation']['release_range']
+    assert low <= first <= result['recommendation']['release'] <= last <= top
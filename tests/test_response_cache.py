@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""回复缓存的语义匹配不应串答"""
+
+import pytest
+
+from response_cache import ResponseCache
+
+
+def _cache_with(question):
+    cache = ResponseCache(semantic=True)
+    cache.put(cache.make_key('qwen-plus', 'sys', [], question, tenant_id='t1'), '缓存的回答')
+    return cache
+
+
+def _lookup(cache, question):
+    return cache.get(cache.make_key('qwen-plus', 'sys', [], question, tenant_id='t1'))
+
+
+@pytest.mark.parametrize('cached, asked', [
+    ('水库这个月该放多少水', '水库下个月该放多少水'),
+    ('什么是MPC控制?', 'MPC控制是什么'),
+    ('2号闸门开度多少', '3号闸门开度多少'),
+    ('MPC和PID的区别', 'LQR和PID的区别'),
+])
+def test_different_questions_miss(cached, asked):
+    assert _lookup(_cache_with(cached), asked) is None
+
+
+def test_near_identical_question_hits():
+    hit = _lookup(_cache_with('什么是MPC控制？'), '什么是MPC控制啊')
+    assert hit is not None and hit['match'] == 'semantic'
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""进程池运行时：结束前的进度事件不丢失，提交后立即取消不出错"""
+
+from mcp_services.runtime import ServiceRuntime
+
+
+def burst(arguments, progress):
+    """快速连发部分结果后立即返回（最后几条进度很可能晚于完成回调到达）"""
+    for i in range(arguments['count']):
+        progress({'progress': 100.0 * (i + 1) / arguments['count'], 'partial': {'offset': i, 'values': [i]}})
+    return {'count': arguments['count']}
+
+
+def test_iter_events_delivers_every_partial_before_result():
+    runtime = ServiceRuntime({'burst': f'{__name__}:burst'}, max_workers=1, start_method='spawn')
+    try:
+        for _ in range(5):
+            task_id = runtime.submit('burst', {'count': 10})['task_id']
+            events = list(runtime.iter_events(task_id, timeout=30))
+
+            assert [e['type'] for e in events] == ['progress'] * 10 + ['result']
+            assert [e['partial']['offset'] for e in events[:-1]] == list(range(10))
+    finally:
+        runtime.shutdown()
+
+
+def test_cancel_right_after_submit():
+    runtime = ServiceRuntime({'burst': f'{__name__}:burst'}, max_workers=1, start_method='spawn')
+    try:
+        task_id = runtime.submit('burst', {'count': 3})['task_id']
+        runtime.cancel(task_id)
+        events = list(runtime.iter_events(task_id, timeout=30))
+        assert events[-1]['type'] == 'result'
+    finally:
+        runtime.shutdown()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""有压管网GGA求解器和延时模拟"""
+
+import numpy as np
+import pytest
+
+from mcp_services.simulation import PipeNetwork, GGASolver, ExtendedPeriodSimulation, build_default_network, run_simulation
+
+
+def _single_pipe(headloss='H-W', roughness=120.0):
+    return PipeNetwork.from_config({
+        'headloss': headloss,
+        'nodes': [
+            {'id': 'R1', 'type': 'reservoir', 'head': 50.0},
+            {'id': 'J1', 'type': 'junction', 'elevation': 0.0, 'demand': 180.0}
+        ],
+        'pipes': [{'id': 'P1', 'from': 'R1', 'to': 'J1', 'length': 1000.0, 'diameter': 0.3, 'roughness': roughness}]
+    })
+
+
+def _looped_network(headloss):
+    """两个环、一座水库和一个水池"""
+    return PipeNetwork.from_config({
+        'headloss': headloss,
+        'nodes': [
+            {'id': 'R1', 'type': 'reservoir', 'head': 60.0},
+            {'id': 'T1', 'type': 'tank', 'elevation': 40.0, 'init_level': 3.0, 'min_level': 0.5, 'max_level': 6.0, 'diameter': 15.0},
+            {'id': 'J1', 'elevation': 5.0, 'demand': 60.0},
+            {'id': 'J2', 'elevation': 6.0, 'demand': 80.0, 'pattern': 'res'},
+            {'id': 'J3', 'elevation': 4.0, 'demand': 50.0, 'pattern': 'res'},
+            {'id': 'J4', 'elevation': 7.0, 'demand': 70.0}
+        ],
+        'pipes': [
+            {'from': 'R1', 'to': 'J1', 'length': 800, 'diameter': 0.4},
+            {'from': 'J1', 'to': 'J2', 'length': 500, 'diameter': 0.25},
+            {'from': 'J1', 'to': 'J3', 'length': 600, 'diameter': 0.25},
+            {'from': 'J2', 'to': 'J4', 'length': 500, 'diameter': 0.2},
+            {'from': 'J3', 'to': 'J4', 'length': 600, 'diameter': 0.2},
+            {'from': 'J2', 'to': 'J3', 'length': 400, 'diameter': 0.15},
+            {'from': 'T1', 'to': 'J4', 'length': 300, 'diameter': 0.2}
+        ],
+        'patterns': {'res': [0.6, 0.8, 1.2, 1.4, 1.0, 0.9]}
+    })
+
+
+def _check_mass_balance(solver, demands, flows):
+    # 每个未知水头节点：流入 - 流出 = 需求
+    np.testing.assert_allclose(solver.A21 @ flows, demands, atol=1e-9)
+    # 水源出流之和等于总需求
+    assert -solver.fixed_node_inflows(flows).sum() == pytest.approx(demands.sum(), rel=1e-9)
+
+
+def test_single_pipe_hazen_williams_matches_analytic_headloss():
+    network = _single_pipe()
+    solver = GGASolver(network, accuracy=1e-8)
+    demand = 180.0 / 3600.0
+    state = solver.solve(np.array([demand]), network.fixed_elevations)
+
+    expected = 10.667 * 1000.0 * demand ** 1.852 / (120.0 ** 1.852 * 0.3 ** 4.871)
+    assert state['converged']
+    assert state['flows'][0] == pytest.approx(demand, rel=1e-9)
+    assert 50.0 - state['heads'][0] == pytest.approx(expected, rel=1e-6)
+
+
+def test_default_grid_conserves_mass():
+    network = build_default_network()
+    solver = GGASolver(network, accuracy=1e-6)
+    demands = network.demands_at(8) / 3600.0
+    state = solver.solve(demands, network.fixed_elevations)
+
+    assert state['converged']
+    _check_mass_balance(solver, demands, state['flows'])
+    # 水头沿管道流向降低：水头损失与水头差一致
+    h, _ = solver.headloss(state['flows'])
+    heads = np.r_[state['heads'], network.fixed_elevations]
+    np.testing.assert_allclose(heads[network.pipe_from] - heads[network.pipe_to], h, atol=1e-3)
+
+
+@pytest.mark.parametrize('headloss', ['D-W', 'H-W'])
+def test_looped_network_converges(headloss):
+    network = _looped_network(headloss)
+    solver = GGASolver(network, accuracy=1e-6)
+    demands = network.demands_at(3) / 3600.0
+    state = solver.solve(demands, network.fixed_elevations + network.tank_init_level * network.tank_mask)
+
+    assert state['converged']
+    assert state['iterations'] < solver.max_iterations
+    _check_mass_balance(solver, demands, state['flows'])
+
+
+def test_darcy_weisbach_single_pipe_uses_swamee_jain():
+    network = _single_pipe('D-W', roughness=0.1)
+    solver = GGASolver(network, accuracy=1e-10)
+    demand = 180.0 / 3600.0
+    state = solver.solve(np.array([demand]), network.fixed_elevations)
+
+    d, area = 0.3, np.pi * 0.3 ** 2 / 4
+    reynolds = demand / area * d / 1.004e-6
+    friction = 0.25 / np.log10(0.1e-3 / d / 3.7 + 5.74 / reynolds ** 0.9) ** 2
+    expected = friction * 1000.0 / d * (demand / area) ** 2 / (2 * 9.81)
+    assert state['converged']
+    assert 50.0 - state['heads'][0] == pytest.approx(expected, rel=1e-6)
+
+
+def test_extended_period_simulation_over_a_week():
+    network = _looped_network('H-W')
+    updates = []
+    results = ExtendedPeriodSimulation(network, duration=168).run(updates.append)
+
+    assert len(results['hours']) == 169
+    assert results['converged'].all()
+    # 热启动后每个时段只需少量迭代
+    assert results['iterations'][1:].max() <= 5
+    tank = network.tank_mask
+    assert (results['tank_levels'][:, tank] >= 0.5 - 1e-9).all()
+    assert (results['tank_levels'][:, tank] <= 6.0 + 1e-9).all()
+    assert updates[-1]['progress'] == 100.0
+    assert sum(len(u['partial']['time_series']['hour']) for u in updates) == 169
+
+
+def test_run_simulation_default_network_week():
+    result = run_simulation({'boundary_conditions': {'inflow': 150, 'pressure': 0.5}, 'duration': 168})
+
+    assert result['status'] == 'success'
+    assert len(result['results']['time_series']) == 169
+    assert not any('未收敛' in w for w in result['results']['warnings'])
+    # 无水池时入流等于同时刻总需求；日变化系数归一化后一周平均需求等于设定入流
+    network = build_default_network(inflow=150)
+    demand = [network.demands_at(hour).sum() for hour in range(169)]
+    for point, expected in zip(result['results']['time_series'], demand):
+        assert point['flow'] == pytest.approx(expected, abs=0.01)
+    assert np.mean(demand[:168]) == pytest.approx(150.0)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""性能测试：固定种子可复现，小概率估计与解析解一致"""
+
+import math
+
+import numpy as np
+import pytest
+
+from mcp_services.testing import montecarlo
+from mcp_services.testing.engine import run_testing
+from mcp_services.testing.system import station_config
+
+MISSION_HOURS = 500.0
+
+
+def _reliability(components, seed=11, trials=40000):
+    return run_testing({
+        'test_type': 'reliability',
+        'test_duration': MISSION_HOURS,
+        'components': components,
+        'trials': trials,
+        'precision': 0,
+        'seed': seed
+    })
+
+
+def test_fixed_seed_reproduces_reliability_numbers():
+    first = _reliability(None)
+    second = _reliability(None)
+
+    assert first['solver']['seed'] == second['solver']['seed'] == 11
+    for key in ('performance_metrics', 'confidence_intervals', 'component_analysis'):
+        assert first['results'][key] == second['results'][key]
+    assert _reliability(None, seed=12)['results']['performance_metrics'] != first['results']['performance_metrics']
+
+
+def test_ensemble_does_not_depend_on_worker_count():
+    config = station_config({}, MISSION_HOURS, 'reliability')
+    serial, _ = montecarlo.run_ensemble(
+        'reliability', config, 40000, converged=lambda s: False, seed=5, batch_size=10000, workers=1
+    )
+    parallel, info = montecarlo.run_ensemble(
+        'reliability', config, 40000, converged=lambda s: False, seed=5, batch_size=10000, workers=2
+    )
+
+    assert info['batches'] == 4
+    for key, value in serial.items():
+        np.testing.assert_array_equal(parallel[key], value)
+
+
+def _k_out_of_n(p: float, n: int, k: int) -> float:
+    return sum(math.comb(n, i) * p ** i * (1 - p) ** (n - i) for i in range(k, n + 1))
+
+
+@pytest.mark.parametrize('components, expected', [
+    # 两个指数寿命部件串联：R = exp(-t/m1 - t/m2)
+    (
+        [{'name': 'A', 'count': 1, 'mtbf': 2000.0, 'mttr': 10.0},
+         {'name': 'B', 'count': 1, 'mtbf': 1000.0, 'mttr': 10.0}],
+        math.exp(-MISSION_HOURS / 2000.0 - MISSION_HOURS / 1000.0)
+    ),
+    # 3 取 2、任务期内不可修：R = 3p² - 2p³
+    (
+        [{'name': '水泵', 'count': 3, 'required': 2, 'mtbf': 800.0, 'mttr': 1e9}],
+        _k_out_of_n(math.exp(-MISSION_HOURS / 800.0), 3, 2)
+    )
+])
+def test_reliability_estimate_matches_closed_form(components, expected):
+    result = _reliability(components)['results']
+    low, high = result['confidence_intervals']['reliability']
+
+    assert low <= expected <= high
+    assert high - low < 0.02
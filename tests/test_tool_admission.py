@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""工具调用准入控制：租户间公平排队、套餐权重、排队中取消、空闲租户状态清除"""
+
+import asyncio
+
+from tool_admission import ToolAdmissionController
+
+# 不限租户并发和排队深度，权重相同：放行顺序只由公平队列决定
+EQUAL_PLANS = {
+    'free': {'tool_concurrency': -1, 'tool_queue_depth': -1, 'tool_queue_weight': 1}
+}
+
+
+async def _wait_queued(controller, count):
+    for _ in range(500):
+        if controller._queued == count:
+            return
+        await asyncio.sleep(0.002)
+    raise AssertionError(f'排队数未达到 {count}')
+
+
+async def _run_queued(controller, requests):
+    """
+    用一个占住后端的请求把 requests 里的 (租户, 套餐) 依次排进队列，
+    释放后按放行顺序返回租户列表
+    """
+    order = []
+    hold = asyncio.Event()
+
+    async def holder():
+        async with controller.admit('holder', 'free'):
+            await hold.wait()
+
+    async def call(tenant_id, plan):
+        async with controller.admit(tenant_id, plan):
+            order.append(tenant_id)
+            await asyncio.sleep(0)
+
+    holding = asyncio.create_task(holder())
+    await asyncio.sleep(0)
+    tasks = []
+    for i, (tenant_id, plan) in enumerate(requests):
+        tasks.append(asyncio.create_task(call(tenant_id, plan)))
+        await _wait_queued(controller, i + 1)
+
+    hold.set()
+    await asyncio.gather(holding, *tasks)
+    return order
+
+
+def test_tenants_with_equal_weight_alternate():
+    controller = ToolAdmissionController(default_backend_limit=1, plan_limits=EQUAL_PLANS)
+    # A 先排入4个请求，B 后排入2个：B 不必等 A 的请求全部执行完
+    requests = [('a', 'free')] * 4 + [('b', 'free')] * 2
+    order = asyncio.run(_run_queued(controller, requests))
+
+    assert order == ['a', 'b', 'a', 'b', 'a', 'a']
+
+
+def test_plan_weight_sets_share_of_grants():
+    controller = ToolAdmissionController(default_backend_limit=1)
+    # free 权重1、pro 权重4：两个租户都有积压时，pro 获得4倍的放行次数
+    requests = [('f', 'free')] * 5 + [('p', 'pro')] * 10
+    order = asyncio.run(_run_queued(controller, requests))
+
+    assert order[:10].count('p') == 8
+    assert order[:10].count('f') == 2
+    assert sorted(order) == sorted(tenant for tenant, _ in requests)
+
+
+def test_cancel_while_queued_frees_queue_slot():
+    controller = ToolAdmissionController(default_backend_limit=1, plan_limits=EQUAL_PLANS)
+
+    async def scenario():
+        granted = []
+        hold = asyncio.Event()
+
+        async def holder():
+            async with controller.admit('holder', 'free'):
+                await hold.wait()
+
+        async def call(tenant_id):
+            async with controller.admit(tenant_id, 'free'):
+                granted.append(tenant_id)
+
+        holding = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(call('t1'))
+        await _wait_queued(controller, 1)
+
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert controller._queued == 0
+        assert controller._tenant_queued['t1'] == 0
+        assert controller._tenant_running.get('t1', 0) == 0
+
+        # 释放后端后被取消的请求不会获得许可，后续请求正常放行
+        hold.set()
+        await holding
+        await asyncio.wait_for(call('t2'), 1.0)
+        return granted
+
+    assert asyncio.run(scenario()) == ['t2']
+    assert controller.get_metrics()['backends']['local']['running'] == 0
+
+
+def test_idle_tenant_state_expires():
+    controller = ToolAdmissionController(tenant_idle_ttl=0.0)
+
+    async def scenario():
+        async with controller.admit('idle', 'free'):
+            pass
+        async with controller.admit('active', 'free'):
+            pass
+
+    asyncio.run(scenario())
+
+    for state in (controller._tenant_limit, controller._tenant_running, controller._tenant_stats):
+        assert 'idle' not in state
+    assert not any(flow[0] == 'idle' for flow in controller._last_finish)
+    assert 'active' in controller._tenant_limit
+
+
+def test_tracked_tenants_bounded_but_busy_tenant_kept():
+    controller = ToolAdmissionController(max_tenants=3)
+
+    async def scenario():
+        async with controller.admit('busy', 'pro'):
+            for i in range(10):
+                async with controller.admit(f't{i}', 'free'):
+                    pass
+            assert 'busy' in controller._tenant_limit
+            assert controller._tenant_running['busy'] == 1
+
+    asyncio.run(scenario())
+
+    assert len(controller._tenant_seen) <= 3
+    assert len(controller._tenant_stats) <= 4
+    assert 't0' not in controller._tenant_stats
+    assert 't9' in controller._tenant_stats
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+MCP工具调用准入控制
+按租户/套餐加权公平排队，按后端限制并发，队列满时快速拒绝
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from collections import deque, OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Any
+
+from plans import PLAN_LIMITS
+
+logger = logging.getLogger(__name__)
+
+
+# 交互式对话优先于批量任务（在套餐权重基础上再乘以该系数）
+PRIORITY_WEIGHTS = {
+    'interactive': 4.0,
+    'batch': 1.0
+}
+
+
+class ToolAdmissionRejected(Exception):
+    """工具调用被准入控制拒绝（队列已满或排队超时）"""
+
+    def __init__(self, message: str, reason: str = 'queue_full'):
+        super().__init__(message)
+        self.reason = reason
+
+
+class _Waiter:
+    """排队中的一次工具调用"""
+
+    __slots__ = ('tenant_id', 'flow', 'backend', 'tag', 'enqueued_at',
+                 'loop', 'future', 'granted')
+
+    def __init__(self, tenant_id: str, flow: tuple, backend: str, tag: float):
+        self.tenant_id = tenant_id
+        self.flow = flow
+        self.backend = backend
+        self.tag = tag
+        self.enqueued_at = time.monotonic()
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.granted = False
+
+
+class ToolAdmissionController:
+    """
+    工具调用准入控制器
+
+    - 加权公平队列：每个 (租户, 优先级) 是一条流，按开始时间公平排队（SFQ），
+      权重 = 套餐 tool_queue_weight × 优先级系数
+    - 租户并发上限：套餐 tool_concurrency
+    - 后端并发上限：每个后端（HydroSIS、远程服务URL、本地计算）一个计数信号量
+    - 队列深度：套餐 tool_queue_depth 和全局上限，超出立即拒绝
+    - 租户状态（并发上限、公平队列标签、指标）在租户空闲超过 tenant_idle_ttl 秒后清除，
+      空闲租户数超过 max_tenants 时按最久未活动先清除
+
+    Flask为每个请求新建事件循环，因此内部状态用线程锁保护，
+    唤醒时通过 call_soon_threadsafe 投递到等待者自己的事件循环。
+    """
+
+    def __init__(
+        self,
+        backend_limits: Dict[str, int] = None,
+        default_backend_limit: int = 8,
+        max_queue_depth: int = 200,
+        queue_timeout: float = 30.0,
+        plan_limits: Dict[str, Dict] = None,
+        tenant_idle_ttl: float = 3600.0,
+        max_tenants: int = 10000
+    ):
+        """
+        Args:
+            backend_limits: 指定后端的并发上限 {backend: limit}
+            default_backend_limit: 其他后端的默认并发上限
+            max_queue_depth: 全局排队上限
+            queue_timeout: 最长排队时间（秒）
+            plan_limits: 套餐限制表（默认使用 plans.PLAN_LIMITS）
+            tenant_idle_ttl: 空闲租户的状态保留时长（秒）
+            max_tenants: 最多保留状态的租户数（正在执行或排队的租户不计入清除）
+        """
+        self.backend_limits = backend_limits or {}
+        self.default_backend_limit = default_backend_limit
+        self.max_queue_depth = max_queue_depth
+        self.queue_timeout = queue_timeout
+        self.plan_limits = plan_limits or PLAN_LIMITS
+        self.tenant_idle_ttl = tenant_idle_ttl
+        self.max_tenants = max(1, max_tenants)
+
+        self._lock = threading.Lock()
+        self._flows: Dict[tuple, deque] = {}
+        self._last_finish: Dict[tuple, float] = {}
+        self._virtual_time = 0.0
+        self._queued = 0
+        self._tenant_queued: Dict[str, int] = {}
+        self._tenant_running: Dict[str, int] = {}
+        self._tenant_limit: Dict[str, int] = {}
+        self._backend_running: Dict[str, int] = {}
+        # 租户最近活动时间（按活动先后排列）和用过的优先级（公平队列的流）
+        self._tenant_seen: 'OrderedDict[str, float]' = OrderedDict()
+        self._tenant_priorities: Dict[str, set] = {}
+
+        # 指标
+        self._stats = {'admitted': 0, 'rejected': 0, 'timeouts': 0}
+        self._tenant_stats: Dict[str, Dict[str, float]] = {}
+        self._wait_samples = deque(maxlen=1000)
+
+    def _plan(self, plan: Optional[str]) -> Dict:
+        return self.plan_limits.get(plan or 'free', self.plan_limits['free'])
+
+    def _backend_limit(self, backend: str) -> int:
+        return self.backend_limits.get(backend, self.default_backend_limit)
+
+    def _tenant_stat(self, tenant_id: str) -> Dict[str, float]:
+        if tenant_id not in self._tenant_stats:
+            self._tenant_stats[tenant_id] = {
+                'admitted': 0, 'rejected': 0, 'wait_total': 0.0, 'wait_max': 0.0
+            }
+        return self._tenant_stats[tenant_id]
+
+    def _touch(self, tenant_id: str, priority: Optional[str] = None):
+        """记录租户活动（持锁调用）"""
+        self._tenant_seen[tenant_id] = time.monotonic()
+        self._tenant_seen.move_to_end(tenant_id)
+        if priority is not None:
+            self._tenant_priorities.setdefault(tenant_id, set()).add(priority)
+
+    def _expire(self):
+        """清除空闲过久或超出个数上限的租户状态（持锁调用，按最久未活动先检查）"""
+        now = time.monotonic()
+        for _ in range(len(self._tenant_seen)):
+            tenant_id, seen = next(iter(self._tenant_seen.items()))
+            if now - seen <= self.tenant_idle_ttl and len(self._tenant_seen) <= self.max_tenants:
+                return
+            if self._tenant_running.get(tenant_id, 0) or self._tenant_queued.get(tenant_id, 0):
+                # 仍在执行或排队：保留，稍后再检查
+                self._tenant_seen.move_to_end(tenant_id)
+                continue
+            del self._tenant_seen[tenant_id]
+            for priority in self._tenant_priorities.pop(tenant_id, ()):
+                flow = (tenant_id, priority)
+                self._last_finish.pop(flow, None)
+                self._flows.pop(flow, None)
+            for state in (self._tenant_limit, self._tenant_running, self._tenant_queued, self._tenant_stats):
+                state.pop(tenant_id, None)
+
+    def _can_run(self, tenant_id: str, backend: str) -> bool:
+        tenant_limit = self._tenant_limit.get(tenant_id, 1)
+        if tenant_limit != -1 and self._tenant_running.get(tenant_id, 0) >= tenant_limit:
+            return False
+        return self._backend_running.get(backend, 0) < self._backend_limit(backend)
+
+    def _start(self, tenant_id: str, backend: str, wait: float):
+        self._tenant_running[tenant_id] = self._tenant_running.get(tenant_id, 0) + 1
+        self._backend_running[backend] = self._backend_running.get(backend, 0) + 1
+
+        self._stats['admitted'] += 1
+        stat = self._tenant_stat(tenant_id)
+        stat['admitted'] += 1
+        stat['wait_total'] += wait
+        stat['wait_max'] = max(stat['wait_max'], wait)
+        self._wait_samples.append(wait)
+
+    def _dispatch(self):
+        """按开始标签从小到大放行可运行的队首请求（持锁调用）"""
+        while self._queued:
+            heads = sorted(
+                (queue[0] for queue in self._flows.values() if queue),
+                key=lambda w: w.tag
+            )
+            waiter = next((w for w in heads if self._can_run(w.tenant_id, w.backend)), None)
+            if waiter is None:
+                return
+
+            self._flows[waiter.flow].popleft()
+            self._queued -= 1
+            self._tenant_queued[waiter.tenant_id] -= 1
+            self._virtual_time = max(self._virtual_time, waiter.tag)
+
+            waiter.granted = True
+            self._start(waiter.tenant_id, waiter.backend, time.monotonic() - waiter.enqueued_at)
+            waiter.loop.call_soon_threadsafe(self._wake, waiter.future)
+
+    @staticmethod
+    def _wake(future: asyncio.Future):
+        if not future.done():
+            future.set_result(True)
+
+    def _reject(self, tenant_id: str, message: str, reason: str):
+        self._stats['rejected'] += 1
+        self._tenant_stat(tenant_id)['rejected'] += 1
+        logger.warning(f"🚫 工具调用被拒绝 [{tenant_id}]: {message}")
+        raise ToolAdmissionRejected(message, reason)
+
+    def _release(self, tenant_id: str, backend: str):
+        with self._lock:
+            self._tenant_running[tenant_id] -= 1
+            self._backend_running[backend] -= 1
+            self._touch(tenant_id)
+            self._dispatch()
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        tenant_id: str,
+        plan: Optional[str] = None,
+        backend: str = 'local',
+        priority: str = 'interactive'
+    ):
+        """
+        获取执行许可（异步上下文管理器）
+
+        用法:
+            async with controller.admit(tenant_id, 'pro', 'hydrosis'):
+                ...
+
+        Raises:
+            ToolAdmissionRejected: 队列已满或排队超时
+        """
+        policy = self._plan(plan)
+        waiter = None
+
+        with self._lock:
+            self._touch(tenant_id, priority)
+            self._expire()
+            self._tenant_limit[tenant_id] = policy['tool_concurrency']
+
+            if not self._queued and self._can_run(tenant_id, backend):
+                # 快速路径：无人排队且有空闲并发
+                self._start(tenant_id, backend, 0.0)
+            else:
+                depth = policy['tool_queue_depth']
+                if self._queued >= self.max_queue_depth:
+                    self._reject(tenant_id, f"工具队列已满（{self._queued}/{self.max_queue_depth}）", 'queue_full')
+                if depth != -1 and self._tenant_queued.get(tenant_id, 0) >= depth:
+                    self._reject(tenant_id, f"租户排队请求过多（上限 {depth}）", 'tenant_queue_full')
+
+                flow = (tenant_id, priority)
+                weight = policy['tool_queue_weight'] * PRIORITY_WEIGHTS.get(priority, 1.0)
+                start_tag = max(self._virtual_time, self._last_finish.get(flow, 0.0))
+                self._last_finish[flow] = start_tag + 1.0 / weight
+
+                waiter = _Waiter(tenant_id, flow, backend, start_tag)
+                self._flows.setdefault(flow, deque()).append(waiter)
+                self._queued += 1
+                self._tenant_queued[tenant_id] = self._tenant_queued.get(tenant_id, 0) + 1
+                self._dispatch()
+
+        if waiter is not None and not waiter.granted:
+            logger.info(f"⏳ 工具调用排队 [{tenant_id}/{priority}] -> {backend}")
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except BaseException as e:
+                with self._lock:
+                    if not waiter.granted:
+                        # 仍在队列中：移出队列
+                        self._flows[waiter.flow].remove(waiter)
+                        self._queued -= 1
+                        self._tenant_queued[tenant_id] -= 1
+                        if isinstance(e, asyncio.TimeoutError):
+                            self._stats['timeouts'] += 1
+                            self._reject(tenant_id, f"工具排队超时（>{self.queue_timeout}秒）", 'queue_timeout')
+                        raise
+                # 已获得许可但被取消：归还许可
+                if not isinstance(e, asyncio.TimeoutError):
+                    self._release(tenant_id, backend)
+                    raise
+
+        try:
+            yield
+        finally:
+            self._release(tenant_id, backend)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取排队和并发指标"""
+        with self._lock:
+            waits: List[float] = sorted(self._wait_samples)
+
+            def percentile(p):
+                if not waits:
+                    return 0.0
+                return round(waits[min(len(waits) - 1, int(p * len(waits)))], 4)
+
+            return {
+                **self._stats,
+                'queued': self._queued,
+                'queue_wait': {
+                    'p50': percentile(0.5),
+                    'p95': percentile(0.95),
+                    'max': round(waits[-1], 4) if waits else 0.0
+                },
+                'backends': {
+                    backend: {'running': running, 'limit': self._backend_limit(backend)}
+                    for backend, running in self._backend_running.items()
+                },
+                'tenants': {
+                    tenant_id: {
+                        **stat,
+                        'running': self._tenant_running.get(tenant_id, 0),
+                        'queued': self._tenant_queued.get(tenant_id, 0),
+                        'avg_wait': round(stat['wait_total'] / stat['admitted'], 4) if stat['admitted'] else 0.0
+                    }
+                    for tenant_id, stat in self._tenant_stats.items()
+                }
+            }
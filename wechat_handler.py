@@ -10,6 +10,8 @@ import logging
 from typing import Dict, Optional
 from xml.etree import ElementTree as ET
 
+from conversation_store import WECHAT_NAMESPACE, get_conversation_store
+
 logger = logging.getLogger(__name__)
 
 
@@ -29,8 +31,8 @@ class WechatMessageHandler:
         self.qwen_client = qwen_client
         self.mcp_manager = mcp_manager
         
-        # 用户会话管理
-        self.user_sessions = {}
+        # 用户会话管理（多进程共享，空闲超时淘汰）
+        self.user_sessions = get_conversation_store()
         
         logger.info("微信消息处理器初始化完成（使用阿里云通义千问）")
     
@@ -154,14 +156,15 @@ class WechatMessageHandler:
         """
         try:
             # 获取或创建用户会话
-            if user_id not in self.user_sessions:
+            session = self.user_sessions.load(WECHAT_NAMESPACE, user_id)
+            if session is None:
                 import uuid
-                self.user_sessions[user_id] = {
+                session = {
                     'conversation_id': str(uuid.uuid4()),
                     'created_at': time.time()
                 }
+                self.user_sessions.save(WECHAT_NAMESPACE, user_id, session)
             
-            session = self.user_sessions[user_id]
             conversation_id = session['conversation_id']
             
             # 检查是否需要调用MCP服务
@@ -176,13 +179,15 @@ class WechatMessageHandler:
                 response = self.qwen_client.chat(
                     content,
                     conversation_id=conversation_id,
-                    system_prompt=system_prompt
+                    system_prompt=system_prompt,
+                    priority='wechat'
                 )
             else:
                 # 直接对话
                 response = self.qwen_client.chat(
                     content,
-                    conversation_id=conversation_id
+                    conversation_id=conversation_id,
+                    priority='wechat'
                 )
             
             # 微信消息有字数限制，如果回复太长，进行截断
@@ -224,8 +229,8 @@ class WechatMessageHandler:
     
     def clear_user_session(self, user_id: str):
         """清除用户会话"""
-        if user_id in self.user_sessions:
-            conversation_id = self.user_sessions[user_id]['conversation_id']
-            self.qwen_client.clear_conversation(conversation_id)
-            del self.user_sessions[user_id]
+        session = self.user_sessions.load(WECHAT_NAMESPACE, user_id)
+        if session is not None:
+            self.qwen_client.clear_conversation(session['conversation_id'])
+            self.user_sessions.delete(WECHAT_NAMESPACE, user_id)
             logger.info(f"已清除用户会话: {user_id}")